@@ -0,0 +1,32 @@
+"""add_workflow_execution_due_index
+
+Revision ID: 4ecd71f44ecc
+Revises: f73ef2a321c3
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4ecd71f44ecc'
+down_revision: Union[str, Sequence[str], None] = 'f73ef2a321c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add due-time index used by the workflow engine scheduler."""
+    op.create_index(
+        'ix_workflow_executions_status_next_action',
+        'workflow_executions',
+        ['status', 'next_action_at'],
+    )
+
+
+def downgrade() -> None:
+    """Drop workflow engine due-time index."""
+    op.drop_index('ix_workflow_executions_status_next_action', table_name='workflow_executions')
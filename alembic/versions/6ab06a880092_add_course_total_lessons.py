@@ -0,0 +1,37 @@
+"""add_course_total_lessons
+
+Revision ID: 6ab06a880092
+Revises: 7a2ea0bc04d5
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6ab06a880092'
+down_revision: Union[str, Sequence[str], None] = '7a2ea0bc04d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add denormalized lesson count to courses and backfill it."""
+    op.add_column('courses', sa.Column('total_lessons', sa.Integer(), nullable=True, server_default='0'))
+    op.execute(
+        """
+        UPDATE courses SET total_lessons = (
+            SELECT COUNT(lessons.id)
+            FROM lessons JOIN modules ON modules.id = lessons.module_id
+            WHERE modules.course_id = courses.id
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    """Drop denormalized lesson count."""
+    op.drop_column('courses', 'total_lessons')
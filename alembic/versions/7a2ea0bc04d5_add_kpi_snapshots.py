@@ -0,0 +1,39 @@
+"""add_kpi_snapshots
+
+Revision ID: 7a2ea0bc04d5
+Revises: 4ecd71f44ecc
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a2ea0bc04d5'
+down_revision: Union[str, Sequence[str], None] = '4ecd71f44ecc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add executive KPI snapshot table."""
+    op.create_table(
+        'kpi_snapshots',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('computed_at', sa.DateTime(), nullable=False),
+        sa.Column('data', sa.JSON(), nullable=False),
+        sa.Column('compute_ms', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_kpi_snapshots_id'), 'kpi_snapshots', ['id'], unique=False)
+    op.create_index(op.f('ix_kpi_snapshots_computed_at'), 'kpi_snapshots', ['computed_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Drop executive KPI snapshot table."""
+    op.drop_index(op.f('ix_kpi_snapshots_computed_at'), table_name='kpi_snapshots')
+    op.drop_index(op.f('ix_kpi_snapshots_id'), table_name='kpi_snapshots')
+    op.drop_table('kpi_snapshots')
@@ -0,0 +1,99 @@
+"""add_revenue_rollups
+
+Revision ID: eb7811c0f744
+Revises: 6ab06a880092
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'eb7811c0f744'
+down_revision: Union[str, Sequence[str], None] = '6ab06a880092'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add hourly revenue rollup table and backfill it from completed orders."""
+    op.create_table(
+        'revenue_rollups',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('hour', sa.Integer(), nullable=False),
+        sa.Column('course_id', sa.Integer(), nullable=False),
+        sa.Column('instructor_id', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Float(), nullable=False),
+        sa.Column('orders', sa.Integer(), nullable=False),
+        sa.Column('items', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('day', 'hour', 'course_id', 'instructor_id', name='uq_revenue_rollup_bucket'),
+    )
+    op.create_index(op.f('ix_revenue_rollups_id'), 'revenue_rollups', ['id'], unique=False)
+    op.create_index(op.f('ix_revenue_rollups_day'), 'revenue_rollups', ['day'], unique=False)
+    op.create_index(op.f('ix_revenue_rollups_course_id'), 'revenue_rollups', ['course_id'], unique=False)
+    op.create_index(op.f('ix_revenue_rollups_instructor_id'), 'revenue_rollups', ['instructor_id'], unique=False)
+
+    if op.get_bind().dialect.name != 'postgresql':
+        # Other databases: run the rebuild_revenue_rollups task with days=0
+        return
+
+    # Platform rows: order totals per UTC hour
+    op.execute(
+        """
+        INSERT INTO revenue_rollups (day, hour, course_id, instructor_id, revenue, orders, items)
+        SELECT CAST(o.created_at AT TIME ZONE 'UTC' AS DATE),
+               CAST(EXTRACT(HOUR FROM o.created_at AT TIME ZONE 'UTC') AS INTEGER),
+               0, 0, SUM(o.total), COUNT(*), COALESCE(SUM(i.quantity), 0)
+        FROM orders o
+        LEFT JOIN (
+            SELECT order_id, SUM(COALESCE(quantity, 1)) AS quantity
+            FROM order_items GROUP BY order_id
+        ) i ON i.order_id = o.id
+        WHERE o.status = 'COMPLETED'
+        GROUP BY 1, 2
+        """
+    )
+    # Course rows: item revenue per course and instructor
+    op.execute(
+        """
+        INSERT INTO revenue_rollups (day, hour, course_id, instructor_id, revenue, orders, items)
+        SELECT CAST(o.created_at AT TIME ZONE 'UTC' AS DATE),
+               CAST(EXTRACT(HOUR FROM o.created_at AT TIME ZONE 'UTC') AS INTEGER),
+               oi.course_id, COALESCE(c.instructor_id, 0), SUM(oi.total),
+               COUNT(DISTINCT o.id), SUM(COALESCE(oi.quantity, 1))
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        LEFT JOIN courses c ON c.id = oi.course_id
+        WHERE o.status = 'COMPLETED' AND oi.course_id IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+        """
+    )
+    # Instructor rows: item revenue across each instructor's courses
+    op.execute(
+        """
+        INSERT INTO revenue_rollups (day, hour, course_id, instructor_id, revenue, orders, items)
+        SELECT CAST(o.created_at AT TIME ZONE 'UTC' AS DATE),
+               CAST(EXTRACT(HOUR FROM o.created_at AT TIME ZONE 'UTC') AS INTEGER),
+               0, c.instructor_id, SUM(oi.total),
+               COUNT(DISTINCT o.id), SUM(COALESCE(oi.quantity, 1))
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        JOIN courses c ON c.id = oi.course_id
+        WHERE o.status = 'COMPLETED' AND c.instructor_id IS NOT NULL
+        GROUP BY 1, 2, 4
+        """
+    )
+
+
+def downgrade() -> None:
+    """Drop revenue rollup table."""
+    op.drop_index(op.f('ix_revenue_rollups_instructor_id'), table_name='revenue_rollups')
+    op.drop_index(op.f('ix_revenue_rollups_course_id'), table_name='revenue_rollups')
+    op.drop_index(op.f('ix_revenue_rollups_day'), table_name='revenue_rollups')
+    op.drop_index(op.f('ix_revenue_rollups_id'), table_name='revenue_rollups')
+    op.drop_table('revenue_rollups')
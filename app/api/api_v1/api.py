@@ -135,3 +135,7 @@ api_router.include_router(study.router, prefix="/study", tags=["study"])
 from app.api.api_v1.endpoints import polity
 api_router.include_router(polity.router, prefix="/polity", tags=["polity"])
 
+
+# Performance (query instrumentation, request metrics; admin only)
+from app.api.api_v1.endpoints import performance
+api_router.include_router(performance.router, prefix="/performance", tags=["performance"])
@@ -5,11 +5,13 @@ Provides endpoints for the Teacher Portal to view AI operation logs
 
 from typing import Any, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
 
 from app.api import deps
 from app.models.user import User
 from app.services.ai_debug_service import ai_debug_service
+from app.services.ai_metering import ai_meter
 
 router = APIRouter()
 
@@ -170,5 +172,37 @@ async def get_ai_stats(
         "by_operation_type": [
             {"type": t.operation_type, "count": t.count}
             for t in by_type
-        ]
+        ],
+        "writer": ai_debug_service.get_writer_stats(),
     }
+
+
+@router.get("/usage")
+async def get_ai_usage(
+    current_user: User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Get AI usage per provider, model and feature.
+    
+    Shows requests, error rates, fallbacks, tokens, latency percentiles and
+    estimated cost - use it to pick features to cache or move to cheaper models.
+    """
+    if current_user.role not in ["admin", "teacher", "superadmin"]:
+        raise HTTPException(
+            status_code=403,
+            detail="Only administrators and teachers can access AI usage"
+        )
+    
+    return ai_meter.summary()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_ai_metrics(_: None = Depends(deps.verify_metrics_token)) -> Any:
+    """
+    AI usage counters in Prometheus text format.
+    
+    Requires ``Authorization: Bearer <METRICS_TOKEN>``; not served without a token.
+    """
+    return PlainTextResponse(
+        ai_meter.prometheus(), media_type="text/plain; version=0.0.4"
+    )
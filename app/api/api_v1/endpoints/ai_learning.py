@@ -85,7 +85,8 @@ async def generate_mcq_from_notes(
             system_message=SYSTEM_PROMPT,
             max_tokens=2000,
             temperature=0.7,
-            is_complex=True
+            is_complex=True,
+            feature="mcq_generation"
         )
         
         content = result["content"]
@@ -212,7 +213,8 @@ async def chat_with_coach(
             prompt=prompt,
             system_message=system_msg,
             max_tokens=300,
-            temperature=0.7
+            temperature=0.7,
+            feature="coach_chat"
         )
         
         ai_reply = result["content"]
@@ -10,6 +10,7 @@ from typing import List, Optional, Dict
 from pydantic import BaseModel, ConfigDict
 
 from app.api import deps
+from app.models.course import Course
 from app.models.user import User
 from app.services.ai_grading_service import AIGradingService
 from app.services.quiz_generator_service import QuizGeneratorService
@@ -222,6 +223,24 @@ def analyze_difficulty(
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
 
+@router.get("/course-difficulty/{course_id}")
+def analyze_course_difficulty(
+    course_id: int,
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_active_user),
+):
+    """
+    Analyze readability of every lesson in a course in one request.
+    """
+    course = db.query(Course).filter(Course.id == course_id).first()
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+    if course.instructor_id != current_user.id and not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    return DifficultyAnalyzerService.analyze_course(db, course_id)
+
+
 # --- Plagiarism Detection Endpoints ---
 
 
@@ -103,24 +103,11 @@ def create_announcement(
         db, obj_in=announcement_in, instructor_id=current_user.id
     )
 
-    # Send announcement emails to all enrolled students
+    # Queue announcement emails to all enrolled students (batched Celery sends)
     try:
-        from app.services.email_notification_service import send_announcement_email_sync
-        from app.models.enrollment import Enrollment
+        from app.services.email_notification_service import queue_announcement_emails
 
-        # Get all enrolled students
-        enrollments = (
-            db.query(Enrollment).filter(Enrollment.course_id == course_id).all()
-        )
-
-        enrolled_students = []
-        for enrollment in enrollments:
-            student = db.query(User).filter(User.id == enrollment.student_id).first()
-            if student:
-                enrolled_students.append(student)
-
-        if enrolled_students:
-            send_announcement_email_sync(db, enrolled_students, announcement)
+        queue_announcement_emails(db, announcement)
     except Exception as e:
         print(f"Failed to send announcement emails: {e}")
 
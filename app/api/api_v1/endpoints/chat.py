@@ -404,25 +404,24 @@ def get_online_users(
     """
     Get list of currently online users.
     """
-    cache_key = f"presence:online:{location or 'all'}"
-
-    # Try cache
-    cached = cache.get(cache_key)
-    if cached:
-        return [UserPresenceResponse(**u) for u in cached]
-
     presences = presence_service.get_online_users(db, location)
 
+    # Resolve display names for the whole page in one query
+    user_ids = [p.user_id for p in presences]
+    users = (
+        {u.id: u for u in db.query(User).filter(User.id.in_(user_ids)).all()}
+        if user_ids
+        else {}
+    )
+
     responses = []
     for presence in presences:
         response = UserPresenceResponse.from_orm(presence)
-        if presence.user:
-            response.user_name = presence.user.full_name or presence.user.username
+        user = users.get(presence.user_id)
+        if user:
+            response.user_name = user.full_name or user.username
         responses.append(response)
 
-    # Cache for 30 seconds
-    cache.set(cache_key, [r.model_dump() for r in responses], ttl=30)
-
     return responses
 
 
@@ -442,7 +441,8 @@ def get_user_presence(
         raise HTTPException(status_code=404, detail="User presence not found")
 
     response = UserPresenceResponse.from_orm(presence)
-    if presence.user:
-        response.user_name = presence.user.full_name or presence.user.username
+    user = db.query(User).filter(User.id == user_id).first()
+    if user:
+        response.user_name = user.full_name or user.username
 
     return response
@@ -21,6 +21,7 @@ from app.schemas.notification import (
     EmailTemplateUpdate,
     EmailLog,
 )
+from app.services.mailer import bulk_mailer
 
 router = APIRouter()
 
@@ -158,11 +159,13 @@ def update_email_template(
             status_code=403, detail="Not authorized to modify this template"
         )
 
+    previous_name = template.name
     template = crud_email_template.update(
         db, template_id=template_id, obj_in=template_in
     )
     if not template:
         raise HTTPException(status_code=400, detail="Failed to update template")
+    bulk_mailer.templates.invalidate(previous_name)
 
     return template
 
@@ -187,9 +190,11 @@ def delete_email_template(
             status_code=403, detail="Not authorized to delete this template"
         )
 
+    name = template.name
     success = crud_email_template.delete(db, template_id=template_id)
     if not success:
         raise HTTPException(status_code=400, detail="Failed to delete template")
+    bulk_mailer.templates.invalidate(name)
 
 
 # =============================================================================
@@ -9,6 +9,7 @@ from sqlalchemy.orm import Session
 
 from app.api import deps
 from app.services.executive_service import ExecutiveService
+from app.services.kpi_engine import KPISnapshotUnavailable
 from app.models.user import User
 
 router = APIRouter()
@@ -37,6 +38,8 @@ def get_executive_kpis(
     try:
         kpis = ExecutiveService.get_kpis(db)
         return kpis
+    except KPISnapshotUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to calculate KPIs: {str(e)}"
@@ -66,6 +69,8 @@ def get_platform_health(
     try:
         health_data = ExecutiveService.calculate_health_score(db)
         return health_data
+    except KPISnapshotUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to calculate health score: {str(e)}"
@@ -99,6 +104,8 @@ def get_platform_risks(
             "total_count": len(risks),
             "critical_count": sum(1 for r in risks if r["severity"] == "high"),
         }
+    except KPISnapshotUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to identify risks: {str(e)}"
@@ -126,6 +133,8 @@ def get_growth_metrics(
     try:
         growth_data = ExecutiveService.get_growth_metrics(db)
         return growth_data
+    except KPISnapshotUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to get growth metrics: {str(e)}"
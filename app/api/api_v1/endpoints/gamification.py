@@ -1,33 +1,98 @@
-from typing import Any, List
-from fastapi import APIRouter, Depends
+from typing import Any, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
 from app.api import deps
 from app.models.user import User
 from app.schemas.gamification import LeaderboardEntry
+from app.services.leaderboard_service import (
+    leaderboard_service,
+    course_board,
+    USERS_ALLTIME,
+    USERS_WEEKLY,
+)
 
 router = APIRouter()
 
 
+def _resolve_board(period: str, course_id: Optional[int]) -> str:
+    if course_id:
+        return course_board(course_id)
+    if period == "weekly":
+        return USERS_WEEKLY
+    if period == "alltime":
+        return USERS_ALLTIME
+    raise HTTPException(status_code=400, detail="period must be 'alltime' or 'weekly'")
+
+
+def _to_entries(db: Session, entries) -> List[LeaderboardEntry]:
+    users = leaderboard_service.load_users(db, entries)
+    result = []
+    for user_id, score, rank in entries:
+        u = users.get(user_id)
+        if not u:
+            continue
+        result.append(
+            LeaderboardEntry(
+                user_id=u.id,
+                full_name=u.full_name or "Anonymous",
+                coins=u.coins,
+                streak_days=u.streak_days,
+                rank=rank,
+                score=score,
+            )
+        )
+    return result
+
+
 @router.get("/leaderboard", response_model=List[LeaderboardEntry])
 def get_leaderboard(
     db: Session = Depends(deps.get_db),
     current_user: User = Depends(deps.get_current_active_user),
-    limit: int = 10,
+    limit: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    period: str = "alltime",
+    course_id: Optional[int] = None,
 ) -> Any:
     """
-    Get top users by coins.
+    Get top users by coins (all-time), coins earned this week, or coins
+    earned in a course.
     """
-    users = db.query(User).order_by(desc(User.coins)).limit(limit).all()
-    return [
-        LeaderboardEntry(
-            user_id=u.id,
-            full_name=u.full_name or "Anonymous",
-            coins=u.coins,
-            streak_days=u.streak_days,
-        )
-        for u in users
-    ]
+    board = _resolve_board(period, course_id)
+    return _to_entries(db, leaderboard_service.top(db, board, limit, offset))
+
+
+@router.get("/leaderboard/me")
+def get_my_rank(
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_active_user),
+    period: str = "alltime",
+    course_id: Optional[int] = None,
+) -> Any:
+    """
+    Get current user's rank and score on a leaderboard.
+    """
+    board = _resolve_board(period, course_id)
+    mine = leaderboard_service.rank(db, board, current_user.id)
+    return {
+        "rank": mine[2] if mine else None,
+        "score": mine[1] if mine else 0,
+        "total": leaderboard_service.size(db, board),
+    }
+
+
+@router.get("/leaderboard/around-me", response_model=List[LeaderboardEntry])
+def get_leaderboard_around_me(
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_active_user),
+    radius: int = Query(5, ge=1, le=25),
+    period: str = "alltime",
+    course_id: Optional[int] = None,
+) -> Any:
+    """
+    Get the users ranked just above and below the current user.
+    """
+    board = _resolve_board(period, course_id)
+    return _to_entries(db, leaderboard_service.around(db, board, current_user.id, radius))
 
 
 @router.get("/stats")
@@ -55,6 +120,7 @@ def add_coins(
     """
     current_user.coins += amount
     db.commit()
+    leaderboard_service.record_user_coins(current_user.id, current_user.coins, earned=amount)
     return {"msg": "Coins added", "new_balance": current_user.coins}
 
 
@@ -136,6 +202,7 @@ def purchase_item(
     user_reward = UserReward(user_id=current_user.id, reward_id=item.id)
     db.add(user_reward)
     db.commit()
+    leaderboard_service.record_user_coins(current_user.id, current_user.coins)
 
     return {
         "msg": "Purchase successful",
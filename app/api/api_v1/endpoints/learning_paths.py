@@ -42,10 +42,10 @@ def get_my_path_enrollments(
     current_user: User = Depends(deps.get_current_user),
 ):
     """
-    Get all path enrollments for the current user.
+    Get all path enrollments for the current user, with the next course and
+    the courses whose prerequisites are met.
     """
-    enrollments = crud.get_student_path_enrollments(db, current_user.id)
-    return enrollments
+    return crud.get_student_path_progress(db, current_user.id)
 
 
 @router.get("/", response_model=List[schemas.LearningPath])
@@ -12,9 +12,11 @@ from app.schemas.lesson_drip import (
     DripSettingCreate,
     DripSettingUpdate,
     LessonAccessInfo,
+    CourseAccessOutline,
 )
 from app.crud.lesson_drip import lesson_drip
 from app.services.lesson_access import check_lesson_access
+from app.services.entitlements import entitlements
 
 router = APIRouter()
 
@@ -143,3 +145,22 @@ def check_access(
     Check if current user has access to a lesson based on drip settings.
     """
     return check_lesson_access(db, current_user.id, lesson_id, course_id)
+
+
+@router.get("/courses/{course_id}/access", response_model=CourseAccessOutline)
+def get_course_access(
+    course_id: int,
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Get lock states for every lesson of a course in outline order.
+    """
+    access_map = entitlements.course_access(db, current_user.id, course_id)
+    return {
+        "course_id": course_id,
+        "has_access": access_map.has_course_access,
+        "granted_by": access_map.granted_by,
+        "reason": access_map.reason,
+        "lessons": access_map.outline(),
+    }
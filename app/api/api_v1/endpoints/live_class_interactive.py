@@ -1,5 +1,5 @@
 from typing import Any, List
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.api import deps
 from app.crud.live_class_interactive import live_class_interactive
@@ -17,6 +17,7 @@ from app.schemas.live_class_interactive import (
 from app.models.user import User
 from app.models.live_class_interactive import PollStatus
 from app.services.realtime_service import realtime_service
+from app.services.live_interaction import live_interaction
 
 router = APIRouter()
 
@@ -36,6 +37,7 @@ async def create_poll(
     poll = live_class_interactive.create_poll(
         db, obj_in=poll_in, live_class_id=live_class_id
     )
+    live_interaction.register_poll(poll)
 
     # Broadcast poll created event
     await realtime_service.send_live_class_update(
@@ -67,20 +69,41 @@ async def respond_to_poll(
 ) -> Any:
     """
     Submit a response to a poll
-    """
-    # Check if already responded (logic omitted)
-    response = live_class_interactive.create_poll_response(
-        db, obj_in=response_in, student_id=current_user.id
-    )
 
-    # Broadcast poll update (e.g., updated counts)
-    poll = live_class_interactive.get_poll(db, poll_id=poll_id)
-    await realtime_service.send_live_class_update(
-        class_id=poll.live_class_id,
-        update_type="poll_updated",
-        data={"poll_id": poll_id},
-    )
-    return {"status": "success"}
+    Votes are counted live and written to the database when the poll ends;
+    tally broadcasts are coalesced per class.
+    """
+    try:
+        vote = live_interaction.record_vote(
+            db, poll_id, current_user.id, response_in.selected_option_index
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if vote is None:
+        raise HTTPException(status_code=404, detail="Poll not found")
+
+    if vote.counted:
+        live_interaction.broadcaster.mark(vote.class_id, poll_id=poll_id)
+    return {
+        "status": "success",
+        "counted": vote.counted,
+        "selected_option_index": vote.option_index,
+    }
+
+
+@router.get("/polls/{poll_id}/results", response_model=Any)
+def get_poll_results(
+    poll_id: int,
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Get the vote tally of a poll
+    """
+    results = live_interaction.poll_results(db, poll_id)
+    if results is None:
+        raise HTTPException(status_code=404, detail="Poll not found")
+    return results
 
 
 @router.put("/polls/{poll_id}/status", response_model=PollResponse)
@@ -93,7 +116,22 @@ async def update_poll_status(
     """
     Update poll status (e.g., end poll)
     """
-    poll = live_class_interactive.update_poll_status(db, poll_id=poll_id, status=status)
+    if status == PollStatus.ENDED:
+        poll = live_class_interactive.get_poll(db, poll_id=poll_id)
+        if poll is None:
+            raise HTTPException(status_code=404, detail="Poll not found")
+        # Persists all votes in one batch
+        live_interaction.close_poll(db, poll)
+    else:
+        poll = live_class_interactive.update_poll_status(
+            db, poll_id=poll_id, status=status
+        )
+        if poll is None:
+            raise HTTPException(status_code=404, detail="Poll not found")
+        live_interaction.register_poll(poll)
+
+    # Send the final tally before the status change
+    await live_interaction.broadcaster.flush(poll.live_class_id)
 
     # Broadcast status change
     await realtime_service.send_live_class_update(
@@ -153,6 +191,7 @@ def get_questions(
     Get all questions for a live class
     """
     questions = live_class_interactive.get_questions(db, live_class_id=live_class_id)
+    live_upvotes = live_interaction.upvote_counts(live_class_id)
     # Enrich with student names (could be optimized with join)
     result = []
     for q in questions:
@@ -165,7 +204,7 @@ def get_questions(
                 question_text=q.question_text,
                 is_answered=q.is_answered,
                 answer_text=q.answer_text,
-                upvotes=q.upvotes,
+                upvotes=live_upvotes.get(q.id, q.upvotes),
                 created_at=q.created_at,
             )
         )
@@ -214,15 +253,17 @@ async def upvote_question(
 ) -> Any:
     """
     Upvote a question
+
+    Each user's upvote counts once; counts are written behind to the
+    database and broadcasts are coalesced per class.
     """
-    question = live_class_interactive.upvote_question(db, question_id=question_id)
+    question = live_class_interactive.get_question(db, question_id=question_id)
+    if question is None:
+        raise HTTPException(status_code=404, detail="Question not found")
 
-    # Broadcast upvote
-    await realtime_service.send_live_class_update(
-        class_id=question.live_class_id,
-        update_type="question_upvoted",
-        data={"question_id": question_id, "upvotes": question.upvotes},
-    )
+    upvotes, counted = live_interaction.upvote(question, current_user.id)
+    if counted:
+        live_interaction.broadcaster.mark(question.live_class_id, question_id=question_id)
 
     student = question.student
     return QuestionResponse(
@@ -232,7 +273,7 @@ async def upvote_question(
         question_text=question.question_text,
         is_answered=question.is_answered,
         answer_text=question.answer_text,
-        upvotes=question.upvotes,
+        upvotes=upvotes,
         created_at=question.created_at,
     )
 
@@ -25,6 +25,7 @@ from app.schemas.marketing_automation import (
     AutomationDashboard, ChannelAnalytics, WorkflowAnalytics,
     TriggerWorkflowRequest, SendMessageRequest,
 )
+from app.services.workflow_engine import workflow_engine
 
 router = APIRouter()
 
@@ -343,55 +344,7 @@ def trigger_workflow(
             MarketingWorkflow.status == "ACTIVE"
         ).all()
     
-    executions_created = 0
-    for lead_id in request.lead_ids:
-        # Verify lead exists
-        lead = db.query(Lead).filter(Lead.id == lead_id).first()
-        if not lead:
-            continue
-        
-        for workflow in workflows:
-            # Check if lead already in workflow (unless re-entry allowed)
-            if not workflow.allow_re_entry:
-                existing = db.query(WorkflowExecution).filter(
-                    and_(
-                        WorkflowExecution.workflow_id == workflow.id,
-                        WorkflowExecution.lead_id == lead_id,
-                        WorkflowExecution.status.in_(["PENDING", "RUNNING"])
-                    )
-                ).first()
-                if existing:
-                    continue
-            
-            # Get first step
-            first_step = db.query(WorkflowStep).filter(
-                WorkflowStep.workflow_id == workflow.id
-            ).order_by(WorkflowStep.order_index).first()
-            
-            if not first_step:
-                continue
-            
-            # Create execution
-            execution = WorkflowExecution(
-                workflow_id=workflow.id,
-                lead_id=lead_id,
-                status="RUNNING",
-                current_step_id=first_step.id,
-                started_at=datetime.utcnow(),
-                execution_log=[{
-                    "timestamp": datetime.utcnow().isoformat(),
-                    "action": "WORKFLOW_STARTED",
-                    "step_id": first_step.id
-                }]
-            )
-            db.add(execution)
-            
-            # Update workflow stats
-            workflow.total_enrolled += 1
-            
-            executions_created += 1
-    
-    db.commit()
+    executions_created = workflow_engine.enroll_leads(db, workflows, request.lead_ids)
     
     return {
         "message": f"Triggered {executions_created} workflow executions",
@@ -399,6 +352,52 @@ def trigger_workflow(
     }
 
 
+@router.post("/workflows/{workflow_id}/enroll-audience")
+def enroll_workflow_audience(
+    workflow_id: int,
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """Enroll every lead matching the workflow's audience filters."""
+    workflow = db.query(MarketingWorkflow).filter(
+        and_(MarketingWorkflow.id == workflow_id, MarketingWorkflow.status == "ACTIVE")
+    ).first()
+    if not workflow:
+        raise HTTPException(status_code=404, detail="Active workflow not found")
+    
+    executions_created = workflow_engine.enroll_audience(db, workflow)
+    
+    return {
+        "message": f"Enrolled {executions_created} leads",
+        "executions_created": executions_created
+    }
+
+
+@router.post("/engine/tick")
+def run_engine_tick(
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(deps.get_admin_user),
+) -> Any:
+    """Advance one batch of due workflow executions immediately."""
+    return workflow_engine.tick(db)
+
+
+@router.get("/engine/metrics")
+def get_engine_metrics(
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """Get workflow engine throughput metrics and the current due backlog."""
+    due_backlog = db.query(WorkflowExecution).filter(
+        and_(
+            WorkflowExecution.status.in_(["PENDING", "RUNNING"]),
+            WorkflowExecution.next_action_at <= datetime.utcnow(),
+        )
+    ).count()
+    
+    return {**workflow_engine.metrics.snapshot(), "due_backlog": due_backlog}
+
+
 @router.get("/executions", response_model=List[Execution])
 def get_executions(
     db: Session = Depends(deps.get_db),
@@ -25,6 +25,14 @@ def get_pack_leaderboard(
     else:
         packs = pack_service.get_leaderboard(db, limit)
     
+    from app.models.learning_group import GroupMembership
+    my_pack_ids = {
+        group_id
+        for (group_id,) in db.query(GroupMembership.group_id)
+        .filter(GroupMembership.user_id == current_user.id)
+        .all()
+    }
+    
     result = []
     for p in packs:
         metadata = json.loads(p.pack_metadata) if p.pack_metadata else {}
@@ -34,7 +42,7 @@ def get_pack_leaderboard(
             "house_type": p.house_type,
             "points": p.weekly_points if weekly else p.pack_points,
             "metadata": metadata,
-            "is_my_pack": any(m.user_id == current_user.id for m in p.members)
+            "is_my_pack": p.id in my_pack_ids
         })
     
     return result
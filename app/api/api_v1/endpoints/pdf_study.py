@@ -276,15 +276,29 @@ async def evaluate_recall(request: RecallEvaluationRequest):
     # Use Gemini for audio transcription and evaluation
     # Note: Using import inside function to avoid circular imports if any, but unlikely here.
     from app.services.gemini_service import gemini_service
+    from app.services.recall_scorer import recall_scorer, split_sentences
     
     # Transcribe audio
     transcription = gemini_service.transcribe_audio(request.audio_base64)
     
-    # Evaluate recall
-    evaluation = gemini_service.evaluate_recall(
-        original_text=page_text,
-        student_recall=transcription
+    # Settle empty, copied, off-topic and fully covered recalls locally
+    prescore = recall_scorer.prescore(
+        f"{request.segment_key}:{request.page_number}",
+        split_sentences(page_text),
+        transcription,
+        source_text=page_text,
     )
+    baseline = local_recall_evaluation(prescore)
+    
+    if prescore.is_local:
+        evaluation = baseline
+    else:
+        # Evaluate recall
+        evaluation = gemini_service.evaluate_recall(
+            original_text=page_text,
+            student_recall=transcription,
+            baseline=baseline,
+        )
     
     passed = evaluation["score"] >= 80
     
@@ -298,6 +312,27 @@ async def evaluate_recall(request: RecallEvaluationRequest):
     )
 
 
+def local_recall_evaluation(prescore) -> Dict[str, Any]:
+    """Evaluation in the Gemini result format, built from the local pre-score."""
+    if prescore.reason == "empty":
+        feedback = "We couldn't hear enough of your recall to assess it. Please try recording again."
+    elif prescore.reason == "off_topic":
+        feedback = "Your recall doesn't seem to match this page. Review the page and try again."
+    elif prescore.reason == "copied":
+        feedback = "Your recall matches the page word for word. Try explaining it in your own words."
+    elif prescore.reason == "covered":
+        feedback = "Great recall! You covered the key points on this page."
+    else:
+        feedback = f"You recalled {len(prescore.concepts_covered)} of {len(prescore.concepts_covered) + len(prescore.concepts_missed)} key points. Review the ones you missed."
+    
+    return {
+        "score": prescore.recall_score or 0,
+        "recalled_points": prescore.concepts_covered,
+        "missing_points": prescore.concepts_missed,
+        "feedback": feedback,
+    }
+
+
 @router.get("/progress/{segment_key}")
 async def get_study_progress(segment_key: str, user_id: int = 0):
     """Get student's progress on a PDF study session."""
@@ -0,0 +1,110 @@
+"""
+Performance API Endpoints
+Query instrumentation, connection pool, request latency and operation timings
+for administrators, plus a Prometheus scrape endpoint
+"""
+
+from typing import Any, Optional
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
+
+from app.api import deps
+from app.db.instrumentation import pool_monitor, query_instrumentation
+from app.models.user import User
+from app.services.performance_monitor import PerformanceMonitor
+from app.services.request_metrics import request_metrics
+
+router = APIRouter()
+
+
+@router.get("/queries")
+def get_query_stats(
+    current_user: User = Depends(deps.get_admin_user),
+) -> Any:
+    """
+    SQL instrumentation snapshot of this worker.
+
+    Per-route latency, query count and database time percentiles, recent
+    N+1 candidates and slow-query samples with their EXPLAIN plans.
+    """
+    return query_instrumentation.snapshot()
+
+
+@router.get("/routes")
+def get_route_stats(
+    limit: int = Query(20, le=200),
+    sort: str = Query("queries", pattern="^(queries|db_ms|latency_ms)$"),
+    current_user: User = Depends(deps.get_admin_user),
+) -> Any:
+    """
+    Routes ranked by p95 of the chosen metric.
+
+    - **sort**: queries, db_ms or latency_ms
+    """
+    routes = query_instrumentation.route_stats()
+    ranked = sorted(
+        routes.items(), key=lambda item: item[1][sort]["p95"] or 0, reverse=True
+    )
+    return [{"route": route, **stats} for route, stats in ranked[:limit]]
+
+
+@router.get("/pool")
+def get_pool_stats(
+    current_user: User = Depends(deps.get_admin_user),
+) -> Any:
+    """
+    Database connection pool of this worker.
+
+    Saturation (checked out / size + overflow), checkout hold-time
+    percentiles and which routes hold the longest-lived connections.
+    """
+    return pool_monitor.snapshot()
+
+
+@router.get("/operations")
+def get_operation_stats(
+    current_user: User = Depends(deps.get_admin_user),
+) -> Any:
+    """Timings of operations decorated with PerformanceMonitor.track_time."""
+    return {
+        "operations": PerformanceMonitor.get_stats(),
+        "slow_operations": PerformanceMonitor.get_slow_queries(limit=20),
+    }
+
+
+@router.post("/reset")
+def reset_stats(
+    current_user: User = Depends(deps.get_admin_user),
+) -> Any:
+    """Clear query, pool and operation statistics of this worker."""
+    query_instrumentation.reset()
+    pool_monitor.reset()
+    PerformanceMonitor.reset_metrics()
+    return {"status": "reset"}
+
+
+@router.get("/requests")
+def get_request_metrics(
+    route: Optional[str] = None,
+    current_user: User = Depends(deps.get_admin_user),
+) -> Any:
+    """
+    Request latency percentiles and status counts of this worker, per route.
+
+    - **route**: Only this route template (e.g. "/api/v1/users/{user_id}")
+    """
+    return request_metrics.summary(route=route)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_request_metrics_prometheus(_: None = Depends(deps.verify_metrics_token)) -> Any:
+    """
+    Request latency, counters and connection pool gauges in Prometheus text format.
+
+    Requires ``Authorization: Bearer <METRICS_TOKEN>``; not served without a token.
+    """
+    return PlainTextResponse(
+        request_metrics.prometheus() + pool_monitor.prometheus(),
+        media_type="text/plain; version=0.0.4",
+    )
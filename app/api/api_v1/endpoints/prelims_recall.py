@@ -5,13 +5,14 @@ Uses AI Router for smart model selection and cost optimization
 
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Tuple
 from sqlalchemy.orm import Session
 import json
 from datetime import datetime
 
 from app.db.session import get_db
 from app.services.ai_router import ai_router
+from app.services.recall_scorer import RecallPrescore, recall_scorer, split_key_points
 from app.api.deps import get_current_user
 from app.models.user import User
 
@@ -131,14 +132,8 @@ RESPOND WITH ONLY A JSON OBJECT:
 }"""
 
 
-def build_prompt(request: RecallAnalysisRequest) -> str:
-    """Build the prompt for AI analysis with unique identifiers"""
-    import uuid
-    
-    # Generate unique submission ID for this analysis
-    submission_id = uuid.uuid4().hex[:8]
-    submission_time = datetime.utcnow().isoformat()
-    
+def resolve_key_points(request: RecallAnalysisRequest) -> Tuple[Optional[str], Optional[str]]:
+    """Pick the key points to grade against and where they came from"""
     # Try to load transcription document for actual video content
     segment_key = f"{request.cycle_id}_{request.day_number}_{request.part_number}_{request.segment_number}"
     
@@ -157,9 +152,8 @@ def build_prompt(request: RecallAnalysisRequest) -> str:
     
     # Determine key points to use (priority: transcription > provided > placeholder)
     if transcription_key_points and len(transcription_key_points) > 20:
-        key_points = transcription_key_points
-        source = "VIDEO TRANSCRIPTION"
-    elif request.key_points and len(request.key_points.strip()) > 10:
+        return transcription_key_points, "VIDEO TRANSCRIPTION"
+    if request.key_points and len(request.key_points.strip()) > 10:
         # Check if it's not a placeholder
         placeholder_texts = [
             "key points will load",
@@ -168,27 +162,29 @@ def build_prompt(request: RecallAnalysisRequest) -> str:
             "not provided"
         ]
         if not any(p in request.key_points.lower() for p in placeholder_texts):
-            key_points = request.key_points
-            source = "ADMIN PROVIDED"
-        else:
-            key_points = None
-            source = None
-    else:
-        key_points = None
-        source = None
+            return request.key_points, "ADMIN PROVIDED"
+    return None, None
+
+
+def build_prompt(
+    request: RecallAnalysisRequest,
+    resolved: Optional[Tuple[Optional[str], Optional[str]]] = None,
+) -> str:
+    """Build the prompt for AI analysis with unique identifiers"""
+    import uuid
+    
+    # Generate unique submission ID for this analysis
+    submission_id = uuid.uuid4().hex[:8]
+    submission_time = datetime.utcnow().isoformat()
+    
+    key_points, source = resolved or resolve_key_points(request)
     
     # Build key points section
     if key_points:
         # Number the key points for clear reference
-        key_point_lines = [kp.strip() for kp in key_points.split('\n') if kp.strip() and kp.strip().startswith('-')]
-        if not key_point_lines:
-            key_point_lines = [kp.strip() for kp in key_points.replace(';', ',').split(',') if kp.strip()]
-        
-        if len(key_point_lines) <= 1 and '\n' in key_points:
-            key_point_lines = [kp.strip() for kp in key_points.split('\n') if kp.strip()]
-        
+        key_point_lines = split_key_points(key_points)
         num_key_points = len(key_point_lines)
-        numbered_points = "\n".join([f"  {i+1}. {kp.lstrip('- ')}" for i, kp in enumerate(key_point_lines)])
+        numbered_points = "\n".join([f"  {i+1}. {kp}" for i, kp in enumerate(key_point_lines)])
         key_points_section = f"""VIDEO KEY POINTS ({num_key_points} total from {source} - student should cover ALL):
 {numbered_points}"""
     else:
@@ -271,9 +267,78 @@ def parse_ai_response(response_text: str) -> dict:
     raise json.JSONDecodeError("Could not extract JSON from response", clean_response, 0)
 
 
-def get_fallback_response(is_ai_failure: bool = False) -> RecallAnalysisResponse:
-    """Return template response when AI fails or is unavailable"""
+def prescore_recall(
+    request: RecallAnalysisRequest, key_points: Optional[str]
+) -> RecallPrescore:
+    """Score the submission locally against the segment's key points"""
+    segment_key = f"{request.cycle_id}_{request.day_number}_{request.part_number}_{request.segment_number}"
+    points = split_key_points(key_points) if key_points else []
+    return recall_scorer.prescore(segment_key, points, request.response_text)
+
+
+def understanding_level_for(score: int) -> str:
+    if score >= 85:
+        return "Excellent"
+    if score >= 70:
+        return "Good"
+    if score >= 50:
+        return "Satisfactory"
+    if score >= 25:
+        return "Needs Work"
+    return "Insufficient"
+
+
+def revision_priority_for(score: int) -> str:
+    if score < 50:
+        return "high"
+    if score <= 70:
+        return "medium"
+    return "low"
+
+
+def get_local_response(request: RecallAnalysisRequest, prescore: RecallPrescore) -> RecallAnalysisResponse:
+    """Response for submissions the pre-scorer settles without an LLM call"""
+    score = prescore.recall_score or 0
+    is_relevant = prescore.reason not in ("empty", "off_topic")
+
+    if prescore.reason == "empty":
+        relevance_message = "No recall content was captured from your submission."
+        feedback = "We couldn't find enough content to assess. Try recalling the segment in your own words."
+    elif prescore.reason == "off_topic":
+        relevance_message = f"Your response doesn't appear to be about \"{request.segment_title}\"."
+        feedback = "Please submit a response about the video topic."
+    elif prescore.reason == "copied":
+        relevance_message = "Your response closely matches the source material word for word."
+        feedback = "Recall works best in your own words. Close the material and explain the key points from memory."
+    else:
+        relevance_message = ""
+        feedback = f"You covered {len(prescore.concepts_covered)} of {len(prescore.concepts_covered) + len(prescore.concepts_missed)} key points from the segment."
+
     return RecallAnalysisResponse(
+        is_relevant=is_relevant,
+        relevance_message=relevance_message,
+        recall_score=score,
+        understanding_level=understanding_level_for(score),
+        coverage_percentage=round(prescore.coverage * 100),
+        feedback=feedback,
+        strengths=[f"Recalled: {c}" for c in prescore.concepts_covered[:5]] if is_relevant else [],
+        areas_to_improve=[f"Revisit: {c}" for c in prescore.concepts_missed[:5]],
+        concepts_covered=prescore.concepts_covered,
+        concepts_missed=prescore.concepts_missed,
+        base_score=score,
+        revision_priority=revision_priority_for(score),
+        ai_source="local",
+        ai_model=None,
+        analysis_timestamp=datetime.utcnow().isoformat(),
+        confidence_score=round(60 + 40 * prescore.similarity) if prescore.decision == "accept" else 90,
+    )
+
+
+def get_fallback_response(
+    is_ai_failure: bool = False, prescore: Optional[RecallPrescore] = None
+) -> RecallAnalysisResponse:
+    """Return template response when AI fails or is unavailable"""
+    response = RecallAnalysisResponse(
         # Topic Relevance
         is_relevant=True,
         relevance_message="",
@@ -306,6 +371,21 @@ def get_fallback_response(is_ai_failure: bool = False) -> RecallAnalysisResponse
         analysis_timestamp=datetime.utcnow().isoformat(),
         confidence_score=50
     )
+    if prescore is None or prescore.recall_score is None:
+        return response
+
+    # Use the local score as the baseline instead of a fixed template score
+    score = prescore.recall_score
+    return response.model_copy(update={
+        "recall_score": score,
+        "understanding_level": understanding_level_for(score),
+        "coverage_percentage": round(prescore.coverage * 100),
+        "base_score": score,
+        "concepts_covered": prescore.concepts_covered,
+        "concepts_missed": prescore.concepts_missed,
+        "revision_priority": revision_priority_for(score),
+        "ai_source": "local",
+    })
 
 
 @router.post("/analyze-recall", response_model=RecallAnalysisResponse)
@@ -319,8 +399,14 @@ async def analyze_recall(
     
     Compares the student's response against the key points from the video segment
     and provides a recall score with feedback. Includes topic relevance checking.
+    Clear cases are settled locally; only ambiguous ones reach the AI Router.
     """
-    prompt = build_prompt(request)
+    resolved = resolve_key_points(request)
+    prescore = prescore_recall(request, resolved[0])
+    if prescore.is_local:
+        return get_local_response(request, prescore)
+
+    prompt = build_prompt(request, resolved)
     
     try:
         # Call AI Router - automatically selects optimal model
@@ -329,7 +415,8 @@ async def analyze_recall(
             system_message=SYSTEM_MESSAGE,
             max_tokens=600,
             temperature=0.3,
-            is_complex=True  # Recall analysis is complex
+            is_complex=True,  # Recall analysis is complex
+            feature="prelims_recall"
         )
         
         response_text = result["content"]
@@ -355,12 +442,12 @@ async def analyze_recall(
             )
         except json.JSONDecodeError:
             # AI response wasn't valid JSON, return template with warning
-            return get_fallback_response(is_ai_failure=True)
+            return get_fallback_response(is_ai_failure=True, prescore=prescore)
             
     except Exception as e:
         print(f"AI analysis failed: {str(e)}")
         # Return template response instead of throwing error
-        return get_fallback_response(is_ai_failure=True)
+        return get_fallback_response(is_ai_failure=True, prescore=prescore)
 
 
 @router.post("/analyze-recall-demo", response_model=RecallAnalysisResponse)
@@ -379,7 +466,13 @@ async def analyze_recall_demo(
     print(f"[Prelims Recall] Key points: {request.key_points[:100] if request.key_points else 'EMPTY'}...")
     print(f"[Prelims Recall] Response text: {request.response_text[:100] if request.response_text else 'EMPTY'}...")
     
-    prompt = build_prompt(request)
+    resolved = resolve_key_points(request)
+    prescore = prescore_recall(request, resolved[0])
+    print(f"[Prelims Recall] Pre-score: {prescore.decision} ({prescore.reason}), score {prescore.recall_score}")
+    if prescore.is_local:
+        return get_local_response(request, prescore)
+
+    prompt = build_prompt(request, resolved)
     print(f"[Prelims Recall] Prompt built successfully")
     
     try:
@@ -391,7 +484,8 @@ async def analyze_recall_demo(
             system_message=SYSTEM_MESSAGE,
             max_tokens=1500,  # Increased for comprehensive unique analysis
             temperature=0.5,  # Increased for more varied responses
-            is_complex=True  # Recall analysis is complex
+            is_complex=True,  # Recall analysis is complex
+            feature="prelims_recall"
         )
         
         print(f"[Prelims Recall] AI Router returned successfully!")
@@ -458,12 +552,12 @@ async def analyze_recall_demo(
         except json.JSONDecodeError as je:
             print(f"[Prelims Recall] JSON Parse Error: {je}")
             print(f"[Prelims Recall] Raw response: {response_text[:500]}")
-            return get_fallback_response(is_ai_failure=True)
+            return get_fallback_response(is_ai_failure=True, prescore=prescore)
             
     except Exception as e:
         print(f"[Prelims Recall] ERROR: {type(e).__name__}: {str(e)}")
         print(f"[Prelims Recall] Traceback:\n{traceback.format_exc()}")
-        return get_fallback_response(is_ai_failure=True)
+        return get_fallback_response(is_ai_failure=True, prescore=prescore)
 
 
 @router.get("/usage-stats")
@@ -494,7 +588,8 @@ async def test_ai():
             prompt="Say hello in exactly 5 words.",
             system_message="You are a helpful assistant. Respond concisely.",
             max_tokens=50,
-            temperature=0.3
+            temperature=0.3,
+            feature="test"
         )
         
         print(f"[TEST-AI] SUCCESS! Model: {result.get('model')}")
@@ -7,10 +7,20 @@ from app import models, schemas
 from app.api import deps
 from app.models.lesson_progress import LessonProgress, ProgressStatus
 from app.models.enrollment import Enrollment, EnrollmentStatus
+from app.services.progress_ingestion import progress_ingestion
 
 router = APIRouter()
 
 
+def _lesson_context_or_error(db: Session, user_id: int, lesson_id: int):
+    context = progress_ingestion.lesson_context(db, user_id, lesson_id)
+    if context is None:
+        raise HTTPException(status_code=404, detail="Lesson not found")
+    if context.enrollment_id is None:
+        raise HTTPException(status_code=403, detail="Not enrolled in this course")
+    return context
+
+
 @router.post(
     "/lessons/{lesson_id}/mark-complete", response_model=schemas.LessonProgress
 )
@@ -22,24 +32,8 @@ def mark_lesson_complete(
     """
     Mark a lesson as complete.
     """
-    # Check if lesson exists
-    lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
-    if not lesson:
-        raise HTTPException(status_code=404, detail="Lesson not found")
-
-    # Check enrollment
-    enrollment = (
-        db.query(Enrollment)
-        .filter(
-            Enrollment.user_id == current_user.id,
-            Enrollment.course_id == lesson.module.course_id,
-            Enrollment.status == EnrollmentStatus.ACTIVE,
-        )
-        .first()
-    )
-
-    if not enrollment:
-        raise HTTPException(status_code=403, detail="Not enrolled in this course")
+    context = _lesson_context_or_error(db, current_user.id, lesson_id)
+    now = datetime.utcnow()
 
     # Get or create progress
     progress = (
@@ -56,24 +50,28 @@ def mark_lesson_complete(
             user_id=current_user.id,
             lesson_id=lesson_id,
             status=ProgressStatus.COMPLETED,
-            completed_at=datetime.utcnow(),
-            first_accessed_at=datetime.utcnow(),
+            completed_at=now,
+            first_accessed_at=now,
         )
         db.add(progress)
     else:
         progress.status = ProgressStatus.COMPLETED
-        progress.completed_at = datetime.utcnow()
-        progress.last_accessed_at = datetime.utcnow()
+        progress.completed_at = now
+        progress.last_accessed_at = now
 
     # Update enrollment last accessed lesson
-    enrollment.last_accessed_lesson_id = lesson_id
-    enrollment.last_accessed_at = datetime.utcnow()
+    db.query(Enrollment).filter(Enrollment.id == context.enrollment_id).update(
+        {"last_accessed_lesson_id": lesson_id, "last_accessed_at": now},
+        synchronize_session=False,
+    )
 
     db.commit()
     db.refresh(progress)
 
     # Check course completion
-    check_course_completion(db, current_user.id, lesson.module.course_id, enrollment)
+    progress_ingestion.update_course_completion(
+        db, {(current_user.id, context.course_id)}
+    )
 
     # Award coins for lesson completion
     try:
@@ -85,7 +83,7 @@ def mark_lesson_complete(
             action="lesson_complete",
             reference_type="lesson",
             reference_id=lesson_id,
-            description=f"Completed lesson: {lesson.title}",
+            description=f"Completed lesson: {context.lesson_title}",
         )
     except Exception as e:
         print(f"Failed to award coins for lesson completion: {e}")
@@ -104,72 +102,21 @@ def update_lesson_progress(
 ) -> Any:
     """
     Update lesson progress (e.g. video watch time).
-    """
-    # Check if lesson exists
-    lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
-    if not lesson:
-        raise HTTPException(status_code=404, detail="Lesson not found")
 
-    # Check enrollment
-    enrollment = (
-        db.query(Enrollment)
-        .filter(
-            Enrollment.user_id == current_user.id,
-            Enrollment.course_id == lesson.module.course_id,
-            Enrollment.status == EnrollmentStatus.ACTIVE,
-        )
-        .first()
-    )
-
-    if not enrollment:
-        raise HTTPException(status_code=403, detail="Not enrolled in this course")
-
-    # Get or create progress
-    progress = (
-        db.query(LessonProgress)
-        .filter(
-            LessonProgress.user_id == current_user.id,
-            LessonProgress.lesson_id == lesson_id,
-        )
-        .first()
+    Heartbeats are buffered and written to the database in bulk; watching
+    past 95% completes the lesson on the next flush.
+    """
+    context = _lesson_context_or_error(db, current_user.id, lesson_id)
+
+    return progress_ingestion.record_heartbeat(
+        db,
+        user_id=current_user.id,
+        lesson_id=lesson_id,
+        course_id=context.course_id,
+        enrollment_id=context.enrollment_id,
+        update_data=progress_data.model_dump(exclude_none=True),
     )
 
-    if not progress:
-        progress = LessonProgress(
-            user_id=current_user.id,
-            lesson_id=lesson_id,
-            status=ProgressStatus.IN_PROGRESS,
-            first_accessed_at=datetime.utcnow(),
-        )
-        db.add(progress)
-
-    # Update fields
-    if progress_data.time_spent_seconds:
-        progress.time_spent_seconds = progress_data.time_spent_seconds
-
-    if progress_data.video_completed_percentage:
-        progress.video_completed_percentage = progress_data.video_completed_percentage
-
-        # Auto-complete if watched > 95%
-        if (
-            progress_data.video_completed_percentage >= 95.0
-            and progress.status != ProgressStatus.COMPLETED
-        ):
-            progress.status = ProgressStatus.COMPLETED
-            progress.completed_at = datetime.utcnow()
-            # Check course completion
-            check_course_completion(
-                db, current_user.id, lesson.module.course_id, enrollment
-            )
-
-    progress.last_accessed_at = datetime.utcnow()
-    enrollment.last_accessed_lesson_id = lesson_id
-    enrollment.last_accessed_at = datetime.utcnow()
-
-    db.commit()
-    db.refresh(progress)
-    return progress
-
 
 @router.get("/courses/{course_id}/my-progress", response_model=schemas.CourseProgress)
 def get_course_progress(
@@ -191,11 +138,13 @@ def get_course_progress(
     if not enrollment:
         raise HTTPException(status_code=404, detail="Enrollment not found")
 
-    # Get all lessons in course
-    course = db.query(models.Course).filter(models.Course.id == course_id).first()
-    total_lessons = 0
-    for module in course.modules:
-        total_lessons += len(module.lessons)
+    # Lesson count is denormalized on the course
+    total_lessons = (
+        db.query(models.Course.total_lessons)
+        .filter(models.Course.id == course_id)
+        .scalar()
+        or 0
+    )
 
     # Get completed lessons
     completed_lessons_count = (
@@ -236,69 +185,4 @@ def check_course_completion(
     db: Session, user_id: int, course_id: int, enrollment: Enrollment
 ):
     """Helper to check and update course completion status"""
-    # Count total lessons
-    course = db.query(models.Course).filter(models.Course.id == course_id).first()
-    total_lessons = 0
-    for module in course.modules:
-        total_lessons += len(module.lessons)
-
-    # Count completed lessons
-    completed_count = (
-        db.query(LessonProgress)
-        .join(models.Lesson)
-        .join(models.Module)
-        .filter(
-            LessonProgress.user_id == user_id,
-            models.Module.course_id == course_id,
-            LessonProgress.status == ProgressStatus.COMPLETED,
-        )
-        .count()
-    )
-
-    # Calculate percentage
-    percentage = 0.0
-    if total_lessons > 0:
-        percentage = (completed_count / total_lessons) * 100
-
-    enrollment.progress_percentage = percentage
-
-    # Mark completed if 100%
-    if percentage >= 100.0 and enrollment.status != EnrollmentStatus.COMPLETED:
-        enrollment.status = EnrollmentStatus.COMPLETED
-        enrollment.completed_at = datetime.utcnow()
-
-        # Generate certificate automatically
-        from .certificates import generate_certificate_internal
-
-        generate_certificate_internal(db, user_id, course_id, enrollment.id)
-
-        # Award coins for course completion!
-        try:
-            from app.services.coin_service import trigger_coin_reward
-
-            user = db.query(models.User).filter(models.User.id == user_id).first()
-
-            if user:
-                # Big reward for completing entire course
-                trigger_coin_reward(
-                    db=db,
-                    user=user,
-                    action="course_complete",
-                    reference_type="course",
-                    reference_id=course_id,
-                    description=f"Completed course: {course.title}",
-                )
-
-                # Bonus for earning certificate
-                trigger_coin_reward(
-                    db=db,
-                    user=user,
-                    action="certificate_earn",
-                    reference_type="course",
-                    reference_id=course_id,
-                    description=f"Certificate earned: {course.title}",
-                )
-        except Exception as e:
-            print(f"Failed to award coins for course completion: {e}")
-
-    db.commit()
+    progress_ingestion.update_course_completion(db, {(user_id, course_id)})
@@ -1,8 +1,8 @@
 from typing import Any, List
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from sqlalchemy import case, func
 from sqlalchemy.orm import Session
 from datetime import datetime
-import random
 
 from app.api import deps
 from app.models.user import User
@@ -12,7 +12,6 @@ from app.models.quiz import (
     QuestionOption,
     QuizAttempt,
     StudentAnswer,
-    QuestionType,
     QuizFeedback,
     QuizAttemptAnalytics,
     AIGradingResult,
@@ -28,10 +27,10 @@ from app.schemas.quiz import (
     SubmitAnswerResponse,
     CompleteQuizRequest,
     QuizResultsResponse,
-    QuestionWithFeedback,
     QuizFeedback as QuizFeedbackSchema,
     AIGradingResult as AIGradingResultSchema,
 )
+from app.services.quiz_compiler import quiz_compiler
 
 router = APIRouter()
 
@@ -165,15 +164,16 @@ def start_quiz_attempt(
     Start a new quiz attempt.
     Returns quiz details, questions (possibly shuffled), and creates attempt record.
     """
-    quiz = db.query(Quiz).filter(Quiz.id == quiz_id).first()
-    if not quiz:
+    compiled = quiz_compiler.get(db, quiz_id)
+    if not compiled:
         raise HTTPException(status_code=404, detail="Quiz not found")
+    settings = compiled.settings
 
-    if not quiz.is_published:
+    if not settings["is_published"]:
         raise HTTPException(status_code=403, detail="Quiz is not published")
 
     # Check max attempts
-    if quiz.max_attempts:
+    if settings["max_attempts"]:
         existing_attempts = (
             db.query(QuizAttempt)
             .filter(
@@ -182,10 +182,10 @@ def start_quiz_attempt(
             .count()
         )
 
-        if existing_attempts >= quiz.max_attempts:
+        if existing_attempts >= settings["max_attempts"]:
             raise HTTPException(
                 status_code=403,
-                detail=f"Maximum attempts ({quiz.max_attempts}) reached",
+                detail=f"Maximum attempts ({settings['max_attempts']}) reached",
             )
 
     # Create attempt record
@@ -200,37 +200,13 @@ def start_quiz_attempt(
     db.commit()
     db.refresh(db_attempt)
 
-    # Get questions with feedback
-    questions = list(quiz.questions)
-
-    # Shuffle questions if configured
-    if quiz.shuffle_questions:
-        random.shuffle(questions)
-
-    # Prepare questions with feedback (if show_hints is enabled)
-    questions_with_feedback = []
-    for q in questions:
-        q_dict = QuestionWithFeedback.from_orm(q).dict()
-
-        # Get feedback if exists
-        feedback = (
-            db.query(QuizFeedback).filter(QuizFeedback.question_id == q.id).first()
-        )
-
-        if feedback:
-            q_dict["feedback"] = QuizFeedbackSchema.from_orm(feedback).dict()
-
-        # Randomize options if configured
-        if quiz.randomize_options and q_dict.get("options"):
-            random.shuffle(q_dict["options"])
-
-        questions_with_feedback.append(q_dict)
-
+    # Questions with feedback come pre-serialized from the compiled quiz,
+    # shuffled per attempt if configured
     return {
         "attempt_id": db_attempt.id,
-        "quiz": quiz,
-        "questions": questions_with_feedback,
-        "time_limit_minutes": quiz.time_limit_minutes,
+        "quiz": compiled.quiz_payload,
+        "questions": compiled.start_questions(),
+        "time_limit_minutes": settings["time_limit_minutes"],
         "started_at": db_attempt.started_at,
     }
 
@@ -262,13 +238,19 @@ def submit_single_answer(
     if attempt.completed_at:
         raise HTTPException(status_code=400, detail="Quiz already completed")
 
-    # Get question and quiz
-    question = db.query(Question).filter(Question.id == answer_in.question_id).first()
-
-    if not question:
+    # Grade against the compiled quiz; the question must belong to it
+    compiled = quiz_compiler.get(db, attempt.quiz_id)
+    if not compiled or answer_in.question_id not in compiled.questions:
         raise HTTPException(status_code=404, detail="Question not found")
 
-    quiz = attempt.quiz
+    if (
+        answer_in.selected_option_id
+        and answer_in.selected_option_id
+        not in compiled.questions[answer_in.question_id].option_ids
+    ):
+        raise HTTPException(
+            status_code=400, detail="Option does not belong to this question"
+        )
 
     # Check if answer already exists (prevent duplicate submissions)
     existing_answer = (
@@ -300,111 +282,18 @@ def submit_single_answer(
         db.add(db_answer)
 
     # Auto-grade the answer
-    is_correct = False
-    points_awarded = 0.0
-    correct_option_id = None
-
-    if question.type in [QuestionType.MULTIPLE_CHOICE, QuestionType.TRUE_FALSE]:
-        # Check if selected option is correct
-        if answer_in.selected_option_id:
-            selected_option = (
-                db.query(QuestionOption)
-                .filter(QuestionOption.id == answer_in.selected_option_id)
-                .first()
-            )
-
-            if selected_option and selected_option.is_correct:
-                is_correct = True
-                points_awarded = float(question.points)
-
-            # Find correct option for feedback
-            correct_option = (
-                db.query(QuestionOption)
-                .filter(
-                    QuestionOption.question_id == question.id,
-                    QuestionOption.is_correct == True,
-                )
-                .first()
-            )
-
-            if correct_option:
-                correct_option_id = correct_option.id
-
-    elif question.type == QuestionType.SHORT_ANSWER:
-        # Simple string matching
-        if answer_in.text_response:
-            for option in question.options:
-                if (
-                    option.is_correct
-                    and option.text.lower().strip()
-                    == answer_in.text_response.lower().strip()
-                ):
-                    is_correct = True
-                    points_awarded = float(question.points)
-                    break
-
-    elif question.type == QuestionType.FILL_IN_BLANK:
-        # Similar to short answer
-        if answer_in.text_response:
-            for option in question.options:
-                if (
-                    option.is_correct
-                    and option.text.lower().strip() in answer_in.text_response.lower()
-                ):
-                    is_correct = True
-                    points_awarded = float(question.points)
-                    break
+    grade = compiled.grade(
+        answer_in.question_id, answer_in.selected_option_id, answer_in.text_response
+    )
 
     # Update answer with grading results
-    db_answer.is_correct = is_correct
-    db_answer.points_awarded = points_awarded
+    db_answer.is_correct = grade.is_correct
+    db_answer.points_awarded = grade.points_awarded
 
     db.commit()
-    db.refresh(db_answer)
-
-    # Prepare response based on quiz settings
-    response = {
-        "is_correct": is_correct,
-        "points_awarded": points_awarded,
-        "feedback": None,
-        "explanation": None,
-        "show_correct_answer": False,
-        "correct_option_id": None,
-    }
 
-    # Add instant feedback if enabled
-    if quiz.instant_feedback:
-        feedback = (
-            db.query(QuizFeedback)
-            .filter(QuizFeedback.question_id == question.id)
-            .first()
-        )
-
-        if feedback:
-            # Show appropriate feedback based on correctness
-            feedback_text = feedback.feedback_text
-            if is_correct and feedback.feedback_for_correct:
-                feedback_text = feedback.feedback_for_correct
-            elif not is_correct and feedback.feedback_for_incorrect:
-                feedback_text = feedback.feedback_for_incorrect
-
-            response["feedback"] = {
-                "feedback_text": feedback_text,
-                "hint_text": feedback.hint_text if quiz.show_hints else None,
-                "explanation_url": feedback.explanation_url,
-                "media_url": feedback.media_url,
-            }
-
-        # Show explanation if available
-        if question.explanation:
-            response["explanation"] = question.explanation
-
-        # Show correct answer if configured
-        if quiz.show_correct_answers:
-            response["show_correct_answer"] = True
-            response["correct_option_id"] = correct_option_id
-
-    return response
+    # Feedback, explanation and correct answer depend on quiz settings
+    return compiled.answer_response(answer_in.question_id, grade)
 
 
 @router.post("/attempts/{attempt_id}/complete", response_model=QuizResultsResponse)
@@ -433,34 +322,26 @@ def complete_quiz_attempt(
 
     quiz = attempt.quiz
 
-    # Calculate final score
-    total_score = 0.0
-    max_possible_score = 0.0
-    correct_count = 0
-    incorrect_count = 0
-    skipped_count = 0
-
-    all_questions = db.query(Question).filter(Question.quiz_id == quiz.id).all()
-    answered_question_ids = set()
+    compiled = quiz_compiler.get(db, quiz.id)
 
-    for answer in attempt.answers:
-        answered_question_ids.add(answer.question_id)
-        question = answer.question
-        max_possible_score += question.points
-        total_score += answer.points_awarded
-
-        if answer.is_correct:
-            correct_count += 1
-        else:
-            incorrect_count += 1
-
-    # Count skipped questions
-    for q in all_questions:
-        if q.id not in answered_question_ids:
-            skipped_count += 1
-            max_possible_score += q.points
+    # Calculate final score with one aggregate over the submitted answers
+    answered_count, total_score, correct_count = (
+        db.query(
+            func.count(StudentAnswer.id),
+            func.coalesce(func.sum(StudentAnswer.points_awarded), 0.0),
+            func.coalesce(
+                func.sum(case((StudentAnswer.is_correct == True, 1), else_=0)), 0
+            ),
+        )
+        .filter(StudentAnswer.attempt_id == attempt_id)
+        .one()
+    )
+    total_score = float(total_score)
+    incorrect_count = answered_count - correct_count
 
-    total_questions = len(all_questions)
+    total_questions = compiled.question_count
+    skipped_count = max(total_questions - answered_count, 0)
+    max_possible_score = compiled.total_points
 
     # Calculate percentage
     percentage = (
@@ -483,7 +364,7 @@ def complete_quiz_attempt(
         attempt_id=attempt_id,
         time_spent_seconds=time_spent,
         average_time_per_question=avg_time_per_question,
-        questions_answered=len(answered_question_ids),
+        questions_answered=answered_count,
         questions_correct=correct_count,
         questions_incorrect=incorrect_count,
         questions_skipped=skipped_count,
@@ -497,18 +378,25 @@ def complete_quiz_attempt(
     db.refresh(analytics)
 
     # Trigger AI grading for essay questions if enabled
-    if quiz.enable_ai_grading:
-        for answer in attempt.answers:
-            question = answer.question
-            if question.type in [QuestionType.ESSAY, QuestionType.LONG_ANSWER]:
-                # Add to background queue for AI grading
-                background_tasks.add_task(
-                    trigger_ai_grading,
-                    db=db,
-                    answer_id=answer.id,
-                    model=quiz.ai_grading_model,
-                    threshold=quiz.manual_review_threshold,
-                )
+    essay_question_ids = compiled.essay_question_ids()
+    if quiz.enable_ai_grading and essay_question_ids:
+        essay_answer_ids = (
+            db.query(StudentAnswer.id)
+            .filter(
+                StudentAnswer.attempt_id == attempt_id,
+                StudentAnswer.question_id.in_(essay_question_ids),
+            )
+            .all()
+        )
+        for (answer_id,) in essay_answer_ids:
+            # Add to background queue for AI grading
+            background_tasks.add_task(
+                trigger_ai_grading,
+                db=db,
+                answer_id=answer_id,
+                model=quiz.ai_grading_model,
+                threshold=quiz.manual_review_threshold,
+            )
 
     # Send quiz completion email
     try:
@@ -599,7 +487,6 @@ def get_quiz_results(
     if not attempt.completed_at:
         raise HTTPException(status_code=400, detail="Quiz not yet completed")
 
-    quiz = attempt.quiz
     analytics = (
         db.query(QuizAttemptAnalytics)
         .filter(QuizAttemptAnalytics.attempt_id == attempt_id)
@@ -607,8 +494,9 @@ def get_quiz_results(
     )
 
     # Calculate stats
-    total_questions = len(quiz.questions)
-    max_possible_score = sum(q.points for q in quiz.questions)
+    compiled = quiz_compiler.get(db, attempt.quiz_id)
+    total_questions = compiled.question_count
+    max_possible_score = compiled.total_points
     percentage = (
         (attempt.score / max_possible_score * 100) if max_possible_score > 0 else 0
     )
@@ -796,7 +684,6 @@ def list_all_quiz_attempts(
         if not attempt.completed_at:
             continue
             
-        quiz = attempt.quiz
         analytics = (
             db.query(QuizAttemptAnalytics)
             .filter(QuizAttemptAnalytics.attempt_id == attempt.id)
@@ -804,8 +691,9 @@ def list_all_quiz_attempts(
         )
         
         # Calculate stats
-        total_questions = len(quiz.questions)
-        max_possible_score = sum(q.points for q in quiz.questions)
+        compiled = quiz_compiler.get(db, attempt.quiz_id)
+        total_questions = compiled.question_count
+        max_possible_score = compiled.total_points
         percentage = (
             (attempt.score / max_possible_score * 100) if max_possible_score > 0 else 0
         )
@@ -3,7 +3,7 @@ Report Export API Endpoints
 CSV and PDF export functionality
 """
 
-from fastapi import APIRouter, Depends, Query, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from typing import Optional
 from datetime import date, datetime
@@ -14,6 +14,7 @@ from app.services.report_service import ReportService
 from app.services.pdf_service import PDFReportService
 from app.services.revenue_analytics_service import RevenueAnalyticsService
 from app.services.executive_service import ExecutiveService
+from app.services.kpi_engine import KPISnapshotUnavailable
 
 router = APIRouter()
 
@@ -181,25 +182,11 @@ def export_revenue_pdf(
     """
     Generate revenue report as PDF.
     """
-    # Get revenue data
+    # Get revenue data from the revenue rollup
     service = RevenueAnalyticsService(db)
-    revenue_data = {
-        "revenue_summary": {
-            "total": 50000,  # Would get from actual analytics
-            "monthly": 12000,
-            "growth_rate": 15.5,
-            "avg_order": 150,
-        },
-        "monthly_data": [
-            {"month": "2025-01", "revenue": 10000},
-            {"month": "2025-02", "revenue": 11000},
-            {"month": "2025-03", "revenue": 12000},
-        ],
-        "top_courses": [
-            {"name": "Python Basics", "revenue": 5000, "enrollments": 50},
-            {"name": "Web Development", "revenue": 4500, "enrollments": 40},
-        ],
-    }
+    revenue_data = service.get_report_data(
+        instructor_id=current_user.id, start_date=start_date, end_date=end_date
+    )
 
     pdf_bytes = PDFReportService.generate_revenue_report(revenue_data)
 
@@ -220,10 +207,13 @@ def admin_export_executive_pdf(
     """
     Generate executive summary PDF (admin only).
     """
-    # Get executive data
-    kpis = ExecutiveService.get_kpis(db)
-    health = ExecutiveService.calculate_health_score(db)
-    risks = ExecutiveService.identify_risks(db)
+    # Get executive data from one KPI snapshot
+    try:
+        kpis = ExecutiveService.get_kpis(db)
+    except KPISnapshotUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    health = ExecutiveService.calculate_health_score(db, kpis=kpis)
+    risks = ExecutiveService.identify_risks(db, kpis=kpis)
 
     pdf_bytes = PDFReportService.generate_executive_summary(kpis, health, risks)
 
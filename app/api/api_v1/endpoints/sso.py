@@ -424,8 +424,8 @@ async def handle_oauth_callback(
     if not success:
         raise HTTPException(status_code=400, detail=f"Token exchange failed: {error}")
         
-    # Get user info
-    success, user_info, error = await oauth_service.get_user_info(tokens["access_token"])
+    # Get user info (from the verified id_token when the provider sends one)
+    success, user_info, error = await oauth_service.user_info_from_tokens(tokens)
     if not success:
         raise HTTPException(status_code=400, detail=f"Failed to get user info: {error}")
         
@@ -579,19 +579,18 @@ async def test_sso_connection(
         if not OAUTH_AVAILABLE:
             return {"status": "error", "message": "OAuth support not installed"}
             
-        import httpx
+        from app.services.idp_metadata import sso_http
         try:
-            async with httpx.AsyncClient() as client:
-                # Try to reach the authorization endpoint
-                resp = await client.get(config.authorization_endpoint)
-                # We expect 200 or 400 (missing params), but connectivity is what matters
-                reachable = resp.status_code < 500
-                
-                return {
-                    "status": "success" if reachable else "error",
-                    "message": "Endpoint reachable" if reachable else f"Endpoint returned {resp.status_code}",
-                    "provider": config.provider_name
-                }
+            # Try to reach the authorization endpoint
+            resp = await sso_http.async_client().get(config.authorization_endpoint)
+            # We expect 200 or 400 (missing params), but connectivity is what matters
+            reachable = resp.status_code < 500
+            
+            return {
+                "status": "success" if reachable else "error",
+                "message": "Endpoint reachable" if reachable else f"Endpoint returned {resp.status_code}",
+                "provider": config.provider_name
+            }
         except Exception as e:
              return {
                 "status": "error",
@@ -3,7 +3,7 @@ Student Portal API Endpoints
 """
 from typing import Any, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from app.db.session import get_db
 from app.api.deps import get_current_user
 from app.models.user import User
@@ -13,6 +13,7 @@ from app.models.module import Module
 from app.models.lesson import Lesson
 from app.models.lesson_progress import LessonProgress
 from app.schemas.course import Course as CourseSchema
+from app.services.entitlements import entitlements
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -125,7 +126,12 @@ def get_course_funnel_data(
     """
     Get detailed course data for the funnel view
     """
-    course = db.query(Course).filter(Course.id == course_id).first()
+    course = (
+        db.query(Course)
+        .options(selectinload(Course.modules).selectinload(Module.lessons))
+        .filter(Course.id == course_id)
+        .first()
+    )
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
         
@@ -139,23 +145,19 @@ def get_course_funnel_data(
         raise HTTPException(status_code=403, detail="Not enrolled in this course")
         
     # Build module/lesson structure with lock status
+    access_map = entitlements.course_access(db, current_user.id, course_id)
     modules_data = []
     for module in course.modules:
         lessons_data = []
         for lesson in module.lessons:
-            # Check progress
-            progress = db.query(LessonProgress).filter(
-                LessonProgress.user_id == current_user.id,
-                LessonProgress.lesson_id == lesson.id
-            ).first()
-            
+            access = access_map.lessons.get(lesson.id)
             lessons_data.append({
                 "id": lesson.id,
                 "title": lesson.title,
-                "duration": lesson.duration,
+                "duration": lesson.video_duration_seconds,
                 "type": lesson.type,
-                "is_completed": progress.is_completed if progress else False,
-                "is_locked": False # Implement locking logic later
+                "is_completed": access.is_completed if access else False,
+                "is_locked": not (access and access.has_access),
             })
             
         modules_data.append({
@@ -169,8 +171,8 @@ def get_course_funnel_data(
             "id": course.id,
             "title": course.title,
             "description": course.description,
-            "thumbnail": course.thumbnail,
+            "thumbnail": course.thumbnail_url,
         },
-        "progress": enrollment.progress,
+        "progress": enrollment.progress_percentage,
         "modules": modules_data
     }
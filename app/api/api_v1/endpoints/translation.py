@@ -4,7 +4,7 @@ Translation API Endpoints
 RESTful API for translation management and localization.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query, Response
 from sqlalchemy.orm import Session
 from app.db.session import get_db
 from app.api import deps
@@ -34,6 +34,7 @@ from app.services.translation_service import (
     UserLanguageService,
 )
 from app.services.ai_translation_service import translate_text_ai, LANGUAGE_METADATA
+from app.services.i18n_catalogue import catalogues
 from app.middleware.i18n_middleware import get_request_language
 from typing import List, Dict, Any
 from datetime import datetime
@@ -112,6 +113,7 @@ def update_language(
 
 @router.get("/translations/{namespace}", response_model=TranslationExport)
 def get_translations(
+    response: Response,
     namespace: str = "common",
     language: str = Query(
         None, description="Language code (default: request language)"
@@ -119,18 +121,29 @@ def get_translations(
     request: Request = None,
     db: Session = Depends(get_db),
 ):
-    """Get all translations for a namespace and language."""
+    """
+    Get all translations for a namespace and language.
+
+    Served from the in-memory catalogue with an ETag; clients that send it
+    back in If-None-Match get 304 Not Modified until the catalogue changes.
+    """
     lang_code = language or get_request_language(request)
+    catalogue = catalogues.get(db, lang_code, namespace)
 
-    translations = TranslationService.get_translations_by_namespace(
-        db, lang_code, namespace
-    )
+    headers = {
+        "ETag": catalogue.etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Language",
+    }
+    if catalogue.matches(request.headers.get("if-none-match")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
+    response.headers.update(headers)
     return TranslationExport(
         language_code=lang_code,
         namespace=namespace,
-        translations=translations,
-        total_count=len(translations),
+        translations=dict(catalogue.entries),
+        total_count=len(catalogue.entries),
     )
 
 
@@ -1,11 +1,17 @@
 """
 WebSocket API Endpoints for Real-Time Features
+
+Sockets never hold a database session: users are authenticated with a
+short-lived session during the handshake, and every write opens its own.
 """
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
+from starlette.concurrency import run_in_threadpool
 from app.core.websocket import manager, typing_indicator
 from app.api import deps
+from app.db.session import SessionLocal
+from app.services.live_quiz import live_quiz
+from app.services.whiteboard import whiteboard
 import json
 
 router = APIRouter()
@@ -16,14 +22,13 @@ async def websocket_discussion(
     websocket: WebSocket,
     thread_id: int,
     token: str = Query(...),
-    db: Session = Depends(deps.get_db),
 ):
     """
     WebSocket endpoint for real-time discussion updates
     """
     # Verify token and get user
     try:
-        user = await deps.get_current_user_ws(token, db)
+        user = await deps.authenticate_websocket(token)
     except Exception:
         await websocket.close(code=1008, reason="Unauthorized")
         return
@@ -86,24 +91,52 @@ async def websocket_discussion(
         manager.disconnect(websocket)
 
 
+def _start_live_quiz(quiz_session_id: int, user, message: dict) -> dict:
+    """Start a live quiz with a session held only for the start."""
+    db = SessionLocal()
+    try:
+        quiz_id = int(message["quiz_id"])
+        if not live_quiz.can_host(db, quiz_id, user):
+            raise ValueError("Only the quiz's instructor can run it live")
+        return live_quiz.start(
+            db, quiz_session_id, quiz_id, user.id, message.get("question_seconds")
+        )
+    finally:
+        db.close()
+
+
+def _end_live_quiz(quiz_session_id: int):
+    """Write the live quiz results with a session held only for the write."""
+    db = SessionLocal()
+    try:
+        return live_quiz.finish(db, quiz_session_id)
+    finally:
+        db.close()
+
+
 @router.websocket("/ws/live-quiz/{quiz_session_id}")
 async def websocket_live_quiz(
     websocket: WebSocket,
     quiz_session_id: int,
     token: str = Query(...),
-    db: Session = Depends(deps.get_db),
 ):
     """
     WebSocket endpoint for live quiz sessions
+
+    The host (the quiz's instructor or an admin) starts the quiz, opens
+    questions and ends it. Answers are scored on the server, and the room
+    receives throttled leaderboard deltas instead of full leaderboards.
     """
     try:
-        user = await deps.get_current_user_ws(token, db)
+        user = await deps.authenticate_websocket(token)
     except Exception:
         await websocket.close(code=1008, reason="Unauthorized")
         return
 
     room = f"quiz:{quiz_session_id}"
-    await manager.connect(websocket, room, user.id, user.full_name or user.username)
+    user_name = user.full_name or user.username
+    await manager.connect(websocket, room, user.id, user_name)
+    await websocket.send_json(await live_quiz.join(quiz_session_id, user.id))
 
     try:
         while True:
@@ -112,28 +145,52 @@ async def websocket_live_quiz(
 
             message_type = message.get("type")
 
-            if message_type == "answer_submitted":
-                # Broadcast updated leaderboard
-                await manager.broadcast_to_room(
-                    room,
-                    {
-                        "type": "leaderboard_update",
-                        "leaderboard": message.get("leaderboard"),
-                    },
-                )
+            try:
+                if message_type == "answer_submitted":
+                    question_id = int(message["question_id"])
+                    # May load the quiz snapshot from the DB on this worker
+                    result = await run_in_threadpool(
+                        live_quiz.submit_answer,
+                        quiz_session_id,
+                        user.id,
+                        user_name,
+                        question_id,
+                        selected_option_id=message.get("selected_option_id"),
+                        text_response=message.get("text_response"),
+                    )
+                    if result.counted:
+                        live_quiz.broadcaster.mark(quiz_session_id, user.id)
+                    await websocket.send_json(
+                        {
+                            "type": "answer_result",
+                            "question_id": question_id,
+                            "counted": result.counted,
+                            "is_correct": result.is_correct,
+                            "awarded": result.awarded,
+                            "score": result.score,
+                        }
+                    )
 
-            elif message_type == "quiz_started":
-                # Only quiz creator/instructor can start
-                await manager.broadcast_to_room(
-                    room,
-                    {"type": "quiz_started", "start_time": message.get("start_time")},
-                )
+                elif message_type == "quiz_started":
+                    await run_in_threadpool(_start_live_quiz, quiz_session_id, user, message)
+                    await live_quiz.broadcaster.flush(quiz_session_id)
 
-            elif message_type == "quiz_ended":
-                await manager.broadcast_to_room(
-                    room,
-                    {"type": "quiz_ended", "final_results": message.get("results")},
-                )
+                elif message_type == "question_started":
+                    if not live_quiz.is_host(quiz_session_id, user.id):
+                        raise ValueError("Only the host can open questions")
+                    await run_in_threadpool(
+                        live_quiz.open_question, quiz_session_id, int(message["question_id"])
+                    )
+                    await live_quiz.broadcaster.flush(quiz_session_id)
+
+                elif message_type == "quiz_ended":
+                    if not live_quiz.is_host(quiz_session_id, user.id):
+                        raise ValueError("Only the host can end the quiz")
+                    await run_in_threadpool(_end_live_quiz, quiz_session_id)
+                    await live_quiz.broadcaster.flush(quiz_session_id)
+
+            except (KeyError, TypeError, ValueError) as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
 
     except WebSocketDisconnect:
         manager.disconnect(websocket)
@@ -144,13 +201,16 @@ async def websocket_whiteboard(
     websocket: WebSocket,
     session_id: int,
     token: str = Query(...),
-    db: Session = Depends(deps.get_db),
+    encoding: str = Query("json"),
 ):
     """
     WebSocket endpoint for collaborative whiteboard
+
+    Ops are logged and rebroadcast in per-frame ``ops`` batches; pass
+    ``encoding=msgpack`` for binary frames.
     """
     try:
-        user = await deps.get_current_user_ws(token, db)
+        user = await deps.authenticate_websocket(token)
     except Exception:
         await websocket.close(code=1008, reason="Unauthorized")
         return
@@ -158,53 +218,22 @@ async def websocket_whiteboard(
     room = f"whiteboard:{session_id}"
     await manager.connect(websocket, room, user.id, user.full_name or user.username)
 
-    # Send current state to new user
-    from app.models.live_class import LiveClass
-
-    live_class = db.query(LiveClass).filter(LiveClass.id == session_id).first()
-    if live_class and live_class.whiteboard_data:
-        await websocket.send_text(
-            json.dumps({"type": "init_state", "data": live_class.whiteboard_data})
-        )
+    # Send the current board (snapshot + tail) to the new user
+    await whiteboard.join(session_id, websocket, encoding)
 
     try:
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
-            message_type = message.get("type")
-
-            if message_type == "save_state":
-                # Save state to DB (Instructor only ideally, but allowing all for now)
-                live_class = (
-                    db.query(LiveClass).filter(LiveClass.id == session_id).first()
-                )
-                if live_class:
-                    live_class.whiteboard_data = message.get("data")
-                    db.commit()
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
 
-            elif message_type in ["draw", "erase", "clear", "undo", "redo"]:
-                # Broadcast drawing actions to all users except sender
-                await manager.broadcast_to_room(
-                    room,
-                    {
-                        "type": message_type,
-                        "data": message.get("data"),
-                        "user_id": user.id,
-                    },
-                    exclude=websocket,
-                )
-
-                # Auto-save clear action
-                if message_type == "clear":
-                    live_class = (
-                        db.query(LiveClass).filter(LiveClass.id == session_id).first()
-                    )
-                    if live_class:
-                        live_class.whiteboard_data = {}
-                        db.commit()
+            message = whiteboard.decode(frame)
+            if message is not None:
+                await whiteboard.submit(session_id, websocket, user.id, message)
 
     except WebSocketDisconnect:
         manager.disconnect(websocket)
+        await whiteboard.leave(session_id, websocket)
 
 
 @router.websocket("/ws/notifications/{user_id}")
@@ -216,20 +245,14 @@ async def websocket_notifications(
     """
     WebSocket endpoint for real-time notifications
     """
-    from app.db.session import SessionLocal
-    
-    # Authenticate with a short-lived session
-    db = SessionLocal()
     try:
-        user = await deps.get_current_user_ws(token, db)
-        if user.id != user_id:
-            await websocket.close(code=1008, reason="Unauthorized")
-            return
+        user = await deps.authenticate_websocket(token)
     except Exception:
         await websocket.close(code=1008, reason="Unauthorized")
         return
-    finally:
-        db.close()
+    if user.id != user_id:
+        await websocket.close(code=1008, reason="Unauthorized")
+        return
 
     room = f"notifications:{user_id}"
     await manager.connect(websocket, room, user.id, user.full_name or user.username)
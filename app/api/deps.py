@@ -1,5 +1,6 @@
+import secrets
 from typing import Generator, Optional
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 from pydantic import ValidationError
@@ -128,6 +129,18 @@ def get_current_active_superuser(
     return current_user
 
 
+def verify_metrics_token(authorization: Optional[str] = Header(None)) -> None:
+    """
+    Authenticate a Prometheus scrape with ``Authorization: Bearer <METRICS_TOKEN>``.
+    Metrics endpoints don't exist (404) until a token is configured.
+    """
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    expected = f"Bearer {settings.METRICS_TOKEN}"
+    if not authorization or not secrets.compare_digest(authorization, expected):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+
+
 import logging
 from starlette.concurrency import run_in_threadpool
 logger = logging.getLogger(__name__)
@@ -170,5 +183,20 @@ async def get_current_user_ws(token: str, db: Session) -> User:
     return user
 
 
+async def authenticate_websocket(token: str) -> User:
+    """
+    Authenticate a WebSocket handshake with a short-lived session.
+
+    The session and its pooled connection are released before the socket is
+    accepted, so open sockets never hold a database connection. The returned
+    user is detached: its columns are loaded, relationships are not.
+    """
+    db = SessionLocal()
+    try:
+        return await get_current_user_ws(token, db)
+    finally:
+        await run_in_threadpool(db.close)
+
+
 get_current_admin = get_admin_user
 get_current_superuser = get_current_active_superuser
@@ -98,6 +98,13 @@ class Settings(BaseSettings):
     MAIL_SUPPRESS_SEND: bool = int(
         os.getenv("MAIL_SUPPRESS_SEND", 1)
     )  # Default to 1 (True) for dev
+    # Bulk mail: pooled SMTP connections per process, recipients per Celery
+    # batch, and messages sent over one connection before it is recycled
+    MAIL_POOL_SIZE: int = int(os.getenv("MAIL_POOL_SIZE", "2"))
+    MAIL_BATCH_SIZE: int = int(os.getenv("MAIL_BATCH_SIZE", "200"))
+    MAIL_MAX_MESSAGES_PER_CONNECTION: int = int(
+        os.getenv("MAIL_MAX_MESSAGES_PER_CONNECTION", "100")
+    )
 
     # Redis Configuration
     REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
@@ -158,6 +165,69 @@ class Settings(BaseSettings):
     SENTRY_DSN: str = os.getenv("SENTRY_DSN", "")  # Leave empty to disable Sentry
     APP_VERSION: str = os.getenv("APP_VERSION", "2.0.0")
 
+    # Executive dashboard KPI snapshots are recomputed once older than this
+    KPI_SNAPSHOT_MAX_AGE_SECONDS: int = int(
+        os.getenv("KPI_SNAPSHOT_MAX_AGE_SECONDS", "900")
+    )
+
+    # AI debug logging (write-behind; sessions are sampled, failures always kept)
+    AI_DEBUG_SAMPLE_RATE: float = float(os.getenv("AI_DEBUG_SAMPLE_RATE", "1.0"))
+    AI_DEBUG_QUEUE_SIZE: int = int(os.getenv("AI_DEBUG_QUEUE_SIZE", "10000"))
+    AI_DEBUG_BATCH_SIZE: int = int(os.getenv("AI_DEBUG_BATCH_SIZE", "200"))
+    AI_DEBUG_FLUSH_INTERVAL_SECONDS: float = float(
+        os.getenv("AI_DEBUG_FLUSH_INTERVAL_SECONDS", "1.0")
+    )
+    AI_DEBUG_MAX_SESSIONS: int = int(os.getenv("AI_DEBUG_MAX_SESSIONS", "1000"))
+    AI_DEBUG_SESSION_TTL_SECONDS: int = int(
+        os.getenv("AI_DEBUG_SESSION_TTL_SECONDS", "3600")
+    )
+
+    # AI usage counters are folded into Redis this often (per process)
+    AI_METERING_FLUSH_SECONDS: float = float(os.getenv("AI_METERING_FLUSH_SECONDS", "10"))
+
+    # Bearer token required to scrape Prometheus metrics (not served if empty)
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+
+    # SQL instrumentation: statements slower than this are sampled with their plan
+    SLOW_QUERY_MS: float = float(os.getenv("SLOW_QUERY_MS", "200"))
+    # The same statement this many times in one request is reported as N+1
+    N_PLUS_ONE_THRESHOLD: int = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+    SLOW_QUERY_SAMPLES: int = int(os.getenv("SLOW_QUERY_SAMPLES", "100"))
+    EXPLAIN_SLOW_QUERIES: bool = os.getenv("EXPLAIN_SLOW_QUERIES", "true").lower() == "true"
+    # Connection checkouts held longer than this are logged and counted
+    POOL_LONG_HOLD_SECONDS: float = float(os.getenv("POOL_LONG_HOLD_SECONDS", "10"))
+
+    # Request logs: lines per second per worker before sampling kicks in
+    # (server errors and slow requests are always logged)
+    REQUEST_LOG_RATE_PER_SECOND: float = float(os.getenv("REQUEST_LOG_RATE_PER_SECOND", "20"))
+    SLOW_REQUEST_MS: float = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+
+    # Live classes: poll/Q&A tally broadcasts per second per room
+    LIVE_TALLY_BROADCASTS_PER_SECOND: float = float(
+        os.getenv("LIVE_TALLY_BROADCASTS_PER_SECOND", "2")
+    )
+    # Live quizzes: leaderboard updates per second per room
+    LIVE_QUIZ_UPDATES_PER_SECOND: float = float(
+        os.getenv("LIVE_QUIZ_UPDATES_PER_SECOND", "2")
+    )
+
+    # Whiteboards: seconds without changes before the board is written to SQL
+    WHITEBOARD_PERSIST_DELAY_SECONDS: float = float(
+        os.getenv("WHITEBOARD_PERSIST_DELAY_SECONDS", "5")
+    )
+
+    # Notifications: rows per bulk INSERT, and audiences handed to Celery
+    NOTIFICATION_BATCH_SIZE: int = int(os.getenv("NOTIFICATION_BATCH_SIZE", "1000"))
+    NOTIFICATION_CELERY_MIN_RECIPIENTS: int = int(
+        os.getenv("NOTIFICATION_CELERY_MIN_RECIPIENTS", "5000")
+    )
+
+    # SSO: pooled connections to identity providers, and how long OIDC
+    # discovery documents and key sets are reused before refetching
+    SSO_HTTP_MAX_CONNECTIONS: int = int(os.getenv("SSO_HTTP_MAX_CONNECTIONS", "20"))
+    SSO_HTTP_TIMEOUT_SECONDS: float = float(os.getenv("SSO_HTTP_TIMEOUT_SECONDS", "10"))
+    OIDC_METADATA_TTL_SECONDS: int = int(os.getenv("OIDC_METADATA_TTL_SECONDS", "3600"))
+
     # AI Configuration
     # Free Tier Gemini Key (15 RPM)
     FREE_GEMINI_API_KEY: str = os.getenv("FREE_GEMINI_API_KEY", "")
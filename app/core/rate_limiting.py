@@ -2,20 +2,24 @@
 Rate limiting middleware for API protection.
 """
 
-from fastapi import Request, HTTPException, status
-from starlette.middleware.base import BaseHTTPMiddleware
-from typing import Dict, Tuple
-from datetime import datetime, timedelta
-from collections import defaultdict
-import asyncio
+from fastapi import status
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Deque, Dict, List, Tuple
+from collections import deque
+import math
+import time
 
 
 class RateLimiter:
-    """In-memory rate limiter (use Redis for production)."""
+    """In-memory sliding-window rate limiter (use Redis for production)."""
+
+    # Drop keys with no recent requests after this many checks
+    PRUNE_EVERY = 10_000
 
     def __init__(self):
-        self.requests: Dict[str, list] = defaultdict(list)
-        self.lock = asyncio.Lock()
+        self.requests: Dict[str, Deque[float]] = {}
+        self._checks = 0
 
     async def is_allowed(
         self, key: str, max_requests: int, window_seconds: int
@@ -23,39 +27,49 @@ class RateLimiter:
         """
         Check if request is allowed based on rate limit.
 
+        Runs without awaiting, so it is atomic on the event loop.
+
         Returns:
             Tuple of (is_allowed, retry_after_seconds)
         """
-        async with self.lock:
-            now = datetime.utcnow()
-            window_start = now - timedelta(seconds=window_seconds)
+        now = time.monotonic()
+        window_start = now - window_seconds
 
-            # Clean old requests
-            self.requests[key] = [
-                req_time for req_time in self.requests[key] if req_time > window_start
-            ]
+        self._checks += 1
+        if self._checks % self.PRUNE_EVERY == 0:
+            self._prune(window_start)
 
-            # Check limit
-            if len(self.requests[key]) >= max_requests:
-                oldest_request = min(self.requests[key])
-                retry_after = int(
-                    (
-                        oldest_request + timedelta(seconds=window_seconds) - now
-                    ).total_seconds()
-                )
-                return False, max(retry_after, 1)
+        timestamps = self.requests.get(key)
+        if timestamps is None:
+            timestamps = self.requests[key] = deque()
 
-            # Add current request
-            self.requests[key] = [now]
+        # Clean old requests
+        while timestamps and timestamps[0] <= window_start:
+            timestamps.popleft()
 
-            return True, 0
+        # Check limit
+        if len(timestamps) >= max_requests:
+            retry_after = math.ceil(timestamps[0] + window_seconds - now)
+            return False, max(retry_after, 1)
+
+        # Add current request
+        timestamps.append(now)
+        return True, 0
+
+    def _prune(self, window_start: float) -> None:
+        stale = [
+            key for key, timestamps in self.requests.items()
+            if not timestamps or timestamps[-1] <= window_start
+        ]
+        for key in stale:
+            del self.requests[key]
 
 
 # Global rate limiter instance
 rate_limiter = RateLimiter()
 
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+class RateLimitMiddleware:
     """
     Rate limiting middleware.
 
@@ -63,56 +77,86 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
     - 100 requests per minute per IP (general)
     - 20 requests per minute for auth endpoints
     - 1000 requests per minute for authenticated users
+
+    Pure ASGI: rejected requests get a 429 response directly and the
+    rate-limit headers are encoded once per limit.
     """
 
-    def __init__(self, app):
-        super().__init__(app)
-        self.general_limit = 100
-        self.auth_limit = 20
-        self.user_limit = 1000
-        self.window = 60  # seconds
+    def __init__(
+        self,
+        app: ASGIApp,
+        general_limit: int = 100,
+        auth_limit: int = 20,
+        user_limit: int = 1000,
+        window: int = 60,  # seconds
+        limiter: RateLimiter = rate_limiter,
+    ):
+        self.app = app
+        self.general_limit = general_limit
+        self.auth_limit = auth_limit
+        self.user_limit = user_limit
+        self.window = window
+        self.limiter = limiter
+        self._headers: Dict[int, List[Tuple[bytes, bytes]]] = {
+            limit: [
+                (b"x-ratelimit-limit", str(limit).encode()),
+                (b"x-ratelimit-window", str(window).encode()),
+            ]
+            for limit in (general_limit, auth_limit, user_limit)
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-    async def dispatch(self, request: Request, call_next):
         # Get client IP
-        client_ip = request.client.host
+        client_ip = scope["client"][0] if scope.get("client") else "unknown"
 
         # Determine limit based on endpoint
-        path = request.url.path
+        path = scope["path"]
 
         if "/auth/" in path or "/login" in path or "/register" in path:
             max_requests = self.auth_limit
             key = f"auth:{client_ip}"
         else:
             # Check if user is authenticated
-            auth_header = request.headers.get("Authorization")
-            if auth_header and auth_header.startswith("Bearer "):
+            auth_header = next(
+                (value for name, value in scope["headers"] if name == b"authorization"),
+                None,
+            )
+            if auth_header and auth_header.startswith(b"Bearer "):
                 # For authenticated users, use higher limit
                 # Extract user ID from token (simplified - implement proper JWT decode)
-                key = f"user:{auth_header[:50]}"  # Use token prefix as key
+                key = f"user:{auth_header[:50].decode('latin-1')}"  # Use token prefix as key
                 max_requests = self.user_limit
             else:
                 max_requests = self.general_limit
                 key = f"ip:{client_ip}"
 
         # Check rate limit
-        allowed, retry_after = await rate_limiter.is_allowed(
+        allowed, retry_after = await self.limiter.is_allowed(
             key, max_requests, self.window
         )
 
         if not allowed:
-            raise HTTPException(
+            response = JSONResponse(
+                {"detail": f"Rate limit exceeded. Retry after {retry_after} seconds."},
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail=f"Rate limit exceeded. Retry after {retry_after} seconds.",
                 headers={"Retry-After": str(retry_after)},
             )
-
-        response = await call_next(request)
+            await response(scope, receive, send)
+            return
 
         # Add rate limit headers
-        response.headers["X-RateLimit-Limit"] = str(max_requests)
-        response.headers["X-RateLimit-Window"] = str(self.window)
+        extra_headers = self._headers[max_requests]
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", ())) + extra_headers
+            await send(message)
 
-        return response
+        await self.app(scope, receive, send_with_headers)
 
 
 def get_rate_limiter():
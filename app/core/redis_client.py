@@ -5,11 +5,16 @@ Provides Redis connection for caching, sessions, and real-time features
 
 import redis
 from redis import Redis
+from redis.exceptions import RedisError
 from typing import Optional
 import os
 import json
+import logging
+import time
 from functools import wraps
 
+logger = logging.getLogger(__name__)
+
 
 class RedisClient:
     """Singleton Redis client for the application"""
@@ -37,6 +42,32 @@ class RedisClient:
             cls._instance = None
 
 
+# Availability probe shared by services that fall back to SQL without Redis
+_AVAILABILITY_RECHECK_SECONDS = 30
+_availability = {"ok": False, "checked_at": 0.0}
+
+
+def get_redis() -> Optional[Redis]:
+    """
+    Get the shared Redis client if Redis is reachable, else None.
+
+    The result of the ping is remembered for a short interval so callers on
+    hot paths don't pay a round trip (or a connect timeout) on every call.
+    """
+    now = time.monotonic()
+    if now - _availability["checked_at"] >= _AVAILABILITY_RECHECK_SECONDS:
+        _availability["checked_at"] = now
+        try:
+            RedisClient.get_instance().ping()
+            _availability["ok"] = True
+        except (RedisError, OSError) as e:
+            if _availability["ok"]:
+                logger.warning(f"Redis became unavailable: {e}")
+            _availability["ok"] = False
+
+    return RedisClient.get_instance() if _availability["ok"] else None
+
+
 # Cache decorator for functions
 def cache_result(ttl: int = 300, key_prefix: str = "cache"):
     """
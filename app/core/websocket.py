@@ -4,6 +4,7 @@ Handles WebSocket connections for live discussions, quizzes, and notifications
 """
 
 from fastapi import WebSocket
+from starlette.concurrency import run_in_threadpool
 from typing import Dict, Set, Optional
 import asyncio
 from datetime import datetime
@@ -11,6 +12,17 @@ from app.core.cache import cache
 from app.services.presence import presence_service
 from app.db.session import SessionLocal
 
+# Fire-and-forget tasks started from sync code; the event loop only keeps weak
+# references, so hold them here until they finish
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def _spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
 
 class ConnectionManager:
     """Manage WebSocket connections"""
@@ -50,15 +62,8 @@ class ConnectionManager:
             exclude=websocket,
         )
 
-        # Update presence to online
-        try:
-            db = SessionLocal()
-            presence_service.update_presence(
-                db=db, user_id=user_id, status="online", current_location=f"room:{room}"
-            )
-            db.close()
-        except Exception as e:
-            print(f"Error updating presence: {e}")
+        # Update presence to online (own session, off the event loop)
+        await run_in_threadpool(self._set_presence, user_id, f"room:{room}")
 
         # Send current online users to new connection
         online_users = await self.get_online_users(room)
@@ -79,7 +84,7 @@ class ConnectionManager:
             del self.connection_users[websocket]
 
             # Notify room about user leaving
-            asyncio.create_task(
+            _spawn(
                 self.broadcast_to_room(
                     room,
                     {
@@ -92,12 +97,23 @@ class ConnectionManager:
             )
 
             # Set user offline
-            try:
-                db = SessionLocal()
-                presence_service.set_offline(db=db, user_id=user_info["user_id"])
-                db.close()
-            except Exception as e:
-                print(f"Error setting offline: {e}")
+            _spawn(run_in_threadpool(self._set_presence, user_info["user_id"], None))
+
+    @staticmethod
+    def _set_presence(user_id: int, location: Optional[str]):
+        """Write presence with a session held only for this write (offline when no location)."""
+        db = SessionLocal()
+        try:
+            if location is None:
+                presence_service.set_offline(db=db, user_id=user_id)
+            else:
+                presence_service.update_presence(
+                    db=db, user_id=user_id, status="online", current_location=location
+                )
+        except Exception as e:
+            print(f"Error updating presence: {e}")
+        finally:
+            db.close()
 
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         """Send message to specific connection"""
@@ -63,37 +63,33 @@ class CRUDAnnouncement(
         self, db: Session, *, announcement: CourseAnnouncement
     ) -> None:
         """Send notifications to all enrolled students"""
-        from app.services.notification_helpers import create_and_emit_notification
+        from app.services.notification_helpers import create_and_emit_notifications
         from app.models.notification import NotificationType
 
         # Get all enrolled students
-        enrollments = (
-            db.query(Enrollment)
-            .filter(
+        student_ids = [
+            user_id
+            for (user_id,) in db.query(Enrollment.user_id).filter(
                 Enrollment.course_id == announcement.course_id,
                 Enrollment.status == "active",
             )
-            .all()
+        ]
+
+        # Bulk notification for every student, instructor excluded
+        create_and_emit_notifications(
+            db=db,
+            user_ids=student_ids,
+            notification_type=NotificationType.SYSTEM_ANNOUNCEMENT,
+            title=f"New announcement: {announcement.title}",
+            message=announcement.content[:200],  # Preview
+            data={
+                "course_id": announcement.course_id,
+                "announcement_id": announcement.id,
+            },
+            action_url=f"/lms/courses/{announcement.course_id}/announcements/{announcement.id}",
+            exclude=[announcement.instructor_id],
         )
 
-        # Create notification for each student
-        for enrollment in enrollments:
-            if (
-                enrollment.user_id != announcement.instructor_id
-            ):  # Don't notify instructor
-                create_and_emit_notification(
-                    db=db,
-                    user_id=enrollment.user_id,
-                    notification_type=NotificationType.COURSE_ANNOUNCEMENT,
-                    title=f"New announcement: {announcement.title}",
-                    message=announcement.content[:200],  # Preview
-                    data={
-                        "course_id": announcement.course_id,
-                        "announcement_id": announcement.id,
-                    },
-                    action_url=f"/lms/courses/{announcement.course_id}/announcements/{announcement.id}",
-                )
-
     def mark_as_read(
         self, db: Session, *, announcement_id: int, user_id: int
     ) -> AnnouncementRead:
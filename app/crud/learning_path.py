@@ -3,8 +3,9 @@ from sqlalchemy import and_, func
 from typing import List, Optional
 from datetime import datetime, timezone
 from app.models.learning_path import LearningPath, PathCourse, PathEnrollment
-from app.models.enrollment import Enrollment, EnrollmentStatus
 from app.schemas import learning_path as schemas
+from app.services.entitlements import entitlements
+from app.services.path_graph import path_graph
 
 
 # LearningPath CRUD
@@ -219,6 +220,27 @@ def get_student_path_enrollments(db: Session, student_id: int) -> List[PathEnrol
     )
 
 
+def get_student_path_progress(
+    db: Session, student_id: int
+) -> List[schemas.PathEnrollmentWithProgress]:
+    """Get a student's path enrollments with progress computed from the path graphs"""
+    enrollments = get_student_path_enrollments(db, student_id)
+    progress = path_graph.progress_many(db, enrollments)
+
+    results = []
+    for enrollment in enrollments:
+        computed = progress[enrollment.id]
+        result = schemas.PathEnrollmentWithProgress.model_validate(enrollment)
+        result.completed_courses = computed.completed_courses
+        result.total_courses = computed.total_courses
+        result.progress_percentage = computed.progress_percentage
+        result.is_completed = enrollment.is_completed or computed.is_completed
+        result.next_course_id = computed.next_course_id
+        result.unlockable_course_ids = list(computed.unlockable_course_ids)
+        results.append(result)
+    return results
+
+
 def get_path_enrollment(
     db: Session, path_id: int, student_id: int
 ) -> Optional[PathEnrollment]:
@@ -245,25 +267,25 @@ def update_path_enrollment_progress(
     if not enrollment:
         return None
 
-    enrollment.completed_courses += 1
-    enrollment.last_accessed_at = datetime.now(timezone.utc).replace(tzinfo=None)
-
-    if enrollment.total_courses > 0:
-        enrollment.progress_percentage = (
-            enrollment.completed_courses / enrollment.total_courses
-        ) * 100
-
-    # Check if path is completed
-    if enrollment.completed_courses >= enrollment.total_courses:
+    # Recompute from the path graph: the course just finished plus every
+    # other course the student has completed, in or before the path
+    graph = path_graph.get(db, enrollment.path_id)
+    done = path_graph.completed_course_ids(
+        db, [enrollment.student_id], graph.prerequisite_ids()
+    )[enrollment.student_id]
+    done.add(completed_course_id)
+    progress = graph.progress(graph.completed_mask(done))
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    enrollment.last_accessed_at = now
+    enrollment.completed_courses = progress.completed_courses
+    enrollment.total_courses = progress.total_courses
+    enrollment.progress_percentage = progress.progress_percentage
+    if progress.next_course_id is not None:
+        enrollment.current_course_id = progress.next_course_id
+    if progress.is_completed and not enrollment.is_completed:
         enrollment.is_completed = True
-        enrollment.completed_at = datetime.now(timezone.utc).replace(tzinfo=None)
-    else:
-        # Find next course
-        path_courses = get_path_courses(db, enrollment.path_id)
-        for i, pc in enumerate(path_courses):
-            if pc.course_id == completed_course_id and i + 1 < len(path_courses):
-                enrollment.current_course_id = path_courses[i + 1].course_id
-                break
+        enrollment.completed_at = now
 
     db.commit()
     db.refresh(enrollment)
@@ -274,35 +296,7 @@ def check_course_access(
     db: Session, path_id: int, student_id: int, course_id: int
 ) -> bool:
     """Check if student has access to a course in the path"""
-    enrollment = get_path_enrollment(db, path_id, student_id)
-    if not enrollment:
-        return False
-
-    # Get course info
-    path_course = (
-        db.query(PathCourse)
-        .filter(and_(PathCourse.path_id == path_id, PathCourse.course_id == course_id))
-        .first()
-    )
-
-    if not path_course:
-        return False
-
-    # If no prerequisite, allow access
-    if not path_course.prerequisite_course_id:
-        return True
-
-    # Check if prerequisite is completed
-    prereq_enrollment = (
-        db.query(Enrollment)
-        .filter(
-            and_(
-                Enrollment.user_id == student_id,
-                Enrollment.course_id == path_course.prerequisite_course_id,
-                Enrollment.status == EnrollmentStatus.COMPLETED,
-            )
-        )
-        .first()
+    # Path enrollment and prerequisite are part of the cached course access map
+    return entitlements.course_access(db, student_id, course_id).can_access_path_course(
+        path_id
     )
-
-    return prereq_enrollment is not None
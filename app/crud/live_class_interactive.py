@@ -1,4 +1,5 @@
 from typing import List, Optional
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from app.models.live_class_interactive import (
     LiveClassPoll,
@@ -109,6 +110,15 @@ class CRUDLiveClassInteractive:
             .all()
         )
 
+    def get_question(
+        self, db: Session, *, question_id: int
+    ) -> Optional[LiveClassQuestion]:
+        return (
+            db.query(LiveClassQuestion)
+            .filter(LiveClassQuestion.id == question_id)
+            .first()
+        )
+
     def answer_question(
         self, db: Session, *, question_id: int, obj_in: QuestionAnswer
     ) -> Optional[LiveClassQuestion]:
@@ -130,16 +140,17 @@ class CRUDLiveClassInteractive:
     def upvote_question(
         self, db: Session, *, question_id: int
     ) -> Optional[LiveClassQuestion]:
-        question = (
+        # Increment in SQL so concurrent upvotes aren't lost
+        updated = (
             db.query(LiveClassQuestion)
             .filter(LiveClassQuestion.id == question_id)
-            .first()
+            .update(
+                {LiveClassQuestion.upvotes: func.coalesce(LiveClassQuestion.upvotes, 0) + 1},
+                synchronize_session=False,
+            )
         )
-        if question:
-            question.upvotes += 1
-            db.commit()
-            db.refresh(question)
-        return question
+        db.commit()
+        return self.get_question(db, question_id=question_id) if updated else None
 
     # Chat
     def create_chat_message(
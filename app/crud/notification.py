@@ -8,6 +8,7 @@ from fastapi.encoders import jsonable_encoder
 
 from app.models.notification import Notification
 from app.schemas.notification import NotificationCreate, NotificationUpdate
+from app.services.notification_dispatch import unread_counter
 from datetime import datetime
 
 
@@ -36,11 +37,7 @@ def get_multi_by_user(
 
 def get_unread_count(db: Session, user_id: int) -> int:
     """Get count of unread notifications"""
-    return (
-        db.query(Notification)
-        .filter(Notification.user_id == user_id, Notification.is_read == False)
-        .count()
-    )
+    return unread_counter.get(db, user_id)
 
 
 def create(
@@ -52,6 +49,7 @@ def create(
     db.add(db_obj)
     db.commit()
     db.refresh(db_obj)
+    unread_counter.invalidate([db_obj.user_id])
     return db_obj
 
 
@@ -72,6 +70,7 @@ def update(
     db.add(db_obj)
     db.commit()
     db.refresh(db_obj)
+    unread_counter.invalidate([db_obj.user_id])
     return db_obj
 
 
@@ -83,6 +82,7 @@ def mark_all_as_read(db: Session, user_id: int) -> int:
         .update({"is_read": True, "read_at": datetime.utcnow()})
     )
     db.commit()
+    unread_counter.set(user_id, 0)
     return result
 
 
@@ -91,4 +91,5 @@ def delete(db: Session, id: int) -> Notification:
     obj = db.query(Notification).get(id)
     db.delete(obj)
     db.commit()
+    unread_counter.invalidate([obj.user_id])
     return obj
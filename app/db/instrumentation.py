@@ -0,0 +1,637 @@
+"""
+SQL instrumentation for the application engine.
+
+Hooks cursor execution on the engine in app.db.session and tracks, per request
+(propagated through a contextvar, so threadpool endpoints are included):
+- statement count and database time
+- N+1 candidates: the same statement repeated N_PLUS_ONE_THRESHOLD or more
+  times within one request, reported with the route
+- slow statements, kept in a bounded ring buffer with their EXPLAIN plan
+  (captured off the request path)
+
+Per-route latency (a ``LatencySketch`` with bounded relative error), status
+counts, query count and database time are fixed-memory, so p50/p95/p99 cost
+the same however long the process runs. This is the one per-route request
+store; app.services.request_metrics reports and exports it.
+``PoolMonitor`` tracks connection pool saturation, how long connections are
+held and by which route, so long-lived holders (e.g. WebSocket handlers)
+show up before they exhaust the pool.
+``count_queries``/``assert_max_queries`` let tests pin query budgets.
+"""
+
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from sqlalchemy import event
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 0.1ms .. ~30s in 30% steps
+LATENCY_BOUNDS_MS = tuple(round(0.1 * 1.3 ** i, 3) for i in range(49))
+QUERY_COUNT_BOUNDS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 12, 15, 20, 25, 30, 40, 50, 75, 100, 150, 200, 300, 500, 1000)
+
+EXPLAIN_COOLDOWN_SECONDS = 600
+MAX_EXPLAINED = 1024
+MAX_STATEMENT_CHARS = 2000
+UNMATCHED_ROUTE = "<unmatched>"
+# Routes tracked individually; any beyond share OVERFLOW_ROUTE
+MAX_ROUTES = 1000
+OVERFLOW_ROUTE = "<other>"
+# Execution option that keeps a connection's statements out of the stats
+SKIP_OPTION = "skip_instrumentation"
+
+
+class Histogram:
+    """Fixed-memory bucketed histogram; percentiles are bucket upper bounds."""
+
+    __slots__ = ("bounds", "counts", "count", "total", "max")
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BOUNDS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        running = 0
+        for i, n in enumerate(self.counts):
+            running += n
+            if running >= rank:
+                # Never report more than was actually observed
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self) -> Dict:
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 3) if self.count else None,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": round(self.max, 3),
+        }
+
+
+class LatencySketch:
+    """
+    Mergeable quantile sketch with bounded relative error (DDSketch).
+
+    Values fall into bucket ``ceil(log_gamma(value))``; any quantile is
+    reported within ``relative_accuracy`` of the true value. When more than
+    ``max_buckets`` are in use the lowest ones are collapsed, which only
+    affects the accuracy of the smallest values.
+    """
+
+    __slots__ = ("relative_accuracy", "max_buckets", "_gamma", "_log_gamma",
+                 "bins", "zero_count", "count", "total", "min", "max")
+
+    MIN_VALUE = 1e-3  # values below this (ms) are counted as zero
+
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value <= self.MIN_VALUE:
+            self.zero_count += 1
+            return
+
+        key = math.ceil(math.log(value) / self._log_gamma)
+        bins = self.bins
+        bins[key] = bins.get(key, 0) + 1
+        if len(bins) > self.max_buckets:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        lowest, second = sorted(self.bins)[:2]
+        self.bins[second] += self.bins.pop(lowest)
+
+    def merge(self, other: "LatencySketch") -> None:
+        """Fold another sketch with the same accuracy into this one."""
+        for key, n in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + n
+        while len(self.bins) > self.max_buckets:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return max(0.0, self.min)
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                value = 2 * self._gamma ** key / (self._gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def copy(self) -> "LatencySketch":
+        sketch = LatencySketch(self.relative_accuracy, self.max_buckets)
+        sketch.merge(self)
+        return sketch
+
+    def summary(self) -> Dict:
+        """Same shape as ``Histogram.summary``."""
+        return {
+            "count": self.count,
+            "avg": round(self.mean, 3) if self.count else None,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": round(self.max, 3),
+        }
+
+
+@dataclass
+class RequestQueryStats:
+    """SQL activity of one request (or one ``track`` block)."""
+
+    scope: Optional[dict] = None
+    # Response status, set by the middleware when the response starts
+    status: Optional[int] = None
+    count: int = 0
+    duration_ms: float = 0.0
+    statements: Counter = field(default_factory=Counter)
+
+    @property
+    def route(self) -> str:
+        return route_name(self.scope) if self.scope is not None else UNMATCHED_ROUTE
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        return {s: n for s, n in self.statements.items() if n >= threshold}
+
+
+class RouteStats:
+    __slots__ = ("latency_ms", "statuses", "queries", "db_ms", "n_plus_one")
+
+    def __init__(self):
+        self.latency_ms = LatencySketch()
+        self.statuses: Counter = Counter()
+        self.queries = Histogram(QUERY_COUNT_BOUNDS)
+        self.db_ms = Histogram()
+        self.n_plus_one = 0
+
+
+_current: ContextVar[Optional[RequestQueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_stats() -> Optional[RequestQueryStats]:
+    """Stats of the request being served, if any."""
+    return _current.get()
+
+
+def route_template(scope: dict) -> str:
+    """Path template of the route that matched an ASGI scope."""
+    # Routes of included routers keep their own path; FastAPI records the
+    # prefixed template in the effective route context
+    effective = (scope.get("fastapi") or {}).get("effective_route_context")
+    path = getattr(effective, "path", None) or getattr(scope.get("route"), "path", None)
+    return path or UNMATCHED_ROUTE
+
+
+def route_name(scope: dict) -> str:
+    """Method and route template of an ASGI scope (bounded cardinality)."""
+    return f"{scope.get('method', 'WS')} {route_template(scope)}"
+
+
+class QueryInstrumentation:
+    """Engine event hooks plus the per-route and slow-query aggregates."""
+
+    def __init__(
+        self,
+        slow_query_ms: float = settings.SLOW_QUERY_MS,
+        n_plus_one_threshold: int = settings.N_PLUS_ONE_THRESHOLD,
+        max_samples: int = settings.SLOW_QUERY_SAMPLES,
+        explain: bool = settings.EXPLAIN_SLOW_QUERIES,
+    ):
+        self.slow_query_ms = slow_query_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.explain = explain
+        self._lock = threading.Lock()
+        self._routes: Dict[str, RouteStats] = {}
+        self.query_time_ms = Histogram()
+        self.slow_queries: deque = deque(maxlen=max_samples)
+        self.n_plus_one: deque = deque(maxlen=max_samples)
+        self._explained: "OrderedDict[str, float]" = OrderedDict()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    # ------------------------------------------------------------------
+    # Engine hooks
+    # ------------------------------------------------------------------
+
+    def install(self, engine) -> None:
+        if not event.contains(engine, "before_cursor_execute", self._before):
+            event.listen(engine, "before_cursor_execute", self._before)
+            event.listen(engine, "after_cursor_execute", self._after)
+
+    def uninstall(self, engine) -> None:
+        if event.contains(engine, "before_cursor_execute", self._before):
+            event.remove(engine, "before_cursor_execute", self._before)
+            event.remove(engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        if conn.get_execution_options().get(SKIP_OPTION):
+            return
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        if not starts or conn.get_execution_options().get(SKIP_OPTION):
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+
+        with self._lock:
+            self.query_time_ms.record(elapsed_ms)
+
+        stats = _current.get()
+        if stats is not None:
+            stats.count += 1
+            stats.duration_ms += elapsed_ms
+            stats.statements[statement] += 1
+
+        if elapsed_ms >= self.slow_query_ms:
+            self._capture_slow(conn.engine, statement, parameters, executemany, elapsed_ms, stats)
+
+    # ------------------------------------------------------------------
+    # Requests
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def track(self, scope: Optional[dict] = None, record: bool = True) -> Iterator[RequestQueryStats]:
+        """
+        Attribute statements executed inside the block to one request.
+
+        Args:
+            scope: ASGI scope; its route (resolved after routing) names the request
+            record: Add the block to the per-route stats (off for WebSockets,
+                whose lifetime isn't a request latency)
+        """
+        stats = RequestQueryStats(scope=scope)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            _current.reset(token)
+            if scope is not None and record:
+                self.record_request(stats, (time.perf_counter() - start) * 1000)
+
+    def record_request(self, stats: RequestQueryStats, latency_ms: float) -> None:
+        route = stats.route
+        repeated = stats.repeated(self.n_plus_one_threshold)
+        # An exception before the response started is served as a 500
+        status = stats.status or 500
+        with self._lock:
+            route_stats = self._routes.get(route)
+            if route_stats is None:
+                if len(self._routes) >= MAX_ROUTES:
+                    route = f"{route.split(' ', 1)[0]} {OVERFLOW_ROUTE}"
+                route_stats = self._routes.setdefault(route, RouteStats())
+            route_stats.latency_ms.add(latency_ms)
+            route_stats.statuses[status] += 1
+            route_stats.queries.record(stats.count)
+            route_stats.db_ms.record(stats.duration_ms)
+            if repeated:
+                route_stats.n_plus_one += 1
+
+        for statement, count in repeated.items():
+            logger.warning(
+                f"Possible N+1 in {route}: statement ran {count} times: {statement[:200]}"
+            )
+            self.n_plus_one.append(
+                {
+                    "route": route,
+                    "count": count,
+                    "statement": statement[:MAX_STATEMENT_CHARS],
+                    "request_queries": stats.count,
+                    "timestamp": datetime.utcnow().isoformat(),
+                }
+            )
+
+    # ------------------------------------------------------------------
+    # Slow queries
+    # ------------------------------------------------------------------
+
+    def _capture_slow(self, engine, statement, parameters, executemany, elapsed_ms, stats):
+        sample = {
+            "statement": statement[:MAX_STATEMENT_CHARS],
+            "duration_ms": round(elapsed_ms, 2),
+            "route": stats.route if stats is not None else None,
+            "timestamp": datetime.utcnow().isoformat(),
+            "plan": None,
+        }
+        self.slow_queries.append(sample)
+        logger.warning(f"Slow query ({elapsed_ms:.0f}ms): {statement[:200]}")
+
+        if not self.explain or executemany:
+            return
+        if not statement.lstrip()[:6].upper().startswith(("SELECT", "WITH")):
+            return
+        now = time.monotonic()
+        with self._lock:
+            last = self._explained.get(statement)
+            if last is not None and now - last < EXPLAIN_COOLDOWN_SECONDS:
+                return
+            self._explained[statement] = now
+            self._explained.move_to_end(statement)
+            while len(self._explained) > MAX_EXPLAINED:
+                self._explained.popitem(last=False)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="query-explain"
+                )
+        self._executor.submit(self._explain, engine, statement, parameters, sample)
+
+    @staticmethod
+    def _explain(engine, statement, parameters, sample) -> None:
+        prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+        try:
+            with engine.connect().execution_options(**{SKIP_OPTION: True}) as conn:
+                rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+            sample["plan"] = "\n".join(" ".join(str(c) for c in row) for row in rows)
+        except Exception as e:
+            sample["plan"] = f"EXPLAIN failed: {e}"
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def route_stats(self) -> Dict[str, Dict]:
+        """Per-route request latency, query count and database time percentiles."""
+        with self._lock:
+            return {
+                route: {
+                    "requests": stats.latency_ms.count,
+                    "latency_ms": stats.latency_ms.summary(),
+                    "queries": stats.queries.summary(),
+                    "db_ms": stats.db_ms.summary(),
+                    "n_plus_one_requests": stats.n_plus_one,
+                }
+                for route, stats in sorted(self._routes.items())
+            }
+
+    def route_latency(self) -> Dict[str, tuple]:
+        """Copies of each route's (latency sketch, status counts) for reporting."""
+        with self._lock:
+            return {
+                route: (stats.latency_ms.copy(), Counter(stats.statuses))
+                for route, stats in self._routes.items()
+            }
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            query_time = self.query_time_ms.summary()
+        return {
+            "thresholds": {
+                "slow_query_ms": self.slow_query_ms,
+                "n_plus_one": self.n_plus_one_threshold,
+            },
+            "query_time_ms": query_time,
+            "routes": self.route_stats(),
+            "n_plus_one": list(self.n_plus_one),
+            "slow_queries": sorted(
+                self.slow_queries, key=lambda s: s["duration_ms"], reverse=True
+            ),
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._routes.clear()
+            self.query_time_ms = Histogram()
+            self.slow_queries.clear()
+            self.n_plus_one.clear()
+            self._explained.clear()
+
+
+query_instrumentation = QueryInstrumentation()
+
+
+# ----------------------------------------------------------------------
+# Connection pool
+# ----------------------------------------------------------------------
+
+# Connections attributed to no request (Celery tasks, background threads, sockets)
+BACKGROUND_HOLDER = "<background>"
+
+# Longest-held connections listed in the snapshot
+MAX_LISTED_HOLDS = 20
+
+
+class PoolMonitor:
+    """
+    Connection pool saturation and checkout hold times.
+
+    Checkouts are attributed to the request (or WebSocket) holding them via
+    the query stats contextvar, so a route that keeps a connection for the
+    lifetime of a socket is visible long before the pool runs dry.
+    """
+
+    def __init__(self, long_hold_seconds: float = settings.POOL_LONG_HOLD_SECONDS):
+        self.long_hold_seconds = long_hold_seconds
+        self._lock = threading.Lock()
+        self._engine = None
+        self._held: Dict[int, tuple] = {}
+        self.hold_ms = Histogram()
+        self.checkouts = 0
+        self.long_holds = 0
+        self.peak_checked_out = 0
+
+    def install(self, engine) -> None:
+        self._engine = engine
+        if not event.contains(engine, "checkout", self._checkout):
+            event.listen(engine, "checkout", self._checkout)
+            event.listen(engine, "checkin", self._checkin)
+
+    def uninstall(self, engine) -> None:
+        if event.contains(engine, "checkout", self._checkout):
+            event.remove(engine, "checkout", self._checkout)
+            event.remove(engine, "checkin", self._checkin)
+
+    def _checkout(self, dbapi_connection, connection_record, connection_proxy):
+        stats = _current.get()
+        holder = stats.route if stats is not None else BACKGROUND_HOLDER
+        with self._lock:
+            self._held[id(connection_record)] = (time.perf_counter(), holder)
+            self.checkouts += 1
+            self.peak_checked_out = max(self.peak_checked_out, len(self._held))
+
+    def _checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            held = self._held.pop(id(connection_record), None)
+            if held is None:
+                return
+            elapsed_ms = (time.perf_counter() - held[0]) * 1000
+            self.hold_ms.record(elapsed_ms)
+            if elapsed_ms >= self.long_hold_seconds * 1000:
+                self.long_holds += 1
+        if elapsed_ms >= self.long_hold_seconds * 1000:
+            logger.warning(f"Connection held {elapsed_ms / 1000:.1f}s by {held[1]}")
+
+    def pool_status(self) -> Dict:
+        """Size, checked-out connections and saturation of the installed engine's pool."""
+        pool = self._engine.pool if self._engine is not None else None
+        size = pool.size() if hasattr(pool, "size") else None
+        max_overflow = getattr(pool, "_max_overflow", None)
+        checked_out = pool.checkedout() if hasattr(pool, "checkedout") else len(self._held)
+        capacity = None
+        if size is not None and max_overflow is not None and max_overflow >= 0:
+            capacity = size + max_overflow
+        return {
+            "pool": type(pool).__name__ if pool is not None else None,
+            "size": size,
+            "max_overflow": max_overflow,
+            "capacity": capacity,
+            "checked_out": checked_out,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+            "saturation": round(checked_out / capacity, 3) if capacity else None,
+        }
+
+    def snapshot(self) -> Dict:
+        now = time.perf_counter()
+        with self._lock:
+            held = sorted(self._held.values())
+            summary = {
+                "checkouts": self.checkouts,
+                "peak_checked_out": self.peak_checked_out,
+                "long_holds": self.long_holds,
+                "hold_ms": self.hold_ms.summary(),
+            }
+        return {
+            **self.pool_status(),
+            **summary,
+            "long_hold_seconds": self.long_hold_seconds,
+            "holders": dict(Counter(holder for _, holder in held).most_common()),
+            "oldest_holds": [
+                {"holder": holder, "held_seconds": round(now - start, 3)}
+                for start, holder in held[:MAX_LISTED_HOLDS]
+            ],
+        }
+
+    def prometheus(self) -> str:
+        """Pool gauges and hold-time quantiles in the Prometheus text format."""
+        status = self.pool_status()
+        with self._lock:
+            hold = self.hold_ms.summary()
+            checkouts, long_holds = self.checkouts, self.long_holds
+        lines = [
+            "# HELP db_pool_checked_out Connections currently checked out.",
+            "# TYPE db_pool_checked_out gauge",
+            f"db_pool_checked_out {status['checked_out']}",
+        ]
+        if status["capacity"] is not None:
+            lines += [
+                "# HELP db_pool_capacity Pool size plus max overflow.",
+                "# TYPE db_pool_capacity gauge",
+                f"db_pool_capacity {status['capacity']}",
+            ]
+        lines += [
+            "# HELP db_pool_checkouts_total Connection checkouts.",
+            "# TYPE db_pool_checkouts_total counter",
+            f"db_pool_checkouts_total {checkouts}",
+            "# HELP db_pool_long_holds_total Checkouts held longer than the long-hold threshold.",
+            "# TYPE db_pool_long_holds_total counter",
+            f"db_pool_long_holds_total {long_holds}",
+            "# HELP db_pool_hold_ms Time connections stay checked out.",
+            "# TYPE db_pool_hold_ms summary",
+        ]
+        for q, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+            lines.append(f'db_pool_hold_ms{{quantile="{q}"}} {hold[key] or 0:.3f}')
+        lines.append(f"db_pool_hold_ms_count {hold['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self.hold_ms = Histogram()
+            self.checkouts = 0
+            self.long_holds = 0
+            self.peak_checked_out = len(self._held)
+
+
+pool_monitor = PoolMonitor()
+
+
+# ----------------------------------------------------------------------
+# Test helpers
+# ----------------------------------------------------------------------
+
+
+@contextmanager
+def count_queries(engine) -> Iterator[List[str]]:
+    """Collect every statement executed on ``engine`` inside the block."""
+    statements: List[str] = []
+
+    def collect(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", collect)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", collect)
+
+
+@contextmanager
+def assert_max_queries(engine, limit: int) -> Iterator[List[str]]:
+    """
+    Fail if the block executes more than ``limit`` statements on ``engine``.
+
+    Usage::
+
+        with assert_max_queries(engine, 3):
+            client.get("/api/v1/courses/1")
+    """
+    with count_queries(engine) as statements:
+        yield statements
+    if len(statements) > limit:
+        listing = "\n".join(f"  {i}. {s[:200]}" for i, s in enumerate(statements, 1))
+        raise AssertionError(
+            f"Expected at most {limit} queries, {len(statements)} were executed:\n{listing}"
+        )
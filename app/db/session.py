@@ -2,6 +2,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.core.config import settings
+from app.db.instrumentation import pool_monitor, query_instrumentation
 
 Base = declarative_base()
 
@@ -44,6 +45,12 @@ if "sqlite" in settings.DATABASE_URL:
 
 # PostgreSQL Engine
 engine = create_engine(settings.DATABASE_URL, **engine_kwargs)
+
+# Per-request query counts, N+1 detection and slow-query sampling
+query_instrumentation.install(engine)
+# Pool saturation and connection hold times
+pool_monitor.install(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # MongoDB
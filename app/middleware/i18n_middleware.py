@@ -5,15 +5,21 @@ Language detection and header processing middleware for internationalization.
 """
 
 from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
-from starlette.responses import Response
+from functools import lru_cache
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import QueryParams
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from typing import Optional
 import logging
 
+from app.services.i18n_catalogue import user_languages
+
 logger = logging.getLogger(__name__)
 
+RTL_LANGUAGES = frozenset(["ar", "he", "fa", "ur"])
+
 
-class I18nMiddleware(BaseHTTPMiddleware):
+class I18nMiddleware:
     """
     Middleware to detect and set user's preferred language.
 
@@ -22,32 +28,52 @@ class I18nMiddleware(BaseHTTPMiddleware):
     2. User preference from database (if authenticated)
     3. Accept-Language header
     4. Default language (en)
+
+    Pure ASGI: the detected language is stored in the request state and the
+    response headers for each language are encoded once at startup. User
+    preferences come from the i18n catalogue cache, so detection does not
+    touch the database once a user's preference is cached.
     """
 
     DEFAULT_LANGUAGE = "en"
     SUPPORTED_LANGUAGES = ["en", "es", "fr", "de", "ar", "hi", "zh"]
 
-    async def dispatch(
-        self, request: Request, call_next: RequestResponseEndpoint
-    ) -> Response:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._supported = frozenset(self.SUPPORTED_LANGUAGES)
+        self._response_headers = {
+            language: [(b"content-language", language.encode("latin-1"))]
+            + ([(b"x-rtl-enabled", b"true")] if language in RTL_LANGUAGES else [])
+            for language in self.SUPPORTED_LANGUAGES
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """Process request and detect language."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
         # Detect language
-        language = await self._detect_language(request)
+        language = await self._detect_language(Request(scope))
 
         # Store language in request state
-        request.state.language = language
-        request.state.is_rtl = language in ["ar", "he", "fa", "ur"]  # RTL languages
+        state = scope.setdefault("state", {})
+        state["language"] = language
+        state["is_rtl"] = language in RTL_LANGUAGES
 
-        # Process request
-        response = await call_next(request)
+        extra_headers = self._response_headers[language]
 
-        # Add language headers to response
-        response.headers["Content-Language"] = language
-        if request.state.is_rtl:
-            response.headers["X-RTL-Enabled"] = "true"
+        async def send_with_language(message: Message) -> None:
+            # Add language headers to response
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    header
+                    for header in message.get("headers", ())
+                    if header[0].lower() != b"content-language"
+                ] + extra_headers
+            await send(message)
 
-        return response
+        await self.app(scope, receive, send_with_language)
 
     async def _detect_language(self, request: Request) -> str:
         """
@@ -60,33 +86,24 @@ class I18nMiddleware(BaseHTTPMiddleware):
             Language code (e.g., 'en', 'es')
         """
         # 1. Check query parameter
-        lang_param = request.query_params.get("lang")
-        if lang_param and lang_param in self.SUPPORTED_LANGUAGES:
+        query_string = request.scope.get("query_string", b"")
+        lang_param = (
+            QueryParams(query_string).get("lang") if b"lang=" in query_string else None
+        )
+        if lang_param and lang_param in self._supported:
             logger.debug(f"Language from query parameter: {lang_param}")
             return lang_param
 
         # 2. Check user preference (if authenticated)
-        if hasattr(request.state, "user") and request.state.user:
+        user = request.scope.get("state", {}).get("user")
+        if user:
             try:
-                from app.db.session import SessionLocal
-                from app.models.translation import UserLanguagePreference
-
-                db = SessionLocal()
-                user_pref = (
-                    db.query(UserLanguagePreference)
-                    .filter(UserLanguagePreference.user_id == request.state.user.id)
-                    .first()
-                )
-                db.close()
-
-                if (
-                    user_pref
-                    and user_pref.preferred_language in self.SUPPORTED_LANGUAGES
-                ):
-                    logger.debug(
-                        f"Language from user preference: {user_pref.preferred_language}"
-                    )
-                    return user_pref.preferred_language
+                hit, preferred = user_languages.cached(user.id)
+                if not hit:
+                    preferred = await run_in_threadpool(user_languages.get, user.id)
+                if preferred in self._supported:
+                    logger.debug(f"Language from user preference: {preferred}")
+                    return preferred
             except Exception as e:
                 logger.warning(f"Error fetching user language preference: {e}")
 
@@ -103,49 +120,56 @@ class I18nMiddleware(BaseHTTPMiddleware):
         return self.DEFAULT_LANGUAGE
 
     def _parse_accept_language(self, accept_language: str) -> Optional[str]:
-        """
-        Parse Accept-Language header and return best match.
+        return _parse_accept_language(accept_language, self._supported)
 
-        Format: "en-US,en;q=0.9,es;q=0.8,fr;q=0.7"
 
-        Args:
-            accept_language: Accept-Language header value
+# Clients send few distinct headers, so each is parsed once
+@lru_cache(maxsize=1024)
+def _parse_accept_language(accept_language: str, supported: frozenset) -> Optional[str]:
+    """
+    Parse Accept-Language header and return best match.
 
-        Returns:
-            Language code or None
-        """
-        try:
-            # Split by comma
-            languages = accept_language.split(",")
-
-            # Parse and sort by quality
-            parsed = []
-            for lang in languages:
-                lang = lang.strip()
-                if ";q=" in lang:
-                    code, quality = lang.split(";q=")
-                    quality = float(quality)
-                else:
-                    code = lang
-                    quality = 1.0
-
-                # Extract base language code (e.g., 'en' from 'en-US')
-                base_code = code.split("-")[0].lower()
-
-                if base_code in self.SUPPORTED_LANGUAGES:
-                    parsed.append((base_code, quality))
-
-            # Sort by quality (highest first)
-            parsed.sort(key=lambda x: x[1], reverse=True)
-
-            # Return highest quality language
-            if parsed:
-                return parsed[0][0]
-
-        except Exception as e:
-            logger.warning(f"Error parsing Accept-Language header: {e}")
-
-        return None
+    Format: "en-US,en;q=0.9,es;q=0.8,fr;q=0.7"
+
+    Args:
+        accept_language: Accept-Language header value
+        supported: Supported language codes
+
+    Returns:
+        Language code or None
+    """
+    try:
+        # Split by comma
+        languages = accept_language.split(",")
+
+        # Parse and sort by quality
+        parsed = []
+        for lang in languages:
+            lang = lang.strip()
+            if ";q=" in lang:
+                code, quality = lang.split(";q=")
+                quality = float(quality)
+            else:
+                code = lang
+                quality = 1.0
+
+            # Extract base language code (e.g., 'en' from 'en-US')
+            base_code = code.split("-")[0].lower()
+
+            if base_code in supported:
+                parsed.append((base_code, quality))
+
+        # Sort by quality (highest first)
+        parsed.sort(key=lambda x: x[1], reverse=True)
+
+        # Return highest quality language
+        if parsed:
+            return parsed[0][0]
+
+    except Exception as e:
+        logger.warning(f"Error parsing Accept-Language header: {e}")
+
+    return None
 
 
 def get_request_language(request: Request) -> str:
@@ -0,0 +1,44 @@
+"""
+Per-request SQL instrumentation middleware
+"""
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.db.instrumentation import query_instrumentation
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Attribute SQL statements to the request being served.
+
+    Pure ASGI so the request context (and the contextvar holding its query
+    stats) reaches the endpoint without an extra task per request. The route
+    template is read from the scope after routing, so stats are per endpoint
+    rather than per URL. HTTP requests are timed here, with their status, into
+    the per-route stats. WebSocket scopes are tracked too, so pool checkouts
+    made on a socket's behalf are attributed to its route, but their lifetime
+    is kept out of the request latency stats.
+    """
+
+    def __init__(self, app: ASGIApp, instrumentation=None):
+        self.app = app
+        self.instrumentation = instrumentation
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        instrumentation = self.instrumentation or query_instrumentation
+        is_http = scope["type"] == "http"
+        with instrumentation.track(scope, record=is_http) as stats:
+            if not is_http:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_wrapper(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    stats.status = message["status"]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
@@ -4,28 +4,39 @@ Request/Response logging middleware for API monitoring
 
 import time
 import logging
-from typing import Callable
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.db.instrumentation import route_template
+from app.services.request_metrics import request_metrics
 
 logger = logging.getLogger(__name__)
 
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
+class RequestLoggingMiddleware:
     """
     Middleware to log all incoming requests and outgoing responses
+
+    Pure ASGI: headers are added to the ``http.response.start`` message and
+    the body (when ``log_body`` is set) is replayed to the application.
     """
 
-    def __init__(self, app, log_body: bool = False):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp, log_body: bool = False):
+        self.app = app
         self.log_body = log_body
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+
         # Generate request ID if not present
         request_id = request.headers.get("X-Request-ID", f"req-{time.time()}")
 
         # Start timer
-        start_time = time.time()
+        start_time = time.perf_counter()
 
         # Log request
         log_data = {
@@ -39,21 +50,46 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
 
         # Optionally log request body (be careful with sensitive data)
         if self.log_body and request.method in ["POST", "PUT", "PATCH"]:
-            try:
-                body = await request.body()
-                if body:
-                    log_data["request_body"] = body.decode("utf-8")[:1000]  # Limit size
-            except Exception:
-                pass
+            messages = []
+            more_body = True
+            while more_body:
+                message = await receive()
+                messages.append(message)
+                more_body = message.get("more_body", False) and message["type"] == "http.request"
+            body = b"".join(m.get("body", b"") for m in messages)
+            if body:
+                log_data["request_body"] = body.decode("utf-8", "replace")[:1000]  # Limit size
+
+            async def replay() -> Message:
+                return messages.pop(0) if messages else await receive()
+
+            app_receive = replay
+        else:
+            app_receive = receive
 
         logger.info("Incoming request", extra=log_data)
 
+        response_log = dict(log_data)
+        request_id_header = (b"x-request-id", request_id.encode("latin-1"))
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                duration_ms = (time.perf_counter() - start_time) * 1000
+                response_log["status_code"] = message["status"]
+                response_log["duration_ms"] = round(duration_ms, 2)
+                # Add custom headers
+                message["headers"] = list(message.get("headers", ())) + [
+                    request_id_header,
+                    (b"x-response-time", f"{duration_ms:.2f}ms".encode()),
+                ]
+            await send(message)
+
         # Process request
         try:
-            response = await call_next(request)
+            await self.app(scope, app_receive, send_wrapper)
         except Exception as e:
             # Log exception
-            duration_ms = (time.time() - start_time) * 1000
+            duration_ms = (time.perf_counter() - start_time) * 1000
             logger.error(
                 "Request failed",
                 extra={
@@ -66,55 +102,90 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
             )
             raise
 
-        # Calculate duration
-        duration_ms = (time.time() - start_time) * 1000
-
-        # Log response
-        response_log = {
-            **log_data,
-            "status_code": response.status_code,
-            "duration_ms": round(duration_ms, 2),
-        }
-
-        # Add custom headers
-        response.headers["X-Request-ID"] = request_id
-        response.headers["X-Response-Time"] = f"{duration_ms:.2f}ms"
-
         # Log based on status code
-        if response.status_code >= 500:
+        status_code = response_log.get("status_code", 500)
+        if status_code >= 500:
             logger.error("Server error response", extra=response_log)
-        elif response.status_code >= 400:
+        elif status_code >= 400:
             logger.warning("Client error response", extra=response_log)
         else:
             logger.info("Successful response", extra=response_log)
 
-        return response
-
 
-class PerformanceMonitoringMiddleware(BaseHTTPMiddleware):
+class PerformanceMonitoringMiddleware:
     """
     Middleware to track API performance metrics
     """
 
     SLOW_REQUEST_THRESHOLD_MS = 1000  # 1 second
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        start_time = time.time()
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-        response = await call_next(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        duration_ms = (time.time() - start_time) * 1000
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            duration_ms = (time.perf_counter() - start_time) * 1000
+
+            # Log slow requests
+            if duration_ms > self.SLOW_REQUEST_THRESHOLD_MS:
+                logger.warning(
+                    "Slow request detected",
+                    extra={
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "duration_ms": round(duration_ms, 2),
+                        "threshold_ms": self.SLOW_REQUEST_THRESHOLD_MS,
+                    },
+                )
+
+
+class RequestMetricsMiddleware:
+    """
+    Write sampled request logs with the route template, status and duration.
 
-        # Log slow requests
-        if duration_ms > self.SLOW_REQUEST_THRESHOLD_MS:
-            logger.warning(
-                "Slow request detected",
-                extra={
-                    "method": request.method,
-                    "path": request.url.path,
+    Pure ASGI: no extra task or stream per request, and streaming responses
+    pass straight through. Per-route latency and status counts are recorded
+    by QueryInstrumentationMiddleware; this only decides which requests get a
+    log line.
+    """
+
+    def __init__(self, app: ASGIApp, metrics=request_metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            route = route_template(scope)
+            self.metrics.log(
+                {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route,
+                    "status_code": status,
                     "duration_ms": round(duration_ms, 2),
-                    "threshold_ms": self.SLOW_REQUEST_THRESHOLD_MS,
-                },
+                    "client_ip": scope["client"][0] if scope.get("client") else None,
+                }
             )
-
-        return response
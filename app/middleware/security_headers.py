@@ -2,53 +2,79 @@
 Security headers middleware for enhanced application security
 """
 
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
+from typing import List, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
 from app.core.config import settings
 
+DEFAULT_CSP = "; ".join(
+    [
+        "default-src 'self'",
+        "script-src 'self' 'unsafe-inline' 'unsafe-eval'",  # Adjust based on your needs
+        "style-src 'self' 'unsafe-inline'",
+        "img-src 'self' data: https:",
+        "font-src 'self' data:",
+        "connect-src 'self' ws: wss:",
+        "frame-ancestors 'none'",
+    ]
+)
+DEFAULT_PERMISSIONS_POLICY = "geolocation=(), microphone=(), camera=()"
+DEFAULT_HSTS = "max-age=31536000; includeSubDomains; preload"
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
+
+class SecurityHeadersMiddleware:
     """
     Add security headers to all responses
+
+    Pure ASGI: the header list is encoded once at startup and merged into the
+    ``http.response.start`` message, replacing any value set by the endpoint.
+    Pass ``None`` for a policy to leave that header out.
     """
 
-    async def dispatch(self, request: Request, call_next):
-        response: Response = await call_next(request)
-
-        # Prevent MIME type sniffing
-        response.headers["X-Content-Type-Options"] = "nosniff"
-
-        # Prevent clickjacking
-        response.headers["X-Frame-Options"] = "DENY"
-
-        # Enable XSS protection
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-
-        # Enforce HTTPS in production
-        if settings.ENVIRONMENT == "production":
-            response.headers["Strict-Transport-Security"] = (
-                "max-age=31536000; includeSubDomains; preload"
-            )
-
-        # Content Security Policy
-        csp_directives = [
-            "default-src 'self'",
-            "script-src 'self' 'unsafe-inline' 'unsafe-eval'",  # Adjust based on your needs
-            "style-src 'self' 'unsafe-inline'",
-            "img-src 'self' data: https:",
-            "font-src 'self' data:",
-            "connect-src 'self' ws: wss:",
-            "frame-ancestors 'none'",
+    def __init__(
+        self,
+        app: ASGIApp,
+        content_security_policy: Optional[str] = DEFAULT_CSP,
+        permissions_policy: Optional[str] = DEFAULT_PERMISSIONS_POLICY,
+        strict_transport_security: Optional[str] = (
+            DEFAULT_HSTS if settings.ENVIRONMENT == "production" else None
+        ),
+    ):
+        self.app = app
+        headers = {
+            # Prevent MIME type sniffing
+            "x-content-type-options": "nosniff",
+            # Prevent clickjacking
+            "x-frame-options": "DENY",
+            # Enable XSS protection
+            "x-xss-protection": "1; mode=block",
+            "referrer-policy": "strict-origin-when-cross-origin",
+            "content-security-policy": content_security_policy,
+            "permissions-policy": permissions_policy,
+            # Enforce HTTPS (production)
+            "strict-transport-security": strict_transport_security,
+        }
+        self.headers: List[Tuple[bytes, bytes]] = [
+            (name.encode("latin-1"), value.encode("latin-1"))
+            for name, value in headers.items()
+            if value is not None
         ]
-        response.headers["Content-Security-Policy"] = "; ".join(csp_directives)
+        self._names = frozenset(name for name, _ in self.headers)
 
-        # Referrer policy
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        # Permissions policy (formerly Feature-Policy)
-        response.headers["Permissions-Policy"] = (
-            "geolocation=(), microphone=(), camera=()"
-        )
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                names = self._names
+                message["headers"] = [
+                    header
+                    for header in message.get("headers", ())
+                    if header[0].lower() not in names
+                ] + self.headers
+            await send(message)
 
-        return response
+        await self.app(scope, receive, send_with_headers)
@@ -111,6 +111,8 @@ from app.models.analytics import (
     StudentAnalytics,
     PlatformAnalytics,
     AnalyticsEvent,
+    KPISnapshot,
+    RevenueRollup,
 )
 
 # Translation/i18n
@@ -12,6 +12,8 @@ from sqlalchemy import (
     ForeignKey,
     Boolean,
     Text,
+    JSON,
+    UniqueConstraint,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -239,3 +241,53 @@ class AnalyticsEvent(Base):
     # - page_view, video_play, video_complete, quiz_start, quiz_complete
     # - assignment_submit, discussion_post, course_enroll, course_complete
     # - purchase, refund, login, logout
+
+
+class KPISnapshot(Base):
+    """Periodic snapshot of executive dashboard KPIs"""
+
+    __tablename__ = "kpi_snapshots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    computed_at = Column(DateTime, nullable=False, index=True)
+
+    # Output of KPIEngine.compute(): {"kpis": {...}, "growth": {...}}
+    data = Column(JSON, nullable=False)
+
+    # How long the refresh took, for spotting slow aggregates
+    compute_ms = Column(Float, default=0.0)
+
+
+class RevenueRollup(Base):
+    """
+    Completed-order revenue pre-aggregated per hour and (course, instructor).
+
+    Each bucket has up to three kinds of row:
+    - course_id = 0, instructor_id = 0: platform totals (order totals, including
+      tax and order-level discounts)
+    - course_id = 0, instructor_id = N: item revenue of instructor N's courses
+    - course_id = N: item revenue of course N
+
+    Maintained incrementally when orders complete (see the listener in
+    app.models.order) and rebuilt by app.services.revenue_rollup.
+    """
+
+    __tablename__ = "revenue_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False, index=True)
+    hour = Column(Integer, nullable=False, default=0)  # 0-23, UTC
+
+    # 0 = all; not foreign keys so deleted courses keep their history
+    course_id = Column(Integer, nullable=False, default=0, index=True)
+    instructor_id = Column(Integer, nullable=False, default=0, index=True)
+
+    revenue = Column(Float, nullable=False, default=0.0)
+    orders = Column(Integer, nullable=False, default=0)
+    items = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "day", "hour", "course_id", "instructor_id", name="uq_revenue_rollup_bucket"
+        ),
+    )
@@ -10,7 +10,8 @@ from sqlalchemy import (
     Enum as SQLEnum,
     JSON,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.orm import Session, relationship
 
 from app.db.session import Base
 from datetime import datetime
@@ -83,6 +84,7 @@ class Course(Base):
     average_rating = Column(Float, default=0.0)
     total_reviews = Column(Integer, default=0)
     total_duration_minutes = Column(Integer, default=0)
+    total_lessons = Column(Integer, default=0)  # Maintained by recount_course_lessons
 
     # Relationships
     # from app.models.category import course_tags
@@ -131,3 +133,61 @@ class Course(Base):
 
     def __repr__(self):
         return f"<Course {self.title}>"
+
+
+def recount_course_lessons(connection, course_ids) -> None:
+    """Recompute Course.total_lessons for the given courses in one UPDATE."""
+    from app.models.lesson import Lesson
+    from app.models.module import Module
+
+    course_ids = [cid for cid in set(course_ids) if cid is not None]
+    if not course_ids:
+        return
+    lesson_count = (
+        select(func.count(Lesson.id))
+        .join(Module, Module.id == Lesson.module_id)
+        .where(Module.course_id == Course.id)
+        .scalar_subquery()
+    )
+    connection.execute(
+        update(Course).where(Course.id.in_(course_ids)).values(total_lessons=lesson_count)
+    )
+
+
+def _changed_values(obj, attr: str, is_new_or_deleted: bool) -> set:
+    """Old and new values of a foreign key, or none if it didn't change."""
+    history = inspect(obj).attrs[attr].history
+    if is_new_or_deleted:
+        return set(history.sum())
+    if not history.has_changes():
+        return set()
+    return set(history.added) | set(history.deleted)
+
+
+@event.listens_for(Session, "after_flush")
+def _keep_lesson_counts(session, flush_context):
+    """Keep Course.total_lessons in step with lesson and module inserts, moves and deletes."""
+    from app.models.lesson import Lesson
+    from app.models.module import Module
+
+    course_ids, module_ids = set(), set()
+    for objects, is_new_or_deleted in (
+        (session.new, True),
+        (session.deleted, True),
+        (session.dirty, False),
+    ):
+        for obj in objects:
+            if isinstance(obj, Lesson):
+                module_ids |= _changed_values(obj, "module_id", is_new_or_deleted)
+            elif isinstance(obj, Module):
+                course_ids |= _changed_values(obj, "course_id", is_new_or_deleted)
+
+    module_ids.discard(None)
+    if module_ids:
+        course_ids.update(
+            session.connection()
+            .execute(select(Module.course_id).where(Module.id.in_(module_ids)))
+            .scalars()
+        )
+    if course_ids:
+        recount_course_lessons(session.connection(), course_ids)
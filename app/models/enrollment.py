@@ -7,7 +7,8 @@ from sqlalchemy import (
     Boolean,
     Enum as SQLEnum,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, relationship
 from app.db.session import Base
 from datetime import datetime
 import enum
@@ -69,3 +70,138 @@ class Enrollment(Base):
 
     def __repr__(self):
         return f"<Enrollment user_id={self.user_id} course_id={self.course_id}>"
+
+
+# Entitlement invalidation -----------------------------------------------
+# Course access maps (app.services.entitlements) are versioned per user and
+# per course; changes to the rules behind them bump those versions once the
+# change commits.
+
+_CHANGED_ENTITLEMENTS_KEY = "entitlements_changed"
+
+
+def _access_keys(obj, key_attr: str, attrs, is_new_or_deleted: bool) -> set:
+    """Owner keys (old and new) of an object whose access-relevant state changed."""
+    state = inspect(obj)
+    history = state.attrs[key_attr].history
+    if is_new_or_deleted:
+        return set(history.sum())
+    if not history.has_changes() and not any(
+        state.attrs[attr].history.has_changes() for attr in attrs
+    ):
+        return set()
+    return {getattr(obj, key_attr)} | set(history.deleted)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_entitlements(session, flush_context):
+    """Record users and courses whose access rules changed."""
+    from app.models.learning_path import PathCourse, PathEnrollment
+    from app.models.lesson import Lesson
+    from app.models.lesson_drip import LessonDripSetting
+    from app.models.lesson_progress import LessonProgress
+    from app.models.module import Module
+    from app.models.subscription import SubscriptionPlan, UserSubscription
+
+    # Attributes that affect access: model -> (owner key, other attributes)
+    user_rules = (
+        (Enrollment, "user_id", ("course_id", "status", "enrolled_at", "expires_at")),
+        (LessonProgress, "user_id", ("lesson_id", "status")),
+        (UserSubscription, "user_id", ("plan_id", "status", "started_at", "current_period_end")),
+        (PathEnrollment, "student_id", ("path_id",)),
+    )
+    course_rules = (
+        (Module, "course_id", ("order_index",)),
+        (PathCourse, "course_id", ("path_id", "prerequisite_course_id")),
+    )
+
+    user_ids, course_ids, module_ids, lesson_ids = set(), set(), set(), set()
+    path_ids = set()
+    everything = False
+    for objects, is_new_or_deleted in (
+        (session.new, True),
+        (session.deleted, True),
+        (session.dirty, False),
+    ):
+        for obj in objects:
+            for model, key_attr, attrs in user_rules:
+                if isinstance(obj, model):
+                    user_ids |= _access_keys(obj, key_attr, attrs, is_new_or_deleted)
+            for model, key_attr, attrs in course_rules:
+                if isinstance(obj, model):
+                    course_ids |= _access_keys(obj, key_attr, attrs, is_new_or_deleted)
+            if isinstance(obj, PathCourse):
+                # Prerequisites are transitive, so every course in the path may change
+                path_ids |= _access_keys(
+                    obj, "path_id", ("course_id", "prerequisite_course_id"), is_new_or_deleted
+                )
+            elif isinstance(obj, Lesson):
+                module_ids |= _access_keys(
+                    obj, "module_id", ("order_index", "is_preview"), is_new_or_deleted
+                )
+            elif isinstance(obj, LessonDripSetting):
+                lesson_ids |= _access_keys(
+                    obj,
+                    "lesson_id",
+                    ("unlock_type", "unlock_date", "unlock_after_days",
+                     "prerequisite_lesson_id", "is_active"),
+                    is_new_or_deleted,
+                )
+            elif isinstance(obj, SubscriptionPlan) and not is_new_or_deleted:
+                # Plans are shared by many users; a level change resets every map
+                everything = everything or inspect(obj).attrs.access_level.history.has_changes()
+
+    lesson_ids.discard(None)
+    if lesson_ids:
+        module_ids.update(
+            session.connection()
+            .execute(select(Lesson.module_id).where(Lesson.id.in_(lesson_ids)))
+            .scalars()
+        )
+    module_ids.discard(None)
+    if module_ids:
+        course_ids.update(
+            session.connection()
+            .execute(select(Module.course_id).where(Module.id.in_(module_ids)))
+            .scalars()
+        )
+    path_ids.discard(None)
+    if path_ids:
+        course_ids.update(
+            session.connection()
+            .execute(select(PathCourse.course_id).where(PathCourse.path_id.in_(path_ids)))
+            .scalars()
+        )
+    user_ids.discard(None)
+    course_ids.discard(None)
+    if user_ids or course_ids or everything:
+        changed = session.info.setdefault(
+            _CHANGED_ENTITLEMENTS_KEY, {"users": set(), "courses": set(), "everything": False}
+        )
+        changed["users"] |= user_ids
+        changed["courses"] |= course_ids
+        changed["everything"] = changed["everything"] or everything
+
+
+def has_pending_entitlement_changes(session) -> bool:
+    """
+    Whether the session flushed access-relevant writes that haven't committed.
+
+    Results read inside such a transaction must not be cached: if it rolls
+    back, nothing bumps the versions they would be stored under.
+    """
+    return bool(session.info.get(_CHANGED_ENTITLEMENTS_KEY))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_entitlements(session):
+    changed = session.info.pop(_CHANGED_ENTITLEMENTS_KEY, None)
+    if changed:
+        from app.services.entitlements import entitlements
+
+        entitlements.invalidate(changed["users"], changed["courses"], changed["everything"])
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_entitlements(session):
+    session.info.pop(_CHANGED_ENTITLEMENTS_KEY, None)
@@ -8,7 +8,8 @@ from sqlalchemy import (
     DateTime,
     Float,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, relationship
 from app.db.session import Base
 from datetime import datetime, timezone
 
@@ -161,3 +162,57 @@ class PathEnrollment(Base):
 
     def __repr__(self):
         return f"<PathEnrollment {self.student_id} - Path {self.path_id}>"
+
+
+# Path graph invalidation ------------------------------------------------
+# Compiled path graphs (app.services.path_graph) are versioned; any change
+# to a path's courses bumps its version once the change commits.
+
+_CHANGED_PATHS_KEY = "path_graph_changed_ids"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_paths(session, flush_context):
+    """Record paths whose courses, order, prerequisites or requirements changed."""
+    path_ids = set()
+    for objects, is_new_or_deleted in (
+        (session.new, True),
+        (session.deleted, True),
+        (session.dirty, False),
+    ):
+        for obj in objects:
+            if not isinstance(obj, PathCourse):
+                continue
+            state = inspect(obj)
+            history = state.attrs.path_id.history
+            if is_new_or_deleted:
+                path_ids.update(history.sum())
+            elif history.has_changes() or any(
+                state.attrs[attr].history.has_changes()
+                for attr in ("course_id", "order_index", "prerequisite_course_id", "is_required")
+            ):
+                path_ids.add(obj.path_id)
+                path_ids.update(history.deleted)
+
+    path_ids.discard(None)
+    if path_ids:
+        session.info.setdefault(_CHANGED_PATHS_KEY, set()).update(path_ids)
+
+
+def pending_path_changes(session) -> set:
+    """Paths whose courses this session flushed but hasn't committed yet."""
+    return set(session.info.get(_CHANGED_PATHS_KEY, ()))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_path_graphs(session):
+    path_ids = session.info.pop(_CHANGED_PATHS_KEY, None)
+    if path_ids:
+        from app.services.path_graph import path_graph
+
+        path_graph.invalidate(path_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_paths(session):
+    session.info.pop(_CHANGED_PATHS_KEY, None)
@@ -1,5 +1,5 @@
 """Marketing Automation Models."""
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, JSON, Float, Enum
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, JSON, Float, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.session import Base
@@ -150,6 +150,10 @@ class WorkflowStep(Base):
 class WorkflowExecution(Base):
     """Track individual workflow executions for leads."""
     __tablename__ = "workflow_executions"
+    __table_args__ = (
+        # Due-time index used by the workflow engine to claim due executions
+        Index("ix_workflow_executions_status_next_action", "status", "next_action_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     workflow_id = Column(Integer, ForeignKey("marketing_workflows.id"), nullable=False, index=True)
@@ -13,7 +13,8 @@ from sqlalchemy import (
     Text,
     Enum as SQLEnum,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, column_property, relationship
 from sqlalchemy.sql import func
 from datetime import datetime
 import enum
@@ -59,8 +60,12 @@ class Order(Base):
     )
 
     # Order status
-    status = Column(
-        SQLEnum(OrderStatus), default=OrderStatus.PENDING, nullable=False, index=True
+    # Previous status is loaded on change so the revenue rollup sees reversals
+    status = column_property(
+        Column(
+            SQLEnum(OrderStatus), default=OrderStatus.PENDING, nullable=False, index=True
+        ),
+        active_history=True,
     )
 
     # Pricing
@@ -160,3 +165,45 @@ class OrderItem(Base):
 
     def __repr__(self):
         return f"<OrderItem(id={self.id}, item={self.item_name}, total={self.total})>"
+
+
+# Revenue rollup maintenance ---------------------------------------------
+# Completing an order adds it to the revenue rollup (app.services.revenue_rollup)
+# in the same transaction; moving a completed order to another status or
+# deleting it subtracts it again.
+
+
+def _was_completed(order: Order) -> bool:
+    history = inspect(order).attrs.status.history
+    return any(s == OrderStatus.COMPLETED for s in (history.deleted or history.unchanged))
+
+
+@event.listens_for(Session, "after_flush")
+def _update_revenue_rollup(session, flush_context):
+    completed, reversed_ids, deleted = [], [], []
+    for obj in session.new:
+        if isinstance(obj, Order) and obj.status == OrderStatus.COMPLETED:
+            completed.append(obj.id)
+    for obj in session.dirty:
+        if not isinstance(obj, Order) or not inspect(obj).attrs.status.history.has_changes():
+            continue
+        was, now = _was_completed(obj), obj.status == OrderStatus.COMPLETED
+        if now and not was:
+            completed.append(obj.id)
+        elif was and not now:
+            reversed_ids.append(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Order) and _was_completed(obj):
+            deleted.append(obj)
+
+    if not (completed or reversed_ids or deleted):
+        return
+
+    from app.services.revenue_rollup import revenue_rollup
+
+    connection = session.connection()
+    revenue_rollup.apply(connection, revenue_rollup.order_deltas(connection, completed, 1))
+    revenue_rollup.apply(connection, revenue_rollup.order_deltas(connection, reversed_ids, -1))
+    if deleted:
+        # Rows are gone; fold the in-memory orders and items instead
+        revenue_rollup.apply(connection, revenue_rollup.deleted_order_deltas(connection, deleted))
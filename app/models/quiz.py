@@ -8,7 +8,8 @@ from sqlalchemy import (
     Float,
     DateTime,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, relationship
 from sqlalchemy.sql import func
 import enum
 from app.db.session import Base
@@ -286,3 +287,63 @@ class AIGradingResult(Base):
 
     # Relationships
     student_answer = relationship("StudentAnswer", backref="ai_grading", uselist=False)
+
+
+# Quiz snapshot invalidation ---------------------------------------------
+# Compiled quiz snapshots (app.services.quiz_compiler) are versioned; any
+# change to a quiz's content bumps its version once the change commits.
+
+_CHANGED_QUIZZES_KEY = "quiz_snapshot_changed_ids"
+
+
+def _touched_ids(session, obj, attr: str, is_new_or_deleted: bool) -> set:
+    """Current and previous values of a parent key for a changed object."""
+    history = inspect(obj).attrs[attr].history
+    if is_new_or_deleted:
+        return set(history.sum())
+    if not session.is_modified(obj, include_collections=False):
+        return set()
+    return {getattr(obj, attr)} | set(history.deleted)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_quizzes(session, flush_context):
+    """Record quizzes whose questions, options, feedback or rubrics changed."""
+    quiz_ids, question_ids = set(), set()
+    for objects, is_new_or_deleted in (
+        (session.new, True),
+        (session.deleted, True),
+        (session.dirty, False),
+    ):
+        for obj in objects:
+            if isinstance(obj, Quiz):
+                quiz_ids |= _touched_ids(session, obj, "id", is_new_or_deleted)
+            elif isinstance(obj, Question):
+                quiz_ids |= _touched_ids(session, obj, "quiz_id", is_new_or_deleted)
+            elif isinstance(obj, (QuestionOption, QuizFeedback, AssessmentRubric)):
+                question_ids |= _touched_ids(session, obj, "question_id", is_new_or_deleted)
+
+    question_ids.discard(None)
+    if question_ids:
+        quiz_ids.update(
+            session.connection()
+            .execute(select(Question.quiz_id).where(Question.id.in_(question_ids)))
+            .scalars()
+        )
+    quiz_ids.discard(None)
+    if quiz_ids:
+        session.info.setdefault(_CHANGED_QUIZZES_KEY, set()).update(quiz_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_quiz_snapshots(session):
+    quiz_ids = session.info.pop(_CHANGED_QUIZZES_KEY, None)
+    if quiz_ids:
+        from app.services.quiz_compiler import quiz_compiler
+
+        quiz_compiler.invalidate(quiz_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_quizzes(session):
+    session.info.pop(_CHANGED_QUIZZES_KEY, None)
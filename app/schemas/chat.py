@@ -92,7 +92,7 @@ class UserPresenceUpdate(BaseModel):
 
 
 class UserPresenceResponse(BaseModel):
-    id: int
+    id: Optional[int] = None
     user_id: int
     user_name: Optional[str] = None
     status: str
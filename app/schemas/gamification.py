@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 
 class LeaderboardEntry(BaseModel):
@@ -7,6 +7,8 @@ class LeaderboardEntry(BaseModel):
     full_name: str
     coins: int
     streak_days: int
+    rank: Optional[int] = None
+    score: Optional[int] = None
 
 
 class Leaderboard(BaseModel):
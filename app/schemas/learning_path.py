@@ -113,6 +113,9 @@ class PathEnrollmentWithProgress(PathEnrollment):
     """Enrollment with path details"""
 
     path: Optional[LearningPath] = None
+    # Computed from the path's prerequisite graph
+    next_course_id: Optional[int] = None
+    unlockable_course_ids: List[int] = []
 
 
 class LearningPathList(BaseModel):
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, field_validator, ConfigDict
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 
 class DripSettingBase(BaseModel):
@@ -56,3 +56,22 @@ class LessonAccessInfo(BaseModel):
     unlock_date: Optional[datetime] = None
     days_remaining: Optional[int] = None
     prerequisite_lesson_id: Optional[int] = None
+
+
+class LessonOutlineAccess(LessonAccessInfo):
+    """Access status of one lesson in a course outline"""
+
+    lesson_id: int
+    module_id: int
+    is_locked: bool
+    is_completed: bool = False
+
+
+class CourseAccessOutline(BaseModel):
+    """Access status of a course and every lesson in it"""
+
+    course_id: int
+    has_access: bool
+    granted_by: Optional[str] = None  # enrollment, subscription
+    reason: Optional[str] = None
+    lessons: List[LessonOutlineAccess] = []
@@ -1,22 +1,245 @@
 """
 AI Debug Service
 Logs and tracks every AI operation step-by-step for transparency
+
+Logging is write-behind: sessions and steps are queued in memory and a
+background writer inserts them in batches, so logging adds no database
+round-trip to AI requests. Full payloads are compressed (zstd if
+installed, otherwise gzip); the summaries stay plain for listing. The
+queue is bounded - when it is full new entries are dropped and counted
+rather than slowing requests down.
 """
 
+import base64
+import gzip
+import logging
+import queue
+import random
+import threading
+import time
 import uuid
+from collections import OrderedDict
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 import json
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
+from app.db.session import SessionLocal
 from app.models.ai_debug_logs import AIDebugLog, AIDebugSession
+from app.services.ai_metering import estimate_cost
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_CHARS = 500
+
+# Payloads smaller than this are stored as plain text
+COMPRESS_MIN_BYTES = 1024
+
+_ZSTD_PREFIX = "~zstd1:"
+_GZIP_PREFIX = "~gzip1:"
+
+
+def compress_payload(text: Optional[str]) -> Optional[str]:
+    """Compress a payload into a text-safe string (plain text if small)."""
+    if not text:
+        return text
+    raw = text.encode("utf-8")
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return text
+    if zstandard is not None:
+        return _ZSTD_PREFIX + base64.b64encode(zstandard.ZstdCompressor(level=6).compress(raw)).decode()
+    return _GZIP_PREFIX + base64.b64encode(gzip.compress(raw, compresslevel=6)).decode()
+
+
+def decompress_payload(value: Optional[str]) -> Optional[str]:
+    """Inverse of compress_payload; rows written before compression pass through."""
+    if not value:
+        return value
+    if value.startswith(_GZIP_PREFIX):
+        return gzip.decompress(base64.b64decode(value[len(_GZIP_PREFIX):])).decode("utf-8")
+    if value.startswith(_ZSTD_PREFIX):
+        if zstandard is None:
+            return "[zstd-compressed payload; install zstandard to read it]"
+        data = base64.b64decode(value[len(_ZSTD_PREFIX):])
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data).decode("utf-8")
+    return value
+
+
+class SessionTracker:
+    """Running totals per debug session, bounded by size (LRU) and age (TTL)."""
+
+    def __init__(self, max_sessions: int, ttl_seconds: float):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, dict]" = OrderedDict()
+
+    def _evict(self, now: float):
+        while self._sessions:
+            session_id, info = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions or now - info["touched"] > self.ttl_seconds:
+                self._sessions.popitem(last=False)
+            else:
+                break
+
+    def add(self, session_id: str, info: dict):
+        now = time.monotonic()
+        with self._lock:
+            info["touched"] = now
+            self._sessions[session_id] = info
+            self._evict(now)
+
+    def get(self, session_id: str) -> Optional[dict]:
+        now = time.monotonic()
+        with self._lock:
+            info = self._sessions.get(session_id)
+            if info is None:
+                return None
+            if now - info["touched"] > self.ttl_seconds:
+                del self._sessions[session_id]
+                return None
+            info["touched"] = now
+            self._sessions.move_to_end(session_id)
+            return info
+
+    def pop(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class AIDebugLogWriter:
+    """Bounded queue of debug records drained in batches by a background thread."""
+
+    def __init__(
+        self,
+        max_queue: int,
+        batch_size: int,
+        flush_interval: float,
+        session_factory=SessionLocal,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.session_factory = session_factory
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.written = 0
+        self.dropped = 0
+
+    def submit(self, kind: str, record: dict) -> bool:
+        """Queue a record without blocking; returns False if it was dropped."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((kind, record))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="ai-debug-log-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            self._write_batch(self._drain([first]))
+
+    def _drain(self, batch: list) -> list:
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch: list):
+        if not batch:
+            return
+        starts = [r for kind, r in batch if kind == "session"]
+        steps = [r for kind, r in batch if kind == "step"]
+        ends = [r for kind, r in batch if kind == "end"]
+
+        with self._write_lock:
+            db = self.session_factory()
+            try:
+                # Sessions first so ends queued in the same batch find them
+                if starts:
+                    db.execute(insert(AIDebugSession), starts)
+                if steps:
+                    db.execute(insert(AIDebugLog), steps)
+                for end in ends:
+                    session_id = end.pop("session_id")
+                    db.query(AIDebugSession).filter(
+                        AIDebugSession.session_id == session_id
+                    ).update(end, synchronize_session=False)
+                db.commit()
+                self.written += len(batch)
+            except Exception as e:
+                db.rollback()
+                self.dropped += len(batch)
+                logger.error(f"Failed to write {len(batch)} AI debug records: {e}")
+            finally:
+                db.close()
+
+    def flush(self):
+        """Write everything queued so far (used by tests and on shutdown)."""
+        while True:
+            batch = self._drain([])
+            if not batch:
+                return
+            self._write_batch(batch)
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval * 2)
+        self.flush()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
 
 
 class AIDebugService:
     """Service for logging and retrieving AI operation steps"""
 
-    def __init__(self):
-        self._current_sessions: Dict[str, dict] = {}  # In-memory tracking
+    def __init__(
+        self,
+        sample_rate: float = settings.AI_DEBUG_SAMPLE_RATE,
+        writer: Optional[AIDebugLogWriter] = None,
+    ):
+        self.sample_rate = sample_rate
+        self.writer = writer or AIDebugLogWriter(
+            max_queue=settings.AI_DEBUG_QUEUE_SIZE,
+            batch_size=settings.AI_DEBUG_BATCH_SIZE,
+            flush_interval=settings.AI_DEBUG_FLUSH_INTERVAL_SECONDS,
+        )
+        self._current_sessions = SessionTracker(
+            max_sessions=settings.AI_DEBUG_MAX_SESSIONS,
+            ttl_seconds=settings.AI_DEBUG_SESSION_TTL_SECONDS,
+        )
 
     def start_session(
         self,
@@ -28,8 +251,11 @@ class AIDebugService:
         """
         Start a new debug session.
         
+        Sessions are sampled at ``AI_DEBUG_SAMPLE_RATE``; an unsampled session
+        is still tracked and gets persisted if one of its steps fails.
+        
         Args:
-            db: Database session
+            db: Database session (unused; records are written in the background)
             operation_type: Type of operation (e.g., "drill_evaluation")
             student_id: Optional student ID
             related_entity_id: Optional related entity (question_id, etc.)
@@ -38,26 +264,31 @@ class AIDebugService:
             session_id for logging subsequent steps
         """
         session_id = str(uuid.uuid4())[:16]
-        
-        # Create session record
-        session = AIDebugSession(
-            session_id=session_id,
-            student_id=student_id,
-            operation_type=operation_type,
-            operation_status="in_progress"
-        )
-        db.add(session)
-        db.commit()
+        session_row = {
+            "id": uuid.uuid4(),
+            "session_id": session_id,
+            "student_id": student_id,
+            "operation_type": operation_type,
+            "operation_status": "in_progress",
+            "created_at": datetime.utcnow(),
+        }
+
+        sampled = random.random() < self.sample_rate
+        if sampled:
+            self.writer.submit("session", session_row)
         
         # Track in memory
-        self._current_sessions[session_id] = {
+        self._current_sessions.add(session_id, {
             "step_count": 0,
             "total_tokens": 0,
             "total_duration": 0,
             "total_cost": 0.0,
             "start_time": datetime.utcnow(),
-            "related_entity_id": related_entity_id
-        }
+            "related_entity_id": related_entity_id,
+            "student_id": student_id,
+            "sampled": sampled,
+            "session_row": None if sampled else session_row,
+        })
         
         return session_id
 
@@ -82,7 +313,7 @@ class AIDebugService:
         Log a single AI processing step.
         
         Args:
-            db: Database session
+            db: Database session (unused; records are written in the background)
             session_id: The session this step belongs to
             step_name: Name of the step (e.g., "topic_extraction")
             step_description: Human readable description
@@ -98,12 +329,18 @@ class AIDebugService:
             context_type: Context category
         """
         # Get session tracking
-        session_info = self._current_sessions.get(session_id, {
-            "step_count": 0,
-            "total_tokens": 0,
-            "total_duration": 0,
-            "total_cost": 0.0
-        })
+        session_info = self._current_sessions.get(session_id)
+        if session_info is None:
+            # Unknown or evicted session - track it from here on
+            session_info = {
+                "step_count": 0,
+                "total_tokens": 0,
+                "total_duration": 0,
+                "total_cost": 0.0,
+                "sampled": True,
+                "session_row": None,
+            }
+            self._current_sessions.add(session_id, session_info)
         
         session_info["step_count"] += 1
         session_info["total_tokens"] += tokens_used
@@ -112,37 +349,41 @@ class AIDebugService:
         # Estimate cost (rough estimate based on model)
         cost = self._estimate_cost(model_used, tokens_used)
         session_info["total_cost"] += cost
+
+        if not session_info["sampled"]:
+            if success:
+                return
+            # Failures are always kept: persist the session from this step on
+            session_info["sampled"] = True
+            self.writer.submit("session", session_info.pop("session_row"))
         
         # Serialize input/output
         input_str = self._safe_serialize(input_data)
         output_str = self._safe_serialize(output_data)
         
-        # Create log entry
-        log = AIDebugLog(
-            session_id=session_id,
-            step_number=session_info["step_count"],
-            step_name=step_name,
-            step_description=step_description,
-            input_summary=input_str[:500] if input_str else None,
-            input_full=input_str,
-            output_summary=output_str[:500] if output_str else None,
-            output_full=output_str,
-            model_used=model_used,
-            provider=provider,
-            tokens_used=tokens_used,
-            estimated_cost=cost,
-            duration_ms=duration_ms,
-            success=success,
-            is_fallback=is_fallback,
-            error_message=error_message,
-            context_type=context_type,
-            related_entity_id=session_info.get("related_entity_id")
-        )
-        db.add(log)
-        db.commit()
-        
-        # Update session tracking
-        self._current_sessions[session_id] = session_info
+        self.writer.submit("step", {
+            "id": uuid.uuid4(),
+            "session_id": session_id,
+            "student_id": session_info.get("student_id"),
+            "created_at": datetime.utcnow(),
+            "step_number": session_info["step_count"],
+            "step_name": step_name,
+            "step_description": step_description,
+            "input_summary": input_str[:SUMMARY_CHARS] if input_str else None,
+            "input_full": compress_payload(input_str),
+            "output_summary": output_str[:SUMMARY_CHARS] if output_str else None,
+            "output_full": compress_payload(output_str),
+            "model_used": model_used,
+            "provider": provider,
+            "tokens_used": tokens_used,
+            "estimated_cost": cost,
+            "duration_ms": duration_ms,
+            "success": success,
+            "is_fallback": is_fallback,
+            "error_message": error_message,
+            "context_type": context_type,
+            "related_entity_id": session_info.get("related_entity_id"),
+        })
 
     def end_session(
         self,
@@ -156,34 +397,47 @@ class AIDebugService:
         End a debug session and update summary.
         
         Args:
-            db: Database session
+            db: Database session (unused; records are written in the background)
             session_id: The session to end
             final_result: Summary of final result
             had_errors: Whether any errors occurred
             had_fallbacks: Whether any fallbacks were used
         """
-        session_info = self._current_sessions.get(session_id, {})
-        
-        # Update session record
-        session = db.query(AIDebugSession).filter(
-            AIDebugSession.session_id == session_id
-        ).first()
-        
-        if session:
-            session.completed_at = datetime.utcnow()
-            session.operation_status = "completed" if not had_errors else "failed"
-            session.total_steps = session_info.get("step_count", 0)
-            session.total_tokens = session_info.get("total_tokens", 0)
-            session.total_duration_ms = session_info.get("total_duration", 0)
-            session.total_cost = session_info.get("total_cost", 0.0)
-            session.final_result_summary = self._safe_serialize(final_result)[:1000]
-            session.had_errors = had_errors
-            session.had_fallbacks = had_fallbacks
-            db.commit()
-        
-        # Cleanup memory
-        if session_id in self._current_sessions:
-            del self._current_sessions[session_id]
+        session_info = self._current_sessions.pop(session_id) or {"sampled": True}
+        if not session_info.get("sampled"):
+            return
+
+        self.writer.submit("end", {
+            "session_id": session_id,
+            "completed_at": datetime.utcnow(),
+            "operation_status": "completed" if not had_errors else "failed",
+            "total_steps": session_info.get("step_count", 0),
+            "total_tokens": session_info.get("total_tokens", 0),
+            "total_duration_ms": session_info.get("total_duration", 0),
+            "total_cost": session_info.get("total_cost", 0.0),
+            "final_result_summary": self._safe_serialize(final_result)[:1000],
+            "had_errors": had_errors,
+            "had_fallbacks": had_fallbacks,
+        })
+
+    def flush(self) -> None:
+        """Write all queued debug records now."""
+        self.writer.flush()
+
+    def shutdown(self) -> None:
+        """Stop the background writer after writing what's queued."""
+        self.writer.shutdown()
+
+    def get_writer_stats(self) -> Dict[str, Any]:
+        """Queue depth and write/drop counters for monitoring"""
+        return {
+            "pending": self.writer.pending(),
+            "written": self.writer.written,
+            "dropped": self.writer.dropped,
+            "tracked_sessions": len(self._current_sessions),
+            "sample_rate": self.sample_rate,
+            "compression": "zstd" if zstandard is not None else "gzip",
+        }
 
     def get_session_logs(
         self,
@@ -268,8 +522,8 @@ class AIDebugService:
             "step_number": log.step_number,
             "step_name": log.step_name,
             "step_description": log.step_description,
-            "input_full": log.input_full,
-            "output_full": log.output_full,
+            "input_full": decompress_payload(log.input_full),
+            "output_full": decompress_payload(log.output_full),
             "model_used": log.model_used,
             "provider": log.provider,
             "tokens_used": log.tokens_used,
@@ -295,19 +549,7 @@ class AIDebugService:
 
     def _estimate_cost(self, model: str, tokens: int) -> float:
         """Estimate cost based on model and tokens (Fresh 2025)"""
-        # Rough cost estimates per 1K tokens
-        costs = {
-            "gemini-3.0-flash": 0.0001,
-            "gemini-3.0-pro": 0.00125,
-            "gemma-3-27b": 0.0, # Free tier on OpenRouter
-            "llama-3.3-70b": 0.0, # Free tier on OpenRouter
-        }
-        
-        for model_key, cost in costs.items():
-            if model_key.lower() in model.lower():
-                return (tokens / 1000) * cost
-        
-        return (tokens / 1000) * 0.0005  # Standard estimate
+        return estimate_cost(model, tokens)
 
 
 # Global instance
@@ -0,0 +1,369 @@
+"""
+AI Usage Metering
+
+Counts every provider attempt made on the AI path, per (provider, model,
+feature):
+- requests and errors
+- prompt / completion tokens
+- requests served by a fallback (not the first provider in the plan)
+- a latency histogram
+
+Counters are per-thread shards written only by their own thread, so
+recording takes no lock. A background thread folds this process's deltas
+into Redis every AI_METERING_FLUSH_SECONDS, where they add up across
+workers:
+- ``ai:usage:keys``          set of "provider|model|feature" keys
+- ``ai:usage:{key}``         hash of counter totals
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEYS_KEY = "ai:usage:keys"
+COUNTERS_KEY = "ai:usage:{key}"
+
+# Latency bucket upper bounds in milliseconds (last bucket is +Inf)
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+FIELDS = (
+    "requests",
+    "errors",
+    "fallbacks",
+    "prompt_tokens",
+    "completion_tokens",
+    "latency_ms_sum",
+) + tuple(f"le_{b}" for b in LATENCY_BUCKETS_MS) + ("le_inf",)
+
+_LATENCY_OFFSET = FIELDS.index("le_100")
+
+# Rough cost per 1K tokens; anything unlisted uses DEFAULT_COST_PER_1K
+COST_PER_1K = {
+    "gemini-3.0-flash": 0.0001,
+    "gemini-3.0-pro": 0.00125,
+    "gemma-3-27b": 0.0,  # Free tier on OpenRouter
+    "llama-3.3-70b": 0.0,  # Free tier on OpenRouter
+    ":free": 0.0,
+}
+DEFAULT_COST_PER_1K = 0.0005
+
+
+def estimate_cost(model: str, tokens: int) -> float:
+    """Estimate cost based on model and tokens"""
+    for model_key, cost in COST_PER_1K.items():
+        if model_key.lower() in (model or "").lower():
+            return (tokens / 1000) * cost
+    return (tokens / 1000) * DEFAULT_COST_PER_1K
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Rough token count (~4 characters per token) when a provider reports none."""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def _percentile(buckets: List[float], q: float) -> Optional[float]:
+    """Upper bound of the histogram bucket containing quantile q."""
+    total = sum(buckets)
+    if not total:
+        return None
+    rank = q * total
+    running = 0
+    for bound, count in zip(LATENCY_BUCKETS_MS + (None,), buckets):
+        running += count
+        if running >= rank:
+            return float(bound) if bound is not None else float(LATENCY_BUCKETS_MS[-1])
+    return float(LATENCY_BUCKETS_MS[-1])
+
+
+class AIMeter:
+    """Lock-free per-process AI usage counters with periodic Redis aggregation."""
+
+    def __init__(self, flush_interval: float = settings.AI_METERING_FLUSH_SECONDS):
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._shards: List[Dict[str, List[float]]] = []
+        self._shards_lock = threading.Lock()  # taken once per thread, not per record
+        self._flushed: Dict[str, List[float]] = {}
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    def _shard(self) -> Dict[str, List[float]]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            self._ensure_flusher()
+        return shard
+
+    def record(
+        self,
+        provider: str,
+        model: str,
+        feature: str,
+        latency_ms: float,
+        success: bool = True,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        fallback: bool = False,
+    ):
+        """
+        Record one provider attempt.
+
+        Args:
+            provider: Provider name (google, openrouter, ...)
+            model: Model name
+            feature: Calling feature (e.g. "prelims_recall")
+            latency_ms: Time the attempt took
+            success: Whether the provider answered
+            prompt_tokens: Input tokens used
+            completion_tokens: Output tokens used
+            fallback: Whether the answer came from a fallback provider
+        """
+        key = f"{provider}|{model}|{feature}"
+        shard = self._shard()
+        counters = shard.get(key)
+        if counters is None:
+            counters = shard.setdefault(key, [0.0] * len(FIELDS))
+
+        counters[0] += 1
+        if not success:
+            counters[1] += 1
+        if fallback and success:
+            counters[2] += 1
+        counters[3] += prompt_tokens
+        counters[4] += completion_tokens
+        counters[5] += latency_ms
+
+        bucket = len(LATENCY_BUCKETS_MS)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if latency_ms <= bound:
+                bucket = i
+                break
+        counters[_LATENCY_OFFSET + bucket] += 1
+
+    # ------------------------------------------------------------------
+    # Aggregation
+    # ------------------------------------------------------------------
+
+    def local_totals(self) -> Dict[str, List[float]]:
+        """Sum of all shards in this process since start."""
+        with self._shards_lock:
+            shards = list(self._shards)
+        totals: Dict[str, List[float]] = {}
+        for shard in shards:
+            for key, counters in list(shard.items()):
+                total = totals.setdefault(key, [0.0] * len(FIELDS))
+                for i, value in enumerate(list(counters)):
+                    total[i] += value
+        return totals
+
+    def _deltas(self, totals: Dict[str, List[float]]) -> Dict[str, List[float]]:
+        deltas = {}
+        for key, counters in totals.items():
+            previous = self._flushed.get(key, [0.0] * len(FIELDS))
+            delta = [now - before for now, before in zip(counters, previous)]
+            if any(delta):
+                deltas[key] = delta
+        return deltas
+
+    def flush_to_redis(self) -> int:
+        """
+        Add this process's counts since the last flush to the Redis totals.
+
+        Returns:
+            Number of counter keys flushed
+        """
+        redis = get_redis()
+        if redis is None:
+            return 0
+        with self._flush_lock:
+            totals = self.local_totals()
+            deltas = self._deltas(totals)
+            if not deltas:
+                return 0
+            try:
+                pipe = redis.pipeline(transaction=False)
+                pipe.sadd(KEYS_KEY, *deltas.keys())
+                for key, delta in deltas.items():
+                    counters_key = COUNTERS_KEY.format(key=key)
+                    for field, value in zip(FIELDS, delta):
+                        if not value:
+                            continue
+                        if float(value).is_integer():
+                            pipe.hincrby(counters_key, field, int(value))
+                        else:
+                            pipe.hincrbyfloat(counters_key, field, value)
+                pipe.execute()
+            except RedisError as e:
+                logger.warning(f"AI usage flush failed: {e}")
+                return 0
+            for key in deltas:
+                self._flushed[key] = totals[key]
+            return len(deltas)
+
+    def _ensure_flusher(self):
+        if self._thread is not None or self.flush_interval <= 0:
+            return
+        with self._flush_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run_flusher, name="ai-usage-flusher", daemon=True
+                )
+                self._thread.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush_to_redis()
+            except Exception as e:
+                logger.error(f"AI usage flusher error: {e}")
+
+    def totals(self) -> Tuple[Dict[str, List[float]], str]:
+        """
+        Cluster-wide totals when Redis is available, else this process's.
+
+        Returns:
+            (counters by key, scope) where scope is "cluster" or "process"
+        """
+        redis = get_redis()
+        if redis is None:
+            return self.local_totals(), "process"
+
+        self.flush_to_redis()
+        try:
+            keys = sorted(redis.smembers(KEYS_KEY))
+            pipe = redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.hgetall(COUNTERS_KEY.format(key=key))
+            rows = pipe.execute()
+        except RedisError as e:
+            logger.warning(f"AI usage read failed: {e}")
+            return self.local_totals(), "process"
+
+        return {
+            key: [float(row.get(field, 0)) for field in FIELDS]
+            for key, row in zip(keys, rows)
+        }, "cluster"
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def summary(self) -> Dict:
+        """Usage per provider/model/feature plus per-feature and overall totals."""
+        totals, scope = self.totals()
+        rows = []
+        features: Dict[str, Dict] = {}
+        overall = {"requests": 0, "errors": 0, "tokens": 0, "estimated_cost": 0.0}
+
+        for key, c in sorted(totals.items()):
+            provider, model, feature = key.split("|", 2)
+            counts = dict(zip(FIELDS, c))
+            requests = int(counts["requests"])
+            tokens = int(counts["prompt_tokens"] + counts["completion_tokens"])
+            cost = estimate_cost(model, tokens)
+            buckets = c[_LATENCY_OFFSET:]
+            rows.append(
+                {
+                    "provider": provider,
+                    "model": model,
+                    "feature": feature,
+                    "requests": requests,
+                    "errors": int(counts["errors"]),
+                    "error_rate": round(counts["errors"] / requests, 4) if requests else 0.0,
+                    "fallbacks": int(counts["fallbacks"]),
+                    "prompt_tokens": int(counts["prompt_tokens"]),
+                    "completion_tokens": int(counts["completion_tokens"]),
+                    "avg_latency_ms": round(counts["latency_ms_sum"] / requests, 1) if requests else 0.0,
+                    "p50_latency_ms": _percentile(buckets, 0.5),
+                    "p95_latency_ms": _percentile(buckets, 0.95),
+                    "estimated_cost": round(cost, 6),
+                }
+            )
+
+            per_feature = features.setdefault(
+                feature, {"requests": 0, "errors": 0, "tokens": 0, "estimated_cost": 0.0}
+            )
+            for target in (per_feature, overall):
+                target["requests"] += requests
+                target["errors"] += int(counts["errors"])
+                target["tokens"] += tokens
+                target["estimated_cost"] += cost
+
+        for target in list(features.values()) + [overall]:
+            target["estimated_cost"] = round(target["estimated_cost"], 6)
+
+        return {"scope": scope, "totals": overall, "by_feature": features, "by_model": rows}
+
+    def prometheus(self) -> str:
+        """Counters in the Prometheus text exposition format."""
+        totals, _ = self.totals()
+        lines = [
+            "# HELP ai_requests_total AI provider attempts.",
+            "# TYPE ai_requests_total counter",
+        ]
+        lines += self._series("ai_requests_total", totals, "requests")
+        lines += ["# HELP ai_errors_total Failed AI provider attempts.", "# TYPE ai_errors_total counter"]
+        lines += self._series("ai_errors_total", totals, "errors")
+        lines += [
+            "# HELP ai_fallbacks_total Requests served by a fallback provider.",
+            "# TYPE ai_fallbacks_total counter",
+        ]
+        lines += self._series("ai_fallbacks_total", totals, "fallbacks")
+        lines += ["# HELP ai_tokens_total Tokens used.", "# TYPE ai_tokens_total counter"]
+        lines += self._series("ai_tokens_total", totals, "prompt_tokens", 'kind="prompt"')
+        lines += self._series("ai_tokens_total", totals, "completion_tokens", 'kind="completion"')
+
+        lines += [
+            "# HELP ai_request_latency_ms AI provider attempt latency.",
+            "# TYPE ai_request_latency_ms histogram",
+        ]
+        for key, c in sorted(totals.items()):
+            labels = self._labels(key)
+            cumulative = 0.0
+            for bound, count in zip(LATENCY_BUCKETS_MS + ("+Inf",), c[_LATENCY_OFFSET:]):
+                cumulative += count
+                lines.append(f'ai_request_latency_ms_bucket{{{labels},le="{bound}"}} {cumulative:g}')
+            lines.append(f"ai_request_latency_ms_sum{{{labels}}} {c[5]:g}")
+            lines.append(f"ai_request_latency_ms_count{{{labels}}} {c[0]:g}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _labels(key: str) -> str:
+        provider, model, feature = (
+            part.replace("\\", "\\\\").replace('"', '\\"') for part in key.split("|", 2)
+        )
+        return f'provider="{provider}",model="{model}",feature="{feature}"'
+
+    def _series(
+        self, name: str, totals: Dict[str, List[float]], field: str, extra: str = ""
+    ) -> Iterable[str]:
+        index = FIELDS.index(field)
+        for key, c in sorted(totals.items()):
+            labels = self._labels(key) + (f",{extra}" if extra else "")
+            yield f"{name}{{{labels}}} {c[index]:g}"
+
+    def reset(self):
+        """Drop this process's counters (tests)."""
+        with self._shards_lock:
+            for shard in self._shards:
+                shard.clear()
+        self._flushed.clear()
+
+
+ai_meter = AIMeter()
@@ -5,6 +5,7 @@ Provides task classification but uses GeminiService for actual execution.
 
 import logging
 from typing import Optional, Dict, Any
+from app.services.ai_metering import ai_meter
 from app.services.gemini_service import gemini_service
 
 logger = logging.getLogger(__name__)
@@ -22,26 +23,41 @@ class AIRouter:
         max_tokens: int = 2000,
         temperature: float = 0.7,
         user: Any = None,
-        is_complex: bool = False
+        is_complex: bool = False,
+        feature: str = "general"
     ) -> Dict[str, Any]:
         """
         Routes the task to the tiered AI service.
+        
+        ``feature`` labels the request in usage metering.
         """
         full_prompt = f"{system_message}\n\n{prompt}" if system_message else prompt
         
         # Delegate to the cascading service
-        response = gemini_service.generate_text(
+        result = gemini_service.generate_text_with_meta(
             prompt=full_prompt,
             user=user,
             is_complex=is_complex,
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            feature=feature
         )
         
         return {
-            "content": response,
-            "status": "success"
+            "content": result["content"],
+            "status": "success" if result["provider"] else "error",
+            "model": result["model"],
+            "provider": result["provider"],
+            "usage": {
+                "prompt_tokens": result["prompt_tokens"],
+                "completion_tokens": result["completion_tokens"],
+                "fallback_hops": result["fallback_hops"],
+            },
         }
 
+    def get_usage_summary(self) -> Dict[str, Any]:
+        """AI usage per provider/model/feature (see app.services.ai_metering)"""
+        return ai_meter.summary()
+
 # Global router instance
 ai_router = AIRouter()
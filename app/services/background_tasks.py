@@ -2,13 +2,22 @@
 Background tasks using Celery for async processing.
 
 Tasks include:
-- Email sending
+- Email sending (single and batched bulk mail)
 - Report generation
 - Analytics computation
 - Notification processing
+- Notification fan-out to large audiences
 - Presence cleanup
+- Lesson progress write-behind
+- Live-class upvote write-behind
+- Marketing workflow execution
+- Stale workflow message sweeps
+- Weekly leaderboard rollover
+- Executive KPI snapshots
+- Revenue rollup reconciliation
 """
 
+from celery.schedules import crontab
 from app.core.celery_app import celery_app
 from app.db.session import SessionLocal
 from app.services.presence import presence_service
@@ -36,10 +45,65 @@ def cleanup_stale_presence():
         db.close()
 
 
+@celery_app.task(name="flush_presence")
+def flush_presence_task():
+    """
+    Persist presence changes buffered in Redis to the database in bulk.
+    Scheduled to run every 30 seconds.
+    """
+    db = SessionLocal()
+    try:
+        count = presence_service.flush_to_db(db)
+        return {"status": "success", "flushed": count}
+    except Exception as e:
+        logger.error(f"Error flushing presence: {e}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+
+@celery_app.task(name="flush_lesson_progress")
+def flush_lesson_progress_task():
+    """
+    Persist buffered lesson progress heartbeats to the database in bulk.
+    Scheduled to run every 15 seconds.
+    """
+    from app.services.progress_ingestion import progress_ingestion
+
+    db = SessionLocal()
+    try:
+        count = progress_ingestion.flush_to_db(db)
+        return {"status": "success", "flushed": count}
+    except Exception as e:
+        logger.error(f"Error flushing lesson progress: {e}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+
+@celery_app.task(name="flush_live_interactions")
+def flush_live_interactions_task():
+    """
+    Persist live-class question upvotes counted in Redis to the database in bulk.
+    Scheduled to run every 15 seconds.
+    """
+    from app.services.live_interaction import live_interaction
+
+    db = SessionLocal()
+    try:
+        count = live_interaction.flush_to_db(db)
+        return {"status": "success", "flushed": count}
+    except Exception as e:
+        logger.error(f"Error flushing live interactions: {e}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+
 @celery_app.task(name="send_email")
 def send_email_task(to_email: str, subject: str, body: str, html: bool = False):
     """
-    Send email asynchronously.
+    Send email asynchronously over the worker's pooled SMTP connection.
 
     Args:
         to_email: Recipient email
@@ -47,37 +111,65 @@ def send_email_task(to_email: str, subject: str, body: str, html: bool = False):
         body: Email body
         html: Whether body is HTML
     """
-    from app.services.email_notification_service import email_notification_service
+    from app.services.mailer import bulk_mailer
 
     try:
         logger.info(f"Sending email to {to_email}: {subject}")
-
-        # Use email notification service to send email
-        db = SessionLocal()
-        try:
-            # Send the email
-            success = email_notification_service.send_email(
-                db=db, to_email=to_email, subject=subject, body=body, is_html=html
-            )
-
-            if success:
-                logger.info(f"Email sent successfully to {to_email}")
-                return {"status": "success", "to": to_email}
-            else:
-                logger.error(f"Failed to send email to {to_email}")
-                return {
-                    "status": "error",
-                    "to": to_email,
-                    "message": "Email sending failed",
-                }
-        finally:
-            db.close()
+        error = bulk_mailer.send_raw(to_email, subject, body, html=html)
+        if error is None:
+            logger.info(f"Email sent successfully to {to_email}")
+            return {"status": "success", "to": to_email}
+        logger.error(f"Failed to send email to {to_email}: {error}")
+        return {"status": "error", "to": to_email, "message": error}
 
     except Exception as e:
         logger.error(f"Error sending email to {to_email}: {e}")
         return {"status": "error", "to": to_email, "message": str(e)}
 
 
+@celery_app.task(name="send_bulk_email")
+def send_bulk_email_task(
+    template_name: str, notification_type: str, recipients: list, force: bool = False
+):
+    """
+    Send one template to a batch of recipients: preferences resolved in one
+    query, logs written in bulk, messages sent over one pooled SMTP connection.
+
+    Args:
+        template_name: EmailTemplate name
+        notification_type: Email NotificationType value
+        recipients: [{"user_id", "email", "variables"}] for this batch
+        force: Send even to users who disabled this notification type
+    """
+    from app.services.mailer import Recipient, bulk_mailer
+
+    db = SessionLocal()
+    try:
+        result = bulk_mailer.send_batch(
+            db,
+            template_name,
+            notification_type,
+            [Recipient(**recipient) for recipient in recipients],
+            force=force,
+        )
+        logger.info(
+            f"Bulk email '{template_name}': {result.sent} sent, "
+            f"{result.failed} failed, {result.skipped} skipped"
+        )
+        return {
+            "status": "success",
+            "sent": result.sent,
+            "failed": result.failed,
+            "skipped": result.skipped,
+        }
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error sending bulk email '{template_name}': {e}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+
 @celery_app.task(name="generate_report")
 def generate_report_task(report_type: str, user_id: int, filters: dict):
     """
@@ -234,6 +326,160 @@ def process_notification_task(notification_id: int):
         db.close()
 
 
+@celery_app.task(name="dispatch_notifications")
+def dispatch_notifications_task(
+    user_ids: list,
+    notification_type: str,
+    title: str,
+    message: str,
+    data: dict = None,
+    action_url: str = None,
+    priority: str = "normal",
+):
+    """
+    Write and deliver one notification to a large audience in batches.
+    Queued by NotificationDispatcher.dispatch; delivery reaches the web
+    workers' sockets over Redis pub/sub.
+
+    Args:
+        user_ids: Recipient user IDs
+        notification_type: NotificationType value
+    """
+    from app.services.notification_dispatch import notification_dispatcher
+
+    db = SessionLocal()
+    try:
+        ids = notification_dispatcher.dispatch_now(
+            db, user_ids, notification_type, title, message, data, action_url, priority
+        )
+        logger.info(f"Dispatched {len(ids)} '{notification_type}' notifications")
+        return {"status": "success", "created": len(ids)}
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error dispatching notifications: {e}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+
+@celery_app.task(name="advance_marketing_workflows")
+def advance_marketing_workflows_task(max_batches: int = 100):
+    """
+    Advance due marketing workflow executions in batches.
+    Scheduled to run every minute; safe to run on several workers at once
+    since executions are claimed with SKIP LOCKED.
+
+    Args:
+        max_batches: Upper bound on batches processed per run
+    """
+    from app.services.workflow_engine import workflow_engine
+
+    db = SessionLocal()
+    try:
+        totals = workflow_engine.run_until_idle(db, max_batches=max_batches)
+        logger.info(f"Advanced marketing workflows: {totals}")
+        return {"status": "success", **totals}
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error advancing marketing workflows: {e}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+
+@celery_app.task(name="sweep_stale_workflow_messages")
+def sweep_stale_workflow_messages_task():
+    """
+    Retry workflow messages left PENDING after the outbox commit (e.g. by a
+    crashed worker) and fail the ones that are too old to send.
+    """
+    from app.services.workflow_engine import workflow_engine
+
+    db = SessionLocal()
+    try:
+        result = workflow_engine.sweep_stale_messages(db)
+        return {"status": "success", "retried": result["retried"], "expired": result["expired"]}
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error sweeping stale workflow messages: {e}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+
+@celery_app.task(name="rollover_weekly_leaderboards")
+def rollover_weekly_leaderboards_task():
+    """
+    Start a new leaderboard week.
+    Redis weekly boards are keyed per ISO week and roll over by themselves;
+    this resets the persisted pack weekly_points used by the SQL fallback.
+    """
+    from app.services.pack_service import pack_service
+
+    db = SessionLocal()
+    try:
+        pack_service.reset_weekly_points(db)
+        return {"status": "success"}
+    except Exception as e:
+        logger.error(f"Error rolling over weekly leaderboards: {e}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+
+@celery_app.task(name="refresh_kpi_snapshot")
+def refresh_kpi_snapshot_task():
+    """
+    Recompute the executive KPI snapshot and prune old ones.
+    Scheduled well inside the snapshot staleness bound so dashboard
+    reads never have to compute KPIs inline.
+    """
+    from app.services.kpi_engine import kpi_engine
+
+    db = SessionLocal()
+    try:
+        snapshot = kpi_engine.refresh(db)
+        pruned = kpi_engine.prune(db)
+        return {
+            "status": "success",
+            "snapshot_id": snapshot.id,
+            "compute_ms": round(snapshot.compute_ms, 1),
+            "pruned": pruned,
+        }
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error refreshing KPI snapshot: {e}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+
+@celery_app.task(name="rebuild_revenue_rollups")
+def rebuild_revenue_rollups_task(days: int = 2):
+    """
+    Recompute the revenue rollup for the last ``days`` days from orders.
+    The rollup is maintained incrementally; this nightly pass reconciles
+    any drift (e.g. orders edited with bulk SQL). Pass days=0 to rebuild
+    all history, e.g. after the rollup table is first created.
+    """
+    from datetime import timedelta, timezone
+    from app.services.revenue_rollup import revenue_rollup
+
+    db = SessionLocal()
+    try:
+        start = None
+        if days:
+            start = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+        buckets = revenue_rollup.rebuild(db, start=start)
+        return {"status": "success", "buckets": buckets}
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error rebuilding revenue rollups: {e}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+
 # Scheduled tasks configuration
 @celery_app.on_after_configure.connect
 def setup_periodic_tasks(sender, **kwargs):
@@ -247,9 +493,65 @@ def setup_periodic_tasks(sender, **kwargs):
         name="cleanup-stale-presence-every-5min",
     )
 
+    # Write-behind presence flush every 30 seconds
+    sender.add_periodic_task(
+        30.0,
+        flush_presence_task.s(),
+        name="flush-presence-every-30s",
+    )
+
+    # Write-behind lesson progress flush every 15 seconds
+    sender.add_periodic_task(
+        15.0,
+        flush_lesson_progress_task.s(),
+        name="flush-lesson-progress-every-15s",
+    )
+
+    # Write-behind live-class upvote flush every 15 seconds
+    sender.add_periodic_task(
+        15.0,
+        flush_live_interactions_task.s(),
+        name="flush-live-interactions-every-15s",
+    )
+
     # Compute analytics every hour
     sender.add_periodic_task(
         3600.0,  # 1 hour
         compute_analytics_task.s(),
         name="compute-analytics-every-hour",
     )
+
+    # Weekly leaderboard rollover (Monday 00:00 UTC)
+    sender.add_periodic_task(
+        crontab(minute=0, hour=0, day_of_week=1),
+        rollover_weekly_leaderboards_task.s(),
+        name="rollover-weekly-leaderboards",
+    )
+
+    # Advance marketing workflow executions every minute
+    sender.add_periodic_task(
+        60.0,  # 1 minute
+        advance_marketing_workflows_task.s(),
+        name="advance-marketing-workflows-every-minute",
+    )
+
+    # Retry or fail stale PENDING workflow messages every 5 minutes
+    sender.add_periodic_task(
+        300.0,  # 5 minutes
+        sweep_stale_workflow_messages_task.s(),
+        name="sweep-stale-workflow-messages-every-5min",
+    )
+
+    # Refresh executive KPI snapshot every 5 minutes
+    sender.add_periodic_task(
+        300.0,  # 5 minutes
+        refresh_kpi_snapshot_task.s(),
+        name="refresh-kpi-snapshot-every-5min",
+    )
+
+    # Reconcile the revenue rollup nightly (00:30 UTC)
+    sender.add_periodic_task(
+        crontab(minute=30, hour=0),
+        rebuild_revenue_rollups_task.s(),
+        name="rebuild-revenue-rollups-nightly",
+    )
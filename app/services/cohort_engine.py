@@ -0,0 +1,246 @@
+"""
+Cohort Engine
+
+Builds the full cohort x month-offset retention matrix with one grouped
+query. A user's cohort is the month of their first enrollment; they count
+as active in any month with an enrollment or logged activity.
+
+Cells for closed calendar months never change, so they are cached (in
+process and in Redis) and only the columns for months that closed since
+the last build, plus the current month, are ever queried again.
+"""
+
+import json
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import Integer, cast, extract, func, select, union_all
+from sqlalchemy.orm import Session
+
+from app.core.redis_client import get_redis
+from app.models.activity_log import ActivityLog
+from app.models.enrollment import Enrollment
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = "cohorts:matrix:closed"
+CACHE_TTL_SECONDS = 40 * 24 * 3600
+
+
+def month_index(moment: datetime) -> int:
+    """Months since year 0, so consecutive months differ by one."""
+    return moment.year * 12 + moment.month - 1
+
+
+def parse_period(period: str) -> int:
+    """Month index for a "YYYY-MM" period."""
+    year, month = map(int, period.split("-"))
+    return year * 12 + month - 1
+
+
+def format_period(index: int) -> str:
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+def month_index_sql(column):
+    return cast(extract("year", column), Integer) * 12 + cast(
+        extract("month", column), Integer
+    ) - 1
+
+
+@dataclass
+class CohortMatrix:
+    """
+    Ragged retention matrix.
+
+    rows[i][k] is the number of users from cohort month `first + i` who
+    were active `k` months later. rows[i][0] is the cohort size.
+    """
+
+    first: Optional[int] = None
+    rows: List[List[int]] = field(default_factory=list)
+
+    def set_cell(self, cohort: int, month: int, count: int):
+        if self.first is None:
+            self.first = cohort
+        if cohort < self.first:
+            self.rows[:0] = [[0] for _ in range(self.first - cohort)]
+            self.first = cohort
+        i = cohort - self.first
+        while len(self.rows) <= i:
+            self.rows.append([0])
+        row = self.rows[i]
+        k = month - cohort
+        if len(row) <= k:
+            row.extend([0] * (k + 1 - len(row)))
+        row[k] = count
+
+    def pad_to(self, month: int):
+        """Extend every row with zeros through `month` (the current month)."""
+        if self.first is None:
+            return
+        while self.first + len(self.rows) <= month:
+            self.rows.append([0])
+        for i, row in enumerate(self.rows):
+            width = month - (self.first + i) + 1
+            if len(row) < width:
+                row.extend([0] * (width - len(row)))
+
+    def row(self, cohort: int) -> List[int]:
+        if self.first is None or cohort < self.first:
+            return []
+        i = cohort - self.first
+        return self.rows[i] if i < len(self.rows) else []
+
+    def size(self, cohort: int) -> int:
+        row = self.row(cohort)
+        return row[0] if row else 0
+
+    def periods(self) -> List[Tuple[str, int]]:
+        """(period, cohort size) for every non-empty cohort, oldest first."""
+        if self.first is None:
+            return []
+        return [
+            (format_period(self.first + i), row[0])
+            for i, row in enumerate(self.rows)
+            if row[0]
+        ]
+
+    def copy(self) -> "CohortMatrix":
+        return CohortMatrix(self.first, [list(row) for row in self.rows])
+
+    def to_json(self, closed_through: int) -> str:
+        return json.dumps(
+            {"first": self.first, "rows": self.rows, "closed_through": closed_through}
+        )
+
+    @classmethod
+    def from_json(cls, raw: str) -> Tuple["CohortMatrix", int]:
+        data = json.loads(raw)
+        return cls(data["first"], data["rows"]), data["closed_through"]
+
+
+class CohortEngine:
+    """Incrementally maintained cohort retention matrix."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._closed: Optional[CohortMatrix] = None
+        self._closed_through: Optional[int] = None
+
+    def _query_cells(
+        self, db: Session, month_from: Optional[int], month_to: int
+    ) -> List[Tuple[int, int, int]]:
+        """
+        Active-user counts per (cohort month, activity month) in one query.
+
+        Args:
+            db: Database session
+            month_from: First activity month to include (None = all)
+            month_to: Last activity month to include
+
+        Returns:
+            (cohort month, activity month, active users) rows
+        """
+        cohorts = (
+            select(
+                Enrollment.user_id.label("user_id"),
+                func.min(month_index_sql(Enrollment.enrolled_at)).label("cohort"),
+            )
+            .group_by(Enrollment.user_id)
+            .cte("cohorts")
+        )
+        activity = union_all(
+            select(
+                Enrollment.user_id.label("user_id"),
+                month_index_sql(Enrollment.enrolled_at).label("month"),
+            ),
+            select(
+                ActivityLog.user_id.label("user_id"),
+                month_index_sql(ActivityLog.timestamp).label("month"),
+            ).where(ActivityLog.timestamp.isnot(None)),
+        ).cte("activity")
+
+        query = (
+            select(
+                cohorts.c.cohort,
+                activity.c.month,
+                func.count(func.distinct(activity.c.user_id)),
+            )
+            .join(activity, activity.c.user_id == cohorts.c.user_id)
+            .where(activity.c.month >= cohorts.c.cohort, activity.c.month <= month_to)
+            .group_by(cohorts.c.cohort, activity.c.month)
+        )
+        if month_from is not None:
+            query = query.where(activity.c.month >= month_from)
+        return [(int(c), int(m), int(n)) for c, m, n in db.execute(query).all()]
+
+    def _load_cached(self) -> Tuple[Optional[CohortMatrix], Optional[int]]:
+        if self._closed is not None:
+            return self._closed, self._closed_through
+        redis = get_redis()
+        if redis is None:
+            return None, None
+        try:
+            raw = redis.get(CACHE_KEY)
+        except RedisError as e:
+            logger.warning(f"Cohort cache read failed: {e}")
+            return None, None
+        if not raw:
+            return None, None
+        return CohortMatrix.from_json(raw)
+
+    def _store_cached(self, matrix: CohortMatrix, closed_through: int):
+        self._closed, self._closed_through = matrix, closed_through
+        redis = get_redis()
+        if redis is None:
+            return
+        try:
+            redis.set(CACHE_KEY, matrix.to_json(closed_through), ex=CACHE_TTL_SECONDS)
+        except RedisError as e:
+            logger.warning(f"Cohort cache write failed: {e}")
+
+    def matrix(self, db: Session, now: Optional[datetime] = None) -> CohortMatrix:
+        """
+        Get the retention matrix through the current month.
+
+        Closed months come from cache; months that closed since the cache
+        was built are folded in, and the current month is always fresh.
+        """
+        current = month_index(now or datetime.utcnow())
+
+        with self._lock:
+            closed, closed_through = self._load_cached()
+            if closed is None or closed_through is None or closed_through >= current:
+                closed, closed_through = CohortMatrix(), None
+
+            if closed_through is None or closed_through < current - 1:
+                month_from = None if closed_through is None else closed_through + 1
+                closed = closed.copy()
+                for cohort, month, count in self._query_cells(db, month_from, current - 1):
+                    closed.set_cell(cohort, month, count)
+                self._store_cached(closed, current - 1)
+
+        result = closed.copy()
+        for cohort, month, count in self._query_cells(db, current, current):
+            result.set_cell(cohort, month, count)
+        result.pad_to(current)
+        return result
+
+    def invalidate(self):
+        """Drop cached closed months (e.g. after backfilling historic data)."""
+        with self._lock:
+            self._closed, self._closed_through = None, None
+            redis = get_redis()
+            if redis is not None:
+                try:
+                    redis.delete(CACHE_KEY)
+                except RedisError as e:
+                    logger.warning(f"Cohort cache invalidation failed: {e}")
+
+
+cohort_engine = CohortEngine()
@@ -5,14 +5,23 @@ Provides functionality to create and analyze user cohorts,
 track retention, and identify performance patterns.
 """
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime
+from sqlalchemy import case, func, select
 from enum import Enum
 
-from app.models.enrollment import Enrollment
-from app.models.order import Order
+from app.models.enrollment import Enrollment, EnrollmentStatus
+from app.models.order import Order, OrderStatus
+from app.services.cohort_engine import (
+    CohortMatrix,
+    cohort_engine,
+    format_period,
+    month_index_sql,
+    parse_period,
+)
+
+# Month offsets reported by retention analysis (formation month + 12)
+RETENTION_MONTHS = 13
 
 
 class CohortType(str, Enum):
@@ -30,39 +39,62 @@ class CohortService:
     @staticmethod
     def create_enrollment_cohorts(db: Session) -> List[Dict[str, Any]]:
         """
-        Create cohorts based on enrollment month.
+        Create cohorts based on first enrollment month.
 
         Returns list of cohorts with member counts.
         """
-        # Group users by their first enrollment month
-        cohorts_data = (
-            db.query(
-                func.strftime("%Y-%m", Enrollment.enrolled_at).label("cohort_month"),
-                func.count(func.distinct(Enrollment.user_id)).label("member_count"),
-            )
-            .group_by("cohort_month")
-            .order_by("cohort_month")
-            .all()
-        )
+        matrix = cohort_engine.matrix(db)
+        return [
+            {
+                "name": f"Cohort {period}",
+                "cohort_type": CohortType.ENROLLMENT_MONTH,
+                "period": period,
+                "member_count": member_count,
+            }
+            for period, member_count in matrix.periods()
+        ]
 
-        cohorts = []
-        for cohort_month, member_count in cohorts_data:
-            cohorts.append(
-                {
-                    "name": f"Cohort {cohort_month}",
-                    "cohort_type": CohortType.ENROLLMENT_MONTH,
-                    "period": cohort_month,
-                    "member_count": member_count,
-                }
-            )
+    @staticmethod
+    def _retention_from_matrix(
+        matrix: CohortMatrix,
+        cohort_period: str,
+        cohort_type: CohortType = CohortType.ENROLLMENT_MONTH,
+    ) -> Dict[str, Any]:
+        """Slice one cohort's retention curve out of the matrix."""
+        cohort = parse_period(cohort_period)
+        row = matrix.row(cohort)
+        initial_size = row[0] if row else 0
+
+        if initial_size == 0:
+            return {
+                "cohort_period": cohort_period,
+                "initial_size": 0,
+                "retention_data": [],
+            }
+
+        retention_data = [
+            {
+                "months_after_formation": months_after,
+                "period": format_period(cohort + months_after),
+                "active_users": active_count,
+                "retention_rate": round(active_count / initial_size * 100, 2),
+            }
+            for months_after, active_count in enumerate(row[:RETENTION_MONTHS])
+        ]
 
-        return cohorts
+        return {
+            "cohort_period": cohort_period,
+            "cohort_type": cohort_type.value,
+            "initial_size": initial_size,
+            "retention_data": retention_data,
+        }
 
     @staticmethod
     def analyze_cohort_retention(
         db: Session,
         cohort_period: str,  # e.g., "2025-01"
         cohort_type: CohortType = CohortType.ENROLLMENT_MONTH,
+        matrix: Optional[CohortMatrix] = None,
     ) -> Dict[str, Any]:
         """
         Analyze retention for a specific cohort over time.
@@ -71,175 +103,118 @@ class CohortService:
             db: Database session
             cohort_period: Period identifier (e.g., "2025-01")
             cohort_type: Type of cohort analysis
+            matrix: Already-built retention matrix to slice
 
         Returns:
             Retention data by time period
         """
-        # Get cohort start and end dates
-        year, month = map(int, cohort_period.split("-"))
-        cohort_start = datetime(year, month, 1)
-
-        # Calculate next month for end date
-        if month == 12:
-            cohort_end = datetime(year + 1, 1, 1)
-        else:
-            cohort_end = datetime(year, month + 1, 1)
-
-        # Get all users who enrolled in this period
-        cohort_users = (
-            db.query(Enrollment.user_id)
-            .filter(
-                Enrollment.enrolled_at >= cohort_start,
-                Enrollment.enrolled_at < cohort_end,
-            )
-            .distinct()
-            .all()
-        )
+        matrix = matrix or cohort_engine.matrix(db)
+        return CohortService._retention_from_matrix(matrix, cohort_period, cohort_type)
 
-        cohort_user_ids = [u[0] for u in cohort_users]
-        initial_size = len(cohort_user_ids)
-
-        if initial_size == 0:
-            return {
-                "cohort_period": cohort_period,
-                "initial_size": 0,
-                "retention_data": [],
-            }
+    @staticmethod
+    def _performance_by_cohort(
+        db: Session, cohorts: List[int]
+    ) -> Dict[int, Dict[str, float]]:
+        """
+        Enrollment and revenue totals for cohort members, grouped by cohort.
 
-        # Calculate retention for each month after cohort formation
-        retention_data = []
-        current_date = datetime.utcnow()
-
-        for months_after in range(0, 13):  # Up to 12 months
-            # Calculate the period to check
-            check_month = month + months_after
-            check_year = year
-            while check_month > 12:
-                check_month -= 12
-                check_year += 1
-
-            check_start = datetime(check_year, check_month, 1)
-            if check_month == 12:
-                check_end = datetime(check_year + 1, 1, 1)
-            else:
-                check_end = datetime(check_year, check_month + 1, 1)
-
-            # Don't project into the future
-            if check_start > current_date:
-                break
-
-            # Count active users in this period
-            active_count = (
-                db.query(func.count(func.distinct(Enrollment.user_id)))
-                .filter(
-                    Enrollment.user_id.in_(cohort_user_ids),
-                    Enrollment.enrolled_at >= check_start,
-                    Enrollment.enrolled_at < check_end,
-                )
-                .scalar()
-                or 0
-            )
+        Two grouped queries regardless of how many cohorts are requested.
+        """
+        if not cohorts:
+            return {}
 
-            retention_rate = (
-                (active_count / initial_size * 100) if initial_size > 0 else 0
+        members = (
+            select(
+                Enrollment.user_id.label("user_id"),
+                func.min(month_index_sql(Enrollment.enrolled_at)).label("cohort"),
             )
+            .group_by(Enrollment.user_id)
+            .subquery()
+        )
 
-            retention_data.append(
-                {
-                    "months_after_formation": months_after,
-                    "period": f"{check_year}-{check_month:02d}",
-                    "active_users": active_count,
-                    "retention_rate": round(retention_rate, 2),
-                }
+        enrollment_rows = db.execute(
+            select(
+                members.c.cohort,
+                func.count(Enrollment.id),
+                func.sum(case((Enrollment.status == EnrollmentStatus.COMPLETED, 1), else_=0)),
+                func.sum(case((Enrollment.status == EnrollmentStatus.ACTIVE, 1), else_=0)),
             )
+            .join(members, members.c.user_id == Enrollment.user_id)
+            .where(members.c.cohort.in_(cohorts))
+            .group_by(members.c.cohort)
+        ).all()
+
+        revenue_rows = db.execute(
+            select(members.c.cohort, func.sum(Order.total))
+            .join(members, members.c.user_id == Order.user_id)
+            .where(members.c.cohort.in_(cohorts), Order.status == OrderStatus.COMPLETED)
+            .group_by(members.c.cohort)
+        ).all()
+        revenue = {int(cohort): float(total or 0) for cohort, total in revenue_rows}
 
         return {
-            "cohort_period": cohort_period,
-            "cohort_type": cohort_type.value,
-            "initial_size": initial_size,
-            "retention_data": retention_data,
+            int(cohort): {
+                "enrollments": int(total or 0),
+                "completed": int(completed or 0),
+                "active": int(active or 0),
+                "revenue": revenue.get(int(cohort), 0.0),
+            }
+            for cohort, total, completed, active in enrollment_rows
         }
 
     @staticmethod
-    def get_cohort_performance(db: Session, cohort_period: str) -> Dict[str, Any]:
-        """
-        Get performance metrics for a cohort.
-
-        Returns completion rates, revenue, engagement, etc.
-        """
-        year, month = map(int, cohort_period.split("-"))
-        cohort_start = datetime(year, month, 1)
-
-        if month == 12:
-            cohort_end = datetime(year + 1, 1, 1)
-        else:
-            cohort_end = datetime(year, month + 1, 1)
-
-        # Get cohort members
-        cohort_enrollments = (
-            db.query(Enrollment)
-            .filter(
-                Enrollment.enrolled_at >= cohort_start,
-                Enrollment.enrolled_at < cohort_end,
-            )
-            .all()
-        )
-
-        total_enrollments = len(cohort_enrollments)
-
-        if total_enrollments == 0:
+    def _performance_result(
+        cohort_period: str, unique_users: int, totals: Optional[Dict[str, float]]
+    ) -> Dict[str, Any]:
+        total_enrollments = totals["enrollments"] if totals else 0
+        if total_enrollments == 0 or unique_users == 0:
             return {
                 "cohort_period": cohort_period,
                 "total_enrollments": 0,
                 "metrics": {},
             }
 
-        # Calculate metrics
-        completed = sum(1 for e in cohort_enrollments if e.status == "completed")
-        active = sum(
-            1 for e in cohort_enrollments if e.status in ["active", "in_progress"]
-        )
-
-        # Get revenue for cohort
-        cohort_user_ids = list(set(e.user_id for e in cohort_enrollments))
-        total_revenue = (
-            db.query(func.sum(Order.total))
-            .filter(
-                Order.user_id.in_(cohort_user_ids),
-                Order.status == "completed",
-                Order.created_at >= cohort_start,
-            )
-            .scalar()
-            or 0
-        )
-
-        # Calculate LTV (lifetime value per user)
-        unique_users = len(set(e.user_id for e in cohort_enrollments))
-        ltv = total_revenue / unique_users if unique_users > 0 else 0
+        total_revenue = totals["revenue"]
+        ltv = total_revenue / unique_users
 
         return {
             "cohort_period": cohort_period,
             "total_enrollments": total_enrollments,
             "unique_users": unique_users,
             "metrics": {
-                "completion_rate": round(completed / total_enrollments * 100, 2),
-                "active_rate": round(active / total_enrollments * 100, 2),
-                "total_revenue": float(total_revenue),
-                "revenue_per_user": round(total_revenue / unique_users, 2)
-                if unique_users > 0
-                else 0,
+                "completion_rate": round(totals["completed"] / total_enrollments * 100, 2),
+                "active_rate": round(totals["active"] / total_enrollments * 100, 2),
+                "total_revenue": total_revenue,
+                "revenue_per_user": round(total_revenue / unique_users, 2),
                 "ltv": round(ltv, 2),
-                "avg_enrollments_per_user": round(total_enrollments / unique_users, 2)
-                if unique_users > 0
-                else 0,
+                "avg_enrollments_per_user": round(total_enrollments / unique_users, 2),
             },
         }
 
+    @staticmethod
+    def get_cohort_performance(
+        db: Session, cohort_period: str, matrix: Optional[CohortMatrix] = None
+    ) -> Dict[str, Any]:
+        """
+        Get performance metrics for a cohort.
+
+        Returns completion rates, revenue, engagement, etc.
+        """
+        matrix = matrix or cohort_engine.matrix(db)
+        cohort = parse_period(cohort_period)
+        totals = CohortService._performance_by_cohort(db, [cohort]).get(cohort)
+        return CohortService._performance_result(
+            cohort_period, matrix.size(cohort), totals
+        )
+
     @staticmethod
     def compare_cohorts(db: Session, cohort_periods: List[str]) -> Dict[str, Any]:
         """
         Compare multiple cohorts side-by-side.
 
+        Builds the retention matrix once and loads performance totals for
+        all cohorts in one pass.
+
         Args:
             db: Database session
             cohort_periods: List of cohort periods to compare
@@ -247,42 +222,31 @@ class CohortService:
         Returns:
             Comparison data
         """
+        matrix = cohort_engine.matrix(db)
+        cohorts = [parse_period(period) for period in cohort_periods]
+        totals = CohortService._performance_by_cohort(db, cohorts)
+
         comparison_data = []
+        for period, cohort in zip(cohort_periods, cohorts):
+            row = matrix.row(cohort)
+            initial_size = row[0] if row else 0
 
-        for period in cohort_periods:
-            performance = CohortService.get_cohort_performance(db, period)
-            retention = CohortService.analyze_cohort_retention(db, period)
+            def retention_at(months_after: int) -> float:
+                if not initial_size or months_after >= len(row):
+                    return 0
+                return round(row[months_after] / initial_size * 100, 2)
 
             comparison_data.append(
                 {
                     "cohort_period": period,
-                    "performance": performance,
+                    "performance": CohortService._performance_result(
+                        period, initial_size, totals.get(cohort)
+                    ),
                     "retention_summary": {
-                        "initial_size": retention["initial_size"],
-                        "month_1_retention": next(
-                            (
-                                r["retention_rate"]
-                                for r in retention["retention_data"]
-                                if r["months_after_formation"] == 1
-                            ),
-                            0,
-                        ),
-                        "month_3_retention": next(
-                            (
-                                r["retention_rate"]
-                                for r in retention["retention_data"]
-                                if r["months_after_formation"] == 3
-                            ),
-                            0,
-                        ),
-                        "month_6_retention": next(
-                            (
-                                r["retention_rate"]
-                                for r in retention["retention_data"]
-                                if r["months_after_formation"] == 6
-                            ),
-                            0,
-                        ),
+                        "initial_size": initial_size,
+                        "month_1_retention": retention_at(1),
+                        "month_3_retention": retention_at(3),
+                        "month_6_retention": retention_at(6),
                     },
                 }
             )
@@ -68,6 +68,17 @@ def award_coins(
     db.commit()
     db.refresh(transaction)
 
+    # Leaderboards: balance, weekly earnings and course board
+    try:
+        from app.services.leaderboard_service import leaderboard_service
+
+        course_id = leaderboard_service.resolve_course_id(db, reference_type, reference_id)
+        leaderboard_service.record_user_coins(
+            user.id, user.coins, earned=amount, course_id=course_id
+        )
+    except Exception as lb_err:
+        print(f"Error updating leaderboards: {lb_err}")
+
     # Wolf Packs: Sync points to user's pack(s)
     try:
         from app.services.pack_service import pack_service
@@ -112,6 +123,14 @@ def spend_coins(
     db.commit()
     db.refresh(transaction)
 
+    # Leaderboards: spending only lowers the all-time balance board
+    try:
+        from app.services.leaderboard_service import leaderboard_service
+
+        leaderboard_service.record_user_coins(user.id, user.coins)
+    except Exception as lb_err:
+        print(f"Error updating leaderboards: {lb_err}")
+
     return transaction
 
 
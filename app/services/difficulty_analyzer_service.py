@@ -4,19 +4,23 @@ Difficulty Analyzer Service
 Analyze content difficulty using readability metrics and AI.
 """
 
-import os
 import logging
-import re
-from typing import Dict
-from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session, load_only
 
 from app.models.ai_features import ContentDifficultyAnalysis
+from app.models.lesson import Lesson
+from app.models.module import Module
+from app.services.text_analytics import TextMetrics, count_syllables, text_analytics
 
 logger = logging.getLogger(__name__)
 
 # AI analysis integration is handled via gemini_service if needed.
 # openai.api_key = os.getenv("OPENAI_API_KEY")
 
+# Lesson.content keys holding readable text (see app.models.lesson)
+LESSON_TEXT_KEYS = ("markdown", "html", "text", "body", "transcript")
+
 
 class DifficultyAnalyzerService:
     """
@@ -47,12 +51,13 @@ class DifficultyAnalyzerService:
             ContentDifficultyAnalysis with metrics and suggestions
         """
         try:
-            # Calculate readability scores
-            metrics = DifficultyAnalyzerService._calculate_readability(content_text)
+            # Calculate readability scores (cached by content hash)
+            text_metrics = text_analytics.analyze(content_text)
+            metrics = text_metrics.readability()
 
             # Get AI analysis for suggestions
             ai_suggestions = DifficultyAnalyzerService._get_ai_suggestions(
-                content_text, target_level, metrics
+                content_text, target_level, metrics, text_metrics.difficult_terms
             )
 
             # Determine recommended level
@@ -90,113 +95,121 @@ class DifficultyAnalyzerService:
             raise
 
     @staticmethod
-    def _calculate_readability(text: str) -> Dict:
+    def lesson_text(lesson: Lesson) -> str:
         """
-        Calculate various readability metrics.
+        Readable text of a lesson: its description plus any text stored in content.
         """
-        # Clean text
-        text = re.sub(r"<[^>]+>", "", text)  # Remove HTML tags
-        text = re.sub(r"\s+", " ", text).strip()
+        parts = [lesson.description or ""]
+        content = lesson.content if isinstance(lesson.content, dict) else {}
+        for key in LESSON_TEXT_KEYS:
+            value = content.get(key)
+            if isinstance(value, str):
+                parts.append(value)
+        return "\n\n".join(p for p in parts if p.strip())
 
-        # Count sentences, words, syllables
-        sentences = re.split(r"[.!?]+", text)
-        sentences = [s for s in sentences if s.strip()]
-        num_sentences = len(sentences)
+    @staticmethod
+    def analyze_course(db: Session, course_id: int) -> Dict:
+        """
+        Analyze every lesson of a course in one batch.
 
-        words = text.split()
-        num_words = len(words)
+        Lessons are loaded in a single query and their metrics come from the
+        content-hash cache, so only lessons edited since the last analysis are
+        recomputed. Nothing is persisted.
 
-        num_syllables = sum(
-            [DifficultyAnalyzerService._count_syllables(word) for word in words]
-        )
+        Args:
+            db: Database session
+            course_id: ID of the course
 
-        # Avoid division by zero
-        if num_sentences == 0 or num_words == 0:
-            return {
-                "flesch_reading_ease": 100,
-                "flesch_kincaid_grade": 0,
-                "avg_sentence_length": 0,
-                "avg_word_length": 0,
-                "vocabulary_complexity": 0,
-                "reading_time": 0,
-            }
-
-        # Flesch Reading Ease: 206.835 - 1.015 * (words/sentences) - 84.6 * (syllables/words)
-        flesch = (
-            206.835
-            - 1.015 * (num_words / num_sentences)
-            - 84.6 * (num_syllables / num_words)
+        Returns:
+            Dict with per-lesson metrics and word-weighted course totals
+        """
+        lessons = (
+            db.query(Lesson)
+            .join(Module, Lesson.module_id == Module.id)
+            .filter(Module.course_id == course_id)
+            .options(
+                load_only(
+                    Lesson.id,
+                    Lesson.module_id,
+                    Lesson.title,
+                    Lesson.description,
+                    Lesson.content,
+                )
+            )
+            .order_by(Module.order_index, Lesson.order_index, Lesson.id)
+            .all()
         )
-        flesch = max(0, min(100, flesch))  # Clamp to 0-100
 
-        # Flesch-Kincaid Grade Level: 0.39 * (words/sentences) + 11.8 * (syllables/words) - 15.59
-        fk_grade = (
-            0.39 * (num_words / num_sentences)
-            + 11.8 * (num_syllables / num_words)
-            - 15.59
+        computed_before = text_analytics.computed
+        lesson_metrics = text_analytics.analyze_many(
+            [DifficultyAnalyzerService.lesson_text(lesson) for lesson in lessons]
         )
-        fk_grade = max(0, fk_grade)
-
-        # Average sentence length
-        avg_sentence_len = num_words / num_sentences
-
-        # Average word length
-        avg_word_len = sum([len(w) for w in words]) / num_words
 
-        # Vocabulary complexity (% of words > 6 chars)
-        complex_words = [w for w in words if len(w) > 6]
-        vocab_complexity = (len(complex_words) / num_words) * 100
-
-        # Reading time (avg 200 words per minute)
-        reading_time = round(num_words / 200)
+        results = []
+        for lesson, text_metrics in zip(lessons, lesson_metrics):
+            metrics = text_metrics.readability()
+            level = DifficultyAnalyzerService._determine_level(metrics)
+            suggestions = DifficultyAnalyzerService._get_ai_suggestions(
+                "", "", metrics, text_metrics.difficult_terms
+            )
+            results.append(
+                {
+                    "lesson_id": lesson.id,
+                    "module_id": lesson.module_id,
+                    "title": lesson.title,
+                    "word_count": text_metrics.words,
+                    **metrics,
+                    "recommended_level": level,
+                    "simplification_suggestions": suggestions["suggestions"],
+                    "difficult_terms": suggestions["difficult_terms"],
+                }
+            )
 
+        course_metrics = TextMetrics.combine(lesson_metrics).readability()
+        course_level = DifficultyAnalyzerService._determine_level(course_metrics)
         return {
-            "flesch_reading_ease": round(flesch, 2),
-            "flesch_kincaid_grade": round(fk_grade, 2),
-            "avg_sentence_length": round(avg_sentence_len, 2),
-            "avg_word_length": round(avg_word_len, 2),
-            "vocabulary_complexity": round(vocab_complexity, 2),
-            "reading_time": max(1, reading_time),
+            "course_id": course_id,
+            "lesson_count": len(lessons),
+            "recomputed_lessons": text_analytics.computed - computed_before,
+            "course": {
+                **course_metrics,
+                "recommended_level": course_level,
+                "target_audience": DifficultyAnalyzerService._get_audience(course_level),
+            },
+            "lessons": results,
         }
 
+    @staticmethod
+    def _calculate_readability(text: str) -> Dict:
+        """
+        Calculate various readability metrics.
+        """
+        return text_analytics.analyze(text).readability()
+
     @staticmethod
     def _count_syllables(word: str) -> int:
         """
         Estimate syllable count for a word.
         """
-        word = word.lower()
-        vowels = "aeiouy"
-        syllables = 0
-        previous_was_vowel = False
-
-        for char in word:
-            is_vowel = char in vowels
-            if is_vowel and not previous_was_vowel:
-                syllables += 1
-            previous_was_vowel = is_vowel
-
-        # Adjust for silent 'e'
-        if word.endswith("e"):
-            syllables -= 1
-
-        # Minimum 1 syllable
-        return max(1, syllables)
+        return count_syllables(word.lower())
 
     @staticmethod
-    def _get_ai_suggestions(text: str, target_level: str, metrics: Dict) -> Dict:
+    def _get_ai_suggestions(
+        text: str,
+        target_level: str,
+        metrics: Dict,
+        difficult_terms: Optional[List[str]] = None,
+    ) -> Dict:
         """
         Get AI-powered simplification suggestions.
         """
         # For now, return basic suggestions based on metrics
         # In production, could call GPT for detailed analysis
         suggestions = []
-        difficult_terms = []
 
         # Extract long/complex words
-        words = text.split()
-        for word in words:
-            if len(word) > 12:
-                difficult_terms.append(word)
+        if difficult_terms is None:
+            difficult_terms = text_analytics.analyze(text).difficult_terms
 
         if metrics["avg_sentence_length"] > 25:
             suggestions.append("Consider breaking long sentences into shorter ones")
@@ -209,7 +222,7 @@ class DifficultyAnalyzerService:
 
         return {
             "suggestions": suggestions[:5],  # Limit to top 5
-            "difficult_terms": list(set(difficult_terms))[:10],  # Unique, limit to 10
+            "difficult_terms": list(dict.fromkeys(difficult_terms))[:10],  # Unique, limit to 10
         }
 
     @staticmethod
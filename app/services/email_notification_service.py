@@ -10,24 +10,20 @@ from datetime import datetime
 
 from app.models.email_notification import (
     UserEmailPreference,
-    EmailTemplate,
     EmailLog,
     NotificationType,
-    EmailStatus,
 )
 from app.models.user import User
 from app.core.config import settings
+from app.services.mailer import Recipient, bulk_mailer, compile_template, queue_bulk_email
 
 
 def render_template(template_str: str, variables: Dict[str, Any]) -> str:
     """
-    Simple template rendering using string replacement.
     Replaces {{variable_name}} with actual values.
+    Templates are compiled once and cached by their source text.
     """
-    result = template_str
-    for key, value in variables.items():
-        result = result.replace(f"{{{{{key}}}}}", str(value))
-    return result
+    return compile_template(template_str).render(variables)
 
 
 async def send_notification_email(
@@ -50,67 +46,22 @@ async def send_notification_email(
         force: If True, send even if user has disabled this notification type
 
     Returns:
-        EmailLog object if email was sent, None otherwise
-    """
-    # Check user preferences unless forced
-    if not force:
-        preferences = (
-            db.query(UserEmailPreference)
-            .filter(UserEmailPreference.user_id == user.id)
-            .first()
-        )
-
-        if preferences and not preferences.is_enabled(notification_type):
-            return None
-
-    # Get template
-    template = (
-        db.query(EmailTemplate).filter(EmailTemplate.name == template_name).first()
-    )
+        EmailLog object if email was sent (status FAILED if the server refused it),
+        None if the user disabled this notification type
 
-    if not template:
-        raise ValueError(f"Email template '{template_name}' not found")
-
-    # Render template
-    rendered_subject = render_template(template.subject, variables)
-    rendered_html = render_template(template.body_html, variables)
-    rendered_text = (
-        render_template(template.body_text, variables) if template.body_text else None
-    )
-
-    # Create log entry
-    email_log = EmailLog(
-        user_id=user.id,
-        template_id=template.id,
-        recipient_email=user.email,
-        subject=rendered_subject,
-        body_html=rendered_html,
-        body_text=rendered_text,
-        status=EmailStatus.PENDING,
+    Raises:
+        ValueError: If the template doesn't exist
+    """
+    result = bulk_mailer.send_batch(
+        db,
+        template_name,
+        notification_type,
+        [Recipient(user_id=user.id, email=user.email, variables=variables)],
+        force=force,
     )
-    db.add(email_log)
-    db.commit()
-
-    try:
-        # Send email using FastMail
-        if not settings.MAIL_SUPPRESS_SEND:
-            # For now, we'll use direct send since we don't have FastMail templates set up yet
-            # TODO: Implement proper template-based sending
-            pass
-
-        # Update log
-        email_log.status = EmailStatus.SENT
-        email_log.sent_at = datetime.utcnow()
-        db.commit()
-
-        return email_log
-
-    except Exception as e:
-        # Log error
-        email_log.status = EmailStatus.FAILED
-        email_log.error_message = str(e)
-        db.commit()
-        raise
+    if user.id not in result.log_ids:
+        return None  # User disabled this notification type
+    return db.get(EmailLog, result.log_ids[user.id])
 
 
 def get_or_create_preferences(db: Session, user_id: int) -> UserEmailPreference:
@@ -255,34 +206,68 @@ async def send_certificate_earned_email(
     )
 
 
-async def send_announcement_email(
-    db: Session, users: list[User], announcement: Any
-) -> list[EmailLog]:
-    """Send announcement email to multiple users"""
-    email_logs = []
-
-    for user in users:
-        variables = {
+def _announcement_recipient(user: User, announcement: Any) -> Recipient:
+    return Recipient(
+        user_id=user.id,
+        email=user.email,
+        variables={
             "student_name": user.full_name or user.email,
             "announcement_title": announcement.title,
             "announcement_content": announcement.content,
             "instructor_name": announcement.instructor.full_name
             if hasattr(announcement, "instructor") and announcement.instructor
             else "Instructor",
-        }
-
-        log = await send_notification_email(
-            db=db,
-            user=user,
-            notification_type=NotificationType.ANNOUNCEMENT,
-            template_name="course_announcement",
-            variables=variables,
+        },
+    )
+
+
+async def send_announcement_email(
+    db: Session, users: list[User], announcement: Any
+) -> list[EmailLog]:
+    """Send announcement email to multiple users, one pooled SMTP batch at a time"""
+    recipients = [_announcement_recipient(user, announcement) for user in users]
+    log_ids = []
+    batch_size = settings.MAIL_BATCH_SIZE
+    for start in range(0, len(recipients), batch_size):
+        result = bulk_mailer.send_batch(
+            db,
+            "course_announcement",
+            NotificationType.ANNOUNCEMENT,
+            recipients[start : start + batch_size],
         )
+        log_ids.extend(result.log_ids.values())
 
-        if log:
-            email_logs.append(log)
+    if not log_ids:
+        return []
+    return db.query(EmailLog).filter(EmailLog.id.in_(log_ids)).all()
 
-    return email_logs
+
+def queue_announcement_emails(db: Session, announcement: Any) -> int:
+    """
+    Queue announcement emails for every actively enrolled student (instructor
+    excluded) as Celery batches, loading the recipients in one query.
+
+    Returns:
+        Number of recipients
+    """
+    from app.models.enrollment import Enrollment
+
+    users = (
+        db.query(User)
+        .join(Enrollment, Enrollment.user_id == User.id)
+        .filter(
+            Enrollment.course_id == announcement.course_id,
+            Enrollment.status == "active",
+            User.id != announcement.instructor_id,
+        )
+        .all()
+    )
+    recipients = [_announcement_recipient(user, announcement) for user in users]
+    if recipients:
+        queue_bulk_email(
+            db, "course_announcement", NotificationType.ANNOUNCEMENT, recipients
+        )
+    return len(recipients)
 
 
 # =============================================================================
@@ -0,0 +1,553 @@
+"""
+Entitlements.
+
+Access decisions for a (user, course) pair are resolved in one batch into a
+``CourseAccessMap``: enrollment, subscription level, the date, after-days
+and sequence drip rules of every lesson, and learning-path prerequisites.
+The map answers ``can_access`` for any lesson in O(1) and returns the whole
+outline's lock states in one call.
+
+Maps are cached per worker and validated against version counters in Redis:
+- ``entitlements:version``                    bumped when plan access levels change
+- ``entitlements:user:{user_id}:version``     enrollment, progress, subscription changes
+- ``entitlements:course:{course_id}:version`` lessons, modules, drip rules, path courses
+
+Writes to those models bump the versions on commit (see the listener in
+app.models.enrollment). Time-based unlocks need no write: a map expires at
+the earliest future unlock, enrollment expiry or subscription period end.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import and_, select
+from sqlalchemy.orm import Session
+
+from app.core.redis_client import get_redis
+from app.models.enrollment import Enrollment, EnrollmentStatus, has_pending_entitlement_changes
+from app.models.learning_path import PathCourse, PathEnrollment
+from app.models.lesson import Lesson
+from app.models.lesson_drip import LessonDripSetting
+from app.models.lesson_progress import LessonProgress, ProgressStatus
+from app.models.module import Module
+from app.models.subscription import SubscriptionPlan, UserSubscription
+from app.schemas.lesson_drip import LessonAccessInfo
+from app.services.path_graph import path_graph
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_VERSION_KEY = "entitlements:version"
+USER_VERSION_KEY = "entitlements:user:{user_id}:version"
+COURSE_VERSION_KEY = "entitlements:course:{course_id}:version"
+
+# Without Redis other workers can't signal changes, so local copies expire
+LOCAL_TTL_SECONDS = 60
+
+# Access maps kept per worker (least recently used are dropped)
+MAX_LOCAL_ENTRIES = 10_000
+
+# Subscription access level hierarchy
+ACCESS_LEVELS = {"limited": 1, "standard": 2, "premium": 3, "unlimited": 4}
+
+# Subscriptions at or above this level open every course
+COURSE_ACCESS_LEVEL = "standard"
+
+ACTIVE_SUBSCRIPTION_STATUSES = ("active", "trial")
+
+
+def _utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """Compare timezone-aware subscription dates with naive UTC ones."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+@dataclass(frozen=True)
+class SubscriptionEntitlement:
+    """A user's current subscription, as far as access is concerned."""
+
+    access_level: str
+    started_at: Optional[datetime]
+    valid_until: Optional[datetime]
+
+    def allows(self, required_level: str) -> bool:
+        return ACCESS_LEVELS.get(self.access_level, 0) >= ACCESS_LEVELS.get(required_level, 0)
+
+
+@dataclass(frozen=True)
+class LessonAccess:
+    """Access decision for one lesson."""
+
+    lesson_id: int
+    module_id: int
+    has_access: bool
+    reason: str
+    is_completed: bool = False
+    unlock_date: Optional[datetime] = None
+    prerequisite_lesson_id: Optional[int] = None
+
+    def info(self, now: Optional[datetime] = None) -> LessonAccessInfo:
+        days_remaining = None
+        if self.reason == "days_locked":
+            now = now or datetime.utcnow()
+            days_remaining = (self.unlock_date - now).days + 1  # Include current day
+        return LessonAccessInfo(
+            has_access=self.has_access,
+            reason=self.reason,
+            unlock_date=self.unlock_date,
+            days_remaining=days_remaining,
+            prerequisite_lesson_id=self.prerequisite_lesson_id,
+        )
+
+
+@dataclass
+class CourseAccessMap:
+    """Everything a user may open in one course, computed in one batch."""
+
+    user_id: int
+    course_id: int
+    # "enrollment", "subscription", or None without course access
+    granted_by: Optional[str]
+    # Why there is no course access ("not_enrolled", "enrollment_expired")
+    reason: Optional[str]
+    subscription_level: Optional[str]
+    # Lessons in outline order
+    lessons: Dict[int, LessonAccess]
+    # Learning paths containing the course -> prerequisite satisfied
+    paths: Dict[int, bool]
+    valid_until: Optional[datetime] = None
+    versions: Tuple[int, ...] = field(default=(), compare=False)
+
+    @property
+    def has_course_access(self) -> bool:
+        return self.granted_by is not None
+
+    def can_access(self, lesson_id: int) -> bool:
+        lesson = self.lessons.get(lesson_id)
+        return lesson is not None and lesson.has_access
+
+    def lesson(self, lesson_id: int) -> LessonAccessInfo:
+        lesson = self.lessons.get(lesson_id)
+        if lesson is None:
+            return LessonAccessInfo(has_access=False, reason="not_in_course")
+        return lesson.info()
+
+    def can_access_path_course(self, path_id: int) -> bool:
+        return self.paths.get(path_id, False)
+
+    def outline(self) -> List[Dict[str, Any]]:
+        """Lock state of every lesson in outline order."""
+        now = datetime.utcnow()
+        return [
+            {
+                "lesson_id": lesson.lesson_id,
+                "module_id": lesson.module_id,
+                "is_locked": not lesson.has_access,
+                "is_completed": lesson.is_completed,
+                **lesson.info(now).model_dump(),
+            }
+            for lesson in self.lessons.values()
+        ]
+
+
+# ------------------------------------------------------------------
+# Rules
+# ------------------------------------------------------------------
+
+
+def _lesson_access(
+    row: Any,
+    base_date: Optional[datetime],
+    completed: Set[int],
+    now: datetime,
+) -> Tuple[LessonAccess, Optional[datetime]]:
+    """
+    Apply a lesson's drip rule.
+
+    Args:
+        row: Lesson columns joined with its active drip setting (if any)
+        base_date: When access started (enrollment or subscription)
+        completed: Lesson ids the user has completed
+        now: Evaluation time
+
+    Returns:
+        The decision and, for time-based locks, when it changes
+    """
+    common = {
+        "lesson_id": row.id,
+        "module_id": row.module_id,
+        "is_completed": row.id in completed,
+    }
+    unlock_type = row.unlock_type
+
+    if unlock_type is None:
+        return LessonAccess(has_access=True, reason="no_drip", **common), None
+
+    # Date-based unlock
+    if unlock_type == "date":
+        if row.unlock_date and now >= row.unlock_date:
+            return LessonAccess(has_access=True, reason="date_unlocked", **common), None
+        lesson = LessonAccess(
+            has_access=False, reason="date_locked", unlock_date=row.unlock_date, **common
+        )
+        return lesson, row.unlock_date
+
+    # Days after enrollment unlock
+    if unlock_type == "after_days":
+        if not row.unlock_after_days:
+            return LessonAccess(has_access=True, reason="invalid_days_config", **common), None
+        unlock_date = (base_date or now) + timedelta(days=row.unlock_after_days)
+        if now >= unlock_date:
+            return LessonAccess(has_access=True, reason="days_unlocked", **common), None
+        lesson = LessonAccess(
+            has_access=False, reason="days_locked", unlock_date=unlock_date, **common
+        )
+        return lesson, unlock_date
+
+    # Sequence-based unlock (prerequisite)
+    if unlock_type == "sequence":
+        prerequisite = row.prerequisite_lesson_id
+        if not prerequisite:
+            return LessonAccess(has_access=True, reason="no_prerequisite", **common), None
+        if prerequisite in completed:
+            return LessonAccess(has_access=True, reason="prerequisite_completed", **common), None
+        lesson = LessonAccess(
+            has_access=False,
+            reason="prerequisite_not_completed",
+            prerequisite_lesson_id=prerequisite,
+            **common,
+        )
+        return lesson, None
+
+    # Default: grant access
+    return LessonAccess(has_access=True, reason="default", **common), None
+
+
+class EntitlementResolver:
+    """Resolves and caches per-user access maps for courses, lessons and paths."""
+
+    def __init__(self, max_entries: int = MAX_LOCAL_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (entry, versions, cached_at)
+        self._local: "OrderedDict[Hashable, Tuple[Any, Tuple[int, ...], float]]" = OrderedDict()
+        self._local_versions: Dict[str, int] = {}
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def load_subscription(
+        db: Session, user_id: int, now: Optional[datetime] = None
+    ) -> Optional[SubscriptionEntitlement]:
+        """Load the user's active subscription and plan level with one query."""
+        now = now or datetime.utcnow()
+        row = db.execute(
+            select(
+                SubscriptionPlan.access_level,
+                UserSubscription.started_at,
+                UserSubscription.current_period_end,
+            )
+            .join(SubscriptionPlan, SubscriptionPlan.id == UserSubscription.plan_id)
+            .where(
+                UserSubscription.user_id == user_id,
+                UserSubscription.status.in_(ACTIVE_SUBSCRIPTION_STATUSES),
+            )
+            .order_by(UserSubscription.id)
+            .limit(1)
+        ).first()
+        if row is None:
+            return None
+
+        period_end = _utc_naive(row.current_period_end)
+        # Should have been marked expired by background job, but handle here just in case
+        if period_end and period_end < now:
+            return None
+        return SubscriptionEntitlement(
+            access_level=row.access_level,
+            started_at=_utc_naive(row.started_at),
+            valid_until=period_end,
+        )
+
+    def compute(self, db: Session, user_id: int, course_id: int) -> CourseAccessMap:
+        """
+        Build a course access map from the database.
+
+        Uses at most seven queries regardless of course size: enrollment,
+        subscription, lessons with drip settings, completed lessons, the
+        learning paths containing the course, their graphs (usually cached)
+        and completed prerequisite courses.
+        """
+        now = datetime.utcnow()
+        expiries: List[datetime] = []
+
+        enrollment = db.execute(
+            select(Enrollment.status, Enrollment.enrolled_at, Enrollment.expires_at)
+            .where(Enrollment.user_id == user_id, Enrollment.course_id == course_id)
+            .order_by(Enrollment.id)
+            .limit(1)
+        ).first()
+        subscription = self.load_subscription(db, user_id, now)
+
+        granted_by, reason, base_date = None, "not_enrolled", None
+        if enrollment is not None:
+            expired = enrollment.status == EnrollmentStatus.EXPIRED or (
+                enrollment.expires_at is not None and enrollment.expires_at <= now
+            )
+            if expired:
+                reason = "enrollment_expired"
+            else:
+                granted_by, reason, base_date = "enrollment", None, enrollment.enrolled_at
+                if enrollment.expires_at is not None:
+                    expiries.append(enrollment.expires_at)
+        if granted_by is None and subscription and subscription.allows(COURSE_ACCESS_LEVEL):
+            granted_by, reason, base_date = "subscription", None, subscription.started_at
+            if subscription.valid_until is not None:
+                expiries.append(subscription.valid_until)
+
+        rows = db.execute(
+            select(
+                Lesson.id,
+                Lesson.module_id,
+                Lesson.is_preview,
+                LessonDripSetting.unlock_type,
+                LessonDripSetting.unlock_date,
+                LessonDripSetting.unlock_after_days,
+                LessonDripSetting.prerequisite_lesson_id,
+            )
+            .join(Module, Module.id == Lesson.module_id)
+            .outerjoin(
+                LessonDripSetting,
+                and_(
+                    LessonDripSetting.lesson_id == Lesson.id,
+                    LessonDripSetting.is_active.is_(True),
+                ),
+            )
+            .where(Module.course_id == course_id)
+            .order_by(Module.order_index, Module.id, Lesson.order_index, Lesson.id)
+        ).all()
+
+        lesson_ids = {row.id for row in rows}
+        lesson_ids.update(
+            row.prerequisite_lesson_id for row in rows if row.prerequisite_lesson_id
+        )
+        completed: Set[int] = set()
+        if lesson_ids:
+            completed.update(
+                db.execute(
+                    select(LessonProgress.lesson_id).where(
+                        LessonProgress.user_id == user_id,
+                        LessonProgress.status == ProgressStatus.COMPLETED,
+                        LessonProgress.lesson_id.in_(lesson_ids),
+                    )
+                ).scalars()
+            )
+
+        lessons: Dict[int, LessonAccess] = {}
+        for row in rows:
+            if granted_by is not None:
+                lesson, changes_at = _lesson_access(row, base_date, completed, now)
+                if changes_at is not None:
+                    expiries.append(changes_at)
+            elif row.is_preview:
+                lesson = LessonAccess(
+                    lesson_id=row.id,
+                    module_id=row.module_id,
+                    has_access=True,
+                    reason="preview",
+                    is_completed=row.id in completed,
+                )
+            else:
+                lesson = LessonAccess(
+                    lesson_id=row.id,
+                    module_id=row.module_id,
+                    has_access=False,
+                    reason=reason,
+                    is_completed=row.id in completed,
+                )
+            lessons[row.id] = lesson
+
+        # Every prerequisite counts, however indirect (see app.services.path_graph)
+        paths: Dict[int, bool] = {}
+        path_ids = db.execute(
+            select(PathCourse.path_id)
+            .join(
+                PathEnrollment,
+                and_(
+                    PathEnrollment.path_id == PathCourse.path_id,
+                    PathEnrollment.student_id == user_id,
+                ),
+            )
+            .where(PathCourse.course_id == course_id)
+            .distinct()
+        ).scalars().all()
+        if path_ids:
+            graphs = path_graph.get_many(db, path_ids)
+            prerequisite_ids: Set[int] = set()
+            for graph in graphs.values():
+                prerequisite_ids |= graph.prerequisite_ids()
+            done = path_graph.completed_course_ids(db, [user_id], prerequisite_ids)[user_id]
+            for path_id, graph in graphs.items():
+                paths[path_id] = graph.is_unlocked(course_id, graph.completed_mask(done))
+
+        return CourseAccessMap(
+            user_id=user_id,
+            course_id=course_id,
+            granted_by=granted_by,
+            reason=reason,
+            subscription_level=subscription.access_level if subscription else None,
+            lessons=lessons,
+            paths=paths,
+            valid_until=min((t for t in expiries if t > now), default=None),
+        )
+
+    # ------------------------------------------------------------------
+    # Cache
+    # ------------------------------------------------------------------
+
+    def _versions(self, keys: List[str]) -> Tuple[Tuple[int, ...], bool]:
+        """Current version of each key, and whether they came from Redis."""
+        redis = get_redis()
+        if redis is not None:
+            try:
+                return tuple(int(v or 0) for v in redis.mget(keys)), True
+            except RedisError as e:
+                logger.warning(f"Entitlement version lookup failed: {e}")
+        return tuple(self._local_versions.get(key, 0) for key in keys), False
+
+    def _cached(self, key: Hashable, versions: Tuple[int, ...], shared: bool) -> Any:
+        with self._lock:
+            cached = self._local.get(key)
+            if cached is None:
+                return None
+            entry, cached_versions, cached_at = cached
+            valid_until = entry.valid_until if entry is not None else None
+            fresh = (
+                cached_versions == versions
+                and (shared or time.monotonic() - cached_at < LOCAL_TTL_SECONDS)
+                and (valid_until is None or datetime.utcnow() < valid_until)
+            )
+            if not fresh:
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return cached
+
+    def _store(self, key: Hashable, entry: Any, versions: Tuple[int, ...]):
+        with self._lock:
+            self._local[key] = (entry, versions, time.monotonic())
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def course_access(self, db: Session, user_id: int, course_id: int) -> CourseAccessMap:
+        """
+        Get the user's access map for a course.
+
+        Args:
+            db: Database session
+            user_id: User ID
+            course_id: Course ID
+
+        Returns:
+            The cached map, recomputed when a version changed or a timed unlock passed
+        """
+        keys = [
+            GLOBAL_VERSION_KEY,
+            USER_VERSION_KEY.format(user_id=user_id),
+            COURSE_VERSION_KEY.format(course_id=course_id),
+        ]
+        versions, shared = self._versions(keys)
+        key = ("course", user_id, course_id)
+        cached = self._cached(key, versions, shared)
+        if cached is not None:
+            return cached[0]
+
+        access_map = self.compute(db, user_id, course_id)
+        access_map.versions = versions
+        # Built from uncommitted writes: a rollback would leave it cached
+        if not has_pending_entitlement_changes(db):
+            self._store(key, access_map, versions)
+        return access_map
+
+    def subscription(self, db: Session, user_id: int) -> Optional[SubscriptionEntitlement]:
+        """Get the user's active subscription (cached like access maps)."""
+        keys = [GLOBAL_VERSION_KEY, USER_VERSION_KEY.format(user_id=user_id)]
+        versions, shared = self._versions(keys)
+        key = ("subscription", user_id)
+        cached = self._cached(key, versions, shared)
+        if cached is not None:
+            return cached[0]
+
+        subscription = self.load_subscription(db, user_id)
+        if not has_pending_entitlement_changes(db):
+            self._store(key, subscription, versions)
+        return subscription
+
+    def has_subscription(self, db: Session, user_id: int, required_level: str) -> bool:
+        subscription = self.subscription(db, user_id)
+        return subscription is not None and subscription.allows(required_level)
+
+    def can_access(
+        self, db: Session, user_id: int, course_id: int, lesson_id: Optional[int] = None
+    ) -> bool:
+        """Whether the user may open a course, or one of its lessons."""
+        access_map = self.course_access(db, user_id, course_id)
+        if lesson_id is None:
+            return access_map.has_course_access
+        return access_map.can_access(lesson_id)
+
+    # ------------------------------------------------------------------
+    # Invalidation
+    # ------------------------------------------------------------------
+
+    def invalidate(
+        self,
+        user_ids: Iterable[int] = (),
+        course_ids: Iterable[int] = (),
+        everything: bool = False,
+    ):
+        """Bump versions so every worker recomputes the affected maps."""
+        keys = [USER_VERSION_KEY.format(user_id=uid) for uid in set(user_ids) if uid is not None]
+        keys += [
+            COURSE_VERSION_KEY.format(course_id=cid) for cid in set(course_ids) if cid is not None
+        ]
+        if everything:
+            keys.append(GLOBAL_VERSION_KEY)
+        if not keys:
+            return
+
+        with self._lock:
+            for key in keys:
+                self._local_versions[key] = self._local_versions.get(key, 0) + 1
+
+        redis = get_redis()
+        if redis is None:
+            return
+        try:
+            pipe = redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.incr(key)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Entitlement invalidation failed: {e}")
+
+    def clear(self):
+        """Drop this worker's cached maps and local versions."""
+        with self._lock:
+            self._local.clear()
+            self._local_versions.clear()
+
+
+entitlements = EntitlementResolver()
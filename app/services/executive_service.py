@@ -5,176 +5,54 @@ Provides high-level KPIs, platform health scoring,
 and risk indicators for executive dashboard.
 """
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from datetime import datetime, timedelta
 
-from app.models.user import User
-from app.models.enrollment import Enrollment
-from app.models.order import Order
-from app.models.course import Course
-from app.models.course_review import CourseReview as Review
+from app.services.kpi_engine import kpi_engine
 
 
 class ExecutiveService:
     """Service for executive-level analytics and KPIs"""
 
     @staticmethod
-    def get_kpis(db: Session) -> Dict[str, Any]:
+    def get_snapshot_data(
+        db: Session, max_age: Optional[timedelta] = None
+    ) -> Dict[str, Any]:
         """
-        Calculate key platform KPIs.
+        Get the latest KPI snapshot payload, recomputing it if stale.
 
-        Returns comprehensive KPI metrics for executive dashboard.
-        """
-        now = datetime.utcnow()
-        today_start = datetime(now.year, now.month, now.day)
-        week_start = today_start - timedelta(days=7)
-        month_start = today_start - timedelta(days=30)
-        print("DEBUG: Starting get_kpis")
-
-        # Active users
-        print("DEBUG: Querying daily_active")
-        daily_active = (
-            db.query(func.count(func.distinct(Enrollment.user_id)))
-            .filter(Enrollment.enrolled_at >= today_start)
-            .scalar()
-            or 0
-        )
-
-        weekly_active = (
-            db.query(func.count(func.distinct(Enrollment.user_id)))
-            .filter(Enrollment.enrolled_at >= week_start)
-            .scalar()
-            or 0
-        )
-
-        monthly_active = (
-            db.query(func.count(func.distinct(Enrollment.user_id)))
-            .filter(Enrollment.enrolled_at >= month_start)
-            .scalar()
-            or 0
-        )
-
-        # Total users
-        print("DEBUG: Querying total_users")
-        total_users = db.query(func.count(User.id)).scalar() or 0
-
-        # Revenue metrics
-        print("DEBUG: Querying total_revenue")
-        total_revenue = (
-            db.query(func.sum(Order.total)).filter(Order.status == "completed").scalar()
-            or 0
-        )
-
-        monthly_revenue = (
-            db.query(func.sum(Order.total))
-            .filter(Order.status == "completed", Order.created_at >= month_start)
-            .scalar()
-            or 0
-        )
-
-        # Previous month revenue for growth calculation
-        prev_month_start = month_start - timedelta(days=30)
-        prev_month_revenue = (
-            db.query(func.sum(Order.total))
-            .filter(
-                Order.status == "completed",
-                Order.created_at >= prev_month_start,
-                Order.created_at < month_start,
-            )
-            .scalar()
-            or 0
-        )
-
-        revenue_growth = (
-            ((monthly_revenue - prev_month_revenue) / prev_month_revenue * 100)
-            if prev_month_revenue > 0
-            else 0
-        )
-
-        # Course metrics
-        print("DEBUG: Querying total_courses")
-        total_courses = (
-            db.query(func.count(Course.id)).filter(Course.is_published == True).scalar()
-            or 0
-        )
-
-        total_enrollments = db.query(func.count(Enrollment.id)).scalar() or 0
-
-        completed_enrollments = (
-            db.query(func.count(Enrollment.id))
-            .filter(Enrollment.status == "completed")
-            .scalar()
-            or 0
-        )
-
-        completion_rate = (
-            (completed_enrollments / total_enrollments * 100)
-            if total_enrollments > 0
-            else 0
-        )
+        Args:
+            db: Database session
+            max_age: Staleness bound (defaults to KPI_SNAPSHOT_MAX_AGE_SECONDS)
 
-        # Average rating
-        avg_rating = db.query(func.avg(Review.rating)).scalar() or 0
-
-        # Calculate CAC (Customer Acquisition Cost) - simplified
-        # In real scenario, would factor in marketing spend
-        total_orders = (
-            db.query(func.count(Order.id)).filter(Order.status == "completed").scalar()
-            or 0
-        )
-
-        # Simplified CAC calculation
-        cac = 50.0  # Placeholder - would calculate from actual marketing data
-
-        # Calculate churn rate
-        churned_users = (
-            db.query(func.count(User.id)).filter(User.is_active == False).scalar() or 0
-        )
+        Returns:
+            {"kpis": {...}, "growth": {...}, "as_of": ISO timestamp}
+        """
+        snapshot = kpi_engine.get_snapshot(db, max_age=max_age)
+        return {**snapshot.data, "as_of": snapshot.computed_at.isoformat()}
 
-        churn_rate = (churned_users / total_users * 100) if total_users > 0 else 0
+    @staticmethod
+    def get_kpis(db: Session, max_age: Optional[timedelta] = None) -> Dict[str, Any]:
+        """
+        Get key platform KPIs.
 
-        print("DEBUG: Finished get_kpis")
-        return {
-            "active_users": {
-                "daily": daily_active,
-                "weekly": weekly_active,
-                "monthly": monthly_active,
-                "total": total_users,
-            },
-            "revenue": {
-                "total": float(total_revenue),
-                "monthly": float(monthly_revenue),
-                "growth_rate": round(revenue_growth, 2),
-                "arr": float(
-                    monthly_revenue * 12
-                ),  # Annual Recurring Revenue projection
-            },
-            "courses": {
-                "total_published": total_courses,
-                "total_enrollments": total_enrollments,
-                "completion_rate": round(completion_rate, 2),
-            },
-            "satisfaction": {
-                "average_rating": round(float(avg_rating), 2) if avg_rating else 0,
-                "nps_score": 75,  # Placeholder - would calculate from actual NPS surveys
-            },
-            "business_metrics": {
-                "cac": cac,
-                "churn_rate": round(churn_rate, 2),
-                "total_orders": total_orders,
-            },
-        }
+        Served from the KPI snapshot; see KPIEngine for how they're computed.
+        """
+        data = ExecutiveService.get_snapshot_data(db, max_age=max_age)
+        return {**data["kpis"], "as_of": data["as_of"]}
 
     @staticmethod
-    def calculate_health_score(db: Session) -> Dict[str, Any]:
+    def calculate_health_score(
+        db: Session, kpis: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """
         Calculate platform health score (0-100).
 
-        Uses weighted average of key metrics.
+        Uses weighted average of key metrics. Pass `kpis` to reuse
+        already-loaded KPIs instead of reading the snapshot again.
         """
-        kpis = ExecutiveService.get_kpis(db)
+        kpis = kpis or ExecutiveService.get_kpis(db)
 
         # Component scores (0-100)
         components = {}
@@ -227,17 +105,20 @@ class ExecutiveService:
             "trend": trend,
             "components": {k: round(v, 1) for k, v in components.items()},
             "timestamp": datetime.utcnow().isoformat(),
+            "as_of": kpis.get("as_of"),
         }
 
     @staticmethod
-    def identify_risks(db: Session) -> List[Dict[str, Any]]:
+    def identify_risks(
+        db: Session, kpis: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
         """
         Identify platform risks and issues requiring attention.
 
         Returns list of risk indicators with severity levels.
         """
         risks = []
-        kpis = ExecutiveService.get_kpis(db)
+        kpis = kpis or ExecutiveService.get_kpis(db)
 
         # Check churn rate
         churn_rate = kpis["business_metrics"]["churn_rate"]
@@ -301,64 +182,10 @@ class ExecutiveService:
         """
         Calculate growth metrics over time.
 
-        Returns growth trends for key metrics.
+        Returns growth trends for the last 6 complete months, oldest first.
         """
-        now = datetime.utcnow()
-
-        # Calculate metrics for last 6 months
-        monthly_data = []
-
-        for i in range(6):
-            month_start = datetime(now.year, now.month, 1) - timedelta(days=30 * i)
-            if month_start.month == 1:
-                prev_month_start = datetime(month_start.year - 1, 12, 1)
-            else:
-                prev_month_start = datetime(month_start.year, month_start.month - 1, 1)
-
-            # Get metrics for this month
-            enrollments = (
-                db.query(func.count(Enrollment.id))
-                .filter(
-                    Enrollment.enrolled_at >= prev_month_start,
-                    Enrollment.enrolled_at < month_start,
-                )
-                .scalar()
-                or 0
-            )
-
-            revenue = (
-                db.query(func.sum(Order.total))
-                .filter(
-                    Order.status == "completed",
-                    Order.created_at >= prev_month_start,
-                    Order.created_at < month_start,
-                )
-                .scalar()
-                or 0
-            )
-
-            new_users = (
-                db.query(func.count(User.id))
-                .filter(
-                    User.created_at >= prev_month_start, User.created_at < month_start
-                )
-                .scalar()
-                or 0
-            )
-
-            monthly_data.append(
-                {
-                    "month": prev_month_start.strftime("%Y-%m"),
-                    "enrollments": enrollments,
-                    "revenue": float(revenue),
-                    "new_users": new_users,
-                }
-            )
-
-        # Reverse so oldest is first
-        monthly_data.reverse()
-
-        return {"monthly_trends": monthly_data, "period": "6_months"}
+        data = ExecutiveService.get_snapshot_data(db)
+        return {**data["growth"], "as_of": data["as_of"]}
 
     @staticmethod
     def _score_to_grade(score: float) -> str:
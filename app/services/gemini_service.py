@@ -1,8 +1,10 @@
 import os
+import time
 import httpx
 import google.generativeai as genai
 from typing import Optional, List, Dict, Any, Tuple
 from app.core.config import settings
+from app.services.ai_metering import ai_meter, estimate_tokens
 import logging
 
 logger = logging.getLogger(__name__)
@@ -59,8 +61,8 @@ class GeminiService:
             
         return plan
 
-    def _call_google(self, api_key: str, model_name: str, messages: List[Dict[str, str]], temperature: float) -> str:
-        """Call Google Generic AI SDK"""
+    def _call_google(self, api_key: str, model_name: str, messages: List[Dict[str, str]], temperature: float) -> Tuple[str, Optional[Tuple[int, int]]]:
+        """Call Google Generic AI SDK. Returns (text, (prompt_tokens, completion_tokens) or None)"""
         # Configure specifically for this call (in case of multiple keys)
         genai.configure(api_key=api_key)
         
@@ -102,14 +104,20 @@ class GeminiService:
         if history:
              chat = model.start_chat(history=history)
              response = chat.send_message(current_user_message, generation_config=generation_config)
-             return response.text
         else:
              response = model.generate_content(current_user_message, generation_config=generation_config)
-             return response.text
 
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            return response.text, (
+                getattr(usage, "prompt_token_count", 0) or 0,
+                getattr(usage, "candidates_token_count", 0) or 0,
+            )
+        return response.text, None
 
-    def _call_openrouter_sync(self, api_key: str, model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
-        """Sync version of the OpenRouter API caller"""
+
+    def _call_openrouter_sync(self, api_key: str, model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> Tuple[str, Optional[Tuple[int, int]]]:
+        """Sync version of the OpenRouter API caller. Returns (text, (prompt_tokens, completion_tokens) or None)"""
         if not api_key:
             raise ValueError("Missing OpenRouter API Key")
 
@@ -131,34 +139,91 @@ class GeminiService:
             response = client.post(f"{self.base_url}/chat/completions", headers=headers, json=payload)
             if response.status_code == 200:
                 data = response.json()
+                usage = data.get("usage")
+                tokens = (usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)) if usage else None
                 if "choices" in data and len(data["choices"]) > 0:
-                     return data["choices"][0]["message"]["content"]
-                return "Empty response from AI"
+                     return data["choices"][0]["message"]["content"], tokens
+                return "Empty response from AI", tokens
             else:
                 raise Exception(f"OpenRouter Error {response.status_code}: {response.text}")
 
-    def generate_text(self, prompt: str, user: Any = None, is_complex: bool = False, temperature: float = 0.7, max_tokens: int = 2000) -> str:
-        """Generates text with cascading fallback mechanism"""
-        messages = [{"role": "user", "content": prompt}]
-        plan = self._get_execution_plan(user, is_complex)
+    def _run_plan(
+        self,
+        plan: List[Tuple[str, str, str]],
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        feature: str,
+    ) -> Dict[str, Any]:
+        """
+        Try each provider in the plan until one answers, metering every attempt.
         
+        Returns:
+            Dict with content, provider, model, token counts, fallback_hops and
+            error (provider/model are None if every attempt failed)
+        """
         last_error = "No API keys configured"
+        hops = 0
+        prompt_chars = sum(len(m["content"]) for m in messages)
         
         for provider, api_key, model in plan:
+            if not api_key:
+                continue
+            started = time.perf_counter()
             try:
-                if not api_key: continue
-                
                 if provider == "google":
-                    return self._call_google(api_key, model, messages, temperature)
+                    content, usage = self._call_google(api_key, model, messages, temperature)
                 else:
-                    return self._call_openrouter_sync(api_key, model, messages, temperature, max_tokens)
-                    
+                    content, usage = self._call_openrouter_sync(api_key, model, messages, temperature, max_tokens)
             except Exception as e:
+                ai_meter.record(provider, model, feature, (time.perf_counter() - started) * 1000, success=False)
                 last_error = str(e)
+                hops += 1
                 logger.warning(f"Fallback: {provider}/{model} failed. Error: {e}")
                 continue
+            
+            prompt_tokens, completion_tokens = usage or ((prompt_chars + 3) // 4, estimate_tokens(content))
+            ai_meter.record(
+                provider,
+                model,
+                feature,
+                (time.perf_counter() - started) * 1000,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                fallback=hops > 0,
+            )
+            return {
+                "content": content,
+                "provider": provider,
+                "model": model,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "fallback_hops": hops,
+                "error": None,
+            }
         
-        return f"AI Service Unavailable. Last error: {last_error}"
+        return {
+            "content": None,
+            "provider": None,
+            "model": None,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "fallback_hops": hops,
+            "error": last_error,
+        }
+
+    def generate_text_with_meta(self, prompt: str, user: Any = None, is_complex: bool = False, temperature: float = 0.7, max_tokens: int = 2000, feature: str = "general") -> Dict[str, Any]:
+        """Generates text with cascading fallback, reporting which provider served it"""
+        messages = [{"role": "user", "content": prompt}]
+        plan = self._get_execution_plan(user, is_complex)
+        result = self._run_plan(plan, messages, temperature, max_tokens, feature)
+        if result["content"] is None:
+            result["content"] = f"AI Service Unavailable. Last error: {result['error']}"
+        return result
+
+    def generate_text(self, prompt: str, user: Any = None, is_complex: bool = False, temperature: float = 0.7, max_tokens: int = 2000, feature: str = "general") -> str:
+        """Generates text with cascading fallback mechanism"""
+        return self.generate_text_with_meta(prompt, user, is_complex, temperature, max_tokens, feature)["content"]
 
     def analyze_image(self, image_path: str, prompt: str, user: Any = None, temperature: float = 0.4) -> str:
         """Analyze image using Gemini Vision"""
@@ -198,20 +263,10 @@ class GeminiService:
         api_messages.extend(messages)
 
         plan = self._get_execution_plan(user, is_complex=False)
-        
-        last_error = ""
-        for provider, api_key, model in plan:
-            try:
-                if not api_key: continue
-                if provider == "google":
-                    return self._call_google(api_key, model, api_messages, temperature)
-                else:
-                    return self._call_openrouter_sync(api_key, model, api_messages, temperature, 1000)
-            except Exception as e:
-                last_error = str(e)
-                continue
-        
-        return f"Chat Error: {last_error}"
+        result = self._run_plan(plan, api_messages, temperature, 1000, feature="chat")
+        if result["content"] is None:
+            return f"Chat Error: {result['error']}"
+        return result["content"]
 
     def analyze_comprehension(self, student_summary: str, key_concepts: List[str], user: Any = None) -> Dict[str, Any]:
         """FSRS Retention Analysis"""
@@ -227,7 +282,7 @@ Concepts: {key_concepts}
 Student: {student_summary}"""
 
         try:
-            response = self.generate_text(prompt, user=user, is_complex=False, temperature=0.3)
+            response = self.generate_text(prompt, user=user, is_complex=False, temperature=0.3, feature="comprehension")
             
             # Simple cleanup for markdown json
             import json
@@ -264,8 +319,17 @@ Return ONLY the transcription text, nothing else."""
             print(f"Audio transcription error: {e}")
             return "[Audio transcription failed]"
 
-    def evaluate_recall(self, original_text: str, student_recall: str) -> Dict[str, Any]:
-        """Compare student's recall with original text and identify gaps."""
+    def evaluate_recall(
+        self,
+        original_text: str,
+        student_recall: str,
+        baseline: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Compare student's recall with original text and identify gaps.
+
+        ``baseline`` (e.g. a local pre-score) is returned instead of the
+        generic template if the AI evaluation fails.
+        """
         prompt = f"""You are an educational assessment AI. Compare the student's recall with the original text.
 
 ORIGINAL TEXT:
@@ -286,7 +350,7 @@ Return JSON ONLY in this exact format:
 Focus on main concepts, facts, and key details. Be fair but accurate."""
 
         try:
-            response = self.generate_text(prompt, is_complex=False, temperature=0.3)
+            response = self.generate_text(prompt, is_complex=False, temperature=0.3, feature="pdf_recall")
             
             import json
             clean = response.replace("```json", "").replace("```", "").strip()
@@ -294,6 +358,8 @@ Focus on main concepts, facts, and key details. Be fair but accurate."""
             return result
         except Exception as e:
             print(f"Recall evaluation error: {e}")
+            if baseline is not None:
+                return baseline
             return {
                 "score": 50,
                 "recalled_points": [],
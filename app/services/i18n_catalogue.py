@@ -0,0 +1,324 @@
+"""
+i18n catalogue.
+
+Each (language, namespace) catalogue is loaded once into an immutable
+in-process mapping and served from memory until a translation in it changes:
+- ``i18n:version:{language}:{namespace}`` version stamp, bumped on every write
+- ``i18n:user_language:{user_id}``       cached preferred language ("" for none)
+- ``i18n:reload``                        pub/sub channel; each worker drops the
+                                         catalogues and preferences that changed
+
+Without Redis, versions are counted in-process and other workers pick up
+changes when their cached entries expire.
+"""
+
+import hashlib
+import itertools
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy.orm import Session
+
+from app.core.redis_client import get_redis
+from app.models.translation import Translation, UserLanguagePreference
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "i18n:version:{language}:{namespace}"
+USER_LANGUAGE_KEY = "i18n:user_language:{user_id}"
+RELOAD_CHANNEL = "i18n:reload"
+
+# Catalogues are reloaded at least this often, in case a reload message was missed
+CATALOGUE_TTL_SECONDS = 3600
+
+# Preferences are re-read at least this often
+USER_LANGUAGE_TTL_SECONDS = 300
+
+# Pause before resubscribing after the listener loses Redis
+LISTEN_RETRY_SECONDS = 5
+
+
+@dataclass(frozen=True)
+class Catalogue:
+    """One (language, namespace) catalogue as loaded at ``version``."""
+
+    language: str
+    namespace: str
+    version: int
+    entries: Mapping[str, str]
+    etag: str
+
+    def get(self, key: str) -> Optional[str]:
+        return self.entries.get(key)
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Whether a client's If-None-Match header already names this version."""
+        if not if_none_match:
+            return False
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or self.etag in tags
+
+
+def _etag(language: str, namespace: str, entries: Dict[str, str]) -> str:
+    digest = hashlib.sha1(
+        json.dumps([language, namespace, entries], sort_keys=True, ensure_ascii=False).encode()
+    ).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+class CatalogueStore:
+    """Process-local catalogues, dropped when a write to them is published."""
+
+    def __init__(self, ttl: float = CATALOGUE_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # (language, namespace) -> (catalogue, expires at)
+        self._catalogues: Dict[Tuple[str, str], Tuple[Catalogue, float]] = {}
+        # Newest version announced per catalogue; older loads are not cached
+        self._announced: Dict[Tuple[str, str], int] = {}
+        self._versions = itertools.count(1)
+
+    def get(self, db: Session, language: str, namespace: str = "common") -> Catalogue:
+        """Catalogue from memory, loaded with one query on a miss."""
+        ident = (language, namespace)
+        with self._lock:
+            cached = self._catalogues.get(ident)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+        # Read the stamp first: a write that lands during the load bumps it
+        version = self._current_version(language, namespace)
+        rows = (
+            db.query(Translation.key, Translation.value)
+            .filter(
+                Translation.language_code == language,
+                Translation.namespace == namespace,
+            )
+            .all()
+        )
+        entries = {key: value for key, value in rows}
+        catalogue = Catalogue(
+            language=language,
+            namespace=namespace,
+            version=version,
+            entries=MappingProxyType(entries),
+            etag=_etag(language, namespace, entries),
+        )
+        with self._lock:
+            if version >= self._announced.get(ident, 0):
+                self._catalogues[ident] = (catalogue, time.monotonic() + self.ttl)
+        return catalogue
+
+    def _current_version(self, language: str, namespace: str) -> int:
+        client = get_redis()
+        if client is not None:
+            try:
+                return int(
+                    client.get(VERSION_KEY.format(language=language, namespace=namespace))
+                    or 0
+                )
+            except RedisError as e:
+                logger.warning(f"Catalogue version read failed: {e}")
+        with self._lock:
+            return self._announced.get((language, namespace), 0)
+
+    def changed(self, language: str, namespace: str) -> int:
+        """
+        Record a committed write to a catalogue and tell every worker to reload it.
+
+        Returns:
+            The new version stamp
+        """
+        version = None
+        client = get_redis()
+        if client is not None:
+            try:
+                version = client.incr(
+                    VERSION_KEY.format(language=language, namespace=namespace)
+                )
+            except RedisError as e:
+                logger.warning(f"Catalogue version bump failed: {e}")
+        if version is None:
+            with self._lock:
+                version = max(next(self._versions), self._announced.get((language, namespace), 0) + 1)
+        self.drop(language, namespace, version)
+        _publish({"language": language, "namespace": namespace, "version": version})
+        return version
+
+    def drop(self, language: str, namespace: str, version: int):
+        ident = (language, namespace)
+        with self._lock:
+            self._announced[ident] = max(version, self._announced.get(ident, 0))
+            cached = self._catalogues.get(ident)
+            if cached and cached[0].version < version:
+                del self._catalogues[ident]
+
+    def clear(self):
+        with self._lock:
+            self._catalogues.clear()
+            self._announced.clear()
+
+
+class UserLanguageCache:
+    """Preferred UI language per user, so language detection skips the database."""
+
+    def __init__(self, ttl: int = USER_LANGUAGE_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # user id -> (language or None, expires at)
+        self._local: Dict[int, Tuple[Optional[str], float]] = {}
+
+    def cached(self, user_id: int) -> Tuple[bool, Optional[str]]:
+        """(hit, language) from this process only; never blocks."""
+        with self._lock:
+            cached = self._local.get(user_id)
+        if cached and cached[1] > time.monotonic():
+            return True, cached[0]
+        return False, None
+
+    def get(self, user_id: int, db: Optional[Session] = None) -> Optional[str]:
+        """Preferred language, read from Redis or (on a miss) the database."""
+        hit, language = self.cached(user_id)
+        if hit:
+            return language
+
+        client = get_redis()
+        key = USER_LANGUAGE_KEY.format(user_id=user_id)
+        if client is not None:
+            try:
+                stored = client.get(key)
+                if stored is not None:
+                    self._remember(user_id, stored or None)
+                    return stored or None
+            except RedisError as e:
+                logger.warning(f"User language read failed, querying the database: {e}")
+                client = None
+
+        language = self._query(user_id, db)
+        if client is not None:
+            try:
+                client.set(key, language or "", ex=self.ttl)
+            except RedisError as e:
+                logger.warning(f"User language cache failed: {e}")
+        self._remember(user_id, language)
+        return language
+
+    @staticmethod
+    def _query(user_id: int, db: Optional[Session]) -> Optional[str]:
+        if db is None:
+            from app.db.session import SessionLocal
+
+            with SessionLocal() as session:
+                return UserLanguageCache._query(user_id, session)
+        row = (
+            db.query(UserLanguagePreference.preferred_language)
+            .filter(UserLanguagePreference.user_id == user_id)
+            .first()
+        )
+        return row[0] if row else None
+
+    def set(self, user_id: int, language: Optional[str]):
+        """Store a committed preference and drop stale copies on other workers."""
+        client = get_redis()
+        if client is not None:
+            try:
+                client.set(USER_LANGUAGE_KEY.format(user_id=user_id), language or "", ex=self.ttl)
+            except RedisError as e:
+                logger.warning(f"User language cache update failed: {e}")
+        self._remember(user_id, language)
+        _publish({"user_id": user_id})
+
+    def forget(self, user_id: int):
+        with self._lock:
+            self._local.pop(user_id, None)
+
+    def _remember(self, user_id: int, language: Optional[str]):
+        with self._lock:
+            self._local[user_id] = (language, time.monotonic() + self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+
+# ------------------------------------------------------------------
+# Reload messages
+# ------------------------------------------------------------------
+
+
+def _publish(message: dict):
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.publish(RELOAD_CHANNEL, json.dumps(message))
+    except RedisError as e:
+        logger.warning(f"i18n reload publish failed: {e}")
+
+
+class ReloadListener:
+    """Applies reload messages from every worker to this process's caches."""
+
+    def __init__(self, catalogues: CatalogueStore, user_languages: UserLanguageCache):
+        self.catalogues = catalogues
+        self.user_languages = user_languages
+        self._listener: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def apply(self, message: dict):
+        if "user_id" in message:
+            # Our own write already stored the new value; re-reading it is cheap
+            self.user_languages.forget(int(message["user_id"]))
+        else:
+            self.catalogues.drop(
+                message["language"], message["namespace"], int(message["version"])
+            )
+
+    def start(self):
+        """Subscribe to reload messages (call from the app lifespan)."""
+        if self._listener is not None or get_redis() is None:
+            return
+        self._stopping.clear()
+        self._listener = threading.Thread(target=self._listen, name="i18n-reload", daemon=True)
+        self._listener.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._listener is not None:
+            self._listener.join(timeout=LISTEN_RETRY_SECONDS)
+            self._listener = None
+
+    def _listen(self):
+        while not self._stopping.is_set():
+            client = get_redis()
+            if client is None:
+                self._stopping.wait(LISTEN_RETRY_SECONDS)
+                continue
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(RELOAD_CHANNEL)
+                while not self._stopping.is_set():
+                    item = pubsub.get_message(timeout=1.0)
+                    if item is None:
+                        continue
+                    try:
+                        self.apply(json.loads(item["data"]))
+                    except (TypeError, ValueError, KeyError) as e:
+                        logger.warning(f"Dropping malformed i18n reload message: {e}")
+            except RedisError as e:
+                logger.warning(f"i18n reload listener lost Redis, retrying: {e}")
+                self._stopping.wait(LISTEN_RETRY_SECONDS)
+            finally:
+                pubsub.close()
+
+
+# Singleton instances
+catalogues = CatalogueStore()
+user_languages = UserLanguageCache()
+reload_listener = ReloadListener(catalogues, user_languages)
@@ -0,0 +1,309 @@
+"""
+Identity-provider metadata for SSO logins.
+
+Logins reuse pooled connections and cached provider metadata instead of
+paying IdP round trips on every request:
+- ``sso:oidc:discovery:{url}`` cached OpenID discovery document
+- ``sso:oidc:jwks:{url}``      cached JSON Web Key Set
+
+A key set is refetched early when a token is signed with a key id the
+cached set does not have (the provider rotated its keys), at most once per
+``JWKS_MIN_REFRESH_SECONDS``. If the provider is unreachable, an expired
+copy is used rather than failing the login. Without Redis, each worker
+caches in-process.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import httpx
+from jose import jwk, jwt
+from jose.exceptions import JOSEError
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+DISCOVERY_KEY = "sso:oidc:discovery:{url}"
+JWKS_KEY = "sso:oidc:jwks:{url}"
+
+# Unknown key ids trigger a refetch at most this often per key set
+JWKS_MIN_REFRESH_SECONDS = 60
+
+# Clock skew tolerated on id_token exp/iat/nbf
+ID_TOKEN_LEEWAY_SECONDS = 60
+
+ID_TOKEN_ALGORITHMS = frozenset(
+    ["RS256", "RS384", "RS512", "PS256", "PS384", "PS512", "ES256", "ES384", "ES512"]
+)
+
+
+class IdPMetadataError(Exception):
+    """Provider metadata could not be fetched and no cached copy exists."""
+
+
+class IdTokenError(ValueError):
+    """An id_token failed local verification."""
+
+
+class SSOHttpClients:
+    """Connection pools shared by every SSO/OAuth call in this process."""
+
+    def __init__(
+        self,
+        max_connections: int = settings.SSO_HTTP_MAX_CONNECTIONS,
+        timeout: float = settings.SSO_HTTP_TIMEOUT_SECONDS,
+    ):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._async: Optional[httpx.AsyncClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sync: Optional[httpx.Client] = None
+
+    def _options(self) -> dict:
+        return {
+            "timeout": httpx.Timeout(self.timeout),
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            ),
+        }
+
+    def async_client(self) -> httpx.AsyncClient:
+        """Pooled client for the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            # Pooled connections belong to the loop that opened them
+            if self._async is None or self._async.is_closed or self._async_loop is not loop:
+                self._async = httpx.AsyncClient(**self._options())
+                self._async_loop = loop
+            return self._async
+
+    def sync_client(self) -> httpx.Client:
+        """Pooled client for sync callers (threadpool endpoints, Celery)."""
+        with self._lock:
+            if self._sync is None or self._sync.is_closed:
+                self._sync = httpx.Client(**self._options())
+            return self._sync
+
+    async def aclose(self):
+        """Close both pools (call from the app lifespan)."""
+        with self._lock:
+            client, self._async, self._async_loop = self._async, None, None
+        if client is not None:
+            await client.aclose()
+        self.close()
+
+    def close(self):
+        with self._lock:
+            client, self._sync = self._sync, None
+        if client is not None:
+            client.close()
+
+
+class IdPMetadataCache:
+    """OIDC discovery documents and key sets, fetched once per TTL across workers."""
+
+    def __init__(
+        self,
+        http: Optional[SSOHttpClients] = None,
+        ttl: int = settings.OIDC_METADATA_TTL_SECONDS,
+        min_refresh: float = JWKS_MIN_REFRESH_SECONDS,
+    ):
+        self.http = http or sso_http
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        self._lock = threading.Lock()
+        # url -> (document, fetched at)
+        self._local: Dict[str, Tuple[dict, float]] = {}
+        # url -> fetch in flight, shared by concurrent logins on one loop
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def discovery(self, issuer: str) -> dict:
+        """The issuer's ``/.well-known/openid-configuration`` document."""
+        url = f"{issuer.rstrip('/')}/.well-known/openid-configuration"
+        document, _ = await self._get(DISCOVERY_KEY, url)
+        return document
+
+    async def jwks(self, jwks_uri: str, kid: Optional[str] = None) -> dict:
+        """Key set at ``jwks_uri``, refetched early if it lacks ``kid``."""
+        document, fetched_at = await self._get(JWKS_KEY, jwks_uri)
+        if kid is None or _find_key(document, kid) is not None:
+            return document
+
+        # Another worker may already have picked up the rotated keys
+        shared = self._shared(JWKS_KEY, jwks_uri)
+        if shared and shared[1] > fetched_at and _find_key(shared[0], kid) is not None:
+            self._remember(jwks_uri, shared)
+            return shared[0]
+        if time.time() - fetched_at < self.min_refresh:
+            return document
+        document, _ = await self._get(JWKS_KEY, jwks_uri, refresh=True)
+        return document
+
+    async def signing_key(self, jwks_uri: str, kid: Optional[str], algorithm: str):
+        """Constructed public key for a token header, built once per key."""
+        document = await self.jwks(jwks_uri, kid)
+        if kid is not None:
+            key = _find_key(document, kid)
+        else:
+            # No kid: only unambiguous when the set has a single signing key
+            keys = [k for k in document.get("keys", []) if k.get("use", "sig") == "sig"]
+            key = keys[0] if len(keys) == 1 else None
+        if key is None:
+            raise IdTokenError(f"No signing key {kid!r} in {jwks_uri}")
+        return _construct_key(json.dumps(key, sort_keys=True), algorithm)
+
+    def invalidate(self, url: Optional[str] = None):
+        with self._lock:
+            if url is None:
+                self._local.clear()
+            else:
+                self._local.pop(url, None)
+
+    # ------------------------------------------------------------------
+    # Fetching
+    # ------------------------------------------------------------------
+
+    async def _get(self, key_format: str, url: str, refresh: bool = False) -> Tuple[dict, float]:
+        with self._lock:
+            local = self._local.get(url)
+        if not refresh:
+            if local and time.time() - local[1] < self.ttl:
+                return local
+            shared = self._shared(key_format, url)
+            if shared and time.time() - shared[1] < self.ttl:
+                self._remember(url, shared)
+                return shared
+        try:
+            return await self._fetch_once(key_format, url)
+        except IdPMetadataError as e:
+            if local is None:
+                raise
+            logger.warning(f"Using expired IdP metadata for {url}: {e}")
+            return local
+
+    async def _fetch_once(self, key_format: str, url: str) -> Tuple[dict, float]:
+        loop = asyncio.get_running_loop()
+        task = self._inflight.get(url)
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = loop.create_task(self._fetch(key_format, url))
+            self._inflight[url] = task
+            task.add_done_callback(lambda done: self._inflight.pop(url, None)
+                                   if self._inflight.get(url) is done else None)
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key_format: str, url: str) -> Tuple[dict, float]:
+        try:
+            response = await self.http.async_client().get(url)
+            response.raise_for_status()
+            document = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            raise IdPMetadataError(f"Could not fetch {url}: {e}") from e
+        entry = (document, time.time())
+        self._remember(url, entry)
+
+        client = get_redis()
+        if client is not None:
+            try:
+                client.set(
+                    key_format.format(url=url),
+                    json.dumps({"document": document, "fetched_at": entry[1]}),
+                    ex=max(int(self.ttl), 1),
+                )
+            except RedisError as e:
+                logger.warning(f"IdP metadata cache write failed: {e}")
+        return entry
+
+    def _shared(self, key_format: str, url: str) -> Optional[Tuple[dict, float]]:
+        client = get_redis()
+        if client is None:
+            return None
+        try:
+            raw = client.get(key_format.format(url=url))
+            if raw is None:
+                return None
+            entry = json.loads(raw)
+            return entry["document"], float(entry["fetched_at"])
+        except (RedisError, ValueError, KeyError) as e:
+            logger.warning(f"IdP metadata cache read failed: {e}")
+            return None
+
+    def _remember(self, url: str, entry: Tuple[dict, float]):
+        with self._lock:
+            self._local[url] = entry
+
+    def clear(self):
+        self.invalidate()
+
+
+def _find_key(document: dict, kid: str) -> Optional[dict]:
+    for key in document.get("keys", []):
+        if key.get("kid") == kid:
+            return key
+    return None
+
+
+# Keys are shared across logins, so each one's public key is parsed once
+@lru_cache(maxsize=256)
+def _construct_key(serialized: str, algorithm: str):
+    return jwk.construct(json.loads(serialized), algorithm)
+
+
+async def verify_id_token(
+    id_token: str,
+    jwks_uri: str,
+    audience: str,
+    issuer: Optional[str] = None,
+    access_token: Optional[str] = None,
+    nonce: Optional[str] = None,
+    cache: Optional["IdPMetadataCache"] = None,
+) -> dict:
+    """
+    Verify an OIDC id_token locally against the provider's cached key set.
+
+    Returns:
+        The token's claims
+
+    Raises:
+        IdTokenError: If the signature or a claim is invalid
+        IdPMetadataError: If the key set cannot be fetched
+    """
+    cache = cache or idp_metadata
+    try:
+        header = jwt.get_unverified_header(id_token)
+    except JOSEError as e:
+        raise IdTokenError(f"Malformed id_token: {e}") from e
+    algorithm = header.get("alg")
+    if algorithm not in ID_TOKEN_ALGORITHMS:
+        raise IdTokenError(f"Unsupported id_token algorithm: {algorithm}")
+
+    key = await cache.signing_key(jwks_uri, header.get("kid"), algorithm)
+    try:
+        claims = jwt.decode(
+            id_token,
+            key,
+            algorithms=[algorithm],
+            audience=audience,
+            issuer=issuer,
+            access_token=access_token,
+            options={"leeway": ID_TOKEN_LEEWAY_SECONDS, "verify_at_hash": access_token is not None},
+        )
+    except JOSEError as e:
+        raise IdTokenError(str(e)) from e
+    if nonce is not None and claims.get("nonce") != nonce:
+        raise IdTokenError("id_token nonce does not match")
+    return claims
+
+
+# Singleton instances
+sso_http = SSOHttpClients()
+idp_metadata = IdPMetadataCache(sso_http)
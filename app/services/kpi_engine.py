@@ -0,0 +1,370 @@
+"""
+KPI Engine
+
+Computes every executive dashboard metric with a handful of
+conditional-aggregation queries (one scan per table, CASE expressions for
+each time window) and persists the result as a KPISnapshot.
+
+The dashboard, health score, risk report and executive PDF all read the
+latest snapshot. A snapshot older than the staleness bound is recomputed
+on read, so data stays within KPI_SNAPSHOT_MAX_AGE_SECONDS even if the beat
+refresh stops. Only one request recomputes at a time:
+- ``kpi:snapshot:refreshing``  lock held by the worker recomputing (SET NX EX)
+
+Readers arriving meanwhile are served the stale snapshot; before the first
+snapshot exists they wait briefly for it instead of computing their own.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.models.analytics import KPISnapshot
+from app.models.course import Course
+from app.models.course_review import CourseReview
+from app.models.enrollment import Enrollment, EnrollmentStatus
+from app.models.order import Order, OrderStatus
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Number of complete calendar months in the growth trend
+GROWTH_MONTHS = 6
+
+# Snapshots older than this are pruned by the refresh task
+SNAPSHOT_RETENTION_DAYS = 30
+
+REFRESH_LOCK_KEY = "kpi:snapshot:refreshing"
+# Outlives any reasonable compute() so a crashed worker can't block refreshes for long
+REFRESH_LOCK_SECONDS = 300
+
+# How long a request waits for another one to compute the very first snapshot
+FIRST_SNAPSHOT_WAIT_SECONDS = 10
+FIRST_SNAPSHOT_POLL_SECONDS = 0.25
+
+
+class KPISnapshotUnavailable(Exception):
+    """No snapshot exists yet and another request is still computing the first one."""
+
+# Simplified CAC - would be derived from marketing spend
+PLACEHOLDER_CAC = 50.0
+# Placeholder until NPS surveys are collected
+PLACEHOLDER_NPS = 75
+
+
+def _month_starts(now: datetime, months: int) -> List[datetime]:
+    """First day of each of the last `months` complete months, plus this month."""
+    starts = [datetime(now.year, now.month, 1)]
+    for _ in range(months):
+        current = starts[0]
+        if current.month == 1:
+            starts.insert(0, datetime(current.year - 1, 12, 1))
+        else:
+            starts.insert(0, datetime(current.year, current.month - 1, 1))
+    return starts
+
+
+def _count_if(condition):
+    return func.sum(case((condition, 1), else_=0))
+
+
+def _sum_if(condition, column):
+    return func.sum(case((condition, column), else_=0))
+
+
+def _distinct_if(condition, column):
+    return func.count(func.distinct(case((condition, column))))
+
+
+class KPIEngine:
+    """Conditional-aggregation KPI computation with persisted snapshots."""
+
+    def __init__(self, max_age_seconds: Optional[int] = None):
+        self.max_age = timedelta(
+            seconds=max_age_seconds or settings.KPI_SNAPSHOT_MAX_AGE_SECONDS
+        )
+        self._refreshing = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Computation
+    # ------------------------------------------------------------------
+
+    def compute(self, db: Session, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Compute all KPIs and growth trends.
+
+        Args:
+            db: Database session
+            now: Reference time (defaults to utcnow)
+
+        Returns:
+            {"kpis": {...}, "growth": {...}}
+        """
+        now = now or datetime.utcnow()
+        today_start = datetime(now.year, now.month, now.day)
+        week_start = today_start - timedelta(days=7)
+        month_start = today_start - timedelta(days=30)
+        prev_month_start = month_start - timedelta(days=30)
+        buckets = _month_starts(now, GROWTH_MONTHS)
+        bucket_ranges = list(zip(buckets, buckets[1:]))
+
+        # Enrollments: active users, totals and monthly enrollment trend
+        enrolled_at = Enrollment.enrolled_at
+        enrollment_row = db.execute(
+            select(
+                _distinct_if(enrolled_at >= today_start, Enrollment.user_id),
+                _distinct_if(enrolled_at >= week_start, Enrollment.user_id),
+                _distinct_if(enrolled_at >= month_start, Enrollment.user_id),
+                func.count(Enrollment.id),
+                _count_if(Enrollment.status == EnrollmentStatus.COMPLETED),
+                *[
+                    _count_if(and_(enrolled_at >= start, enrolled_at < end))
+                    for start, end in bucket_ranges
+                ],
+            )
+        ).one()
+        daily_active, weekly_active, monthly_active, total_enrollments = (
+            int(v or 0) for v in enrollment_row[:4]
+        )
+        completed_enrollments = int(enrollment_row[4] or 0)
+        monthly_enrollments = [int(v or 0) for v in enrollment_row[5:]]
+
+        # Completed orders: revenue windows and monthly revenue trend
+        created_at = Order.created_at
+        order_row = db.execute(
+            select(
+                func.count(Order.id),
+                func.sum(Order.total),
+                _sum_if(created_at >= month_start, Order.total),
+                _sum_if(
+                    and_(created_at >= prev_month_start, created_at < month_start),
+                    Order.total,
+                ),
+                *[
+                    _sum_if(and_(created_at >= start, created_at < end), Order.total)
+                    for start, end in bucket_ranges
+                ],
+            ).where(Order.status == OrderStatus.COMPLETED)
+        ).one()
+        total_orders = int(order_row[0] or 0)
+        total_revenue, monthly_revenue, prev_month_revenue = (
+            float(v or 0) for v in order_row[1:4]
+        )
+        monthly_revenues = [float(v or 0) for v in order_row[4:]]
+
+        # Users, published courses and ratings in one round trip
+        totals_row = db.execute(
+            select(
+                select(func.count(User.id)).scalar_subquery(),
+                select(_count_if(User.is_active == False)).scalar_subquery(),  # noqa: E712
+                select(func.count(Course.id))
+                .where(Course.is_published == True)  # noqa: E712
+                .scalar_subquery(),
+                select(func.avg(CourseReview.rating)).scalar_subquery(),
+            )
+        ).one()
+        total_users, churned_users, total_courses = (int(v or 0) for v in totals_row[:3])
+        avg_rating = float(totals_row[3] or 0)
+
+        # Users have no signup timestamp; a user counts as new in the month
+        # of their first enrollment
+        first_enrollment = (
+            select(func.min(Enrollment.enrolled_at).label("first_at"))
+            .group_by(Enrollment.user_id)
+            .subquery()
+        )
+        first_at = first_enrollment.c.first_at
+        new_user_row = db.execute(
+            select(
+                *[
+                    _count_if(and_(first_at >= start, first_at < end))
+                    for start, end in bucket_ranges
+                ]
+            )
+        ).one()
+        monthly_new_users = [int(v or 0) for v in new_user_row]
+
+        revenue_growth = (
+            (monthly_revenue - prev_month_revenue) / prev_month_revenue * 100
+            if prev_month_revenue > 0
+            else 0
+        )
+        completion_rate = (
+            completed_enrollments / total_enrollments * 100 if total_enrollments else 0
+        )
+        churn_rate = churned_users / total_users * 100 if total_users else 0
+
+        kpis = {
+            "active_users": {
+                "daily": daily_active,
+                "weekly": weekly_active,
+                "monthly": monthly_active,
+                "total": total_users,
+            },
+            "revenue": {
+                "total": total_revenue,
+                "monthly": monthly_revenue,
+                "growth_rate": round(revenue_growth, 2),
+                "arr": monthly_revenue * 12,  # Annual Recurring Revenue projection
+            },
+            "courses": {
+                "total_published": total_courses,
+                "total_enrollments": total_enrollments,
+                "completion_rate": round(completion_rate, 2),
+            },
+            "satisfaction": {
+                "average_rating": round(avg_rating, 2),
+                "nps_score": PLACEHOLDER_NPS,
+            },
+            "business_metrics": {
+                "cac": PLACEHOLDER_CAC,
+                "churn_rate": round(churn_rate, 2),
+                "total_orders": total_orders,
+            },
+        }
+
+        growth = {
+            "monthly_trends": [
+                {
+                    "month": start.strftime("%Y-%m"),
+                    "enrollments": monthly_enrollments[i],
+                    "revenue": monthly_revenues[i],
+                    "new_users": monthly_new_users[i],
+                }
+                for i, (start, _) in enumerate(bucket_ranges)
+            ],
+            "period": f"{GROWTH_MONTHS}_months",
+        }
+
+        return {"kpis": kpis, "growth": growth}
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+
+    def refresh(self, db: Session, now: Optional[datetime] = None) -> KPISnapshot:
+        """Compute KPIs and persist them as a new snapshot."""
+        now = now or datetime.utcnow()
+        started = time.perf_counter()
+        data = self.compute(db, now=now)
+        compute_ms = (time.perf_counter() - started) * 1000
+
+        snapshot = KPISnapshot(computed_at=now, data=data, compute_ms=compute_ms)
+        db.add(snapshot)
+        db.commit()
+        db.refresh(snapshot)
+        logger.info(f"KPI snapshot {snapshot.id} computed in {compute_ms:.1f}ms")
+        return snapshot
+
+    def latest(self, db: Session) -> Optional[KPISnapshot]:
+        return (
+            db.query(KPISnapshot)
+            .order_by(KPISnapshot.computed_at.desc(), KPISnapshot.id.desc())
+            .first()
+        )
+
+    def get_snapshot(
+        self,
+        db: Session,
+        max_age: Optional[timedelta] = None,
+        now: Optional[datetime] = None,
+    ) -> KPISnapshot:
+        """
+        Get a snapshot no older than the staleness bound.
+
+        Args:
+            db: Database session
+            max_age: Staleness bound (defaults to the configured bound)
+            now: Reference time (defaults to utcnow)
+
+        Returns:
+            The latest snapshot, refreshed first if it was too old. While
+            another request is refreshing, the stale snapshot is returned.
+
+        Raises:
+            KPISnapshotUnavailable: No snapshot exists yet and the request
+                computing the first one didn't finish within the wait
+        """
+        now = now or datetime.utcnow()
+        max_age = self.max_age if max_age is None else max_age
+
+        snapshot = self.latest(db)
+        if snapshot is not None and now - snapshot.computed_at <= max_age:
+            return snapshot
+
+        with self._refresh_lock() as acquired:
+            if acquired:
+                # Another worker may have refreshed since we looked
+                snapshot = self.latest(db)
+                if snapshot is None or now - snapshot.computed_at > max_age:
+                    snapshot = self.refresh(db, now=now)
+                return snapshot
+
+        if snapshot is None:
+            snapshot = self._wait_for_first(db)
+        return snapshot
+
+    def _wait_for_first(self, db: Session) -> KPISnapshot:
+        """Poll for the snapshot another request is computing."""
+        deadline = time.monotonic() + FIRST_SNAPSHOT_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(FIRST_SNAPSHOT_POLL_SECONDS)
+            snapshot = self.latest(db)
+            if snapshot is not None:
+                return snapshot
+        raise KPISnapshotUnavailable("KPI snapshot is still being computed")
+
+    @contextmanager
+    def _refresh_lock(self) -> Iterator[bool]:
+        """Yield whether this request may refresh; at most one does at a time."""
+        if not self._refreshing.acquire(blocking=False):
+            yield False
+            return
+        try:
+            redis = get_redis()
+            token = uuid.uuid4().hex
+            if redis is not None:
+                try:
+                    if not redis.set(REFRESH_LOCK_KEY, token, nx=True, ex=REFRESH_LOCK_SECONDS):
+                        yield False
+                        return
+                except RedisError as e:
+                    logger.warning(f"KPI refresh lock unavailable: {e}")
+                    redis = None
+            try:
+                yield True
+            finally:
+                if redis is not None:
+                    try:
+                        if redis.get(REFRESH_LOCK_KEY) == token:
+                            redis.delete(REFRESH_LOCK_KEY)
+                    except RedisError as e:
+                        logger.warning(f"KPI refresh lock release failed: {e}")
+        finally:
+            self._refreshing.release()
+
+    def prune(self, db: Session, now: Optional[datetime] = None) -> int:
+        """Delete snapshots past the retention window, always keeping the latest."""
+        now = now or datetime.utcnow()
+        latest = self.latest(db)
+        query = db.query(KPISnapshot).filter(
+            KPISnapshot.computed_at < now - timedelta(days=SNAPSHOT_RETENTION_DAYS)
+        )
+        if latest is not None:
+            query = query.filter(KPISnapshot.id != latest.id)
+        deleted = query.delete(synchronize_session=False)
+        db.commit()
+        return deleted
+
+
+kpi_engine = KPIEngine()
@@ -0,0 +1,426 @@
+"""
+Leaderboard Service
+
+Keeps user and pack leaderboards in Redis sorted sets:
+- All-time user board (score = coin balance)
+- Weekly user board (score = coins earned this ISO week)
+- Per-course user board (score = coins earned from the course)
+- All-time and weekly pack boards
+
+Rank, top-N and "around me" windows are O(log n) sorted-set lookups.
+Weekly boards are keyed by ISO week and expire on their own, so rollover
+never rewrites rows. Every board can be rebuilt from SQL, and all reads fall
+back to SQL when Redis is unavailable.
+
+One worker at a time rebuilds a board (``{board}:rebuilding`` lock) into
+its own temporary key; meanwhile other readers use SQL. Members whose coins
+change during the rebuild are collected in ``{board}:pending``, and the swap
+writes their committed scores from SQL rather than replaying increments the
+rebuild's read may already include.
+"""
+
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from redis.exceptions import RedisError, WatchError
+from sqlalchemy import desc, func, or_
+from sqlalchemy.orm import Session
+
+from app.core.redis_client import get_redis
+from app.models.coin_transaction import CoinTransaction, TransactionType
+from app.models.learning_group import LearningGroup
+from app.models.lesson import Lesson
+from app.models.module import Module
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+USERS_ALLTIME = "users:alltime"
+USERS_WEEKLY = "users:weekly"
+PACKS_ALLTIME = "packs:alltime"
+PACKS_WEEKLY = "packs:weekly"
+
+KEY_PREFIX = "leaderboard"
+
+# Weekly boards are kept for a few weeks so last week's results stay readable
+WEEKLY_TTL_SECONDS = 5 * 7 * 24 * 3600
+
+# Entries written per pipeline during a rebuild
+REBUILD_CHUNK_SIZE = 5000
+
+# A rebuild that takes longer than this (or dies) lets another worker retry
+REBUILD_LOCK_SECONDS = 120
+
+Entry = Tuple[int, int, int]  # (member_id, score, rank) - rank is 1-based
+
+
+def week_id(moment: Optional[datetime] = None) -> str:
+    """ISO week identifier, e.g. 2026-W42."""
+    year, week, _ = (moment or datetime.utcnow()).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def week_start(moment: Optional[datetime] = None) -> datetime:
+    moment = moment or datetime.utcnow()
+    start = moment - timedelta(days=moment.weekday())
+    return start.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def course_board(course_id: int) -> str:
+    return f"course:{course_id}"
+
+
+class LeaderboardService:
+    """Sorted-set backed leaderboards with a SQL rebuild path."""
+
+    @staticmethod
+    def _key(board: str, moment: Optional[datetime] = None) -> str:
+        if board in (USERS_WEEKLY, PACKS_WEEKLY):
+            return f"{KEY_PREFIX}:{board}:{week_id(moment)}"
+        return f"{KEY_PREFIX}:{board}"
+
+    @staticmethod
+    def _built_key(key: str) -> str:
+        return f"{key}:built"
+
+    @staticmethod
+    def _lock_key(key: str) -> str:
+        return f"{key}:rebuilding"
+
+    @staticmethod
+    def _pending_key(key: str) -> str:
+        return f"{key}:pending"
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def record_user_coins(
+        self,
+        user_id: int,
+        balance: int,
+        earned: int = 0,
+        course_id: Optional[int] = None,
+    ):
+        """
+        Reflect a coin change on the user boards.
+
+        Args:
+            user_id: User ID
+            balance: Coin balance after the change (all-time board score)
+            earned: Coins earned by this change (weekly/course boards)
+            course_id: Course the coins were earned in, if any
+        """
+        redis = get_redis()
+        if redis is None:
+            return
+
+        # (key, member, value, absolute): absolute values replace the score
+        changes = [(self._key(USERS_ALLTIME), user_id, balance, True)]
+        expire = []
+        if earned > 0:
+            weekly_key = self._key(USERS_WEEKLY)
+            changes.append((weekly_key, user_id, earned, False))
+            expire.append(weekly_key)
+            if course_id:
+                changes.append((self._key(course_board(course_id)), user_id, earned, False))
+        try:
+            self._apply(redis, changes, expire)
+        except RedisError as e:
+            logger.warning(f"Leaderboard update failed for user {user_id}: {e}")
+
+    def record_pack_points(self, pack_ids: List[int], points: int):
+        """Add points to packs on the all-time and weekly pack boards."""
+        redis = get_redis()
+        if redis is None or not pack_ids:
+            return
+
+        weekly_key = self._key(PACKS_WEEKLY)
+        changes = []
+        for pack_id in pack_ids:
+            changes.append((self._key(PACKS_ALLTIME), pack_id, points, False))
+            changes.append((weekly_key, pack_id, points, False))
+        try:
+            self._apply(redis, changes, [weekly_key])
+        except RedisError as e:
+            logger.warning(f"Pack leaderboard update failed: {e}")
+
+    def _apply(self, redis, changes: List[Tuple[str, int, int, bool]], expire: List[str]):
+        """Write score changes, buffering them for any board being rebuilt."""
+        keys = sorted({key for key, _, _, _ in changes})
+        pipe = redis.pipeline(transaction=False)
+        for key, member, value, absolute in changes:
+            self._write(pipe, key, member, value, absolute)
+        for key in expire:
+            pipe.expire(key, WEEKLY_TTL_SECONDS)
+        for key in keys:
+            pipe.exists(self._lock_key(key))
+        results = pipe.execute()
+
+        rebuilding = {key for key, locked in zip(keys, results[-len(keys):]) if locked}
+        if not rebuilding:
+            return
+        # The rebuild may or may not have read this change: its swap re-reads these members
+        pipe = redis.pipeline(transaction=False)
+        for key, member, _, _ in changes:
+            if key in rebuilding:
+                pipe.sadd(self._pending_key(key), member)
+        for key in rebuilding:
+            pipe.expire(self._pending_key(key), REBUILD_LOCK_SECONDS)
+        pipe.execute()
+
+    @staticmethod
+    def _write(pipe, key: str, member: int, value: float, absolute: bool):
+        if absolute:
+            pipe.zadd(key, {member: value})
+        else:
+            pipe.zincrby(key, value, member)
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def top(self, db: Session, board: str, limit: int = 10, offset: int = 0) -> List[Entry]:
+        """Get a page of the board, highest score first."""
+        redis = self._ready(db, board)
+        if redis is None:
+            return self._sql_top(db, board, limit, offset)
+
+        rows = redis.zrevrange(self._key(board), offset, offset + limit - 1, withscores=True)
+        return [
+            (int(member), int(score), offset + i + 1)
+            for i, (member, score) in enumerate(rows)
+        ]
+
+    def rank(self, db: Session, board: str, member_id: int) -> Optional[Entry]:
+        """Get a member's 1-based rank and score, or None if not on the board."""
+        redis = self._ready(db, board)
+        if redis is None:
+            return self._sql_rank(db, board, member_id)
+
+        pipe = redis.pipeline(transaction=False)
+        pipe.zrevrank(self._key(board), member_id)
+        pipe.zscore(self._key(board), member_id)
+        position, score = pipe.execute()
+        if position is None:
+            return None
+        return (member_id, int(score), position + 1)
+
+    def around(
+        self, db: Session, board: str, member_id: int, radius: int = 5
+    ) -> List[Entry]:
+        """Get the entries ranked just above and below a member."""
+        mine = self.rank(db, board, member_id)
+        if mine is None:
+            return []
+        offset = max(mine[2] - 1 - radius, 0)
+        return self.top(db, board, limit=radius * 2 + 1, offset=offset)
+
+    def size(self, db: Session, board: str) -> int:
+        redis = self._ready(db, board)
+        if redis is None:
+            return len(self._sql_scores(db, board))
+        return redis.zcard(self._key(board))
+
+    # ------------------------------------------------------------------
+    # Rebuild
+    # ------------------------------------------------------------------
+
+    def _ready(self, db: Session, board: str):
+        """Return Redis once the board exists, rebuilding it from SQL if needed."""
+        redis = get_redis()
+        if redis is None:
+            return None
+        try:
+            key = self._key(board)
+            if not redis.exists(self._built_key(key)) and self.rebuild(db, board) is None:
+                # Another worker is rebuilding the board; serve SQL until it's done
+                return None
+            return redis
+        except RedisError as e:
+            logger.warning(f"Leaderboard {board} unavailable, using SQL: {e}")
+            return None
+
+    def rebuild(self, db: Session, board: str) -> Optional[int]:
+        """
+        Rebuild a board from SQL into a temporary key and swap it in atomically.
+
+        Members whose coins change while the rebuild runs are re-read from
+        SQL in the swap.
+
+        Returns:
+            Number of entries written, or None if another worker is rebuilding it
+        """
+        redis = get_redis()
+        if redis is None:
+            return 0
+
+        key = self._key(board)
+        token = uuid.uuid4().hex
+        lock_key, pending_key = self._lock_key(key), self._pending_key(key)
+        if not redis.set(lock_key, token, nx=True, ex=REBUILD_LOCK_SECONDS):
+            return None
+        tmp_key = f"{key}:rebuild:{token}"
+        try:
+            # Left over from a rebuild that died; changes buffer again from now on
+            redis.delete(pending_key)
+            scores = self._sql_scores(db, board)
+            for start in range(0, len(scores), REBUILD_CHUNK_SIZE):
+                chunk = dict(scores[start : start + REBUILD_CHUNK_SIZE])
+                redis.zadd(tmp_key, chunk)
+            self._swap(redis, db, board, key, tmp_key, bool(scores), token)
+            return len(scores)
+        finally:
+            redis.delete(tmp_key)
+            if redis.get(lock_key) == token:
+                redis.delete(lock_key)
+
+    def _swap(
+        self, redis, db: Session, board: str, key: str, tmp_key: str, has_scores: bool, token: str
+    ):
+        """Swap the rebuilt board in with fresh scores for members changed meanwhile."""
+        lock_key, pending_key = self._lock_key(key), self._pending_key(key)
+        ttl = WEEKLY_TTL_SECONDS if board in (USERS_WEEKLY, PACKS_WEEKLY) else None
+        with redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    pipe.watch(pending_key, lock_key)
+                    if pipe.get(lock_key) != token:
+                        raise RedisError(f"Leaderboard {board} rebuild lock expired")
+                    pending = [int(member) for member in pipe.smembers(pending_key)]
+                    # Those changes are committed before they reach Redis, so SQL has them
+                    fresh = dict(self._sql_scores(db, board, pending)) if pending else {}
+                    pipe.multi()
+                    if has_scores:
+                        pipe.rename(tmp_key, key)
+                    else:
+                        pipe.delete(key)
+                    if fresh:
+                        pipe.zadd(key, fresh)
+                    gone = [member for member in pending if member not in fresh]
+                    if gone:
+                        pipe.zrem(key, *gone)
+                    if ttl and (has_scores or fresh):
+                        pipe.expire(key, ttl)
+                    pipe.set(self._built_key(key), 1, ex=ttl)
+                    pipe.delete(pending_key, lock_key)
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    def _sql_scores(
+        self, db: Session, board: str, member_ids: Optional[List[int]] = None
+    ) -> List[Tuple[int, int]]:
+        """Compute (member_id, score) pairs for a board (or some of its members) from SQL."""
+        if board == USERS_ALLTIME:
+            query = db.query(User.id, User.coins).filter(User.coins > 0)
+            if member_ids is not None:
+                query = query.filter(User.id.in_(member_ids))
+            rows = query.all()
+        elif board == USERS_WEEKLY:
+            query = db.query(CoinTransaction.user_id, func.sum(CoinTransaction.amount)).filter(
+                CoinTransaction.type == TransactionType.EARNED,
+                CoinTransaction.created_at >= week_start(),
+            )
+            if member_ids is not None:
+                query = query.filter(CoinTransaction.user_id.in_(member_ids))
+            rows = query.group_by(CoinTransaction.user_id).all()
+        elif board in (PACKS_ALLTIME, PACKS_WEEKLY):
+            column = (
+                LearningGroup.pack_points if board == PACKS_ALLTIME else LearningGroup.weekly_points
+            )
+            query = db.query(LearningGroup.id, column).filter(column > 0)
+            if member_ids is not None:
+                query = query.filter(LearningGroup.id.in_(member_ids))
+            rows = query.all()
+        elif board.startswith("course:"):
+            course_id = int(board.split(":", 1)[1])
+            lesson_ids = (
+                db.query(Lesson.id)
+                .join(Module, Module.id == Lesson.module_id)
+                .filter(Module.course_id == course_id)
+            )
+            query = db.query(CoinTransaction.user_id, func.sum(CoinTransaction.amount)).filter(
+                CoinTransaction.type == TransactionType.EARNED,
+                or_(
+                    (CoinTransaction.reference_type == "course")
+                    & (CoinTransaction.reference_id == course_id),
+                    (CoinTransaction.reference_type == "lesson")
+                    & (CoinTransaction.reference_id.in_(lesson_ids)),
+                ),
+            )
+            if member_ids is not None:
+                query = query.filter(CoinTransaction.user_id.in_(member_ids))
+            rows = query.group_by(CoinTransaction.user_id).all()
+        else:
+            raise ValueError(f"Unknown leaderboard: {board}")
+
+        return [(int(member), int(score or 0)) for member, score in rows]
+
+    # ------------------------------------------------------------------
+    # SQL fallback (no Redis)
+    # ------------------------------------------------------------------
+
+    def _sql_top(self, db: Session, board: str, limit: int, offset: int) -> List[Entry]:
+        if board == USERS_ALLTIME:
+            rows = (
+                db.query(User.id, User.coins)
+                .order_by(desc(User.coins), User.id)
+                .offset(offset)
+                .limit(limit)
+                .all()
+            )
+        else:
+            rows = sorted(self._sql_scores(db, board), key=lambda r: (-r[1], r[0]))
+            rows = rows[offset : offset + limit]
+        return [(int(m), int(s or 0), offset + i + 1) for i, (m, s) in enumerate(rows)]
+
+    def _sql_rank(self, db: Session, board: str, member_id: int) -> Optional[Entry]:
+        if board == USERS_ALLTIME:
+            score = db.query(User.coins).filter(User.id == member_id).scalar()
+            if score is None:
+                return None
+            above = db.query(func.count(User.id)).filter(User.coins > score).scalar()
+            return (member_id, int(score), above + 1)
+
+        scores = dict(self._sql_scores(db, board))
+        if member_id not in scores:
+            return None
+        score = scores[member_id]
+        return (member_id, score, sum(1 for s in scores.values() if s > score) + 1)
+
+    # ------------------------------------------------------------------
+    # Helpers for callers
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def resolve_course_id(
+        db: Session, reference_type: Optional[str], reference_id: Optional[int]
+    ) -> Optional[int]:
+        """Map a coin transaction reference onto the course it belongs to."""
+        if not reference_id:
+            return None
+        if reference_type == "course":
+            return reference_id
+        if reference_type == "lesson":
+            return (
+                db.query(Module.course_id)
+                .join(Lesson, Lesson.module_id == Module.id)
+                .filter(Lesson.id == reference_id)
+                .scalar()
+            )
+        return None
+
+    @staticmethod
+    def load_users(db: Session, entries: List[Entry]) -> Dict[int, User]:
+        """Fetch the users for a page of entries in one query."""
+        ids = [member_id for member_id, _, _ in entries]
+        if not ids:
+            return {}
+        return {u.id: u for u in db.query(User).filter(User.id.in_(ids)).all()}
+
+
+leaderboard_service = LeaderboardService()
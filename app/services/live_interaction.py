@@ -0,0 +1,593 @@
+"""
+Live-class interaction engine.
+
+Poll votes and question upvotes are counted in Redis instead of committing
+a row per click:
+- ``live:poll:{poll_id}``                  hash with the poll's class id, option count and status
+- ``live:poll:{poll_id}:votes``            hash student id -> option index (first vote wins)
+- ``live:poll:{poll_id}:tally``            hash option index -> votes
+- ``live:class:{class_id}:upvotes``        hash question id -> upvotes
+- ``live:question:{question_id}:upvoters`` set of users who upvoted
+- ``live:upvotes:dirty``                   set of "class_id:question_id" changed since the last flush
+
+Votes are deduplicated with ``HSETNX`` (in a MULTI that WATCHes the poll's
+status, so no vote lands after the poll ends) and counted with ``HINCRBY``,
+so concurrent voters never lose updates. Closing a poll writes all its
+responses with one bulk INSERT; upvotes are written behind by
+``flush_to_db``. Tally broadcasts are coalesced per room to at most
+``LIVE_TALLY_BROADCASTS_PER_SECOND``. Without Redis the same counters live
+in sharded in-process dictionaries.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from redis.exceptions import RedisError, WatchError
+from sqlalchemy import func, insert, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.models.live_class_interactive import (
+    LiveClassPoll,
+    LiveClassPollResponse,
+    LiveClassQuestion,
+    PollStatus,
+)
+from app.services.realtime_service import realtime_service
+
+logger = logging.getLogger(__name__)
+
+POLL_KEY = "live:poll:{poll_id}"
+VOTES_KEY = "live:poll:{poll_id}:votes"
+TALLY_KEY = "live:poll:{poll_id}:tally"
+UPVOTES_KEY = "live:class:{class_id}:upvotes"
+UPVOTERS_KEY = "live:question:{question_id}:upvoters"
+UPVOTES_DIRTY_KEY = "live:upvotes:dirty"
+
+# Live counters outlast any class session
+LIVE_KEY_TTL_SECONDS = 24 * 3600
+
+# Questions written to SQL per flush round trip
+FLUSH_BATCH_SIZE = 500
+
+# In-process counter shards (without Redis)
+LOCAL_SHARDS = 16
+
+
+def _status_value(status) -> Optional[str]:
+    return status.value if isinstance(status, PollStatus) else status
+
+
+@dataclass(frozen=True)
+class PollMeta:
+    """What vote handling needs to know about a poll."""
+
+    poll_id: int
+    class_id: int
+    option_count: int
+    status: str
+
+    @property
+    def is_open(self) -> bool:
+        return self.status != PollStatus.ENDED.value
+
+
+@dataclass(frozen=True)
+class VoteResult:
+    """Outcome of a vote: counted, or the voter's earlier choice."""
+
+    counted: bool
+    option_index: int
+    class_id: int
+
+
+@dataclass
+class _Shard:
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    meta: Dict[int, PollMeta] = field(default_factory=dict)
+    votes: Dict[int, Dict[int, int]] = field(default_factory=dict)
+    tallies: Dict[int, Dict[int, int]] = field(default_factory=dict)
+    upvotes: Dict[int, int] = field(default_factory=dict)
+    upvoters: Dict[int, Set[int]] = field(default_factory=dict)
+    question_classes: Dict[int, int] = field(default_factory=dict)
+
+
+class LocalCounters:
+    """In-process counters sharded by poll/question id to keep lock contention low."""
+
+    def __init__(self, shards: int = LOCAL_SHARDS):
+        self.shards = [_Shard() for _ in range(shards)]
+        self._dirty_lock = threading.Lock()
+        self.dirty_questions: Set[int] = set()
+
+    def shard(self, key: int) -> _Shard:
+        return self.shards[key % len(self.shards)]
+
+    def clear(self):
+        self.shards = [_Shard() for _ in range(len(self.shards))]
+        with self._dirty_lock:
+            self.dirty_questions.clear()
+
+    def mark_dirty(self, question_id: int):
+        with self._dirty_lock:
+            self.dirty_questions.add(question_id)
+
+    def pop_dirty(self, limit: int) -> List[int]:
+        with self._dirty_lock:
+            popped = list(self.dirty_questions)[:limit]
+            self.dirty_questions.difference_update(popped)
+        return popped
+
+
+class TallyBroadcaster:
+    """
+    Coalesces tally changes into at most ``max_per_second`` broadcasts per room.
+
+    The first change in a quiet room is sent right away; changes arriving
+    within the interval are merged and sent once it has passed, with the
+    counts read at send time.
+    """
+
+    def __init__(self, engine: "LiveInteractionEngine", max_per_second: float):
+        self.engine = engine
+        self.interval = 1.0 / max_per_second if max_per_second > 0 else 0.0
+        self._pending: Dict[int, Tuple[Set[int], Set[int]]] = {}
+        self._last_sent: Dict[int, float] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def mark(self, class_id: int, poll_id: Optional[int] = None, question_id: Optional[int] = None):
+        """Note a change and make sure a broadcast for the room is scheduled."""
+        polls, questions = self._pending.setdefault(class_id, (set(), set()))
+        if poll_id is not None:
+            polls.add(poll_id)
+        if question_id is not None:
+            questions.add(question_id)
+
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(class_id)
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._tasks[class_id] = loop.create_task(self._send_later(class_id))
+
+    async def _send_later(self, class_id: int):
+        delay = self._last_sent.get(class_id, 0.0) + self.interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self.flush(class_id)
+
+    async def flush(self, class_id: int):
+        """Broadcast the room's pending changes now."""
+        pending = self._pending.pop(class_id, None)
+        if not pending:
+            return
+        self._last_sent[class_id] = time.monotonic()
+        polls, questions = pending
+        try:
+            data = {
+                "polls": [
+                    {"poll_id": poll_id, "tally": tally, "responses_count": sum(tally)}
+                    for poll_id, tally in self.engine.tallies(polls).items()
+                ],
+                "questions": [
+                    {"question_id": question_id, "upvotes": upvotes}
+                    for question_id, upvotes in self.engine.upvote_counts(
+                        class_id, questions
+                    ).items()
+                ],
+            }
+        except Exception as e:
+            logger.warning(f"Live tally read failed: {e}")
+            return
+
+        await realtime_service.send_live_class_update(
+            class_id=class_id, update_type="tallies_updated", data=data
+        )
+
+
+class LiveInteractionEngine:
+    """Counts live poll votes and question upvotes, and persists them in batches."""
+
+    def __init__(self, broadcasts_per_second: float = settings.LIVE_TALLY_BROADCASTS_PER_SECOND):
+        self.local = LocalCounters()
+        self.broadcaster = TallyBroadcaster(self, broadcasts_per_second)
+
+    # ------------------------------------------------------------------
+    # Polls
+    # ------------------------------------------------------------------
+
+    def register_poll(self, poll: LiveClassPoll) -> PollMeta:
+        """Record a poll's vote rules (on creation and status changes)."""
+        meta = PollMeta(
+            poll_id=poll.id,
+            class_id=poll.live_class_id,
+            option_count=len(poll.options or []),
+            status=_status_value(poll.status) or PollStatus.CREATED.value,
+        )
+        redis = get_redis()
+        if redis is not None:
+            try:
+                key = POLL_KEY.format(poll_id=poll.id)
+                pipe = redis.pipeline(transaction=False)
+                pipe.hset(
+                    key,
+                    mapping={
+                        "class_id": meta.class_id,
+                        "option_count": meta.option_count,
+                        "status": meta.status,
+                    },
+                )
+                pipe.expire(key, LIVE_KEY_TTL_SECONDS)
+                pipe.execute()
+                return meta
+            except RedisError as e:
+                logger.warning(f"Live poll registration failed: {e}")
+        shard = self.local.shard(poll.id)
+        with shard.lock:
+            shard.meta[poll.id] = meta
+        return meta
+
+    def poll_meta(self, db: Session, poll_id: int) -> Optional[PollMeta]:
+        """Vote rules for a poll, loaded from SQL once and then kept live."""
+        redis = get_redis()
+        if redis is not None:
+            try:
+                data = redis.hgetall(POLL_KEY.format(poll_id=poll_id))
+                if data:
+                    return PollMeta(
+                        poll_id=poll_id,
+                        class_id=int(data["class_id"]),
+                        option_count=int(data["option_count"]),
+                        status=data["status"],
+                    )
+            except RedisError as e:
+                logger.warning(f"Live poll lookup failed: {e}")
+        else:
+            shard = self.local.shard(poll_id)
+            with shard.lock:
+                meta = shard.meta.get(poll_id)
+            if meta is not None:
+                return meta
+
+        poll = db.query(LiveClassPoll).filter(LiveClassPoll.id == poll_id).first()
+        if poll is None:
+            return None
+        return self.register_poll(poll)
+
+    def record_vote(
+        self, db: Session, poll_id: int, student_id: int, option_index: int
+    ) -> Optional[VoteResult]:
+        """
+        Count a student's vote once.
+
+        Args:
+            db: Database session (only used the first time a poll is seen)
+            poll_id: Poll ID
+            student_id: Voting student
+            option_index: Chosen option
+
+        Returns:
+            The vote result, or None if the poll doesn't exist
+
+        Raises:
+            ValueError: If the poll has ended or the option is out of range
+        """
+        meta = self.poll_meta(db, poll_id)
+        if meta is None:
+            return None
+        if not meta.is_open:
+            raise ValueError("Poll has ended")
+        if not 0 <= option_index < meta.option_count:
+            raise ValueError("Invalid option index")
+
+        redis = get_redis()
+        if redis is not None:
+            try:
+                votes_key = VOTES_KEY.format(poll_id=poll_id)
+                if self._store_vote(redis, poll_id, student_id, option_index):
+                    tally_key = TALLY_KEY.format(poll_id=poll_id)
+                    pipe = redis.pipeline(transaction=False)
+                    pipe.hincrby(tally_key, option_index, 1)
+                    pipe.expire(votes_key, LIVE_KEY_TTL_SECONDS)
+                    pipe.expire(tally_key, LIVE_KEY_TTL_SECONDS)
+                    pipe.execute()
+                    return VoteResult(True, option_index, meta.class_id)
+                earlier = int(redis.hget(votes_key, student_id))
+                return VoteResult(False, earlier, meta.class_id)
+            except RedisError as e:
+                logger.warning(f"Live vote failed, counting locally: {e}")
+
+        shard = self.local.shard(poll_id)
+        with shard.lock:
+            local_meta = shard.meta.get(poll_id)
+            if local_meta is not None and not local_meta.is_open:
+                raise ValueError("Poll has ended")
+            votes = shard.votes.setdefault(poll_id, {})
+            if student_id in votes:
+                return VoteResult(False, votes[student_id], meta.class_id)
+            votes[student_id] = option_index
+            tally = shard.tallies.setdefault(poll_id, {})
+            tally[option_index] = tally.get(option_index, 0) + 1
+        return VoteResult(True, option_index, meta.class_id)
+
+    @staticmethod
+    def _store_vote(redis, poll_id: int, student_id: int, option_index: int) -> bool:
+        """
+        HSETNX the vote while the poll is still open.
+
+        Raises:
+            ValueError: The poll ended meanwhile
+        """
+        poll_key = POLL_KEY.format(poll_id=poll_id)
+        with redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    pipe.watch(poll_key)
+                    if pipe.hget(poll_key, "status") == PollStatus.ENDED.value:
+                        raise ValueError("Poll has ended")
+                    pipe.multi()
+                    pipe.hsetnx(VOTES_KEY.format(poll_id=poll_id), student_id, option_index)
+                    return bool(pipe.execute()[0])
+                except WatchError:
+                    continue
+
+    def tallies(self, poll_ids: Iterable[int]) -> Dict[int, List[int]]:
+        """Live vote counts per option for open polls, in one round trip."""
+        poll_ids = sorted(set(poll_ids))
+        if not poll_ids:
+            return {}
+
+        redis = get_redis()
+        raw: Dict[int, Tuple[Dict, Dict]] = {}
+        if redis is not None:
+            try:
+                pipe = redis.pipeline(transaction=False)
+                for poll_id in poll_ids:
+                    pipe.hgetall(POLL_KEY.format(poll_id=poll_id))
+                    pipe.hgetall(TALLY_KEY.format(poll_id=poll_id))
+                results = pipe.execute()
+                for i, poll_id in enumerate(poll_ids):
+                    raw[poll_id] = (results[2 * i], results[2 * i + 1])
+            except RedisError as e:
+                logger.warning(f"Live tally read failed: {e}")
+                redis = None
+        if redis is None:
+            for poll_id in poll_ids:
+                shard = self.local.shard(poll_id)
+                with shard.lock:
+                    meta = shard.meta.get(poll_id)
+                    tally = dict(shard.tallies.get(poll_id, {}))
+                raw[poll_id] = ({"option_count": meta.option_count} if meta else {}, tally)
+
+        result = {}
+        for poll_id, (meta, tally) in raw.items():
+            counts = {int(k): int(v) for k, v in tally.items()}
+            size = max(int(meta.get("option_count", 0)), max(counts, default=-1) + 1)
+            result[poll_id] = [counts.get(i, 0) for i in range(size)]
+        return result
+
+    def poll_results(self, db: Session, poll_id: int) -> Optional[Dict]:
+        """Tally for a poll: live while open, from SQL once it has ended."""
+        meta = self.poll_meta(db, poll_id)
+        if meta is None:
+            return None
+        if meta.is_open:
+            tally = self.tallies([poll_id])[poll_id]
+        else:
+            counts = dict(
+                db.query(
+                    LiveClassPollResponse.selected_option_index,
+                    func.count(LiveClassPollResponse.id),
+                )
+                .filter(LiveClassPollResponse.poll_id == poll_id)
+                .group_by(LiveClassPollResponse.selected_option_index)
+                .all()
+            )
+            tally = [counts.get(i, 0) for i in range(meta.option_count)]
+        return {
+            "poll_id": poll_id,
+            "status": meta.status,
+            "tally": tally,
+            "responses_count": sum(tally),
+        }
+
+    def close_poll(self, db: Session, poll: LiveClassPoll) -> int:
+        """
+        End a poll and persist its votes with one bulk INSERT.
+
+        The poll is marked ended before votes are read, so later votes are
+        rejected rather than lost.
+
+        Returns:
+            Number of responses written
+        """
+        poll.status = PollStatus.ENDED
+        poll.ended_at = poll.ended_at or datetime.utcnow()
+        self.register_poll(poll)
+
+        votes: Dict[int, int] = {}
+        redis = get_redis()
+        if redis is not None:
+            try:
+                votes = {
+                    int(k): int(v)
+                    for k, v in redis.hgetall(VOTES_KEY.format(poll_id=poll.id)).items()
+                }
+            except RedisError as e:
+                logger.warning(f"Live vote read failed: {e}")
+                redis = None
+        shard = self.local.shard(poll.id)
+        with shard.lock:
+            votes.update(shard.votes.get(poll.id, {}))
+
+        existing = {
+            student_id
+            for (student_id,) in db.query(LiveClassPollResponse.student_id).filter(
+                LiveClassPollResponse.poll_id == poll.id
+            )
+        }
+        now = datetime.utcnow()
+        rows = [
+            {
+                "poll_id": poll.id,
+                "student_id": student_id,
+                "selected_option_index": option_index,
+                "responded_at": now,
+            }
+            for student_id, option_index in sorted(votes.items())
+            if student_id not in existing
+        ]
+        if rows:
+            db.execute(insert(LiveClassPollResponse), rows)
+        db.commit()
+
+        # SQL is the source of truth from here on
+        if redis is not None:
+            try:
+                redis.delete(
+                    VOTES_KEY.format(poll_id=poll.id), TALLY_KEY.format(poll_id=poll.id)
+                )
+            except RedisError as e:
+                logger.warning(f"Live vote cleanup failed: {e}")
+        with shard.lock:
+            shard.votes.pop(poll.id, None)
+            shard.tallies.pop(poll.id, None)
+        return len(rows)
+
+    # ------------------------------------------------------------------
+    # Questions
+    # ------------------------------------------------------------------
+
+    def upvote(self, question: LiveClassQuestion, user_id: int) -> Tuple[int, bool]:
+        """
+        Count a user's upvote once.
+
+        Returns:
+            (current upvotes, whether this upvote was counted)
+        """
+        class_id = question.live_class_id
+        redis = get_redis()
+        if redis is not None:
+            try:
+                counts_key = UPVOTES_KEY.format(class_id=class_id)
+                voters_key = UPVOTERS_KEY.format(question_id=question.id)
+                # Seed from SQL the first time the question is upvoted live
+                redis.hsetnx(counts_key, question.id, question.upvotes or 0)
+                if not redis.sadd(voters_key, user_id):
+                    return int(redis.hget(counts_key, question.id)), False
+                pipe = redis.pipeline(transaction=False)
+                pipe.hincrby(counts_key, question.id, 1)
+                pipe.sadd(UPVOTES_DIRTY_KEY, f"{class_id}:{question.id}")
+                pipe.expire(counts_key, LIVE_KEY_TTL_SECONDS)
+                pipe.expire(voters_key, LIVE_KEY_TTL_SECONDS)
+                return int(pipe.execute()[0]), True
+            except RedisError as e:
+                logger.warning(f"Live upvote failed, counting locally: {e}")
+
+        shard = self.local.shard(question.id)
+        with shard.lock:
+            upvotes = shard.upvotes.setdefault(question.id, question.upvotes or 0)
+            voters = shard.upvoters.setdefault(question.id, set())
+            if user_id in voters:
+                return upvotes, False
+            voters.add(user_id)
+            shard.upvotes[question.id] = upvotes + 1
+            shard.question_classes[question.id] = class_id
+        self.local.mark_dirty(question.id)
+        return upvotes + 1, True
+
+    def upvote_counts(
+        self, class_id: int, question_ids: Optional[Iterable[int]] = None
+    ) -> Dict[int, int]:
+        """Live upvote counts for a class (questions never upvoted live are omitted)."""
+        wanted = set(question_ids) if question_ids is not None else None
+        redis = get_redis()
+        if redis is not None:
+            try:
+                counts = {
+                    int(k): int(v)
+                    for k, v in redis.hgetall(UPVOTES_KEY.format(class_id=class_id)).items()
+                }
+                return {k: v for k, v in counts.items() if wanted is None or k in wanted}
+            except RedisError as e:
+                logger.warning(f"Live upvote read failed: {e}")
+
+        counts = {}
+        for shard in self.local.shards:
+            with shard.lock:
+                for question_id, upvotes in shard.upvotes.items():
+                    if shard.question_classes.get(question_id) == class_id and (
+                        wanted is None or question_id in wanted
+                    ):
+                        counts[question_id] = upvotes
+        return counts
+
+    def flush_to_db(self, db: Session, batch_size: int = FLUSH_BATCH_SIZE) -> int:
+        """
+        Write-behind: persist live upvote counts with one bulk UPDATE per batch.
+
+        Returns:
+            Number of questions flushed
+        """
+        redis = get_redis()
+        flushed = 0
+        while True:
+            if redis is not None:
+                members = list(redis.spop(UPVOTES_DIRTY_KEY, batch_size) or [])
+                if not members:
+                    break
+                pairs = [tuple(int(part) for part in m.split(":")) for m in members]
+                pipe = redis.pipeline(transaction=False)
+                for class_id, question_id in pairs:
+                    pipe.hget(UPVOTES_KEY.format(class_id=class_id), question_id)
+                try:
+                    values = pipe.execute()
+                except RedisError:
+                    # Put the batch back so the next flush retries it
+                    redis.sadd(UPVOTES_DIRTY_KEY, *members)
+                    raise
+                counts = {
+                    question_id: int(value)
+                    for (_, question_id), value in zip(pairs, values)
+                    if value is not None
+                }
+            else:
+                question_ids = self.local.pop_dirty(batch_size)
+                members = question_ids
+                if not question_ids:
+                    break
+                counts = {}
+                for question_id in question_ids:
+                    shard = self.local.shard(question_id)
+                    with shard.lock:
+                        counts[question_id] = shard.upvotes[question_id]
+
+            try:
+                if counts:
+                    # Primary-key order keeps lock acquisition consistent across workers
+                    db.execute(
+                        update(LiveClassQuestion),
+                        [{"id": qid, "upvotes": counts[qid]} for qid in sorted(counts)],
+                    )
+                db.commit()
+            except Exception:
+                db.rollback()
+                # Put the batch back so the next flush retries it
+                if redis is not None:
+                    redis.sadd(UPVOTES_DIRTY_KEY, *members)
+                else:
+                    for question_id in members:
+                        self.local.mark_dirty(question_id)
+                raise
+
+            flushed += len(counts)
+            if len(members) < batch_size:
+                break
+        return flushed
+
+
+live_interaction = LiveInteractionEngine()
@@ -0,0 +1,863 @@
+"""
+Live quiz engine.
+
+Live quiz sessions (``/ws/live-quiz``) are scored on the server against the
+compiled quiz snapshot (see app.services.quiz_compiler), pinned in memory
+for the session. Session state lives in Redis so every worker agrees:
+- ``livequiz:{session_id}``           hash: quiz id, host, status, start time, current question
+- ``livequiz:{session_id}:opened``    hash question id -> time the host opened it
+- ``livequiz:{session_id}:answers``   hash "user_id:question_id" -> JSON answer (first answer wins)
+- ``livequiz:{session_id}:scores``    sorted set user id -> score
+- ``livequiz:{session_id}:names``     hash user id -> display name
+- ``livequiz:{session_id}:events``    list of room events (started, question, ended) in order
+- ``livequiz:{session_id}:rev``       counter bumped by every scored answer
+- ``livequiz:{session_id}:persisted`` set by the worker that writes the results
+
+Correct answers earn ``POINTS_PER_QUESTION_POINT`` per question point, half
+of it scaled by how fast the answer came after the host opened the
+question. Ranks come from the sorted set (or an in-process order-statistics
+list without Redis), and each worker relays room events and top-of-board
+rank deltas to its own sockets at most ``LIVE_QUIZ_UPDATES_PER_SECOND``
+times a second. When the quiz ends the results are written with one bulk
+INSERT of attempts and one of answers.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from redis.exceptions import RedisError, WatchError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.core.websocket import manager
+from app.db.session import SessionLocal
+from app.models.course import Course
+from app.models.quiz import Quiz, QuizAttempt, StudentAnswer
+from app.models.user import User
+from app.services.quiz_compiler import CompiledQuiz, quiz_compiler
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = "livequiz:{session_id}"
+OPENED_KEY = "livequiz:{session_id}:opened"
+ANSWERS_KEY = "livequiz:{session_id}:answers"
+SCORES_KEY = "livequiz:{session_id}:scores"
+NAMES_KEY = "livequiz:{session_id}:names"
+EVENTS_KEY = "livequiz:{session_id}:events"
+REV_KEY = "livequiz:{session_id}:rev"
+PERSISTED_KEY = "livequiz:{session_id}:persisted"
+
+# Live sessions outlast any class
+SESSION_TTL_SECONDS = 24 * 3600
+
+DEFAULT_QUESTION_SECONDS = 30
+# Answers arriving this long after the question closed still count (network jitter)
+LATE_GRACE_SECONDS = 2
+
+POINTS_PER_QUESTION_POINT = 1000
+# Share of a correct answer's points that depends on answer speed
+SPEED_BONUS_SHARE = 0.5
+
+LEADERBOARD_SIZE = 10
+
+RUNNING = "running"
+ENDED = "ended"
+
+# Option and question fields students must not see during the quiz
+HIDDEN_QUESTION_FIELDS = ("feedback", "rubrics", "explanation")
+
+
+def _public_question(payload: Dict[str, Any]) -> Dict[str, Any]:
+    question = {k: v for k, v in payload.items() if k not in HIDDEN_QUESTION_FIELDS}
+    question["options"] = [
+        {k: v for k, v in option.items() if k != "is_correct"}
+        for option in payload.get("options") or []
+    ]
+    return question
+
+
+def speed_score(points: float, elapsed: float, window: float) -> int:
+    """Points for a correct answer given ``elapsed`` seconds out of ``window``."""
+    full = points * POINTS_PER_QUESTION_POINT
+    remaining = max(0.0, 1.0 - elapsed / window) if window > 0 else 0.0
+    return int(round(full * (1 - SPEED_BONUS_SHARE) + full * SPEED_BONUS_SHARE * remaining))
+
+
+@dataclass(frozen=True)
+class AnswerResult:
+    """Outcome of an answer: scored, or the user's earlier answer stands."""
+
+    counted: bool
+    is_correct: bool
+    awarded: int
+    score: int
+
+
+class Ranking:
+    """
+    Scores kept in rank order for logarithmic rank lookups.
+
+    Keys are ``(-score, user_id)`` so ties rank by user id; changing a score
+    is a bisect removal and an ``insort``.
+    """
+
+    def __init__(self):
+        self._keys: List[Tuple[int, int]] = []
+        self._scores: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, member: int, delta: int) -> int:
+        old = self._scores.get(member)
+        if old is not None:
+            del self._keys[bisect_left(self._keys, (-old, member))]
+        score = (old or 0) + delta
+        self._scores[member] = score
+        insort(self._keys, (-score, member))
+        return score
+
+    def score(self, member: int) -> Optional[int]:
+        return self._scores.get(member)
+
+    def rank(self, member: int) -> Optional[int]:
+        """Zero-based rank, highest score first."""
+        score = self._scores.get(member)
+        if score is None:
+            return None
+        return bisect_left(self._keys, (-score, member))
+
+    def top(self, n: int) -> List[Tuple[int, int]]:
+        return [(member, -negated) for negated, member in self._keys[:n]]
+
+
+@dataclass
+class _LocalSession:
+    """Session state when Redis is unavailable."""
+
+    meta: Dict[str, Any] = field(default_factory=dict)
+    opened: Dict[int, float] = field(default_factory=dict)
+    answers: Dict[str, str] = field(default_factory=dict)
+    ranking: Ranking = field(default_factory=Ranking)
+    names: Dict[int, str] = field(default_factory=dict)
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    rev: int = 0
+    persisted: bool = False
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+@dataclass
+class _RoomView:
+    """What this worker last relayed to a room."""
+
+    cursor: int
+    rev: Optional[int] = None
+    top: Dict[int, Tuple[int, int]] = field(default_factory=dict)
+    answered: Set[int] = field(default_factory=set)
+    ended: bool = False
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class LeaderboardBroadcaster:
+    """
+    Relays room events and leaderboard rank deltas to this worker's sockets.
+
+    One loop per room while it has local sockets: new events are relayed
+    in order, and when answers were scored anywhere (the ``rev`` counter
+    moved) only the top-of-board entries whose rank or score changed are
+    broadcast, plus a personal rank update for users who answered here.
+    """
+
+    def __init__(self, engine: "LiveQuizEngine", updates_per_second: float):
+        self.engine = engine
+        self.interval = 1.0 / updates_per_second if updates_per_second > 0 else 0.0
+        self._views: Dict[int, _RoomView] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def watch(self, session_id: int):
+        """Make sure the room's relay loop runs on this worker."""
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(session_id)
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._views[session_id] = _RoomView(cursor=self.engine.event_count(session_id))
+            self._tasks[session_id] = loop.create_task(self._run(session_id))
+
+    def mark(self, session_id: int, user_id: int):
+        """Note a user whose score changed on this worker."""
+        view = self._views.get(session_id)
+        if view is not None:
+            view.answered.add(user_id)
+
+    async def _run(self, session_id: int):
+        room = f"quiz:{session_id}"
+        try:
+            while manager.get_room_count(room):
+                if not await self.flush(session_id):
+                    break
+                await asyncio.sleep(self.interval)
+        finally:
+            self._views.pop(session_id, None)
+            self._tasks.pop(session_id, None)
+
+    async def flush(self, session_id: int) -> bool:
+        """
+        Relay what changed since the last flush (also right after host actions).
+
+        Returns:
+            False once the quiz has ended
+        """
+        view = self._views.get(session_id)
+        if view is None:
+            return False
+        room = f"quiz:{session_id}"
+        async with view.lock:
+            if view.ended:
+                return False
+            try:
+                events, rev = self.engine.poll(session_id, view.cursor)
+            except Exception as e:
+                logger.warning(f"Live quiz poll failed: {e}")
+                return True
+            view.cursor += len(events)
+
+            for event in events:
+                if event["type"] == "quiz_ended":
+                    break
+                await manager.broadcast_to_room(room, event)
+            if rev != view.rev:
+                view.rev = rev
+                await self._send_deltas(session_id, view)
+
+            if events and events[-1]["type"] == "quiz_ended":
+                view.ended = True
+                await manager.broadcast_to_room(room, events[-1])
+                await self._send_ranks(session_id, self._local_users(room), "final_rank")
+                return False
+        return True
+
+    async def _send_deltas(self, session_id: int, view: _RoomView):
+        room = f"quiz:{session_id}"
+        top = self.engine.top(session_id, LEADERBOARD_SIZE)
+        current = {entry["user_id"]: (entry["rank"], entry["score"]) for entry in top}
+        changes = [entry for entry in top if view.top.get(entry["user_id"]) != current[entry["user_id"]]]
+        removed = [user_id for user_id in view.top if user_id not in current]
+        view.top = current
+        if changes or removed:
+            await manager.broadcast_to_room(
+                room,
+                {
+                    "type": "leaderboard_delta",
+                    "changes": changes,
+                    "removed": removed,
+                    "participants": self.engine.participant_count(session_id),
+                },
+            )
+        answered, view.answered = view.answered, set()
+        await self._send_ranks(session_id, answered, "rank_update")
+
+    @staticmethod
+    def _local_users(room: str) -> Set[int]:
+        return {
+            manager.connection_users[ws]["user_id"]
+            for ws in manager.active_connections.get(room, ())
+            if ws in manager.connection_users
+        }
+
+    async def _send_ranks(self, session_id: int, user_ids: Set[int], message_type: str):
+        if not user_ids:
+            return
+        room = f"quiz:{session_id}"
+        ranks = self.engine.ranks(session_id, user_ids)
+        for ws in list(manager.active_connections.get(room, ())):
+            user_info = manager.connection_users.get(ws)
+            if user_info is None or user_info["user_id"] not in ranks:
+                continue
+            rank, score = ranks[user_info["user_id"]]
+            try:
+                await ws.send_json({"type": message_type, "rank": rank, "score": score})
+            except Exception:
+                manager.disconnect(ws)
+
+
+class LiveQuizEngine:
+    """Scores live quiz answers, ranks participants and persists the results."""
+
+    def __init__(self, updates_per_second: float = settings.LIVE_QUIZ_UPDATES_PER_SECOND):
+        self.local: Dict[int, _LocalSession] = {}
+        self._local_lock = threading.Lock()
+        self._quizzes: Dict[int, CompiledQuiz] = {}
+        self.broadcaster = LeaderboardBroadcaster(self, updates_per_second)
+
+    def _local_session(self, session_id: int) -> _LocalSession:
+        with self._local_lock:
+            return self.local.setdefault(session_id, _LocalSession())
+
+    @staticmethod
+    def _keys(session_id: int) -> Dict[str, str]:
+        return {
+            name: key.format(session_id=session_id)
+            for name, key in (
+                ("session", SESSION_KEY),
+                ("opened", OPENED_KEY),
+                ("answers", ANSWERS_KEY),
+                ("scores", SCORES_KEY),
+                ("names", NAMES_KEY),
+                ("events", EVENTS_KEY),
+                ("rev", REV_KEY),
+            )
+        }
+
+    # ------------------------------------------------------------------
+    # Host actions
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def can_host(db: Session, quiz_id: int, user: User) -> bool:
+        """Admins and the instructor of the quiz's course can run it live."""
+        if user.is_superuser or user.role == "admin":
+            return True
+        instructor_id = (
+            db.query(Course.instructor_id)
+            .join(Quiz, Quiz.course_id == Course.id)
+            .filter(Quiz.id == quiz_id)
+            .scalar()
+        )
+        return instructor_id == user.id
+
+    def is_host(self, session_id: int, user_id: int) -> bool:
+        meta = self.meta(session_id)
+        return meta is not None and meta["host_id"] == user_id
+
+    def start(
+        self,
+        db: Session,
+        session_id: int,
+        quiz_id: int,
+        host_id: int,
+        question_seconds: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        Start a live session of a quiz.
+
+        Raises:
+            ValueError: The quiz doesn't exist or the session was already started
+        """
+        quiz = quiz_compiler.get(db, quiz_id)
+        if quiz is None:
+            raise ValueError("Quiz not found")
+        started_at = time.time()
+        meta = {
+            "quiz_id": quiz.quiz_id,
+            "version": quiz.version,
+            "host_id": host_id,
+            "status": RUNNING,
+            "started_at": started_at,
+            "question_seconds": float(question_seconds or DEFAULT_QUESTION_SECONDS),
+        }
+        event = {
+            "type": "quiz_started",
+            "quiz_id": quiz.quiz_id,
+            "title": quiz.settings["title"],
+            "question_count": quiz.question_count,
+            "question_seconds": meta["question_seconds"],
+            "start_time": datetime.utcfromtimestamp(started_at).isoformat(),
+        }
+
+        redis = get_redis()
+        if redis is not None:
+            try:
+                keys = self._keys(session_id)
+                if not redis.hsetnx(keys["session"], "status", RUNNING):
+                    raise ValueError("Quiz session already started")
+                pipe = redis.pipeline(transaction=True)
+                pipe.hset(keys["session"], mapping=meta)
+                pipe.rpush(keys["events"], json.dumps(event))
+                for key in keys.values():
+                    pipe.expire(key, SESSION_TTL_SECONDS)
+                pipe.execute()
+                self._quizzes[session_id] = quiz
+                return event
+            except RedisError as e:
+                logger.warning(f"Live quiz start failed: {e}")
+        session = self._local_session(session_id)
+        with session.lock:
+            if session.meta:
+                raise ValueError("Quiz session already started")
+            session.meta = meta
+            session.events.append(event)
+        self._quizzes[session_id] = quiz
+        return event
+
+    def open_question(self, session_id: int, question_id: int) -> Dict[str, Any]:
+        """
+        Open a question for answers; its speed bonus counts from now.
+
+        Raises:
+            ValueError: The quiz isn't running or has no such question
+        """
+        meta = self.meta(session_id)
+        if not meta or meta["status"] != RUNNING:
+            raise ValueError("Quiz is not running")
+        quiz = self._quiz(session_id, meta)
+        payload = next((q for q in quiz.question_payloads if q["id"] == question_id), None)
+        if payload is None:
+            raise ValueError("Question not in quiz")
+        opened_at = time.time()
+        event = {
+            "type": "question_started",
+            "question": _public_question(payload),
+            "ends_at": datetime.utcfromtimestamp(opened_at + meta["question_seconds"]).isoformat(),
+        }
+
+        redis = get_redis()
+        if redis is not None:
+            try:
+                keys = self._keys(session_id)
+                pipe = redis.pipeline(transaction=True)
+                pipe.hset(keys["opened"], question_id, opened_at)
+                pipe.hset(keys["session"], "current_question_id", question_id)
+                pipe.rpush(keys["events"], json.dumps(event))
+                pipe.expire(keys["opened"], SESSION_TTL_SECONDS)
+                pipe.execute()
+                return event
+            except RedisError as e:
+                logger.warning(f"Live quiz question open failed: {e}")
+        session = self._local_session(session_id)
+        with session.lock:
+            session.opened[question_id] = opened_at
+            session.meta["current_question_id"] = question_id
+            session.events.append(event)
+        return event
+
+    def finish(self, db: Session, session_id: int) -> Optional[Dict[str, Any]]:
+        """
+        End the session and write every participant's attempt in one batch.
+
+        Returns:
+            The ``quiz_ended`` event, or None if the quiz isn't running
+        """
+        meta = self.meta(session_id)
+        if not meta or meta["status"] != RUNNING:
+            return None
+
+        redis = get_redis()
+        answers: Dict[str, str] = {}
+        if redis is not None:
+            try:
+                keys = self._keys(session_id)
+                if not redis.set(PERSISTED_KEY.format(session_id=session_id), 1,
+                                 nx=True, ex=SESSION_TTL_SECONDS):
+                    return None
+                redis.hset(keys["session"], "status", ENDED)
+                answers = redis.hgetall(keys["answers"])
+            except RedisError as e:
+                logger.warning(f"Live quiz finish failed: {e}")
+                redis = None
+        if redis is None:
+            session = self._local_session(session_id)
+            with session.lock:
+                if session.persisted:
+                    return None
+                session.persisted = True
+                session.meta["status"] = ENDED
+                answers = dict(session.answers)
+
+        try:
+            self._persist(db, self._quiz(session_id, meta, db), meta, answers)
+        except Exception:
+            # Nothing was written: reopen the session so finish() can be retried
+            db.rollback()
+            self._reopen(session_id)
+            raise
+        event = {
+            "type": "quiz_ended",
+            "final_results": self.top(session_id, LEADERBOARD_SIZE),
+            "participants": self.participant_count(session_id),
+        }
+        self._push_event(session_id, event)
+        return event
+
+    def _reopen(self, session_id: int):
+        """Undo the ENDED status and persisted marker of a failed finish()."""
+        redis = get_redis()
+        if redis is not None:
+            try:
+                pipe = redis.pipeline(transaction=True)
+                pipe.hset(SESSION_KEY.format(session_id=session_id), "status", RUNNING)
+                pipe.delete(PERSISTED_KEY.format(session_id=session_id))
+                pipe.execute()
+            except RedisError as e:
+                logger.warning(f"Live quiz reopen failed: {e}")
+        session = self._local_session(session_id)
+        with session.lock:
+            if session.persisted:
+                session.persisted = False
+                session.meta["status"] = RUNNING
+
+    def _persist(self, db: Session, quiz: CompiledQuiz, meta: Dict[str, Any], answers: Dict[str, str]):
+        by_user: Dict[int, List[Dict[str, Any]]] = {}
+        for field_name, raw in answers.items():
+            user_id, question_id = (int(part) for part in field_name.split(":"))
+            by_user.setdefault(user_id, []).append({"question_id": question_id, **json.loads(raw)})
+        if not by_user:
+            return
+
+        total_points = quiz.total_points
+        started_at = datetime.utcfromtimestamp(meta["started_at"])
+        completed_at = datetime.utcnow()
+        attempts = []
+        for user_id in sorted(by_user):
+            earned = sum(a["points"] for a in by_user[user_id])
+            percent = round(earned / total_points * 100, 2) if total_points else 0.0
+            attempts.append(
+                {
+                    "quiz_id": quiz.quiz_id,
+                    "user_id": user_id,
+                    "score": percent,
+                    "passed": percent >= (quiz.settings["passing_score"] or 0),
+                    "started_at": started_at,
+                    "completed_at": completed_at,
+                }
+            )
+        rows = db.execute(
+            insert(QuizAttempt).returning(QuizAttempt.id, QuizAttempt.user_id),
+            attempts,
+        ).all()
+        attempt_ids = {user_id: attempt_id for attempt_id, user_id in rows}
+        db.execute(
+            insert(StudentAnswer),
+            [
+                {
+                    "attempt_id": attempt_ids[user_id],
+                    "question_id": answer["question_id"],
+                    "selected_option_id": answer["option_id"],
+                    "text_response": answer["text"],
+                    "is_correct": answer["correct"],
+                    "points_awarded": answer["points"],
+                    "time_spent_seconds": int(answer["elapsed"]),
+                    "submitted_at": datetime.utcfromtimestamp(answer["at"]),
+                }
+                for user_id in sorted(by_user)
+                for answer in sorted(by_user[user_id], key=lambda a: a["question_id"])
+            ],
+        )
+        db.commit()
+
+    def _push_event(self, session_id: int, event: Dict[str, Any]):
+        redis = get_redis()
+        if redis is not None:
+            try:
+                redis.rpush(EVENTS_KEY.format(session_id=session_id), json.dumps(event))
+                return
+            except RedisError as e:
+                logger.warning(f"Live quiz event failed: {e}")
+        session = self._local_session(session_id)
+        with session.lock:
+            session.events.append(event)
+
+    # ------------------------------------------------------------------
+    # Answers
+    # ------------------------------------------------------------------
+
+    def meta(self, session_id: int) -> Optional[Dict[str, Any]]:
+        """The session's quiz, host, status and timing, or None if not started."""
+        redis = get_redis()
+        raw = None
+        if redis is not None:
+            try:
+                raw = redis.hgetall(SESSION_KEY.format(session_id=session_id))
+            except RedisError as e:
+                logger.warning(f"Live quiz lookup failed: {e}")
+                redis = None
+        if redis is None:
+            session = self._local_session(session_id)
+            with session.lock:
+                raw = dict(session.meta)
+        if not raw or "quiz_id" not in raw:
+            return None
+        return {
+            "quiz_id": int(raw["quiz_id"]),
+            "version": int(raw["version"]),
+            "host_id": int(raw["host_id"]),
+            "status": raw["status"],
+            "started_at": float(raw["started_at"]),
+            "question_seconds": float(raw["question_seconds"]),
+            "current_question_id": (
+                int(raw["current_question_id"]) if raw.get("current_question_id") else None
+            ),
+        }
+
+    def _quiz(self, session_id: int, meta: Dict[str, Any], db: Optional[Session] = None) -> CompiledQuiz:
+        """The quiz snapshot pinned for the session (loaded once per worker)."""
+        quiz = self._quizzes.get(session_id)
+        if quiz is not None and quiz.quiz_id == meta["quiz_id"]:
+            return quiz
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            quiz = quiz_compiler.get(db, meta["quiz_id"])
+        finally:
+            if own_session:
+                db.close()
+        if quiz is None:
+            raise ValueError("Quiz not found")
+        self._quizzes[session_id] = quiz
+        return quiz
+
+    def submit_answer(
+        self,
+        session_id: int,
+        user_id: int,
+        user_name: str,
+        question_id: int,
+        selected_option_id: Optional[int] = None,
+        text_response: Optional[str] = None,
+    ) -> AnswerResult:
+        """
+        Score an answer; only a user's first answer to a question counts.
+
+        Raises:
+            ValueError: The quiz isn't running, the question isn't in it or hasn't
+                been opened by the host, or its time is up
+        """
+        meta = self.meta(session_id)
+        if not meta or meta["status"] != RUNNING:
+            raise ValueError("Quiz is not running")
+        quiz = self._quiz(session_id, meta)
+        if question_id not in quiz.questions:
+            raise ValueError("Question not in quiz")
+
+        # Question ids come from the client; only questions the host opened count
+        now = time.time()
+        opened_at = self._opened_at(session_id, question_id)
+        if opened_at is None:
+            raise ValueError("Question has not been opened")
+        window = meta["question_seconds"]
+        elapsed = max(0.0, now - opened_at)
+        if elapsed > window + LATE_GRACE_SECONDS:
+            raise ValueError("Time is up for this question")
+
+        grade = quiz.grade(question_id, selected_option_id, text_response)
+        awarded = speed_score(grade.points_awarded, elapsed, window) if grade.is_correct else 0
+        answer = json.dumps(
+            {
+                "option_id": selected_option_id,
+                "text": text_response,
+                "correct": grade.is_correct,
+                "points": grade.points_awarded,
+                "awarded": awarded,
+                "elapsed": round(elapsed, 3),
+                "at": now,
+            }
+        )
+        answer_field = f"{user_id}:{question_id}"
+
+        redis = get_redis()
+        if redis is not None:
+            try:
+                keys = self._keys(session_id)
+                if not self._store_answer(redis, keys, answer_field, answer):
+                    earlier = json.loads(redis.hget(keys["answers"], answer_field))
+                    score = redis.zscore(keys["scores"], user_id)
+                    return AnswerResult(False, earlier["correct"], earlier["awarded"], int(score or 0))
+                pipe = redis.pipeline(transaction=True)
+                pipe.zincrby(keys["scores"], awarded, user_id)
+                pipe.hset(keys["names"], user_id, user_name)
+                pipe.incr(keys["rev"])
+                pipe.expire(keys["answers"], SESSION_TTL_SECONDS)
+                pipe.expire(keys["scores"], SESSION_TTL_SECONDS)
+                pipe.expire(keys["names"], SESSION_TTL_SECONDS)
+                pipe.expire(keys["rev"], SESSION_TTL_SECONDS)
+                score = pipe.execute()[0]
+                return AnswerResult(True, grade.is_correct, awarded, int(score))
+            except RedisError as e:
+                logger.warning(f"Live quiz answer failed: {e}")
+        session = self._local_session(session_id)
+        with session.lock:
+            if session.persisted:
+                raise ValueError("Quiz is not running")
+            earlier = session.answers.get(answer_field)
+            if earlier is not None:
+                earlier = json.loads(earlier)
+                score = session.ranking.score(user_id) or 0
+                return AnswerResult(False, earlier["correct"], earlier["awarded"], score)
+            session.answers[answer_field] = answer
+            session.names[user_id] = user_name
+            session.rev += 1
+            score = session.ranking.add(user_id, awarded)
+        return AnswerResult(True, grade.is_correct, awarded, score)
+
+    @staticmethod
+    def _store_answer(redis, keys: Dict[str, str], answer_field: str, answer: str) -> bool:
+        """
+        HSETNX the answer while the session is still running.
+
+        The status is WATCHed so an answer can't land after finish() has
+        set ENDED and read the answers it persists.
+
+        Raises:
+            ValueError: The quiz ended meanwhile
+        """
+        with redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    pipe.watch(keys["session"])
+                    if pipe.hget(keys["session"], "status") != RUNNING:
+                        raise ValueError("Quiz is not running")
+                    pipe.multi()
+                    pipe.hsetnx(keys["answers"], answer_field, answer)
+                    return bool(pipe.execute()[0])
+                except WatchError:
+                    continue
+
+    def _opened_at(self, session_id: int, question_id: int) -> Optional[float]:
+        redis = get_redis()
+        if redis is not None:
+            try:
+                opened_at = redis.hget(OPENED_KEY.format(session_id=session_id), question_id)
+                return float(opened_at) if opened_at else None
+            except RedisError as e:
+                logger.warning(f"Live quiz lookup failed: {e}")
+        session = self._local_session(session_id)
+        with session.lock:
+            return session.opened.get(question_id)
+
+    # ------------------------------------------------------------------
+    # Ranking
+    # ------------------------------------------------------------------
+
+    def top(self, session_id: int, n: int = LEADERBOARD_SIZE) -> List[Dict[str, Any]]:
+        """The ``n`` best participants with their 1-based ranks."""
+        redis = get_redis()
+        if redis is not None:
+            try:
+                keys = self._keys(session_id)
+                entries = [
+                    (int(member), int(score))
+                    for member, score in redis.zrevrange(keys["scores"], 0, n - 1, withscores=True)
+                ]
+                names = redis.hmget(keys["names"], [m for m, _ in entries]) if entries else []
+                return [
+                    {"user_id": member, "name": name, "score": score, "rank": rank}
+                    for rank, ((member, score), name) in enumerate(zip(entries, names), start=1)
+                ]
+            except RedisError as e:
+                logger.warning(f"Live quiz leaderboard failed: {e}")
+        session = self._local_session(session_id)
+        with session.lock:
+            return [
+                {"user_id": member, "name": session.names.get(member), "score": score, "rank": rank}
+                for rank, (member, score) in enumerate(session.ranking.top(n), start=1)
+            ]
+
+    def ranks(self, session_id: int, user_ids: Set[int]) -> Dict[int, Tuple[int, int]]:
+        """1-based rank and score of each participant among ``user_ids``."""
+        user_ids = sorted(user_ids)
+        redis = get_redis()
+        if redis is not None:
+            try:
+                key = SCORES_KEY.format(session_id=session_id)
+                pipe = redis.pipeline(transaction=False)
+                for user_id in user_ids:
+                    pipe.zrevrank(key, user_id)
+                    pipe.zscore(key, user_id)
+                results = pipe.execute()
+                return {
+                    user_id: (rank + 1, int(score))
+                    for user_id, rank, score in zip(user_ids, results[::2], results[1::2])
+                    if rank is not None
+                }
+            except RedisError as e:
+                logger.warning(f"Live quiz rank lookup failed: {e}")
+        session = self._local_session(session_id)
+        with session.lock:
+            ranking = session.ranking
+            return {
+                user_id: (ranking.rank(user_id) + 1, ranking.score(user_id))
+                for user_id in user_ids
+                if ranking.score(user_id) is not None
+            }
+
+    def participant_count(self, session_id: int) -> int:
+        redis = get_redis()
+        if redis is not None:
+            try:
+                return redis.zcard(SCORES_KEY.format(session_id=session_id))
+            except RedisError as e:
+                logger.warning(f"Live quiz lookup failed: {e}")
+        session = self._local_session(session_id)
+        with session.lock:
+            return len(session.ranking)
+
+    # ------------------------------------------------------------------
+    # Room relay
+    # ------------------------------------------------------------------
+
+    def event_count(self, session_id: int) -> int:
+        redis = get_redis()
+        if redis is not None:
+            try:
+                return redis.llen(EVENTS_KEY.format(session_id=session_id))
+            except RedisError as e:
+                logger.warning(f"Live quiz lookup failed: {e}")
+        session = self._local_session(session_id)
+        with session.lock:
+            return len(session.events)
+
+    def poll(self, session_id: int, cursor: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Room events after ``cursor`` and the current answer revision."""
+        redis = get_redis()
+        if redis is not None:
+            try:
+                pipe = redis.pipeline(transaction=True)
+                pipe.lrange(EVENTS_KEY.format(session_id=session_id), cursor, -1)
+                pipe.get(REV_KEY.format(session_id=session_id))
+                raw_events, rev = pipe.execute()
+                return [json.loads(raw) for raw in raw_events], int(rev or 0)
+            except RedisError as e:
+                logger.warning(f"Live quiz poll failed: {e}")
+        session = self._local_session(session_id)
+        with session.lock:
+            return list(session.events[cursor:]), session.rev
+
+    async def join(self, session_id: int, user_id: int) -> Dict[str, Any]:
+        """State for a socket joining the room; starts the room's relay on this worker."""
+        meta = self.meta(session_id)
+        state: Dict[str, Any] = {"type": "quiz_state", "status": meta["status"] if meta else None}
+        if meta:
+            rank, score = self.ranks(session_id, {user_id}).get(user_id, (None, 0))
+            state.update(
+                quiz_id=meta["quiz_id"],
+                leaderboard=self.top(session_id, LEADERBOARD_SIZE),
+                participants=self.participant_count(session_id),
+                rank=rank,
+                score=score,
+                question=None,
+            )
+            if meta["current_question_id"] and meta["status"] == RUNNING:
+                quiz = await run_in_threadpool(self._quiz, session_id, meta)
+                payload = next(
+                    (q for q in quiz.question_payloads if q["id"] == meta["current_question_id"]), None
+                )
+                state["question"] = _public_question(payload) if payload else None
+        self.broadcaster.watch(session_id)
+        return state
+
+    def clear(self):
+        """Forget local sessions and pinned quizzes (tests)."""
+        with self._local_lock:
+            self.local.clear()
+        self._quizzes.clear()
+
+
+live_quiz = LiveQuizEngine()
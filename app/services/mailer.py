@@ -0,0 +1,484 @@
+"""
+Bulk mail pipeline.
+
+- ``SMTPPool``: persistent SMTP connections shared by every send in the
+  process. An idle connection is checked with NOOP before reuse, and a
+  connection is recycled after ``MAIL_MAX_MESSAGES_PER_CONNECTION`` messages.
+- ``TemplateCache``: each EmailTemplate is compiled once per version
+  (``updated_at``) into literal and placeholder parts.
+- ``BulkMailer``: renders one template for many recipients. It resolves
+  their email preferences in one query, writes the EmailLog rows in bulk
+  and sends the batch over one pooled connection.
+
+``queue_bulk_email`` splits large audiences into ``MAIL_BATCH_SIZE``
+batches, one ``send_bulk_email`` Celery task each.
+"""
+
+import logging
+import re
+import smtplib
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.email_notification import (
+    EmailLog,
+    EmailStatus,
+    EmailTemplate,
+    NotificationType,
+    UserEmailPreference,
+)
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER = re.compile(r"\{\{([^{}]+?)\}\}")
+
+# Idle pooled connections are checked with NOOP before reuse after this long
+SMTP_IDLE_CHECK_SECONDS = 30
+
+# How long a compiled template is trusted before its version is checked again
+TEMPLATE_CHECK_SECONDS = 60
+
+
+# ------------------------------------------------------------------
+# Templates
+# ------------------------------------------------------------------
+
+
+class CompiledTemplate:
+    """``{{variable}}`` placeholders split out once; unknown ones are left as written."""
+
+    __slots__ = ("_pieces",)
+
+    def __init__(self, source: str):
+        # Even indices are literal text, odd ones placeholder names
+        self._pieces = PLACEHOLDER.split(source)
+
+    def render(self, variables: Dict[str, Any]) -> str:
+        pieces = self._pieces[:]
+        for i in range(1, len(pieces), 2):
+            name = pieces[i]
+            pieces[i] = str(variables[name]) if name in variables else f"{{{{{name}}}}}"
+        return "".join(pieces)
+
+
+@lru_cache(maxsize=256)
+def compile_template(source: str) -> CompiledTemplate:
+    return CompiledTemplate(source)
+
+
+@dataclass(frozen=True)
+class CompiledEmail:
+    template_id: int
+    version: Optional[datetime]
+    subject: CompiledTemplate
+    body_html: CompiledTemplate
+    body_text: Optional[CompiledTemplate]
+
+
+class TemplateCache:
+    """EmailTemplate rows compiled once per version and shared across sends."""
+
+    def __init__(self, check_seconds: float = TEMPLATE_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        # name -> (compiled, checked at)
+        self._compiled: Dict[str, tuple] = {}
+
+    def get(self, db: Session, name: str) -> CompiledEmail:
+        """
+        Compiled template by name.
+
+        Raises:
+            ValueError: If no template has this name
+        """
+        with self._lock:
+            cached = self._compiled.get(name)
+        if cached and time.monotonic() - cached[1] < self.check_seconds:
+            return cached[0]
+
+        current = (
+            db.query(EmailTemplate.id, EmailTemplate.updated_at)
+            .filter(EmailTemplate.name == name)
+            .first()
+        )
+        if current is None:
+            self.invalidate(name)
+            raise ValueError(f"Email template '{name}' not found")
+
+        compiled = cached[0] if cached else None
+        if compiled is None or (compiled.template_id, compiled.version) != tuple(current):
+            template = db.get(EmailTemplate, current.id)
+            compiled = CompiledEmail(
+                template_id=template.id,
+                version=template.updated_at,
+                subject=CompiledTemplate(template.subject),
+                body_html=CompiledTemplate(template.body_html),
+                body_text=CompiledTemplate(template.body_text) if template.body_text else None,
+            )
+        with self._lock:
+            self._compiled[name] = (compiled, time.monotonic())
+        return compiled
+
+    def invalidate(self, name: Optional[str] = None):
+        with self._lock:
+            if name is None:
+                self._compiled.clear()
+            else:
+                self._compiled.pop(name, None)
+
+
+# ------------------------------------------------------------------
+# SMTP transport
+# ------------------------------------------------------------------
+
+
+@dataclass
+class OutgoingEmail:
+    recipient: str
+    subject: str
+    body_html: Optional[str] = None
+    body_text: Optional[str] = None
+
+    def as_string(self, sender: str) -> str:
+        if self.body_html and self.body_text:
+            mime = MIMEMultipart("alternative")
+            mime.attach(MIMEText(self.body_text, "plain"))
+            mime.attach(MIMEText(self.body_html, "html"))
+        elif self.body_html:
+            mime = MIMEText(self.body_html, "html")
+        else:
+            mime = MIMEText(self.body_text or "", "plain")
+        mime["Subject"] = self.subject
+        mime["From"] = sender
+        mime["To"] = self.recipient
+        return mime.as_string()
+
+
+@dataclass
+class _Connection:
+    smtp: smtplib.SMTP
+    sent: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class SMTPPool:
+    """Process-wide SMTP connections reused across messages, batches and tasks."""
+
+    def __init__(
+        self,
+        host: str = settings.MAIL_SERVER,
+        port: int = settings.MAIL_PORT,
+        starttls: bool = settings.MAIL_STARTTLS,
+        ssl_tls: bool = settings.MAIL_SSL_TLS,
+        username: Optional[str] = settings.MAIL_USERNAME if settings.USE_CREDENTIALS else None,
+        password: Optional[str] = settings.MAIL_PASSWORD,
+        size: int = settings.MAIL_POOL_SIZE,
+        max_messages: int = settings.MAIL_MAX_MESSAGES_PER_CONNECTION,
+        timeout: float = 30,
+    ):
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.ssl_tls = ssl_tls
+        self.username = username
+        self.password = password
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.sender = f"{settings.MAIL_FROM_NAME} <{settings.MAIL_FROM}>"
+        self.envelope_from = settings.MAIL_FROM
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle: List[_Connection] = []
+        self.connections_opened = 0
+
+    def _open(self) -> _Connection:
+        # Implicit TLS (SMTPS, usually port 465) or STARTTLS on a plain
+        # connection, matching the fastapi-mail settings in app.core.email
+        if self.ssl_tls:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls and not self.ssl_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        with self._lock:
+            self.connections_opened += 1
+        return _Connection(smtp)
+
+    @staticmethod
+    def _close(connection: _Connection):
+        try:
+            connection.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.smtp.close()
+
+    def _checkout(self) -> _Connection:
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        if connection is not None and time.monotonic() - connection.last_used > SMTP_IDLE_CHECK_SECONDS:
+            try:
+                if connection.smtp.noop()[0] != 250:
+                    raise smtplib.SMTPServerDisconnected("NOOP refused")
+            except (smtplib.SMTPException, OSError):
+                self._close(connection)
+                connection = None
+        return connection or self._open()
+
+    def _checkin(self, connection: _Connection):
+        if connection.sent >= self.max_messages:
+            self._close(connection)
+            return
+        connection.last_used = time.monotonic()
+        with self._lock:
+            self._idle.append(connection)
+
+    def send(self, messages: Sequence[OutgoingEmail]) -> List[Optional[str]]:
+        """
+        Send messages over one pooled connection, reconnecting once if the server drops it.
+
+        Returns:
+            Per message: None when accepted, else the error
+        """
+        errors: List[Optional[str]] = []
+        with self._slots:
+            connection = None
+            try:
+                for index, message in enumerate(messages):
+                    if connection is not None and connection.sent >= self.max_messages:
+                        self._close(connection)
+                        connection = None
+                    for attempt in range(2):
+                        if connection is None:
+                            try:
+                                connection = self._checkout() if attempt == 0 else self._open()
+                            except OSError as e:  # includes SMTPException (e.g. login refused)
+                                error = str(e) or type(e).__name__
+                                if attempt:
+                                    errors.extend([error] * (len(messages) - index))
+                                    return errors
+                                continue
+                        try:
+                            connection.smtp.sendmail(
+                                self.envelope_from,
+                                [message.recipient],
+                                message.as_string(self.sender),
+                            )
+                            connection.sent += 1
+                            errors.append(None)
+                            break
+                        except smtplib.SMTPServerDisconnected as e:
+                            error = str(e) or "Server disconnected"
+                        except smtplib.SMTPException as e:
+                            # Refused by the server; the connection is still usable
+                            errors.append(str(e))
+                            break
+                        except OSError as e:
+                            error = str(e) or type(e).__name__
+                        if connection is not None:
+                            connection.smtp.close()
+                            connection = None
+                        if attempt:
+                            # Unreachable twice in a row: fail the rest without waiting on it
+                            errors.extend([error] * (len(messages) - index))
+                            return errors
+            finally:
+                if connection is not None:
+                    self._checkin(connection)
+        return errors
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self._close(connection)
+
+
+# ------------------------------------------------------------------
+# Batches
+# ------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class Recipient:
+    user_id: int
+    email: str
+    variables: Dict[str, Any]
+
+
+@dataclass
+class BatchResult:
+    sent: int = 0
+    failed: int = 0
+    skipped: int = 0
+    log_ids: Dict[int, int] = field(default_factory=dict)  # user id -> EmailLog id
+
+
+def opted_out_users(
+    db: Session, user_ids: Sequence[int], notification_type: NotificationType
+) -> Set[int]:
+    """Of the given users, those who turned this notification type off (one query)."""
+    if not user_ids:
+        return set()
+    preferences = (
+        db.query(UserEmailPreference).filter(UserEmailPreference.user_id.in_(user_ids)).all()
+    )
+    return {p.user_id for p in preferences if not p.is_enabled(notification_type)}
+
+
+class BulkMailer:
+    """Personalised sends of one template to many recipients."""
+
+    def __init__(
+        self,
+        pool: Optional[SMTPPool] = None,
+        templates: Optional[TemplateCache] = None,
+        suppress: Optional[bool] = None,
+    ):
+        self.pool = pool or SMTPPool()
+        self.templates = templates or TemplateCache()
+        self.suppress = bool(settings.MAIL_SUPPRESS_SEND) if suppress is None else suppress
+
+    def send_batch(
+        self,
+        db: Session,
+        template_name: str,
+        notification_type: NotificationType,
+        recipients: Sequence[Recipient],
+        force: bool = False,
+    ) -> BatchResult:
+        """
+        Render, log and send one batch. Each user gets at most one copy, and
+        users who opted out are skipped unless forced.
+
+        Raises:
+            ValueError: If the template doesn't exist
+        """
+        template = self.templates.get(db, template_name)
+        unique = list({r.user_id: r for r in recipients}.values())
+        skip = set() if force else opted_out_users(
+            db, [r.user_id for r in unique], NotificationType(notification_type)
+        )
+        result = BatchResult(skipped=len(recipients) - len(unique) + len(skip))
+        unique = [r for r in unique if r.user_id not in skip]
+        if not unique:
+            return result
+
+        emails = {}
+        for r in unique:
+            emails[r.user_id] = OutgoingEmail(
+                recipient=r.email,
+                subject=template.subject.render(r.variables),
+                body_html=template.body_html.render(r.variables),
+                body_text=template.body_text.render(r.variables) if template.body_text else None,
+            )
+        rows = db.execute(
+            insert(EmailLog).returning(EmailLog.id, EmailLog.user_id),
+            [
+                {
+                    "user_id": user_id,
+                    "template_id": template.template_id,
+                    "recipient_email": email.recipient,
+                    "subject": email.subject,
+                    "body_html": email.body_html,
+                    "body_text": email.body_text,
+                    "status": EmailStatus.PENDING,
+                }
+                for user_id, email in emails.items()
+            ],
+        ).all()
+        db.commit()
+        result.log_ids = {user_id: log_id for log_id, user_id in rows}
+
+        self._deliver(db, [(result.log_ids[u], e) for u, e in emails.items()], result)
+        return result
+
+    def _deliver(self, db: Session, logged: List[tuple], result: BatchResult):
+        if self.suppress:
+            errors = [None] * len(logged)
+        else:
+            try:
+                errors = self.pool.send([email for _, email in logged])
+            except Exception as e:
+                logger.error(f"Bulk email batch failed: {e}")
+                errors = [str(e)] * len(logged)
+
+        sent_ids = [log_id for (log_id, _), error in zip(logged, errors) if error is None]
+        failures = [
+            {"id": log_id, "status": EmailStatus.FAILED, "error_message": error}
+            for (log_id, _), error in zip(logged, errors)
+            if error is not None
+        ]
+        if sent_ids:
+            db.execute(
+                update(EmailLog)
+                .where(EmailLog.id.in_(sent_ids))
+                .values(status=EmailStatus.SENT, sent_at=datetime.utcnow())
+            )
+        if failures:
+            db.execute(update(EmailLog), failures)
+        db.commit()
+        result.sent += len(sent_ids)
+        result.failed += len(failures)
+
+    def send_raw(self, to_email: str, subject: str, body: str, html: bool = False) -> Optional[str]:
+        """Send one ad-hoc message over the pool (not logged); returns the error, if any."""
+        if self.suppress:
+            return None
+        email = OutgoingEmail(
+            recipient=to_email,
+            subject=subject,
+            body_html=body if html else None,
+            body_text=None if html else body,
+        )
+        return self.pool.send([email])[0]
+
+
+def queue_bulk_email(
+    db: Session,
+    template_name: str,
+    notification_type: NotificationType,
+    recipients: Sequence[Recipient],
+    force: bool = False,
+    batch_size: int = settings.MAIL_BATCH_SIZE,
+) -> int:
+    """
+    Hand recipients to ``send_bulk_email`` tasks, one per batch; batches that
+    can't be queued are sent inline.
+
+    Returns:
+        Number of batches
+    """
+    from app.services.background_tasks import send_bulk_email_task
+
+    batches = [recipients[i : i + batch_size] for i in range(0, len(recipients), batch_size)]
+    for batch in batches:
+        try:
+            send_bulk_email_task.delay(
+                template_name,
+                NotificationType(notification_type).value,
+                [{"user_id": r.user_id, "email": r.email, "variables": r.variables} for r in batch],
+                force,
+            )
+        except Exception as e:
+            logger.warning(f"Could not queue bulk email batch, sending inline: {e}")
+            bulk_mailer.send_batch(db, template_name, notification_type, batch, force)
+    return len(batches)
+
+
+# Singleton instance
+bulk_mailer = BulkMailer()
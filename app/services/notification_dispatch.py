@@ -0,0 +1,379 @@
+"""
+Notification fan-out.
+
+Notifying many users writes the rows with one bulk INSERT per batch, keeps
+per-user unread counts in step, and hands WebSocket delivery to every web
+worker as one message per batch:
+- ``notifications:unread:{user_id}`` cached unread count + 1 (recounted from SQL on a miss)
+- ``notifications:deliver``          pub/sub channel; each worker pushes a batch
+                                     to the notification sockets it holds
+
+Audiences of ``NOTIFICATION_CELERY_MIN_RECIPIENTS`` or more are handed to
+the ``dispatch_notifications`` Celery task. Without Redis, counts are
+cached in-process and delivery only reaches sockets on this worker.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.core.websocket import manager
+from app.models.notification import Notification, NotificationPriority, NotificationType
+
+logger = logging.getLogger(__name__)
+
+UNREAD_KEY = "notifications:unread:{user_id}"
+DELIVER_CHANNEL = "notifications:deliver"
+
+# Cached counts are recounted at least this often, bounding any drift
+UNREAD_TTL_SECONDS = 600
+
+# Pause before resubscribing after the listener loses Redis
+LISTEN_RETRY_SECONDS = 5
+
+
+def notification_room(user_id: int) -> str:
+    """Room the /ws/notifications socket of a user joins."""
+    return f"notifications:{user_id}"
+
+
+class UnreadCounter:
+    """Per-user unread counts adjusted on write, so reads skip COUNT(*)."""
+
+    def __init__(self, ttl: int = UNREAD_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # user id -> (count, expires at) without Redis
+        self._local: Dict[int, Tuple[int, float]] = {}
+
+    @staticmethod
+    def _count(db: Session, user_id: int) -> int:
+        return (
+            db.query(Notification)
+            .filter(Notification.user_id == user_id, Notification.is_read == False)
+            .count()
+        )
+
+    def get(self, db: Session, user_id: int) -> int:
+        """Cached unread count, counted in SQL only on a miss."""
+        client = get_redis()
+        key = UNREAD_KEY.format(user_id=user_id)
+        if client is not None:
+            try:
+                cached = client.get(key)
+                if cached is not None:
+                    return max(int(cached) - 1, 0)
+            except RedisError as e:
+                logger.warning(f"Unread count read failed, counting in SQL: {e}")
+                return self._count(db, user_id)
+        else:
+            with self._lock:
+                cached = self._local.get(user_id)
+                if cached and cached[1] > time.monotonic():
+                    return cached[0]
+
+        count = self._count(db, user_id)
+        if client is not None:
+            try:
+                # NX: a write that landed meanwhile already removed the key
+                client.set(key, count + 1, ex=self.ttl, nx=True)
+            except RedisError as e:
+                logger.warning(f"Unread count cache failed: {e}")
+        else:
+            with self._lock:
+                self._local[user_id] = (count, time.monotonic() + self.ttl)
+        return count
+
+    def add(self, user_ids: Iterable[int], delta: int = 1):
+        """Adjust cached counts; users without one are recounted on their next read."""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        client = get_redis()
+        if client is None:
+            with self._lock:
+                for user_id in user_ids:
+                    cached = self._local.get(user_id)
+                    if cached:
+                        self._local[user_id] = (max(cached[0] + delta, 0), cached[1])
+            return
+        keys = [UNREAD_KEY.format(user_id=user_id) for user_id in user_ids]
+        try:
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                pipe.incrby(key, delta)
+            values = pipe.execute()
+            # Counts are stored off by one, so a key INCRBY just created from
+            # nothing (expired meanwhile) shows up as <= delta: drop it to recount
+            stale = [key for key, value in zip(keys, values) if value <= max(delta, 0)]
+            if stale:
+                client.delete(*stale)
+        except RedisError as e:
+            logger.warning(f"Unread count update failed: {e}")
+
+    def set(self, user_id: int, count: int):
+        client = get_redis()
+        if client is None:
+            with self._lock:
+                self._local[user_id] = (count, time.monotonic() + self.ttl)
+            return
+        try:
+            client.set(UNREAD_KEY.format(user_id=user_id), count + 1, ex=self.ttl)
+        except RedisError as e:
+            logger.warning(f"Unread count update failed: {e}")
+
+    def invalidate(self, user_ids: Iterable[int]):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        client = get_redis()
+        if client is None:
+            with self._lock:
+                for user_id in user_ids:
+                    self._local.pop(user_id, None)
+            return
+        try:
+            client.delete(*[UNREAD_KEY.format(user_id=user_id) for user_id in user_ids])
+        except RedisError as e:
+            logger.warning(f"Unread count invalidation failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+
+class NotificationDispatcher:
+    """Bulk-writes notifications for a set of recipients and delivers them per worker."""
+
+    def __init__(
+        self,
+        batch_size: int = settings.NOTIFICATION_BATCH_SIZE,
+        celery_min_recipients: int = settings.NOTIFICATION_CELERY_MIN_RECIPIENTS,
+    ):
+        self.batch_size = batch_size
+        self.celery_min_recipients = celery_min_recipients
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listener: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._tasks: Set[asyncio.Task] = set()
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def dispatch(
+        self,
+        db: Session,
+        user_ids: Iterable[int],
+        notification_type: NotificationType,
+        title: str,
+        message: str,
+        data: Optional[Dict[str, Any]] = None,
+        action_url: Optional[str] = None,
+        priority: NotificationPriority = NotificationPriority.NORMAL,
+        exclude: Iterable[int] = (),
+    ) -> int:
+        """
+        Notify every recipient once (duplicates and excluded users are dropped).
+        Safe to call from sync code; commits the session.
+
+        Returns:
+            Number of recipients notified or queued
+        """
+        recipients = sorted(set(user_ids) - set(exclude))
+        if not recipients:
+            return 0
+        if len(recipients) >= self.celery_min_recipients and self._enqueue(
+            recipients, notification_type, title, message, data, action_url, priority
+        ):
+            return len(recipients)
+        self.dispatch_now(
+            db, recipients, notification_type, title, message, data, action_url, priority
+        )
+        return len(recipients)
+
+    def dispatch_now(
+        self,
+        db: Session,
+        user_ids: List[int],
+        notification_type: NotificationType,
+        title: str,
+        message: str,
+        data: Optional[Dict[str, Any]] = None,
+        action_url: Optional[str] = None,
+        priority: NotificationPriority = NotificationPriority.NORMAL,
+    ) -> List[int]:
+        """
+        Write and deliver in batches of ``batch_size``.
+
+        Returns:
+            The new notification ids, in recipient order
+        """
+        notification_type = NotificationType(notification_type)
+        priority = NotificationPriority(priority)
+        row = {
+            "type": notification_type,
+            "title": title,
+            "message": message,
+            "data": data or {},
+            "action_url": action_url,
+            "priority": priority,
+            "is_read": False,
+            "created_at": datetime.utcnow(),
+        }
+        payload = {
+            "type": notification_type.value,
+            "title": title,
+            "message": message,
+            "data": row["data"],
+            "action_url": action_url,
+            "priority": priority.value,
+            "is_read": False,
+            "created_at": row["created_at"].isoformat(),
+        }
+
+        notification_ids = []
+        for start in range(0, len(user_ids), self.batch_size):
+            batch = user_ids[start : start + self.batch_size]
+            rows = db.execute(
+                insert(Notification).returning(Notification.id, Notification.user_id),
+                [dict(row, user_id=user_id) for user_id in batch],
+            ).all()
+            db.commit()
+            ids = {user_id: notification_id for notification_id, user_id in rows}
+            unread_counter.add(batch)
+            self.publish({"notification": payload, "ids": {str(u): ids[u] for u in batch}})
+            notification_ids.extend(ids[user_id] for user_id in batch)
+        return notification_ids
+
+    def _enqueue(self, user_ids: List[int], notification_type, title, message, data,
+                 action_url, priority) -> bool:
+        from app.services.background_tasks import dispatch_notifications_task
+
+        try:
+            dispatch_notifications_task.delay(
+                user_ids,
+                NotificationType(notification_type).value,
+                title,
+                message,
+                data or {},
+                action_url,
+                NotificationPriority(priority).value,
+            )
+            return True
+        except Exception as e:
+            logger.warning(f"Could not queue notification fan-out, sending inline: {e}")
+            return False
+
+    # ------------------------------------------------------------------
+    # Delivery
+    # ------------------------------------------------------------------
+
+    def publish(self, batch: dict):
+        """Hand a delivery batch to every worker (only this one without Redis)."""
+        client = get_redis()
+        if client is not None:
+            try:
+                client.publish(DELIVER_CHANNEL, json.dumps(batch))
+                return
+            except RedisError as e:
+                logger.warning(f"Notification publish failed, delivering locally: {e}")
+        self._schedule(batch)
+
+    def _schedule(self, batch: dict):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Sync caller (threadpool endpoint or Celery): hand over to the server loop
+            if self._loop is not None and not self._loop.is_closed():
+                asyncio.run_coroutine_threadsafe(self.deliver_local(batch), self._loop)
+            return
+        task = loop.create_task(self.deliver_local(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def deliver_local(self, batch: dict) -> int:
+        """
+        Send a batch to the recipients' sockets on this worker, concurrently.
+
+        Returns:
+            Number of sockets sent to
+        """
+        sends = []
+        for user_id, notification_id in batch["ids"].items():
+            sockets = manager.active_connections.get(notification_room(user_id))
+            if not sockets:
+                continue
+            message = {
+                "type": "notification",
+                "notification": dict(batch["notification"], id=notification_id,
+                                     user_id=int(user_id)),
+            }
+            sends.extend(self._send(websocket, message) for websocket in list(sockets))
+        if sends:
+            await asyncio.gather(*sends)
+        return len(sends)
+
+    @staticmethod
+    async def _send(websocket, message: dict):
+        try:
+            await websocket.send_json(message)
+        except Exception:
+            manager.disconnect(websocket)
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """Deliver batches published by any worker to sockets held here (call from the app lifespan)."""
+        self._loop = loop or asyncio.get_running_loop()
+        if self._listener is not None or get_redis() is None:
+            return
+        self._stopping.clear()
+        self._listener = threading.Thread(
+            target=self._listen, name="notification-delivery", daemon=True
+        )
+        self._listener.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._listener is not None:
+            self._listener.join(timeout=LISTEN_RETRY_SECONDS)
+            self._listener = None
+
+    def _listen(self):
+        while not self._stopping.is_set():
+            client = get_redis()
+            if client is None:
+                self._stopping.wait(LISTEN_RETRY_SECONDS)
+                continue
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(DELIVER_CHANNEL)
+                while not self._stopping.is_set():
+                    item = pubsub.get_message(timeout=1.0)
+                    if item is None:
+                        continue
+                    try:
+                        batch = json.loads(item["data"])
+                    except (TypeError, ValueError) as e:
+                        logger.warning(f"Dropping malformed notification batch: {e}")
+                        continue
+                    asyncio.run_coroutine_threadsafe(self.deliver_local(batch), self._loop)
+            except RedisError as e:
+                logger.warning(f"Notification listener lost Redis, retrying: {e}")
+                self._stopping.wait(LISTEN_RETRY_SECONDS)
+            finally:
+                pubsub.close()
+
+
+# Singleton instances
+unread_counter = UnreadCounter()
+notification_dispatcher = NotificationDispatcher()
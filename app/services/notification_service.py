@@ -2,6 +2,7 @@ from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, desc
 from app.models.notification import Notification, NotificationType
+from app.services.notification_dispatch import unread_counter
 from datetime import datetime
 
 
@@ -31,6 +32,7 @@ class NotificationService:
         db.add(notification)
         db.commit()
         db.refresh(notification)
+        unread_counter.add([user_id])
         return notification
 
     def get_user_notifications(
@@ -56,15 +58,8 @@ class NotificationService:
         return notifications
 
     def get_unread_count(self, db: Session, user_id: int) -> int:
-        """Get count of unread notifications for a user"""
-        count = (
-            db.query(Notification)
-            .filter(
-                and_(Notification.user_id == user_id, Notification.is_read == False)
-            )
-            .count()
-        )
-        return count
+        """Get count of unread notifications for a user (cached, see UnreadCounter)"""
+        return unread_counter.get(db, user_id)
 
     def mark_as_read(
         self, db: Session, notification_id: int, user_id: int
@@ -81,9 +76,12 @@ class NotificationService:
         )
 
         if notification:
+            was_unread = not notification.is_read
             notification.mark_as_read()
             db.commit()
             db.refresh(notification)
+            if was_unread:
+                unread_counter.add([user_id], -1)
 
         return notification
 
@@ -97,6 +95,7 @@ class NotificationService:
             .update({"is_read": True, "read_at": datetime.utcnow()})
         )
         db.commit()
+        unread_counter.set(user_id, 0)
         return count
 
     def delete_notification(
@@ -114,8 +113,11 @@ class NotificationService:
         )
 
         if notification:
+            was_unread = not notification.is_read
             db.delete(notification)
             db.commit()
+            if was_unread:
+                unread_counter.add([user_id], -1)
             return True
         return False
 
@@ -125,12 +127,19 @@ class NotificationService:
 
         cutoff_date = datetime.utcnow() - timedelta(days=days)
 
+        affected_users = [
+            user_id
+            for (user_id,) in db.query(Notification.user_id)
+            .filter(Notification.created_at < cutoff_date, Notification.is_read == False)
+            .distinct()
+        ]
         count = (
             db.query(Notification)
             .filter(Notification.created_at < cutoff_date)
             .delete()
         )
         db.commit()
+        unread_counter.invalidate(affected_users)
         return count
 
 
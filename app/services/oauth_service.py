@@ -3,15 +3,23 @@ OAuth/OIDC Service for Enterprise SSO
 
 Implements OAuth 2.0 and OpenID Connect authentication flows.
 Supports Google Workspace, Azure AD, and any OIDC-compliant provider.
+
+Calls to the provider share one connection pool, and OIDC id_tokens are
+verified locally against the provider's cached key set.
 """
 
-from authlib.jose import jwt
 from typing import Dict, Optional, Tuple
 import logging
-import httpx
 
 from app.models.sso import SSOConfig
 from app.core.config import settings
+from app.services.idp_metadata import (
+    IdPMetadataError,
+    IdTokenError,
+    idp_metadata,
+    sso_http,
+    verify_id_token,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -98,21 +106,20 @@ class OAuthService:
                 "client_secret": self.client_secret,
             }
 
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.token_endpoint,
-                    data=token_data,
-                    headers={"Content-Type": "application/x-www-form-urlencoded"},
-                )
+            response = await sso_http.async_client().post(
+                await self._endpoint("token_endpoint"),
+                data=token_data,
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+            )
 
-                if response.status_code != 200:
-                    error_msg = f"Token exchange failed: {response.text}"
-                    logger.error(error_msg)
-                    return False, None, error_msg
+            if response.status_code != 200:
+                error_msg = f"Token exchange failed: {response.text}"
+                logger.error(error_msg)
+                return False, None, error_msg
 
-                tokens = response.json()
-                logger.info("OAuth token exchange successful")
-                return True, tokens, None
+            tokens = response.json()
+            logger.info("OAuth token exchange successful")
+            return True, tokens, None
 
         except Exception as e:
             logger.exception("Error exchanging OAuth code")
@@ -133,21 +140,22 @@ class OAuthService:
         try:
             headers = {"Authorization": f"Bearer {access_token}"}
 
-            async with httpx.AsyncClient() as client:
-                response = await client.get(self.userinfo_endpoint, headers=headers)
+            response = await sso_http.async_client().get(
+                await self._endpoint("userinfo_endpoint"), headers=headers
+            )
 
-                if response.status_code != 200:
-                    error_msg = f"User info retrieval failed: {response.text}"
-                    logger.error(error_msg)
-                    return False, None, error_msg
+            if response.status_code != 200:
+                error_msg = f"User info retrieval failed: {response.text}"
+                logger.error(error_msg)
+                return False, None, error_msg
 
-                user_info = response.json()
+            user_info = response.json()
 
-                # Map OAuth user info to our user model
-                user_data = self._map_user_info(user_info)
+            # Map OAuth user info to our user model
+            user_data = self._map_user_info(user_info)
 
-                logger.info(f"OAuth user info retrieved for: {user_data.get('email')}")
-                return True, user_data, None
+            logger.info(f"OAuth user info retrieved for: {user_data.get('email')}")
+            return True, user_data, None
 
         except Exception as e:
             logger.exception("Error retrieving OAuth user info")
@@ -243,56 +251,120 @@ class OAuthService:
                 "client_secret": self.client_secret,
             }
 
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.token_endpoint,
-                    data=token_data,
-                    headers={"Content-Type": "application/x-www-form-urlencoded"},
-                )
+            response = await sso_http.async_client().post(
+                await self._endpoint("token_endpoint"),
+                data=token_data,
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+            )
 
-                if response.status_code != 200:
-                    error_msg = f"Token refresh failed: {response.text}"
-                    logger.error(error_msg)
-                    return False, None, error_msg
+            if response.status_code != 200:
+                error_msg = f"Token refresh failed: {response.text}"
+                logger.error(error_msg)
+                return False, None, error_msg
 
-                new_tokens = response.json()
-                logger.info("OAuth token refresh successful")
-                return True, new_tokens, None
+            new_tokens = response.json()
+            logger.info("OAuth token refresh successful")
+            return True, new_tokens, None
 
         except Exception as e:
             logger.exception("Error refreshing OAuth token")
             return False, None, str(e)
 
-    def verify_id_token(self, id_token: str) -> Tuple[bool, Optional[Dict]]:
+    async def verify_id_token(
+        self,
+        id_token: str,
+        access_token: Optional[str] = None,
+        nonce: Optional[str] = None,
+    ) -> Tuple[bool, Optional[Dict]]:
         """
-        Verify and decode ID token (for OIDC).
+        Verify and decode ID token (for OIDC) locally.
+
+        The signature is checked against the provider's cached JWKS, along
+        with issuer, audience (our client ID) and expiry.
 
         Args:
             id_token: JWT ID token from token response
+            access_token: Access token issued with it (checks at_hash)
+            nonce: Nonce sent in the authorization request
 
         Returns:
             Tuple of (is_valid, claims)
         """
         try:
-            # TODO: Fetch JWKS from provider for verification
-            # For now, just decode without verification (NOT PRODUCTION SAFE)
-            claims = jwt.decode(id_token, key=None, options={"verify_signature": False})
-
-            # Verify issuer, audience, expiry
-            # if claims.get("iss") != expected_issuer:
-            #     return False, None
-            # if claims.get("aud") != self.client_id:
-            #     return False, None
-            # if claims.get("exp", 0) < time.time():
-            #     return False, None
-
+            metadata = await self.provider_metadata()
+            jwks_uri = metadata.get("jwks_uri")
+            if not jwks_uri:
+                logger.error("ID token verification failed: provider has no jwks_uri")
+                return False, None
+
+            claims = await verify_id_token(
+                id_token,
+                jwks_uri=jwks_uri,
+                audience=self.client_id,
+                issuer=metadata.get("issuer"),
+                access_token=access_token,
+                nonce=nonce,
+            )
             logger.info("ID token verified successfully")
             return True, claims
 
-        except Exception as e:
+        except (IdTokenError, IdPMetadataError) as e:
             logger.error(f"ID token verification failed: {e}")
             return False, None
 
+    async def user_info_from_tokens(
+        self, tokens: Dict
+    ) -> Tuple[bool, Optional[Dict], Optional[str]]:
+        """
+        User data for a completed token exchange.
+
+        OIDC logins whose id_token verifies and carries an email are mapped
+        from its claims, skipping the userinfo round trip; anything else
+        falls back to the userinfo endpoint.
+
+        Returns:
+            Tuple of (success, user_data, error_message)
+        """
+        id_token = tokens.get("id_token")
+        if id_token:
+            is_valid, claims = await self.verify_id_token(
+                id_token, access_token=tokens.get("access_token")
+            )
+            if is_valid and claims.get("email"):
+                user_data = self._map_user_info(claims)
+                logger.info(f"OIDC user info taken from id_token for: {user_data.get('email')}")
+                return True, user_data, None
+
+        return await self.get_user_info(tokens["access_token"])
+
+    async def provider_metadata(self) -> Dict:
+        """
+        Provider endpoints: the cached discovery document (when an issuer is
+        configured) overlaid with explicitly configured values.
+        """
+        config_settings = self.config.settings or {}
+        metadata = {}
+        issuer = config_settings.get("issuer")
+        if issuer:
+            try:
+                metadata.update(await idp_metadata.discovery(issuer))
+            except IdPMetadataError as e:
+                logger.warning(f"OIDC discovery unavailable, using configured endpoints: {e}")
+        metadata.update(
+            {
+                key: value
+                for key, value in config_settings.items()
+                if value and (key.endswith("_endpoint") or key in ("issuer", "jwks_uri"))
+            }
+        )
+        for name in ("authorization_endpoint", "token_endpoint", "userinfo_endpoint"):
+            if getattr(self, name):
+                metadata[name] = getattr(self, name)
+        return metadata
+
+    async def _endpoint(self, name: str) -> Optional[str]:
+        return getattr(self, name, None) or (await self.provider_metadata()).get(name)
+
     def get_logout_url(self, redirect_uri: Optional[str] = None) -> Optional[str]:
         """
         Generate logout URL if provider supports RP-initiated logout.
@@ -304,7 +376,7 @@ class OAuthService:
             Logout URL or None if not supported
         """
         # Check if provider has end_session_endpoint in settings
-        end_session_endpoint = self.config.settings.get("end_session_endpoint")
+        end_session_endpoint = (self.config.settings or {}).get("end_session_endpoint")
 
         if not end_session_endpoint:
             logger.warning("Provider does not support RP-initiated logout")
@@ -329,7 +401,7 @@ class OAuthService:
             True if revocation successful
         """
         try:
-            revocation_endpoint = self.config.settings.get("revocation_endpoint")
+            revocation_endpoint = await self._endpoint("revocation_endpoint")
 
             if not revocation_endpoint:
                 logger.warning("Provider does not support token revocation")
@@ -342,19 +414,18 @@ class OAuthService:
                 "client_secret": self.client_secret,
             }
 
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    revocation_endpoint,
-                    data=revoke_data,
-                    headers={"Content-Type": "application/x-www-form-urlencoded"},
-                )
-
-                if response.status_code == 200:
-                    logger.info(f"Token revocation successful for {token_type}")
-                    return True
-                else:
-                    logger.error(f"Token revocation failed: {response.text}")
-                    return False
+            response = await sso_http.async_client().post(
+                revocation_endpoint,
+                data=revoke_data,
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+            )
+
+            if response.status_code == 200:
+                logger.info(f"Token revocation successful for {token_type}")
+                return True
+            else:
+                logger.error(f"Token revocation failed: {response.text}")
+                return False
 
         except Exception:
             logger.exception("Error revoking token")
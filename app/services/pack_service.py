@@ -9,9 +9,13 @@ Handles logic for Wolf Packs competition:
 
 from typing import List, Dict, Any
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
 from app.models.learning_group import LearningGroup, HouseType, GroupMembership
 from app.models.user import User
+from app.services.leaderboard_service import (
+    leaderboard_service,
+    PACKS_ALLTIME,
+    PACKS_WEEKLY,
+)
 import json
 
 class PackService:
@@ -20,33 +24,57 @@ class PackService:
         Sync user's earned coins/points to their respective pack.
         """
         # Find which pack(s) the user belongs to
-        memberships = db.query(GroupMembership).filter(GroupMembership.user_id == user_id).all()
-        
-        for membership in memberships:
-            group = db.query(LearningGroup).filter(LearningGroup.id == membership.group_id).first()
-            if group:
-                group.pack_points += points
-                group.weekly_points += points
-        
+        pack_ids = [
+            group_id
+            for (group_id,) in db.query(GroupMembership.group_id)
+            .filter(GroupMembership.user_id == user_id)
+            .all()
+        ]
+        if not pack_ids:
+            return
+
+        # Single set-based UPDATE instead of loading each group
+        db.query(LearningGroup).filter(LearningGroup.id.in_(pack_ids)).update(
+            {
+                LearningGroup.pack_points: LearningGroup.pack_points + points,
+                LearningGroup.weekly_points: LearningGroup.weekly_points + points,
+            },
+            synchronize_session=False,
+        )
         db.commit()
 
+        leaderboard_service.record_pack_points(pack_ids, points)
+
     def get_leaderboard(self, db: Session, limit: int = 10) -> List[LearningGroup]:
         """
         Get the top packs by total points.
         """
-        return db.query(LearningGroup).order_by(desc(LearningGroup.pack_points)).limit(limit).all()
+        return self._packs_in_order(db, leaderboard_service.top(db, PACKS_ALLTIME, limit))
 
     def get_weekly_leaderboard(self, db: Session, limit: int = 10) -> List[LearningGroup]:
         """
         Get the top packs by weekly points.
         """
-        return db.query(LearningGroup).order_by(desc(LearningGroup.weekly_points)).limit(limit).all()
+        return self._packs_in_order(db, leaderboard_service.top(db, PACKS_WEEKLY, limit))
+
+    @staticmethod
+    def _packs_in_order(db: Session, entries) -> List[LearningGroup]:
+        ids = [pack_id for pack_id, _, _ in entries]
+        if not ids:
+            return []
+        packs = {g.id: g for g in db.query(LearningGroup).filter(LearningGroup.id.in_(ids)).all()}
+        return [packs[pack_id] for pack_id in ids if pack_id in packs]
 
     def reset_weekly_points(self, db: Session):
         """
-        Reset weekly points for all packs (intended for a cron job).
+        Reset weekly points for all packs (run weekly by Celery beat).
+
+        The Redis weekly board rolls over on its own (keys are per ISO week),
+        so only packs that actually scored this week are touched in SQL.
         """
-        db.query(LearningGroup).update({LearningGroup.weekly_points: 0})
+        db.query(LearningGroup).filter(LearningGroup.weekly_points != 0).update(
+            {LearningGroup.weekly_points: 0}, synchronize_session=False
+        )
         db.commit()
 
     def set_pack_house_details(self, db: Session, group_id: int, house_type: HouseType, metadata: Dict[str, Any]):
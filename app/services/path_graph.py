@@ -0,0 +1,345 @@
+"""
+Learning-path graphs.
+
+Each learning path is compiled into an immutable prerequisite DAG: its
+courses in topological order (ties broken by ``order_index``) and, per
+course, the transitive closure of its prerequisites as a bitset. Progress
+for any number of enrollments is then bitwise arithmetic over the set of
+courses each student completed:
+- ``learning_path:{path_id}:version`` counter bumped whenever the path's courses change
+
+Graphs are compiled with one query and cached per worker; writes to path
+courses bump the version on commit (see the listener in
+app.models.learning_path).
+"""
+
+import heapq
+import logging
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.redis_client import get_redis
+from app.models.enrollment import Enrollment, EnrollmentStatus
+from app.models.learning_path import PathCourse, PathEnrollment, pending_path_changes
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "learning_path:{path_id}:version"
+
+# Without Redis other workers can't signal changes, so local copies expire
+LOCAL_TTL_SECONDS = 60
+
+
+@dataclass(frozen=True)
+class PathProgress:
+    """A student's standing in one path, derived from their completed courses."""
+
+    completed_courses: int
+    total_courses: int
+    progress_percentage: float
+    is_completed: bool
+    next_course_id: Optional[int]
+    unlockable_course_ids: Tuple[int, ...]
+
+
+@dataclass(frozen=True)
+class CompiledPath:
+    """Immutable prerequisite DAG of a learning path at one version."""
+
+    path_id: int
+    version: int
+    # Path courses in topological order; bit i of a mask is course_ids[i]
+    course_ids: Tuple[int, ...]
+    # Every course the graph mentions (path courses, then outside prerequisites) -> bit
+    bits: Dict[int, int]
+    # Path course -> bitset of all its direct and indirect prerequisites
+    closure: Dict[int, int]
+    required_mask: int
+
+    @property
+    def total_courses(self) -> int:
+        return len(self.course_ids)
+
+    @property
+    def path_mask(self) -> int:
+        return (1 << len(self.course_ids)) - 1
+
+    def prerequisite_ids(self) -> Set[int]:
+        """Every course whose completion can matter to this path."""
+        return set(self.bits)
+
+    def completed_mask(self, completed_course_ids: Iterable[int]) -> int:
+        mask = 0
+        for course_id in completed_course_ids:
+            bit = self.bits.get(course_id)
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def is_unlocked(self, course_id: int, done: int) -> bool:
+        """Whether every prerequisite of a path course, however indirect, is done."""
+        closure = self.closure.get(course_id)
+        return closure is not None and closure & ~done == 0
+
+    def unlockable(self, done: int) -> List[int]:
+        """Courses not yet done whose prerequisites all are, in path order."""
+        return [
+            course_id
+            for bit, course_id in enumerate(self.course_ids)
+            if not done >> bit & 1 and self.closure[course_id] & ~done == 0
+        ]
+
+    def progress(self, done: int) -> PathProgress:
+        unlockable = self.unlockable(done)
+        required_open = [c for c in unlockable if self.required_mask >> self.bits[c] & 1]
+        completed = bin(done & self.path_mask).count("1")
+        total = self.total_courses
+        return PathProgress(
+            completed_courses=completed,
+            total_courses=total,
+            progress_percentage=(completed / total) * 100 if total else 0.0,
+            is_completed=total > 0 and self.required_mask & ~done == 0,
+            next_course_id=(required_open or unlockable or [None])[0],
+            unlockable_course_ids=tuple(unlockable),
+        )
+
+
+def _compile_rows(path_id: int, version: int, rows) -> CompiledPath:
+    """Build the DAG from (id, course_id, prerequisite_course_id, order_index, is_required) rows."""
+    rank: Dict[int, Tuple[int, int]] = {}
+    required: Set[int] = set()
+    prerequisites: Dict[int, Set[int]] = defaultdict(set)
+    for row_id, course_id, prerequisite_id, order_index, is_required in rows:
+        position = (order_index or 0, row_id)
+        rank[course_id] = min(rank.get(course_id, position), position)
+        if is_required or is_required is None:
+            required.add(course_id)
+        if prerequisite_id is not None and prerequisite_id != course_id:
+            prerequisites[course_id].add(prerequisite_id)
+
+    # Kahn's algorithm over path courses; outside prerequisites have no edges
+    dependents: Dict[int, List[int]] = defaultdict(list)
+    waiting = {}
+    for course_id in rank:
+        inside = {p for p in prerequisites[course_id] if p in rank}
+        waiting[course_id] = len(inside)
+        for prerequisite_id in inside:
+            dependents[prerequisite_id].append(course_id)
+    ready = [(rank[c], c) for c, count in waiting.items() if count == 0]
+    heapq.heapify(ready)
+    order: List[int] = []
+    while ready:
+        _, course_id = heapq.heappop(ready)
+        order.append(course_id)
+        for dependent in dependents[course_id]:
+            waiting[dependent] -= 1
+            if waiting[dependent] == 0:
+                heapq.heappush(ready, (rank[dependent], dependent))
+
+    placed = set(order)
+    cyclic = sorted((c for c in rank if c not in placed), key=rank.get)
+    if cyclic:
+        # Drop the edges that close a cycle rather than lock those courses forever
+        logger.warning(f"Learning path {path_id} has a prerequisite cycle among courses {cyclic}")
+        for course_id in cyclic:
+            prerequisites[course_id] = {
+                p for p in prerequisites[course_id] if p not in rank or p in placed
+            }
+            order.append(course_id)
+            placed.add(course_id)
+
+    bits = {course_id: bit for bit, course_id in enumerate(order)}
+    for course_id in order:
+        for prerequisite_id in sorted(prerequisites[course_id]):
+            bits.setdefault(prerequisite_id, len(bits))
+
+    closure: Dict[int, int] = {}
+    for course_id in order:
+        mask = 0
+        for prerequisite_id in prerequisites[course_id]:
+            mask |= 1 << bits[prerequisite_id]
+            mask |= closure.get(prerequisite_id, 0)
+        closure[course_id] = mask
+
+    return CompiledPath(
+        path_id=path_id,
+        version=version,
+        course_ids=tuple(order),
+        bits=bits,
+        closure=closure,
+        required_mask=sum(1 << bits[c] for c in required),
+    )
+
+
+class PathGraphCompiler:
+    """Compiles learning paths into DAGs and caches them per worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local: Dict[int, Tuple[CompiledPath, float]] = {}
+        self._local_versions: Dict[int, int] = {}
+
+    def _versions(self, path_ids: List[int]) -> Tuple[Dict[int, int], bool]:
+        """Current version of each path, and whether they came from Redis."""
+        redis = get_redis()
+        if redis is not None:
+            try:
+                values = redis.mget([VERSION_KEY.format(path_id=pid) for pid in path_ids])
+                return {pid: int(v or 0) for pid, v in zip(path_ids, values)}, True
+            except RedisError as e:
+                logger.warning(f"Learning path version lookup failed: {e}")
+        return {pid: self._local_versions.get(pid, 0) for pid in path_ids}, False
+
+    def compile_many(self, db: Session, versions: Dict[int, int]) -> Dict[int, CompiledPath]:
+        """Build graphs for several paths from the database with one query."""
+        rows_by_path = defaultdict(list)
+        if versions:
+            for path_id, *row in db.execute(
+                select(
+                    PathCourse.path_id,
+                    PathCourse.id,
+                    PathCourse.course_id,
+                    PathCourse.prerequisite_course_id,
+                    PathCourse.order_index,
+                    PathCourse.is_required,
+                ).where(PathCourse.path_id.in_(list(versions)))
+            ):
+                rows_by_path[path_id].append(row)
+        return {
+            path_id: _compile_rows(path_id, version, rows_by_path[path_id])
+            for path_id, version in versions.items()
+        }
+
+    def get_many(self, db: Session, path_ids: Iterable[int]) -> Dict[int, CompiledPath]:
+        """
+        Current graphs of several paths, compiling the stale ones together.
+
+        Returns:
+            path id -> graph (a path without courses has an empty graph)
+        """
+        path_ids = sorted(set(path_ids))
+        if not path_ids:
+            return {}
+        versions, shared = self._versions(path_ids)
+
+        graphs: Dict[int, CompiledPath] = {}
+        now = time.monotonic()
+        with self._lock:
+            for path_id in path_ids:
+                cached = self._local.get(path_id)
+                if cached is None:
+                    continue
+                graph, cached_at = cached
+                if graph.version == versions[path_id] and (
+                    shared or now - cached_at < LOCAL_TTL_SECONDS
+                ):
+                    graphs[path_id] = graph
+
+        stale = {pid: versions[pid] for pid in path_ids if pid not in graphs}
+        if stale:
+            compiled = self.compile_many(db, stale)
+            # Graphs built from uncommitted path courses are not cached
+            uncommitted = pending_path_changes(db)
+            with self._lock:
+                for path_id, graph in compiled.items():
+                    if path_id not in uncommitted:
+                        self._local[path_id] = (graph, now)
+            graphs.update(compiled)
+        return graphs
+
+    def get(self, db: Session, path_id: int) -> CompiledPath:
+        return self.get_many(db, [path_id])[path_id]
+
+    def invalidate(self, path_ids: Iterable[int]):
+        """Bump the version of changed paths so every worker recompiles."""
+        path_ids = [pid for pid in set(path_ids) if pid is not None]
+        if not path_ids:
+            return
+
+        with self._lock:
+            for path_id in path_ids:
+                self._local.pop(path_id, None)
+                self._local_versions[path_id] = self._local_versions.get(path_id, 0) + 1
+
+        redis = get_redis()
+        if redis is None:
+            return
+        try:
+            pipe = redis.pipeline(transaction=False)
+            for path_id in path_ids:
+                pipe.incr(VERSION_KEY.format(path_id=path_id))
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Learning path invalidation failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+            self._local_versions.clear()
+
+    # ------------------------------------------------------------------
+    # Progress
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def completed_course_ids(
+        db: Session, student_ids: Iterable[int], course_ids: Optional[Iterable[int]] = None
+    ) -> Dict[int, Set[int]]:
+        """Completed courses per student, with one query."""
+        student_ids = list(set(student_ids))
+        completed: Dict[int, Set[int]] = {sid: set() for sid in student_ids}
+        if not student_ids:
+            return completed
+        query = select(Enrollment.user_id, Enrollment.course_id).where(
+            Enrollment.user_id.in_(student_ids),
+            Enrollment.status == EnrollmentStatus.COMPLETED,
+        )
+        if course_ids is not None:
+            course_ids = list(set(course_ids))
+            if not course_ids:
+                return completed
+            query = query.where(Enrollment.course_id.in_(course_ids))
+        for student_id, course_id in db.execute(query):
+            completed[student_id].add(course_id)
+        return completed
+
+    def progress_many(
+        self,
+        db: Session,
+        enrollments: Iterable[PathEnrollment],
+        completed: Optional[Dict[int, Set[int]]] = None,
+    ) -> Dict[int, PathProgress]:
+        """
+        Progress of many enrollments, across paths and students.
+
+        Uses at most two queries: stale graphs and completed courses.
+
+        Returns:
+            enrollment id -> progress
+        """
+        enrollments = list(enrollments)
+        graphs = self.get_many(db, (e.path_id for e in enrollments))
+        if completed is None:
+            course_ids = set()
+            for graph in graphs.values():
+                course_ids |= graph.prerequisite_ids()
+            completed = self.completed_course_ids(
+                db, (e.student_id for e in enrollments), course_ids
+            )
+        return {
+            enrollment.id: graphs[enrollment.path_id].progress(
+                graphs[enrollment.path_id].completed_mask(completed.get(enrollment.student_id, ()))
+            )
+            for enrollment in enrollments
+        }
+
+
+# Singleton instance
+path_graph = PathGraphCompiler()
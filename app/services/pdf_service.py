@@ -196,6 +196,10 @@ class PDFReportService:
                 f"Report Date: {datetime.now().strftime('%B %d, %Y')}", styles["Normal"]
             )
         )
+        if kpis.get("as_of"):
+            story.append(
+                Paragraph(f"Data as of: {kpis['as_of'][:16]} UTC", styles["Normal"])
+            )
         story.append(Spacer(1, 0.3 * inch))
 
         # KPI Summary
@@ -8,7 +8,9 @@ import logging
 from functools import wraps
 from typing import Callable, Dict, List
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque
+
+from app.db.instrumentation import LatencySketch
 
 logger = logging.getLogger(__name__)
 
@@ -16,8 +18,9 @@ logger = logging.getLogger(__name__)
 class PerformanceMonitor:
     """Monitor and track performance metrics"""
 
-    _metrics: Dict[str, List[float]] = defaultdict(list)
-    _slow_queries: List[Dict] = []
+    # Quantile sketches (milliseconds) and a ring buffer of slow operations
+    _metrics: Dict[str, LatencySketch] = defaultdict(LatencySketch)
+    _slow_queries: deque = deque(maxlen=100)
 
     @classmethod
     def track_time(cls, operation: str):
@@ -81,33 +84,29 @@ class PerformanceMonitor:
     @classmethod
     def _record_metric(cls, operation: str, duration: float):
         """Record a metric"""
-        cls._metrics[operation].append(duration)
-
-        # Keep only last 1000 measurements per operation
-        if len(cls._metrics[operation]) > 1000:
-            cls._metrics[operation] = cls._metrics[operation][-1000:]
+        cls._metrics[operation].add(duration * 1000)
 
     @classmethod
     def get_stats(cls, operation: str = None) -> Dict:
         """Get performance statistics"""
         if operation:
-            durations = cls._metrics.get(operation, [])
-            if not durations:
+            sketch = cls._metrics.get(operation)
+            if not sketch or not sketch.count:
                 return {}
 
             return {
                 "operation": operation,
-                "count": len(durations),
-                "avg": sum(durations) / len(durations),
-                "min": min(durations),
-                "max": max(durations),
-                "p50": sorted(durations)[len(durations) // 2],
-                "p95": sorted(durations)[int(len(durations) * 0.95)],
-                "p99": sorted(durations)[int(len(durations) * 0.99)],
+                "count": sketch.count,
+                "avg": sketch.mean / 1000,
+                "min": sketch.min / 1000,
+                "max": sketch.max / 1000,
+                "p50": sketch.quantile(0.50) / 1000,
+                "p95": sketch.quantile(0.95) / 1000,
+                "p99": sketch.quantile(0.99) / 1000,
             }
 
         # Return stats for all operations
-        return {op: cls.get_stats(op) for op in cls._metrics.keys()}
+        return {op: cls.get_stats(op) for op in list(cls._metrics.keys())}
 
     @classmethod
     def get_slow_queries(cls, limit: int = 10) -> List[Dict]:
@@ -1,17 +1,160 @@
 """
 Presence service for tracking user online/offline/away status.
+
+Presence lives in Redis when it is available:
+- ``presence:user:{user_id}``     hash with status, message, location, timestamps
+- ``presence:online``             sorted set of user ids scored by last activity
+- ``presence:location:{location}`` sorted set per app location, same scoring
+- ``presence:dirty``              set of user ids changed since the last flush
+
+Heartbeats only touch Redis. ``flush_to_db`` writes changed users to
+``RealtimeUserPresence`` in bulk (write-behind), and stale users are expired
+with a range query on the sorted set instead of a table scan. Without Redis,
+or when a Redis call fails, the service reads and writes SQL directly.
 """
 
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Union
+
+from redis.exceptions import RedisError
+from sqlalchemy import update
 from sqlalchemy.orm import Session
+
+from app.core.redis_client import get_redis
 from app.models.chat import RealtimeUserPresence
-from datetime import datetime, timedelta
-from typing import List, Optional
-from app.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+ONLINE_KEY = "presence:online"
+DIRTY_KEY = "presence:dirty"
+USER_KEY = "presence:user:{user_id}"
+LOCATION_KEY = "presence:location:{location}"
+
+# Users seen within this window are reported as online
+ONLINE_WINDOW_MINUTES = 5
+
+# Presence hashes outlive the online window so last_seen stays queryable
+USER_KEY_TTL_SECONDS = 7 * 24 * 3600
+
+# Users written to SQL per flush round trip
+FLUSH_BATCH_SIZE = 1000
+
+
+@dataclass
+class PresenceRecord:
+    """Presence snapshot read from Redis (attribute-compatible with the model)."""
+
+    user_id: int
+    status: str
+    last_seen: datetime
+    last_activity: datetime
+    status_message: Optional[str] = None
+    current_location: Optional[str] = None
+    id: Optional[int] = None
+
+
+Presence = Union[PresenceRecord, RealtimeUserPresence]
+
+
+def _to_score(moment: datetime) -> float:
+    return (moment - datetime(1970, 1, 1)).total_seconds()
+
+
+def _from_score(score: float) -> datetime:
+    return datetime(1970, 1, 1) + timedelta(seconds=score)
+
+
+def _record_from_hash(user_id: int, data: Dict[str, str]) -> PresenceRecord:
+    return PresenceRecord(
+        id=int(data["id"]) if data.get("id") else None,
+        user_id=user_id,
+        status=data.get("status", "offline"),
+        status_message=data.get("status_message") or None,
+        current_location=data.get("current_location") or None,
+        last_seen=_from_score(float(data.get("last_seen", 0))),
+        last_activity=_from_score(float(data.get("last_activity", 0))),
+    )
 
 
 class PresenceService:
     """Service for managing user presence."""
 
+    # ------------------------------------------------------------------
+    # Redis helpers
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _write(
+        redis,
+        user_id: int,
+        fields: Dict[str, str],
+        activity_score: Optional[float],
+        old_location: Optional[str] = None,
+        new_location: Optional[str] = None,
+        online: bool = True,
+    ):
+        """Apply a presence change in a single pipelined round trip."""
+        key = USER_KEY.format(user_id=user_id)
+        pipe = redis.pipeline(transaction=False)
+        pipe.hset(key, mapping=fields)
+        pipe.expire(key, USER_KEY_TTL_SECONDS)
+
+        if old_location and old_location != new_location:
+            pipe.zrem(LOCATION_KEY.format(location=old_location), user_id)
+
+        if online and activity_score is not None:
+            pipe.zadd(ONLINE_KEY, {user_id: activity_score})
+            if new_location:
+                pipe.zadd(LOCATION_KEY.format(location=new_location), {user_id: activity_score})
+        elif not online:
+            pipe.zrem(ONLINE_KEY, user_id)
+            if new_location:
+                pipe.zrem(LOCATION_KEY.format(location=new_location), user_id)
+
+        pipe.sadd(DIRTY_KEY, user_id)
+        pipe.execute()
+
+    @staticmethod
+    def _warm_from_db(redis, db: Session, user_id: int) -> Optional[PresenceRecord]:
+        """Load a user's presence from SQL into Redis on a cache miss."""
+        row = (
+            db.query(RealtimeUserPresence)
+            .filter(RealtimeUserPresence.user_id == user_id)
+            .first()
+        )
+        if not row:
+            return None
+
+        last_seen = row.last_seen or datetime.utcnow()
+        last_activity = row.last_activity or last_seen
+        redis.hset(
+            USER_KEY.format(user_id=user_id),
+            mapping={
+                "id": row.id,
+                "status": row.status or "offline",
+                "status_message": row.status_message or "",
+                "current_location": row.current_location or "",
+                "last_seen": _to_score(last_seen),
+                "last_activity": _to_score(last_activity),
+            },
+        )
+        redis.expire(USER_KEY.format(user_id=user_id), USER_KEY_TTL_SECONDS)
+        return PresenceRecord(
+            id=row.id,
+            user_id=user_id,
+            status=row.status or "offline",
+            status_message=row.status_message,
+            current_location=row.current_location,
+            last_seen=last_seen,
+            last_activity=last_activity,
+        )
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
     @staticmethod
     def update_presence(
         db: Session,
@@ -19,7 +162,7 @@ class PresenceService:
         status: str,
         status_message: Optional[str] = None,
         current_location: Optional[str] = None,
-    ) -> RealtimeUserPresence:
+    ) -> Presence:
         """
         Update user presence status.
 
@@ -31,48 +174,58 @@ class PresenceService:
             current_location: Current location in app
 
         Returns:
-            Updated RealtimeUserPresence object
+            Updated presence (PresenceRecord from Redis, or the SQL row)
         """
-        presence = (
-            db.query(RealtimeUserPresence)
-            .filter(RealtimeUserPresence.user_id == user_id)
-            .first()
+        redis = get_redis()
+        if redis is not None:
+            try:
+                return PresenceService._update_presence_redis(
+                    redis, user_id, status, status_message, current_location
+                )
+            except RedisError as e:
+                logger.warning(f"Presence update failed for user {user_id}: {e}")
+        return PresenceService._update_presence_sql(
+            db, user_id, status, status_message, current_location
         )
 
-        if not presence:
-            presence = RealtimeUserPresence(user_id=user_id)
-            db.add(presence)
-
-        presence.status = status
-        presence.last_activity = datetime.utcnow()
-
-        if status == "online":
-            presence.last_seen = datetime.utcnow()
-
+    @staticmethod
+    def _update_presence_redis(
+        redis,
+        user_id: int,
+        status: str,
+        status_message: Optional[str],
+        current_location: Optional[str],
+    ) -> PresenceRecord:
+        now = datetime.utcnow()
+        score = _to_score(now)
+        key = USER_KEY.format(user_id=user_id)
+        current = redis.hgetall(key)
+
+        fields = {"status": status, "last_activity": score}
+        if status == "online" or "last_seen" not in current:
+            fields["last_seen"] = score
         if status_message is not None:
-            presence.status_message = status_message
-
+            fields["status_message"] = status_message
         if current_location is not None:
-            presence.current_location = current_location
-
-        db.commit()
-        db.refresh(presence)
+            fields["current_location"] = current_location
+
+        old_location = current.get("current_location") or None
+        new_location = current_location if current_location is not None else old_location
+
+        PresenceService._write(
+            redis,
+            user_id,
+            fields,
+            score,
+            old_location=old_location,
+            new_location=new_location,
+            online=status != "offline",
+        )
 
-        # Cache the presence status
-        cache.set(
-            f"presence:{user_id}",
-            {
-                "status": status,
-                "last_seen": presence.last_seen.isoformat(),
-                "current_location": current_location,
-            },
-            ttl=300,
-        )  # 5 minutes
-
-        return presence
+        return _record_from_hash(user_id, {**current, **{k: str(v) for k, v in fields.items()}})
 
     @staticmethod
-    def get_presence(db: Session, user_id: int) -> Optional[RealtimeUserPresence]:
+    def get_presence(db: Session, user_id: int) -> Optional[Presence]:
         """
         Get user presence status.
 
@@ -81,67 +234,79 @@ class PresenceService:
             user_id: User ID
 
         Returns:
-            RealtimeUserPresence object or None
+            Presence or None
         """
-        # Try cache first
-        cached = cache.get(f"presence:{user_id}")
-        if cached:
-            presence = (
-                db.query(RealtimeUserPresence)
-                .filter(RealtimeUserPresence.user_id == user_id)
-                .first()
-            )
-            return presence
-
-        presence = (
+        redis = get_redis()
+        if redis is not None:
+            try:
+                data = redis.hgetall(USER_KEY.format(user_id=user_id))
+                if data:
+                    return _record_from_hash(user_id, data)
+                return PresenceService._warm_from_db(redis, db, user_id)
+            except RedisError as e:
+                logger.warning(f"Presence lookup failed for user {user_id}: {e}")
+        return (
             db.query(RealtimeUserPresence)
             .filter(RealtimeUserPresence.user_id == user_id)
             .first()
         )
 
-        if presence:
-            # Cache for next time
-            cache.set(
-                f"presence:{user_id}",
-                {
-                    "status": presence.status,
-                    "last_seen": presence.last_seen.isoformat()
-                    if presence.last_seen
-                    else None,
-                    "current_location": presence.current_location,
-                },
-                ttl=300,
-            )
-
-        return presence
-
     @staticmethod
     def get_online_users(
         db: Session, location: Optional[str] = None
-    ) -> List[RealtimeUserPresence]:
+    ) -> List[Presence]:
         """
         Get list of currently online users.
 
+        With Redis this is a score-range query on a sorted set
+        (O(log n + m)) followed by one pipelined hash read.
+
         Args:
             db: Database session
             location: Optional filter by current location
 
         Returns:
-            List of RealtimeUserPresence objects
+            List of presences
         """
+        active_threshold = datetime.utcnow() - timedelta(minutes=ONLINE_WINDOW_MINUTES)
+
+        redis = get_redis()
+        if redis is not None:
+            try:
+                return PresenceService._online_users_redis(redis, active_threshold, location)
+            except RedisError as e:
+                logger.warning(f"Online users lookup failed: {e}")
+
         query = db.query(RealtimeUserPresence).filter(
-            RealtimeUserPresence.status == "online"
+            RealtimeUserPresence.status == "online",
+            RealtimeUserPresence.last_activity >= active_threshold,
         )
-
         if location:
             query = query.filter(RealtimeUserPresence.current_location == location)
-
-        # Consider users active if seen within last 5 minutes
-        active_threshold = datetime.utcnow() - timedelta(minutes=5)
-        query = query.filter(RealtimeUserPresence.last_activity >= active_threshold)
-
         return query.all()
 
+    @staticmethod
+    def _online_users_redis(
+        redis, active_threshold: datetime, location: Optional[str]
+    ) -> List[PresenceRecord]:
+        key = LOCATION_KEY.format(location=location) if location else ONLINE_KEY
+        user_ids = [
+            int(uid)
+            for uid in redis.zrangebyscore(key, _to_score(active_threshold), "+inf")
+        ]
+        if not user_ids:
+            return []
+
+        pipe = redis.pipeline(transaction=False)
+        for uid in user_ids:
+            pipe.hgetall(USER_KEY.format(user_id=uid))
+
+        records = []
+        for uid, data in zip(user_ids, pipe.execute()):
+            if data and data.get("status") == "online":
+                records.append(_record_from_hash(uid, data))
+        return records
+
     @staticmethod
     def set_offline(db: Session, user_id: int):
         """
@@ -151,92 +316,282 @@ class PresenceService:
             db: Database session
             user_id: User ID
         """
+        redis = get_redis()
+        if redis is not None:
+            try:
+                key = USER_KEY.format(user_id=user_id)
+                location = redis.hget(key, "current_location") or None
+                PresenceService._write(
+                    redis,
+                    user_id,
+                    {"status": "offline", "last_seen": _to_score(datetime.utcnow())},
+                    None,
+                    new_location=location,
+                    online=False,
+                )
+                return
+            except RedisError as e:
+                logger.warning(f"Setting user {user_id} offline in Redis failed: {e}")
+
         presence = (
             db.query(RealtimeUserPresence)
             .filter(RealtimeUserPresence.user_id == user_id)
             .first()
         )
-
         if presence:
             presence.status = "offline"
             presence.last_seen = datetime.utcnow()
             db.commit()
 
-            # Update cache
-            cache.set(
-                f"presence:{user_id}",
-                {
-                    "status": "offline",
-                    "last_seen": presence.last_seen.isoformat(),
-                    "current_location": presence.current_location,
-                },
-                ttl=300,
-            )
-
     @staticmethod
     def heartbeat(db: Session, user_id: int):
         """
         Update last activity timestamp (heartbeat).
 
+        With Redis this never touches SQL; the change is picked up by the
+        next ``flush_to_db``.
+
         Args:
             db: Database session
             user_id: User ID
         """
-        presence = (
-            db.query(RealtimeUserPresence)
-            .filter(RealtimeUserPresence.user_id == user_id)
-            .first()
-        )
+        redis = get_redis()
+        if redis is not None:
+            try:
+                PresenceService._heartbeat_redis(redis, db, user_id)
+                return
+            except RedisError as e:
+                logger.warning(f"Presence heartbeat failed for user {user_id}: {e}")
+        PresenceService._heartbeat_sql(db, user_id)
 
-        if presence:
-            presence.last_activity = datetime.utcnow()
-
-            # If user was away, set them back to online
-            if presence.status in ["away", "offline"]:
-                presence.status = "online"
-                presence.last_seen = datetime.utcnow()
-
-            db.commit()
-
-            # Update cache
-            cache.set(
-                f"presence:{user_id}",
-                {
-                    "status": presence.status,
-                    "last_seen": presence.last_seen.isoformat(),
-                    "current_location": presence.current_location,
-                },
-                ttl=300,
-            )
+    @staticmethod
+    def _heartbeat_redis(redis, db: Session, user_id: int):
+        key = USER_KEY.format(user_id=user_id)
+        status, location = redis.hmget(key, "status", "current_location")
+        if status is None:
+            if PresenceService._warm_from_db(redis, db, user_id) is None:
+                return
+            status, location = redis.hmget(key, "status", "current_location")
+
+        score = _to_score(datetime.utcnow())
+        fields = {"last_activity": score}
+
+        # If user was away, set them back to online
+        if status in ("away", "offline"):
+            fields["status"] = "online"
+            fields["last_seen"] = score
+
+        PresenceService._write(
+            redis, user_id, fields, score, new_location=location or None
+        )
 
     @staticmethod
-    def cleanup_stale_presence(db: Session, threshold_minutes: int = 15):
+    def cleanup_stale_presence(db: Session, threshold_minutes: int = 15) -> int:
         """
         Mark users as offline if they haven't been active recently.
 
+        With Redis, stale users are found by a score-range query on the
+        online sorted set and then flushed to SQL with everything else.
+        Without Redis a single bulk UPDATE is issued.
+
         Args:
             db: Database session
             threshold_minutes: Minutes of inactivity before marking offline
+
+        Returns:
+            Number of users marked offline
         """
         threshold = datetime.utcnow() - timedelta(minutes=threshold_minutes)
 
-        stale_presence = (
-            db.query(RealtimeUserPresence)
-            .filter(
+        redis = get_redis()
+        if redis is not None:
+            try:
+                stale_ids = PresenceService._expire_stale_redis(redis, threshold)
+            except RedisError as e:
+                logger.warning(f"Stale presence cleanup in Redis failed: {e}")
+            else:
+                PresenceService.flush_to_db(db)
+                return len(stale_ids)
+
+        result = db.execute(
+            update(RealtimeUserPresence)
+            .where(
                 RealtimeUserPresence.status.in_(["online", "away"]),
                 RealtimeUserPresence.last_activity < threshold,
             )
-            .all()
+            .values(
+                status="offline",
+                last_seen=RealtimeUserPresence.last_activity,
+            )
+            .execution_options(synchronize_session=False)
         )
+        db.commit()
+        return result.rowcount or 0
 
-        for presence in stale_presence:
-            presence.status = "offline"
-            presence.last_seen = presence.last_activity
-            cache.delete(f"presence:{presence.user_id}")
+    @staticmethod
+    def _expire_stale_redis(redis, threshold: datetime) -> List[str]:
+        """Mark users last active before ``threshold`` offline; returns their ids."""
+        stale_ids = redis.zrangebyscore(ONLINE_KEY, "-inf", f"({_to_score(threshold)}")
+        if stale_ids:
+            pipe = redis.pipeline(transaction=False)
+            for uid in stale_ids:
+                pipe.hmget(USER_KEY.format(user_id=uid), "current_location", "last_activity")
+            details = pipe.execute()
+
+            pipe = redis.pipeline(transaction=False)
+            for uid, (location, last_activity) in zip(stale_ids, details):
+                key = USER_KEY.format(user_id=uid)
+                pipe.hset(
+                    key,
+                    mapping={
+                        "status": "offline",
+                        "last_seen": last_activity or _to_score(threshold),
+                    },
+                )
+                if location:
+                    pipe.zrem(LOCATION_KEY.format(location=location), uid)
+            pipe.zrem(ONLINE_KEY, *stale_ids)
+            pipe.sadd(DIRTY_KEY, *stale_ids)
+            pipe.execute()
+        return stale_ids
+
+    @staticmethod
+    def flush_to_db(db: Session, batch_size: int = FLUSH_BATCH_SIZE) -> int:
+        """
+        Write-behind: persist presence changes buffered in Redis to SQL.
+
+        Pops dirty user ids in batches, loads their existing rows with one
+        query per batch and commits once per batch.
+
+        Args:
+            db: Database session
+            batch_size: Users written per batch
+
+        Returns:
+            Number of users flushed
+        """
+        redis = get_redis()
+        if redis is None:
+            return 0
+
+        flushed = 0
+        try:
+            while True:
+                user_ids = [int(uid) for uid in (redis.spop(DIRTY_KEY, batch_size) or [])]
+                if not user_ids:
+                    break
+
+                pipe = redis.pipeline(transaction=False)
+                for uid in user_ids:
+                    pipe.hgetall(USER_KEY.format(user_id=uid))
+                try:
+                    snapshots = dict(zip(user_ids, pipe.execute()))
+                except RedisError:
+                    # Put the batch back so the next flush retries it
+                    redis.sadd(DIRTY_KEY, *user_ids)
+                    raise
+
+                rows = {
+                    row.user_id: row
+                    for row in db.query(RealtimeUserPresence)
+                    .filter(RealtimeUserPresence.user_id.in_(user_ids))
+                    .all()
+                }
+
+                new_rows = []
+                for uid, data in snapshots.items():
+                    if not data:
+                        continue
+                    record = _record_from_hash(uid, data)
+                    row = rows.get(uid)
+                    if row is None:
+                        row = RealtimeUserPresence(user_id=uid)
+                        new_rows.append(row)
+                    row.status = record.status
+                    row.status_message = record.status_message
+                    row.current_location = record.current_location
+                    row.last_seen = record.last_seen
+                    row.last_activity = record.last_activity
+
+                try:
+                    db.add_all(new_rows)
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    # Put the batch back so the next flush retries it
+                    redis.sadd(DIRTY_KEY, *user_ids)
+                    raise
+
+                if new_rows:
+                    pipe = redis.pipeline(transaction=False)
+                    for row in new_rows:
+                        pipe.hset(USER_KEY.format(user_id=row.user_id), "id", row.id)
+                    pipe.execute()
+
+                flushed += len(snapshots)
+                if len(user_ids) < batch_size:
+                    break
+        except RedisError as e:
+            # Users still marked dirty are picked up by the next flush
+            logger.warning(f"Presence flush stopped after {flushed} users: {e}")
+
+        return flushed
+
+    # ------------------------------------------------------------------
+    # SQL fallback (no Redis, or Redis unavailable)
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _update_presence_sql(
+        db: Session,
+        user_id: int,
+        status: str,
+        status_message: Optional[str],
+        current_location: Optional[str],
+    ) -> RealtimeUserPresence:
+        presence = (
+            db.query(RealtimeUserPresence)
+            .filter(RealtimeUserPresence.user_id == user_id)
+            .first()
+        )
+
+        if not presence:
+            presence = RealtimeUserPresence(user_id=user_id)
+            db.add(presence)
+
+        presence.status = status
+        presence.last_activity = datetime.utcnow()
+
+        if status == "online":
+            presence.last_seen = datetime.utcnow()
+
+        if status_message is not None:
+            presence.status_message = status_message
+
+        if current_location is not None:
+            presence.current_location = current_location
 
         db.commit()
+        db.refresh(presence)
+        return presence
+
+    @staticmethod
+    def _heartbeat_sql(db: Session, user_id: int):
+        presence = (
+            db.query(RealtimeUserPresence)
+            .filter(RealtimeUserPresence.user_id == user_id)
+            .first()
+        )
+
+        if presence:
+            presence.last_activity = datetime.utcnow()
+
+            # If user was away, set them back to online
+            if presence.status in ["away", "offline"]:
+                presence.status = "online"
+                presence.last_seen = datetime.utcnow()
 
-        return len(stale_presence)
+            db.commit()
 
 
 presence_service = PresenceService()
@@ -0,0 +1,517 @@
+"""
+Lesson progress ingestion.
+
+Video players send progress heartbeats every few seconds. Instead of a
+read-modify-commit per heartbeat, heartbeats are coalesced in Redis:
+- ``progress:entry:{user_id}:{lesson_id}`` hash with the latest position,
+  plus the row id/status cached from SQL so responses need no query
+- ``progress:dirty`` set of "user_id:lesson_id" pairs changed since the last flush
+
+``flush_to_db`` drains the buffer in batches and writes each batch with one
+bulk UPDATE (and one bulk INSERT for unseen pairs) of ``LessonProgress``,
+one bulk UPDATE of enrollments, and a single course-completion check for
+every (user, course) that gained a completed lesson. Without Redis the same
+write path runs synchronously per heartbeat.
+"""
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import and_, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.core.redis_client import get_redis
+from app.models.course import Course
+from app.models.enrollment import Enrollment, EnrollmentStatus
+from app.models.lesson import Lesson
+from app.models.lesson_progress import LessonProgress, ProgressStatus
+from app.models.module import Module
+from app.models.user import User
+from app.services.entitlements import entitlements
+
+logger = logging.getLogger(__name__)
+
+DIRTY_KEY = "progress:dirty"
+ENTRY_KEY = "progress:entry:{user_id}:{lesson_id}"
+
+# Video watched past this percentage completes the lesson
+AUTO_COMPLETE_PERCENTAGE = 95.0
+
+# Buffered entries are dropped if no flush picks them up for this long
+ENTRY_TTL_SECONDS = 24 * 3600
+
+# (user, lesson) pairs written to SQL per flush round trip
+FLUSH_BATCH_SIZE = 500
+
+# Heartbeat fields copied onto LessonProgress
+PROGRESS_FIELDS = ("time_spent_seconds", "video_progress_seconds", "video_completed_percentage")
+
+Pair = Tuple[int, int]
+
+
+class LessonContext(NamedTuple):
+    course_id: int
+    enrollment_id: Optional[int]
+    lesson_title: str
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _entry_from_hash(data: Dict[str, str]) -> Dict[str, Any]:
+    """Decode a buffered hash into typed values."""
+    entry: Dict[str, Any] = {
+        "user_id": int(data["user_id"]),
+        "lesson_id": int(data["lesson_id"]),
+        "course_id": int(data["course_id"]) if data.get("course_id") else None,
+        "enrollment_id": int(data["enrollment_id"]) if data.get("enrollment_id") else None,
+        "last_accessed_at": _parse_time(data.get("last_accessed_at")),
+        "completed_at": _parse_time(data.get("completed_at")),
+    }
+    for field in ("time_spent_seconds", "video_progress_seconds"):
+        if data.get(field):
+            entry[field] = int(data[field])
+    if data.get("video_completed_percentage"):
+        entry["video_completed_percentage"] = float(data["video_completed_percentage"])
+    return entry
+
+
+def _row_to_hash(row: LessonProgress) -> Dict[str, str]:
+    values = {
+        "id": row.id,
+        "status": row.status.value if row.status else ProgressStatus.IN_PROGRESS.value,
+        "first_accessed_at": row.first_accessed_at.isoformat() if row.first_accessed_at else "",
+        "completed_at": row.completed_at.isoformat() if row.completed_at else "",
+        "time_spent_seconds": row.time_spent_seconds or 0,
+        "video_progress_seconds": row.video_progress_seconds or 0,
+        "video_completed_percentage": row.video_completed_percentage or 0.0,
+    }
+    return {k: str(v) for k, v in values.items()}
+
+
+def _response_from_hash(data: Dict[str, str]) -> Dict[str, Any]:
+    """Shape a buffered hash like schemas.LessonProgress."""
+    completed_at = _parse_time(data.get("completed_at"))
+    status = ProgressStatus(data.get("status") or ProgressStatus.IN_PROGRESS.value)
+    if completed_at:
+        status = ProgressStatus.COMPLETED
+    elif status == ProgressStatus.NOT_STARTED:
+        status = ProgressStatus.IN_PROGRESS
+    return {
+        "id": int(data["id"]),
+        "user_id": int(data["user_id"]),
+        "lesson_id": int(data["lesson_id"]),
+        "status": status,
+        "time_spent_seconds": int(data.get("time_spent_seconds") or 0),
+        "video_progress_seconds": int(data.get("video_progress_seconds") or 0),
+        "video_completed_percentage": float(data.get("video_completed_percentage") or 0),
+        "result_data": {},
+        "first_accessed_at": _parse_time(data.get("first_accessed_at"))
+        or _parse_time(data["last_accessed_at"]),
+        "last_accessed_at": _parse_time(data["last_accessed_at"]),
+        "completed_at": completed_at,
+    }
+
+
+class ProgressIngestionService:
+    """Coalesces progress heartbeats and writes them in bulk."""
+
+    # ------------------------------------------------------------------
+    # Request path
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def lesson_context(db: Session, user_id: int, lesson_id: int) -> Optional[LessonContext]:
+        """
+        Resolve a lesson's course and the user's active enrollment in one query.
+
+        Returns:
+            LessonContext (enrollment_id is None if not enrolled), or None if
+            the lesson doesn't exist
+        """
+        row = (
+            db.query(Module.course_id, Enrollment.id, Lesson.title)
+            .select_from(Lesson)
+            .join(Module, Module.id == Lesson.module_id)
+            .outerjoin(
+                Enrollment,
+                and_(
+                    Enrollment.course_id == Module.course_id,
+                    Enrollment.user_id == user_id,
+                    Enrollment.status == EnrollmentStatus.ACTIVE,
+                ),
+            )
+            .filter(Lesson.id == lesson_id)
+            .first()
+        )
+        if row is None:
+            return None
+        return LessonContext(*row)
+
+    @staticmethod
+    def record_heartbeat(
+        db: Session,
+        user_id: int,
+        lesson_id: int,
+        course_id: int,
+        enrollment_id: int,
+        update_data: Dict[str, Any],
+        now: Optional[datetime] = None,
+    ) -> Dict[str, Any]:
+        """
+        Buffer a progress heartbeat, keeping only the latest position.
+
+        Args:
+            db: Database session
+            user_id: User ID
+            lesson_id: Lesson ID
+            course_id: Course the lesson belongs to
+            enrollment_id: User's active enrollment in the course
+            update_data: Non-empty fields from LessonProgressUpdate
+            now: Heartbeat time (defaults to utcnow)
+
+        Returns:
+            The resulting progress, shaped like schemas.LessonProgress
+        """
+        now = now or datetime.utcnow()
+        fields = {
+            "user_id": str(user_id),
+            "lesson_id": str(lesson_id),
+            "course_id": str(course_id),
+            "enrollment_id": str(enrollment_id),
+            "last_accessed_at": now.isoformat(),
+        }
+        for field in PROGRESS_FIELDS:
+            if update_data.get(field):
+                fields[field] = str(update_data[field])
+        completed = (
+            update_data.get("video_completed_percentage") or 0
+        ) >= AUTO_COMPLETE_PERCENTAGE
+
+        redis = get_redis()
+        if redis is not None:
+            try:
+                return ProgressIngestionService._buffer(db, redis, fields, completed, now)
+            except RedisError as e:
+                logger.warning(f"Progress buffer unavailable, writing through: {e}")
+
+        entry = _entry_from_hash(fields)
+        if completed:
+            entry["completed_at"] = now
+        ProgressIngestionService.apply_entries(db, [entry])
+        row = (
+            db.query(LessonProgress)
+            .filter(LessonProgress.user_id == user_id, LessonProgress.lesson_id == lesson_id)
+            .first()
+        )
+        return _response_from_hash({**fields, **_row_to_hash(row)})
+
+    @staticmethod
+    def _buffer(db: Session, redis, fields: Dict[str, str], completed: bool, now: datetime):
+        user_id, lesson_id = fields["user_id"], fields["lesson_id"]
+        key = ENTRY_KEY.format(user_id=user_id, lesson_id=lesson_id)
+
+        pipe = redis.pipeline(transaction=True)
+        pipe.hset(key, mapping=fields)
+        if completed:
+            # Sticky: seeking back after finishing doesn't undo completion
+            pipe.hsetnx(key, "completed_at", now.isoformat())
+        pipe.expire(key, ENTRY_TTL_SECONDS)
+        pipe.sadd(DIRTY_KEY, f"{user_id}:{lesson_id}")
+        pipe.hgetall(key)
+        data = pipe.execute()[-1]
+
+        if "id" not in data:
+            # First heartbeat since the last flush: attach the row id/status so
+            # later heartbeats answer from Redis alone
+            row = (
+                db.query(LessonProgress)
+                .filter(
+                    LessonProgress.user_id == int(user_id),
+                    LessonProgress.lesson_id == int(lesson_id),
+                )
+                .first()
+            )
+            if row is None:
+                row = LessonProgress(
+                    user_id=int(user_id),
+                    lesson_id=int(lesson_id),
+                    status=ProgressStatus.IN_PROGRESS,
+                    first_accessed_at=now,
+                    last_accessed_at=now,
+                )
+                db.add(row)
+                db.commit()
+                db.refresh(row)
+
+            baseline = _row_to_hash(row)
+            pipe = redis.pipeline(transaction=False)
+            pipe.hset(key, mapping={f: baseline[f] for f in ("id", "status", "first_accessed_at")})
+            for field in PROGRESS_FIELDS + ("completed_at",):
+                if baseline[field]:
+                    pipe.hsetnx(key, field, baseline[field])
+            pipe.hgetall(key)
+            data = pipe.execute()[-1]
+
+        return _response_from_hash(data)
+
+    # ------------------------------------------------------------------
+    # Flush
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def flush_to_db(db: Session, batch_size: int = FLUSH_BATCH_SIZE) -> int:
+        """
+        Write-behind: persist buffered heartbeats to SQL.
+
+        Args:
+            db: Database session
+            batch_size: (user, lesson) pairs written per batch
+
+        Returns:
+            Number of pairs flushed
+        """
+        redis = get_redis()
+        if redis is None:
+            return 0
+
+        flushed = 0
+        while True:
+            members = redis.spop(DIRTY_KEY, batch_size) or []
+            if not members:
+                break
+
+            keys = [
+                ENTRY_KEY.format(user_id=m.split(":")[0], lesson_id=m.split(":")[1])
+                for m in members
+            ]
+            # Read and clear atomically so a heartbeat landing mid-flush
+            # starts a fresh entry instead of being lost
+            pipe = redis.pipeline(transaction=True)
+            for key in keys:
+                pipe.hgetall(key)
+            for key in keys:
+                pipe.delete(key)
+            snapshots = pipe.execute()[: len(keys)]
+
+            raw = [(key, data) for key, data in zip(keys, snapshots) if data]
+            try:
+                ProgressIngestionService.apply_entries(
+                    db, [_entry_from_hash(data) for _, data in raw]
+                )
+            except Exception:
+                db.rollback()
+                # Put the batch back without clobbering newer heartbeats
+                pipe = redis.pipeline(transaction=False)
+                for key, data in raw:
+                    for field, value in data.items():
+                        pipe.hsetnx(key, field, value)
+                    pipe.expire(key, ENTRY_TTL_SECONDS)
+                pipe.sadd(DIRTY_KEY, *members)
+                pipe.execute()
+                raise
+
+            flushed += len(raw)
+            if len(members) < batch_size:
+                break
+
+        return flushed
+
+    @staticmethod
+    def apply_entries(db: Session, entries: List[Dict[str, Any]]) -> Set[Pair]:
+        """
+        Write progress entries with bulk statements and run completion checks.
+
+        Returns:
+            (user_id, course_id) pairs that gained a completed lesson
+        """
+        if not entries:
+            return set()
+
+        user_ids = {e["user_id"] for e in entries}
+        lesson_ids = {e["lesson_id"] for e in entries}
+        existing = {
+            (row.user_id, row.lesson_id): row
+            for row in db.query(
+                LessonProgress.id,
+                LessonProgress.user_id,
+                LessonProgress.lesson_id,
+                LessonProgress.status,
+            ).filter(
+                LessonProgress.user_id.in_(user_ids),
+                LessonProgress.lesson_id.in_(lesson_ids),
+            )
+        }
+
+        updates, inserts = [], []
+        enrollments: Dict[int, Dict[str, Any]] = {}
+        newly_completed: Set[Pair] = set()
+        completed_users: Set[int] = set()
+
+        for entry in entries:
+            values = {f: entry[f] for f in PROGRESS_FIELDS if f in entry}
+            values["last_accessed_at"] = entry["last_accessed_at"]
+
+            row = existing.get((entry["user_id"], entry["lesson_id"]))
+            already_completed = row is not None and row.status == ProgressStatus.COMPLETED
+            if entry.get("completed_at") and not already_completed:
+                values["status"] = ProgressStatus.COMPLETED
+                values["completed_at"] = entry["completed_at"]
+                completed_users.add(entry["user_id"])
+                if entry.get("course_id"):
+                    newly_completed.add((entry["user_id"], entry["course_id"]))
+            elif row is None or row.status == ProgressStatus.NOT_STARTED:
+                values["status"] = ProgressStatus.IN_PROGRESS
+
+            if row is None:
+                inserts.append(
+                    {
+                        "user_id": entry["user_id"],
+                        "lesson_id": entry["lesson_id"],
+                        "first_accessed_at": entry["last_accessed_at"],
+                        **values,
+                    }
+                )
+            else:
+                updates.append({"id": row.id, **values})
+
+            enrollment_id = entry.get("enrollment_id")
+            if enrollment_id and (
+                enrollment_id not in enrollments
+                or enrollments[enrollment_id]["last_accessed_at"] < entry["last_accessed_at"]
+            ):
+                enrollments[enrollment_id] = {
+                    "id": enrollment_id,
+                    "last_accessed_lesson_id": entry["lesson_id"],
+                    "last_accessed_at": entry["last_accessed_at"],
+                }
+
+        # Primary-key order keeps lock acquisition consistent across workers
+        if updates:
+            db.execute(update(LessonProgress), sorted(updates, key=lambda m: m["id"]))
+        if inserts:
+            db.execute(insert(LessonProgress), inserts)
+        if enrollments:
+            db.execute(update(Enrollment), [enrollments[k] for k in sorted(enrollments)])
+        db.commit()
+
+        # Bulk statements skip the ORM listeners; completions unlock sequence drips
+        if completed_users:
+            entitlements.invalidate(user_ids=completed_users)
+
+        if newly_completed:
+            ProgressIngestionService.update_course_completion(db, newly_completed)
+        return newly_completed
+
+    # ------------------------------------------------------------------
+    # Course completion
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def update_course_completion(db: Session, pairs: Iterable[Pair]) -> List[Enrollment]:
+        """
+        Recompute course progress for (user, course) pairs and complete courses.
+
+        Completed-lesson counts come from one grouped query and lesson totals
+        from the denormalized Course.total_lessons.
+
+        Returns:
+            Enrollments that became completed
+        """
+        pairs = set(pairs)
+        if not pairs:
+            return []
+        user_ids = {u for u, _ in pairs}
+        course_ids = {c for _, c in pairs}
+
+        completed_counts = {
+            (user_id, course_id): count
+            for user_id, course_id, count in db.execute(
+                select(LessonProgress.user_id, Module.course_id, func.count(LessonProgress.id))
+                .join(Lesson, Lesson.id == LessonProgress.lesson_id)
+                .join(Module, Module.id == Lesson.module_id)
+                .where(
+                    LessonProgress.user_id.in_(user_ids),
+                    Module.course_id.in_(course_ids),
+                    LessonProgress.status == ProgressStatus.COMPLETED,
+                )
+                .group_by(LessonProgress.user_id, Module.course_id)
+            )
+        }
+        courses = {
+            c.id: c for c in db.query(Course).filter(Course.id.in_(course_ids)).all()
+        }
+        enrollments = (
+            db.query(Enrollment)
+            .filter(
+                Enrollment.user_id.in_(user_ids),
+                Enrollment.course_id.in_(course_ids),
+                Enrollment.status == EnrollmentStatus.ACTIVE,
+            )
+            .all()
+        )
+
+        finished = []
+        for enrollment in enrollments:
+            key = (enrollment.user_id, enrollment.course_id)
+            course = courses.get(enrollment.course_id)
+            if key not in pairs or course is None:
+                continue
+            total = course.total_lessons or 0
+            percentage = completed_counts.get(key, 0) / total * 100 if total else 0.0
+            enrollment.progress_percentage = min(percentage, 100.0)
+            if percentage >= 100.0:
+                enrollment.status = EnrollmentStatus.COMPLETED
+                enrollment.completed_at = datetime.utcnow()
+                finished.append(enrollment)
+        db.commit()
+
+        for enrollment in finished:
+            ProgressIngestionService._on_course_completed(
+                db, enrollment, courses[enrollment.course_id]
+            )
+        return finished
+
+    @staticmethod
+    def _on_course_completed(db: Session, enrollment: Enrollment, course: Course):
+        """Issue the certificate and completion rewards."""
+        from app.api.api_v1.endpoints.certificates import generate_certificate_internal
+        from app.services.coin_service import trigger_coin_reward
+
+        try:
+            generate_certificate_internal(
+                db, enrollment.user_id, enrollment.course_id, enrollment.id
+            )
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to issue certificate for enrollment {enrollment.id}: {e}")
+
+        try:
+            user = db.query(User).filter(User.id == enrollment.user_id).first()
+            if user:
+                # Big reward for completing entire course
+                trigger_coin_reward(
+                    db=db,
+                    user=user,
+                    action="course_complete",
+                    reference_type="course",
+                    reference_id=course.id,
+                    description=f"Completed course: {course.title}",
+                )
+                # Bonus for earning certificate
+                trigger_coin_reward(
+                    db=db,
+                    user=user,
+                    action="certificate_earn",
+                    reference_type="course",
+                    reference_id=course.id,
+                    description=f"Certificate earned: {course.title}",
+                )
+        except Exception as e:
+            logger.error(f"Failed to award coins for course completion: {e}")
+
+
+progress_ingestion = ProgressIngestionService()
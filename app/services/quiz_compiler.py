@@ -0,0 +1,430 @@
+"""
+Quiz compilation.
+
+A quiz is compiled into an immutable, versioned snapshot holding everything
+quiz-taking needs: the serialized quiz and questions (with options,
+feedback and rubrics) and a compact answer key. Snapshots are cached per
+worker and in Redis:
+- ``quiz:{quiz_id}:version``            counter bumped whenever the quiz content changes
+- ``quiz:{quiz_id}:snapshot:{version}`` JSON snapshot for that version
+
+Starting an attempt, grading answers and scoring completions then run
+against the snapshot in memory instead of re-querying questions and
+options. Writes to quizzes, questions, options, feedback and rubrics bump
+the version on commit (see the listener in app.models.quiz).
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy.orm import Session, selectinload
+
+from app.core.redis_client import get_redis
+from app.models.quiz import AssessmentRubric, Question, QuestionType, Quiz, QuizFeedback
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "quiz:{quiz_id}:version"
+SNAPSHOT_KEY = "quiz:{quiz_id}:snapshot:{version}"
+
+SNAPSHOT_TTL_SECONDS = 24 * 3600
+
+# Without Redis other workers can't signal changes, so local copies expire
+LOCAL_TTL_SECONDS = 60
+
+AUTO_GRADED_CHOICE = (QuestionType.MULTIPLE_CHOICE.value, QuestionType.TRUE_FALSE.value)
+
+# Quiz settings quiz-taking reads from the snapshot
+SETTINGS_FIELDS = (
+    "title",
+    "is_published",
+    "max_attempts",
+    "time_limit_minutes",
+    "passing_score",
+    "shuffle_questions",
+    "randomize_options",
+    "instant_feedback",
+    "show_hints",
+    "show_correct_answers",
+    "allow_review_answers",
+    "enable_ai_grading",
+    "ai_grading_model",
+    "manual_review_threshold",
+)
+
+
+def _normalize(text: Optional[str]) -> str:
+    return (text or "").lower().strip()
+
+
+@dataclass(frozen=True)
+class CompiledQuestion:
+    """Answer key entry for one question."""
+
+    id: int
+    type: str
+    points: float
+    explanation: Optional[str]
+    option_ids: FrozenSet[int]
+    correct_option_ids: Tuple[int, ...]
+    accepted_texts: Tuple[str, ...]
+    feedback: Optional[Dict[str, Any]]
+
+
+@dataclass(frozen=True)
+class GradeResult:
+    is_correct: bool
+    points_awarded: float
+    correct_option_id: Optional[int]
+
+
+@dataclass(frozen=True)
+class CompiledQuiz:
+    """Immutable snapshot of a quiz at one content version."""
+
+    quiz_id: int
+    version: int
+    settings: Dict[str, Any]
+    quiz_payload: Dict[str, Any]
+    question_payloads: Tuple[Dict[str, Any], ...]
+    questions: Dict[int, CompiledQuestion]
+
+    @property
+    def question_count(self) -> int:
+        return len(self.questions)
+
+    @property
+    def total_points(self) -> float:
+        return float(sum(q.points for q in self.questions.values()))
+
+    def essay_question_ids(self) -> List[int]:
+        essay_types = (QuestionType.ESSAY.value, QuestionType.LONG_ANSWER.value)
+        return [q.id for q in self.questions.values() if q.type in essay_types]
+
+    # ------------------------------------------------------------------
+    # Quiz-taking
+    # ------------------------------------------------------------------
+
+    def start_questions(self, rng: Optional[random.Random] = None) -> List[Dict[str, Any]]:
+        """Questions for a new attempt, shuffled as configured."""
+        rng = rng or random
+        questions = [dict(q) for q in self.question_payloads]
+        if self.settings["shuffle_questions"]:
+            rng.shuffle(questions)
+        if self.settings["randomize_options"]:
+            for q in questions:
+                if q.get("options"):
+                    q["options"] = list(q["options"])
+                    rng.shuffle(q["options"])
+        return questions
+
+    def grade(
+        self,
+        question_id: int,
+        selected_option_id: Optional[int] = None,
+        text_response: Optional[str] = None,
+    ) -> GradeResult:
+        """Auto-grade an answer against the answer key."""
+        question = self.questions[question_id]
+        is_correct = False
+        correct_option_id = None
+
+        if question.type in AUTO_GRADED_CHOICE:
+            if selected_option_id:
+                is_correct = selected_option_id in question.correct_option_ids
+                if question.correct_option_ids:
+                    correct_option_id = question.correct_option_ids[0]
+        elif question.type == QuestionType.SHORT_ANSWER.value:
+            if text_response:
+                is_correct = _normalize(text_response) in question.accepted_texts
+        elif question.type == QuestionType.FILL_IN_BLANK.value:
+            if text_response:
+                response = text_response.lower()
+                is_correct = any(text in response for text in question.accepted_texts)
+
+        return GradeResult(
+            is_correct=is_correct,
+            points_awarded=question.points if is_correct else 0.0,
+            correct_option_id=correct_option_id,
+        )
+
+    def answer_response(self, question_id: int, grade: GradeResult) -> Dict[str, Any]:
+        """Response for a submitted answer, honouring the quiz's feedback settings."""
+        question = self.questions[question_id]
+        response = {
+            "is_correct": grade.is_correct,
+            "points_awarded": grade.points_awarded,
+            "feedback": None,
+            "explanation": None,
+            "show_correct_answer": False,
+            "correct_option_id": None,
+        }
+        if not self.settings["instant_feedback"]:
+            return response
+
+        feedback = question.feedback
+        if feedback:
+            # Show appropriate feedback based on correctness
+            feedback_text = feedback["feedback_text"]
+            if grade.is_correct and feedback["feedback_for_correct"]:
+                feedback_text = feedback["feedback_for_correct"]
+            elif not grade.is_correct and feedback["feedback_for_incorrect"]:
+                feedback_text = feedback["feedback_for_incorrect"]
+
+            response["feedback"] = {
+                "feedback_text": feedback_text,
+                "hint_text": feedback["hint_text"] if self.settings["show_hints"] else None,
+                "explanation_url": feedback["explanation_url"],
+                "media_url": feedback["media_url"],
+            }
+
+        if question.explanation:
+            response["explanation"] = question.explanation
+
+        if self.settings["show_correct_answers"]:
+            response["show_correct_answer"] = True
+            response["correct_option_id"] = grade.correct_option_id
+
+        return response
+
+    # ------------------------------------------------------------------
+    # Serialization
+    # ------------------------------------------------------------------
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "quiz_id": self.quiz_id,
+                "version": self.version,
+                "settings": self.settings,
+                "quiz": self.quiz_payload,
+                "questions": list(self.question_payloads),
+                "key": [
+                    [
+                        q.id,
+                        q.type,
+                        q.points,
+                        q.explanation,
+                        sorted(q.option_ids),
+                        list(q.correct_option_ids),
+                        list(q.accepted_texts),
+                        q.feedback,
+                    ]
+                    for q in self.questions.values()
+                ],
+            },
+            default=str,
+        )
+
+    @classmethod
+    def from_json(cls, raw: str) -> "CompiledQuiz":
+        data = json.loads(raw)
+        questions = {}
+        for qid, qtype, points, explanation, options, correct, texts, feedback in data["key"]:
+            questions[qid] = CompiledQuestion(
+                id=qid,
+                type=qtype,
+                points=points,
+                explanation=explanation,
+                option_ids=frozenset(options),
+                correct_option_ids=tuple(correct),
+                accepted_texts=tuple(texts),
+                feedback=feedback,
+            )
+        return cls(
+            quiz_id=data["quiz_id"],
+            version=data["version"],
+            settings=data["settings"],
+            quiz_payload=data["quiz"],
+            question_payloads=tuple(data["questions"]),
+            questions=questions,
+        )
+
+
+def _feedback_dict(feedback: QuizFeedback) -> Dict[str, Any]:
+    return {
+        "id": feedback.id,
+        "question_id": feedback.question_id,
+        "feedback_text": feedback.feedback_text,
+        "feedback_for_correct": feedback.feedback_for_correct,
+        "feedback_for_incorrect": feedback.feedback_for_incorrect,
+        "hint_text": feedback.hint_text,
+        "explanation_url": feedback.explanation_url,
+        "media_url": feedback.media_url,
+    }
+
+
+def _rubric_dict(rubric: AssessmentRubric) -> Dict[str, Any]:
+    try:
+        levels = json.loads(rubric.levels) if rubric.levels else []
+    except ValueError:
+        levels = []
+    return {
+        "id": rubric.id,
+        "question_id": rubric.question_id,
+        "criteria_name": rubric.criteria_name,
+        "max_points": rubric.max_points,
+        "description": rubric.description,
+        "order_index": rubric.order_index,
+        "levels": levels,
+        "created_at": rubric.created_at.isoformat() if rubric.created_at else None,
+    }
+
+
+class QuizCompiler:
+    """Compiles quizzes into snapshots and caches them per worker and in Redis."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local: Dict[int, Tuple[CompiledQuiz, float]] = {}
+        self._local_versions: Dict[int, int] = {}
+
+    def compile(self, db: Session, quiz_id: int, version: int = 0) -> Optional[CompiledQuiz]:
+        """
+        Build a snapshot from the database.
+
+        Loads the quiz, its questions, options, feedback and rubrics with
+        five queries regardless of quiz size.
+        """
+        from app.schemas.quiz import Quiz as QuizSchema
+
+        quiz = (
+            db.query(Quiz)
+            .options(selectinload(Quiz.questions).selectinload(Question.options))
+            .filter(Quiz.id == quiz_id)
+            .first()
+        )
+        if quiz is None:
+            return None
+
+        question_ids = [q.id for q in quiz.questions]
+        feedback_by_question: Dict[int, Dict[str, Any]] = {}
+        rubrics_by_question: Dict[int, List[Dict[str, Any]]] = {}
+        if question_ids:
+            for feedback in (
+                db.query(QuizFeedback)
+                .filter(QuizFeedback.question_id.in_(question_ids))
+                .order_by(QuizFeedback.id)
+            ):
+                feedback_by_question.setdefault(feedback.question_id, _feedback_dict(feedback))
+            for rubric in (
+                db.query(AssessmentRubric)
+                .filter(AssessmentRubric.question_id.in_(question_ids))
+                .order_by(AssessmentRubric.order_index)
+            ):
+                rubrics_by_question.setdefault(rubric.question_id, []).append(
+                    _rubric_dict(rubric)
+                )
+
+        quiz_payload = QuizSchema.model_validate(quiz).model_dump(mode="json")
+        question_payloads = [
+            {
+                **payload,
+                "feedback": feedback_by_question.get(payload["id"]),
+                "rubrics": rubrics_by_question.get(payload["id"], []),
+            }
+            for payload in quiz_payload["questions"]
+        ]
+
+        questions = {}
+        for q in quiz.questions:
+            correct = [o for o in q.options if o.is_correct]
+            questions[q.id] = CompiledQuestion(
+                id=q.id,
+                type=q.type.value if isinstance(q.type, QuestionType) else q.type,
+                points=float(q.points or 0),
+                explanation=q.explanation,
+                option_ids=frozenset(o.id for o in q.options),
+                correct_option_ids=tuple(o.id for o in correct),
+                accepted_texts=tuple(_normalize(o.text) for o in correct),
+                feedback=feedback_by_question.get(q.id),
+            )
+
+        return CompiledQuiz(
+            quiz_id=quiz.id,
+            version=version,
+            settings={field: getattr(quiz, field) for field in SETTINGS_FIELDS},
+            quiz_payload=quiz_payload,
+            question_payloads=tuple(question_payloads),
+            questions=questions,
+        )
+
+    def get(self, db: Session, quiz_id: int) -> Optional[CompiledQuiz]:
+        """
+        Get the current snapshot of a quiz.
+
+        Returns:
+            The compiled quiz, or None if the quiz doesn't exist
+        """
+        redis = get_redis()
+        version = None
+        if redis is not None:
+            try:
+                version = int(redis.get(VERSION_KEY.format(quiz_id=quiz_id)) or 0)
+            except RedisError as e:
+                logger.warning(f"Quiz version lookup failed: {e}")
+                redis = None
+        if redis is None:
+            version = self._local_versions.get(quiz_id, 0)
+
+        cached = self._local.get(quiz_id)
+        if cached is not None:
+            compiled, cached_at = cached
+            fresh = redis is not None or time.monotonic() - cached_at < LOCAL_TTL_SECONDS
+            if compiled.version == version and fresh:
+                return compiled
+
+        snapshot_key = SNAPSHOT_KEY.format(quiz_id=quiz_id, version=version)
+        compiled = None
+        if redis is not None:
+            try:
+                raw = redis.get(snapshot_key)
+                if raw:
+                    compiled = CompiledQuiz.from_json(raw)
+            except RedisError as e:
+                logger.warning(f"Quiz snapshot read failed: {e}")
+
+        if compiled is None:
+            compiled = self.compile(db, quiz_id, version)
+            if compiled is None:
+                return None
+            if redis is not None:
+                try:
+                    redis.set(snapshot_key, compiled.to_json(), ex=SNAPSHOT_TTL_SECONDS)
+                except RedisError as e:
+                    logger.warning(f"Quiz snapshot write failed: {e}")
+
+        with self._lock:
+            self._local[quiz_id] = (compiled, time.monotonic())
+        return compiled
+
+    def invalidate(self, quiz_ids: Iterable[int]):
+        """Bump the version of changed quizzes so every worker recompiles."""
+        quiz_ids = [qid for qid in set(quiz_ids) if qid is not None]
+        if not quiz_ids:
+            return
+
+        with self._lock:
+            for quiz_id in quiz_ids:
+                self._local.pop(quiz_id, None)
+                self._local_versions[quiz_id] = self._local_versions.get(quiz_id, 0) + 1
+
+        redis = get_redis()
+        if redis is None:
+            return
+        try:
+            pipe = redis.pipeline(transaction=False)
+            for quiz_id in quiz_ids:
+                pipe.incr(VERSION_KEY.format(quiz_id=quiz_id))
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Quiz snapshot invalidation failed: {e}")
+
+
+quiz_compiler = QuizCompiler()
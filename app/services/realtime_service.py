@@ -7,6 +7,7 @@ from typing import Dict, List
 from sqlalchemy.orm import Session
 from app.core.websocket import manager
 from app.models.notification import Notification, NotificationType, NotificationPriority
+from app.services.notification_dispatch import notification_dispatcher
 from datetime import datetime
 
 
@@ -218,21 +219,16 @@ class RealtimeService:
             grade: Grade received
             assignment_id: Assignment ID
         """
-        notification = Notification(
-            user_id=student_id,
-            type=NotificationType.ASSIGNMENT_GRADED,
+        notification_dispatcher.dispatch(
+            db,
+            [student_id],
+            NotificationType.ASSIGNMENT_GRADED,
             title="Assignment Graded",
             message=f"Your assignment '{assignment_title}' has been graded. Score: {grade}%",
             data={"assignment_id": assignment_id, "grade": grade},
             action_url=f"/lms/assignments/{assignment_id}",
             priority=NotificationPriority.HIGH,
         )
-        db.add(notification)
-        db.commit()
-        db.refresh(notification)
-
-        # Send via WebSocket
-        await RealtimeService.send_notification_realtime(db, student_id, notification)
 
     @staticmethod
     async def notify_live_class_starting(
@@ -252,24 +248,17 @@ class RealtimeService:
             class_id: Live class ID
             start_time: Start time
         """
-        for student_id in enrolled_student_ids:
-            notification = Notification(
-                user_id=student_id,
-                type=NotificationType.LIVE_CLASS_STARTING,
-                title="Live Class Starting Soon",
-                message=f"'{class_title}' is starting in 5 minutes",
-                data={"live_class_id": class_id, "start_time": start_time.isoformat()},
-                action_url=f"/lms/live-classes/{class_id}",
-                priority=NotificationPriority.URGENT,
-            )
-            db.add(notification)
-            db.commit()
-            db.refresh(notification)
-
-            # Send via WebSocket
-            await RealtimeService.send_notification_realtime(
-                db, student_id, notification
-            )
+        # One bulk insert and one delivery per batch (Celery for very large classes)
+        notification_dispatcher.dispatch(
+            db,
+            enrolled_student_ids,
+            NotificationType.LIVE_CLASS_STARTING,
+            title="Live Class Starting Soon",
+            message=f"'{class_title}' is starting in 5 minutes",
+            data={"live_class_id": class_id, "start_time": start_time.isoformat()},
+            action_url=f"/lms/live-classes/{class_id}",
+            priority=NotificationPriority.URGENT,
+        )
 
     @staticmethod
     def get_online_users_count(room: str) -> int:
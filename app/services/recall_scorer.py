@@ -0,0 +1,268 @@
+"""
+Recall Pre-Scorer
+
+Scores a student's recall against a segment's key points in process, before
+any LLM call. Each segment gets a TF-IDF index over its key points (cached
+by content hash), and a submission is compared point by point:
+
+- empty, off-topic or copied submissions are rejected locally
+- submissions that clearly cover the key points are scored locally
+- everything in between is escalated to the LLM
+
+The local ``recall_score`` also serves as the baseline when the AI path fails.
+Segments without key points are only checked for empty submissions.
+"""
+
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Set
+
+REJECT = "reject"
+ACCEPT = "accept"
+ESCALATE = "escalate"
+
+MIN_WORDS = 5
+OFF_TOPIC_SIMILARITY = 0.05
+COPY_RATIO = 0.8
+AUTO_ACCEPT_COVERAGE = 0.85
+POINT_SIMILARITY = 0.35
+POINT_TERM_RECALL = 0.6
+SHINGLE_SIZE = 5
+INDEX_CACHE_SIZE = 256
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    """
+    a about above after again against all also am an and any are as at be because
+    been before being below between both but by can could did do does doing down
+    during each few for from further had has have having he her here hers him his
+    how i if in into is it its itself just me more most my no nor not now of off on
+    once only or other our ours out over own same she should so some such than that
+    the their them then there these they this those through to too under until up
+    very was we were what when where which while who whom why will with would you
+    your yours
+    """.split()
+)
+
+_SUFFIXES = ("ations", "ation", "ments", "ment", "ness", "ings", "ing", "ies", "ed", "es", "s")
+
+
+def _stem(word: str) -> str:
+    """Very light suffix stripping so 'amendments' matches 'amendment'."""
+    for suffix in _SUFFIXES:
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            return word[: -len(suffix)] + ("y" if suffix == "ies" else "")
+    return word
+
+
+def words(text: str) -> List[str]:
+    return _WORD_RE.findall((text or "").lower())
+
+
+def terms(text: str) -> List[str]:
+    """Stemmed content words of a text."""
+    return [_stem(w) for w in words(text) if w not in STOPWORDS and len(w) > 1]
+
+
+def split_key_points(key_points: str) -> List[str]:
+    """Split a key-point block into individual points (bullets, lines or commas)."""
+    lines = [kp.strip() for kp in key_points.split("\n") if kp.strip().startswith("-")]
+    if not lines:
+        lines = [kp.strip() for kp in key_points.replace(";", ",").split(",") if kp.strip()]
+    if len(lines) <= 1 and "\n" in key_points:
+        lines = [kp.strip() for kp in key_points.split("\n") if kp.strip()]
+    return [line.lstrip("- ").strip() for line in lines if line.lstrip("- ").strip()]
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split source text (e.g. a PDF page) into sentence-sized points."""
+    parts = re.split(r"(?<=[.!?])\s+|\n{2,}|\n(?=[-•*\d])", text or "")
+    return [" ".join(p.split()) for p in parts if len(terms(p)) >= 2]
+
+
+def _shingles(tokens: Sequence[str]) -> Set[tuple]:
+    return {
+        tuple(tokens[i : i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)
+    }
+
+
+def _normalize(vector: Dict[str, float]) -> Dict[str, float]:
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    return {t: v / norm for t, v in vector.items()} if norm else {}
+
+
+def _cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(t, 0.0) for t, v in a.items())
+
+
+@dataclass
+class RecallPrescore:
+    """Outcome of local scoring."""
+
+    decision: str
+    recall_score: Optional[int]
+    coverage: float
+    similarity: float
+    copy_ratio: float
+    word_count: int
+    concepts_covered: List[str] = field(default_factory=list)
+    concepts_missed: List[str] = field(default_factory=list)
+    reason: str = ""
+
+    @property
+    def is_local(self) -> bool:
+        return self.decision != ESCALATE
+
+
+class SegmentIndex:
+    """TF-IDF index over one segment's key points."""
+
+    def __init__(self, points: Sequence[str], source_text: Optional[str] = None):
+        self.points = list(points)
+        point_terms = [terms(p) for p in self.points]
+        self._point_term_sets = [set(t) for t in point_terms]
+
+        # Each key point is a document; smoothed idf keeps shared terms non-zero
+        df = Counter(t for ts in self._point_term_sets for t in ts)
+        n = len(self.points)
+        self.idf = {t: math.log((1 + n) / (1 + d)) + 1.0 for t, d in df.items()}
+
+        self._point_vectors = [self._vectorize(t) for t in point_terms]
+        self._segment_vector = self._vectorize([t for ts in point_terms for t in ts])
+
+        self._source_shingles = _shingles(words(source_text or " ".join(self.points)))
+
+    def _vectorize(self, tokens: Sequence[str]) -> Dict[str, float]:
+        tf = Counter(t for t in tokens if t in self.idf)
+        return _normalize({t: (1 + math.log(c)) * self.idf[t] for t, c in tf.items()})
+
+    def score(self, response_text: Optional[str]) -> RecallPrescore:
+        """
+        Compare a submission with the key points.
+
+        Returns:
+            RecallPrescore with a reject/accept/escalate decision
+        """
+        response_words = words(response_text or "")
+        if len(response_words) < MIN_WORDS:
+            return RecallPrescore(
+                decision=REJECT,
+                recall_score=0,
+                coverage=0.0,
+                similarity=0.0,
+                copy_ratio=0.0,
+                word_count=len(response_words),
+                concepts_missed=list(self.points),
+                reason="empty",
+            )
+
+        if not self.points:
+            # Nothing to compare against; only the LLM can judge the topic
+            return RecallPrescore(
+                decision=ESCALATE,
+                recall_score=None,
+                coverage=0.0,
+                similarity=0.0,
+                copy_ratio=0.0,
+                word_count=len(response_words),
+                reason="no_key_points",
+            )
+
+        response_terms = terms(response_text)
+        response_term_set = set(response_terms)
+        response_vector = self._vectorize(response_terms)
+
+        covered, missed = [], []
+        for point, vector, point_terms in zip(
+            self.points, self._point_vectors, self._point_term_sets
+        ):
+            term_recall = (
+                len(point_terms & response_term_set) / len(point_terms) if point_terms else 0.0
+            )
+            if _cosine(vector, response_vector) >= POINT_SIMILARITY or term_recall >= POINT_TERM_RECALL:
+                covered.append(point)
+            else:
+                missed.append(point)
+
+        coverage = len(covered) / len(self.points) if self.points else 0.0
+        similarity = _cosine(self._segment_vector, response_vector)
+
+        response_shingles = _shingles(response_words)
+        copy_ratio = (
+            len(response_shingles & self._source_shingles) / len(response_shingles)
+            if response_shingles
+            else 0.0
+        )
+
+        # Mirrors the LLM rubric: base score tracks key-point coverage
+        recall_score = min(98, round(coverage * 100))
+
+        if copy_ratio >= COPY_RATIO:
+            decision, reason, recall_score = REJECT, "copied", 0
+        elif not covered and similarity < OFF_TOPIC_SIMILARITY:
+            decision, reason, recall_score = REJECT, "off_topic", 0
+        elif coverage >= AUTO_ACCEPT_COVERAGE:
+            decision, reason = ACCEPT, "covered"
+        else:
+            decision, reason = ESCALATE, "ambiguous"
+
+        return RecallPrescore(
+            decision=decision,
+            recall_score=recall_score,
+            coverage=round(coverage, 3),
+            similarity=round(similarity, 3),
+            copy_ratio=round(copy_ratio, 3),
+            word_count=len(response_words),
+            concepts_covered=covered,
+            concepts_missed=missed,
+            reason=reason,
+        )
+
+
+class RecallScorer:
+    """Builds and caches segment indexes keyed by segment and content hash."""
+
+    def __init__(self, max_indexes: int = INDEX_CACHE_SIZE):
+        self._lock = threading.Lock()
+        self._indexes: "OrderedDict[str, SegmentIndex]" = OrderedDict()
+        self.max_indexes = max_indexes
+
+    def index(
+        self, segment_key: str, points: Sequence[str], source_text: Optional[str] = None
+    ) -> SegmentIndex:
+        digest = hashlib.sha1(
+            "\n".join([*points, "\x00", source_text or ""]).encode("utf-8")
+        ).hexdigest()
+        cache_key = f"{segment_key}:{digest}"
+        with self._lock:
+            index = self._indexes.get(cache_key)
+            if index is not None:
+                self._indexes.move_to_end(cache_key)
+                return index
+
+        index = SegmentIndex(points, source_text)
+        with self._lock:
+            self._indexes[cache_key] = index
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+        return index
+
+    def prescore(
+        self,
+        segment_key: str,
+        points: Sequence[str],
+        response_text: Optional[str],
+        source_text: Optional[str] = None,
+    ) -> RecallPrescore:
+        """Score a submission against a segment's key points."""
+        return self.index(segment_key, points, source_text).score(response_text)
+
+
+recall_scorer = RecallScorer()
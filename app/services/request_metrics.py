@@ -0,0 +1,175 @@
+"""
+Request metrics.
+
+Reporting and export of per-route request latency and status counts, plus
+log sampling for the request middleware:
+- Latency and statuses are recorded once per request, by the SQL
+  instrumentation middleware, into the per-route ``LatencySketch`` (a DDSketch
+  with a guaranteed relative error on every quantile) of
+  app.db.instrumentation; this module summarises and exports that store
+- ``LogSampler`` lets through a bounded number of request log lines per
+  second, always keeping server errors and slow requests; suppressed lines
+  are counted on the next line that is written
+"""
+
+import logging
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.db.instrumentation import LatencySketch, query_instrumentation
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99, 0.999)
+
+
+def _route_summary(latency: LatencySketch, statuses: Counter) -> Dict:
+    errors = sum(n for status, n in statuses.items() if status >= 500)
+    return {
+        "requests": latency.count,
+        "errors": errors,
+        "error_rate": round(errors / latency.count, 4) if latency.count else 0.0,
+        "statuses": {str(status): n for status, n in sorted(statuses.items())},
+        "latency_ms": {
+            "mean": _round(latency.mean),
+            **{f"p{_quantile_label(q)}": _round(latency.quantile(q)) for q in QUANTILES},
+            "max": _round(latency.max),
+        },
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+def _quantile_label(q: float) -> str:
+    return f"{q * 100:g}".replace(".", "")
+
+
+class LogSampler:
+    """Token bucket over request log lines."""
+
+    def __init__(
+        self,
+        rate_per_second: float = settings.REQUEST_LOG_RATE_PER_SECOND,
+        slow_ms: float = settings.SLOW_REQUEST_MS,
+    ):
+        self.rate = rate_per_second
+        self.slow_ms = slow_ms
+        self._tokens = rate_per_second
+        self._updated = time.monotonic()
+        self.suppressed = 0
+
+    def sample(self, status: int, duration_ms: float) -> Optional[int]:
+        """
+        Decide whether to log a request.
+
+        Returns:
+            None to skip the line, otherwise the number of lines suppressed
+            since the last one that was written
+        """
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+        if status >= 500 or duration_ms >= self.slow_ms:
+            pass
+        elif self._tokens >= 1:
+            self._tokens -= 1
+        else:
+            self.suppressed += 1
+            return None
+
+        suppressed, self.suppressed = self.suppressed, 0
+        return suppressed
+
+
+class RequestMetrics:
+    """Per-route latency and status report of this worker, with sampled request logs."""
+
+    def __init__(self, instrumentation=None):
+        self._instrumentation = instrumentation
+        self.started_at = time.time()
+        self.sampler = LogSampler()
+
+    @property
+    def instrumentation(self):
+        return self._instrumentation or query_instrumentation
+
+    def _routes(self) -> Dict[tuple, tuple]:
+        return {
+            tuple(route.split(" ", 1)): stats
+            for route, stats in self.instrumentation.route_latency().items()
+        }
+
+    def log(self, fields: Dict) -> None:
+        """Write a sampled request log line."""
+        status, duration_ms = fields["status_code"], fields["duration_ms"]
+        suppressed = self.sampler.sample(status, duration_ms)
+        if suppressed is None:
+            return
+        fields["sampled_out"] = suppressed
+        if status >= 500:
+            logger.error("Server error response", extra=fields)
+        elif duration_ms >= self.sampler.slow_ms:
+            logger.warning("Slow request detected", extra=fields)
+        elif status >= 400:
+            logger.warning("Client error response", extra=fields)
+        else:
+            logger.info("Request completed", extra=fields)
+
+    # ------------------------------------------------------------------
+    # Export
+    # ------------------------------------------------------------------
+
+    def summary(self, route: Optional[str] = None) -> Dict:
+        overall_latency, overall_statuses = LatencySketch(), Counter()
+        routes = []
+        for (method, path), (latency, statuses) in self._routes().items():
+            overall_latency.merge(latency)
+            overall_statuses.update(statuses)
+            if route is None or path == route:
+                routes.append({"method": method, "route": path, **_route_summary(latency, statuses)})
+        overall = _route_summary(overall_latency, overall_statuses)
+        routes.sort(key=lambda r: r["requests"], reverse=True)
+        uptime = time.time() - self.started_at
+        return {
+            "uptime_seconds": round(uptime, 1),
+            "requests_per_second": round(overall["requests"] / uptime, 3) if uptime else 0.0,
+            "overall": overall,
+            "routes": routes,
+        }
+
+    def prometheus(self) -> str:
+        """Latency quantiles and request counters in the Prometheus text format."""
+        lines: List[str] = [
+            "# HELP http_request_duration_ms Request latency by route.",
+            "# TYPE http_request_duration_ms summary",
+        ]
+        counters: List[str] = [
+            "# HELP http_requests_total Requests by route and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route), (latency, statuses) in sorted(self._routes().items()):
+            labels = f'method="{method}",route="{_escape(route)}"'
+            for q in QUANTILES:
+                value = latency.quantile(q)
+                lines.append(f'http_request_duration_ms{{{labels},quantile="{q}"}} {value:.3f}')
+            lines.append(f"http_request_duration_ms_sum{{{labels}}} {latency.total:.3f}")
+            lines.append(f"http_request_duration_ms_count{{{labels}}} {latency.count}")
+            for status, n in sorted(statuses.items()):
+                counters.append(f'http_requests_total{{{labels},status="{status}"}} {n}')
+        return "\n".join(lines + counters) + "\n"
+
+    def reset(self) -> None:
+        self.instrumentation.reset()
+        self.started_at = time.time()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+request_metrics = RequestMetrics()
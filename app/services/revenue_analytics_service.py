@@ -1,16 +1,20 @@
 """
 Advanced Revenue Analytics Service
 Revenue forecasting, trends, and comparative analysis
+
+Revenue figures come from the pre-aggregated revenue rollup
+(app.services.revenue_rollup); only customer lifetime value still reads orders.
 """
 
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta, date, timezone
 from typing import Dict, List, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 import statistics
 
-from app.models.order import Order, OrderStatus, OrderItem
+from app.models.order import Order, OrderStatus
 from app.models.course import Course
+from app.services.revenue_rollup import revenue_rollup
+from app.services.revenue_timeseries import DAY_NAMES, forecast
 
 
 class RevenueAnalyticsService:
@@ -28,34 +32,19 @@ class RevenueAnalyticsService:
         """
         Forecast future revenue based on historical trends.
 
-        Uses simple linear regression on historical data.
+        Uses weekly seasonal decomposition and Holt's exponential smoothing
+        over the gap-filled daily series from the revenue rollup.
         """
         # Get historical data (last 90 days)
         lookback_days = 90
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=lookback_days)
-
-        # Query revenue data
-        query = self.db.query(
-            func.date(Order.created_at).label("date"),
-            func.sum(Order.total).label("revenue"),
-        ).filter(Order.status == OrderStatus.COMPLETED, Order.created_at >= start_date)
-
-        if instructor_id:
-            # Join with courses to filter by instructor
-            query = (
-                query.join(OrderItem)
-                .join(Course)
-                .filter(Course.instructor_id == instructor_id)
-            )
+        end_date = datetime.now(timezone.utc).date()
+        start_date = end_date - timedelta(days=lookback_days - 1)
 
-        if course_id:
-            query = query.join(OrderItem).filter(OrderItem.course_id == course_id)
-
-        query = query.group_by(func.date(Order.created_at))
-        historical_data = query.all()
+        history = revenue_rollup.daily_series(
+            self.db, start_date, end_date, instructor_id, course_id
+        )
 
-        if len(historical_data) < 7:
+        if history.active_days() < 7:
             return {
                 "forecast_period_days": forecast_days,
                 "predicted_revenue": 0.0,
@@ -65,33 +54,23 @@ class RevenueAnalyticsService:
                 "message": "Not enough historical data for reliable forecast",
             }
 
-        # Extract daily revenues
-        daily_revenues = [float(row.revenue) for row in historical_data]
-
-        # Calculate trend using simple moving average
-        avg_daily_revenue = statistics.mean(daily_revenues)
+        # Days before the first sale are not history
+        series = history.trim_leading_zeros()
+        avg_daily_revenue = series.mean()
 
         # Calculate trend (last 30 days vs previous 30 days)
-        if len(daily_revenues) >= 60:
-            recent_avg = statistics.mean(daily_revenues[-30:])
-            previous_avg = statistics.mean(daily_revenues[-60:-30])
+        if len(series) >= 60:
+            recent_avg = series.tail(30).mean()
+            previous_avg = series.tail(60).slice(end=series.end - timedelta(days=30)).mean()
             growth_rate = (
                 (recent_avg - previous_avg) / previous_avg if previous_avg > 0 else 0
             )
         else:
-            recent_avg = avg_daily_revenue
             growth_rate = 0
 
-        # Forecast using recent average + growth
-        predicted_daily = recent_avg * (1 + growth_rate)
-        predicted_revenue = predicted_daily * forecast_days
-
-        # Calculate confidence interval (±20% based on std deviation)
-        std_dev = statistics.stdev(daily_revenues) if len(daily_revenues) > 1 else 0
-        confidence_range = std_dev * forecast_days
-
-        lower_bound = max(0, predicted_revenue - confidence_range)
-        upper_bound = predicted_revenue + confidence_range
+        prediction = forecast(series, forecast_days)
+        predicted_daily = prediction.total / forecast_days if forecast_days else 0.0
+        lower_bound, upper_bound = prediction.total_interval
 
         # Determine trend
         if growth_rate > 0.1:
@@ -103,35 +82,39 @@ class RevenueAnalyticsService:
 
         return {
             "forecast_period_days": forecast_days,
-            "predicted_revenue": round(predicted_revenue, 2),
+            "predicted_revenue": round(prediction.total, 2),
             "predicted_daily_avg": round(predicted_daily, 2),
             "confidence_interval": [round(lower_bound, 2), round(upper_bound, 2)],
             "trend": trend,
             "growth_rate": round(growth_rate * 100, 2),  # as percentage
             "historical_average": round(avg_daily_revenue, 2),
-            "historical_days": len(daily_revenues),
-            "breakdown_by_week": self._forecast_by_week(predicted_daily, forecast_days),
-        }
-
-    def _forecast_by_week(self, daily_avg: float, total_days: int) -> List[Dict]:
-        """Break down forecast into weekly predictions"""
-        weeks = []
-        remaining_days = total_days
-        week_num = 1
-
-        while remaining_days > 0:
-            days_in_week = min(7, remaining_days)
-            weeks.append(
+            "historical_days": len(series),
+            "breakdown_by_week": self._forecast_by_week(prediction.predicted),
+            "daily_forecast": [
                 {
-                    "week": week_num,
-                    "days": days_in_week,
-                    "predicted_revenue": round(daily_avg * days_in_week, 2),
+                    "date": str(prediction.start + timedelta(days=i)),
+                    "predicted_revenue": round(point, 2),
+                    "lower": round(prediction.lower[i], 2),
+                    "upper": round(prediction.upper[i], 2),
                 }
-            )
-            remaining_days -= 7
-            week_num += 1
+                for i, point in enumerate(prediction.predicted)
+            ],
+            "weekly_seasonality": {
+                DAY_NAMES[(series.start.weekday() + i) % 7]: round(value, 2)
+                for i, value in enumerate(prediction.seasonality)
+            },
+        }
 
-        return weeks
+    def _forecast_by_week(self, daily: List[float]) -> List[Dict]:
+        """Break down forecast into weekly predictions"""
+        return [
+            {
+                "week": i // 7 + 1,
+                "days": len(daily[i : i + 7]),
+                "predicted_revenue": round(sum(daily[i : i + 7]), 2),
+            }
+            for i in range(0, len(daily), 7)
+        ]
 
     def get_revenue_breakdown(
         self,
@@ -147,54 +130,18 @@ class RevenueAnalyticsService:
         if not end_date:
             end_date = datetime.now().date()
 
-        # Base query
-        query = self.db.query(Order).filter(
-            Order.status == OrderStatus.COMPLETED,
-            func.date(Order.created_at) >= start_date,
-            func.date(Order.created_at) <= end_date,
+        series = revenue_rollup.daily_series(
+            self.db, start_date, end_date, instructor_id=instructor_id
+        )
+        courses = revenue_rollup.by_course(
+            self.db, start_date, end_date, instructor_id=instructor_id
+        )
+        hours = revenue_rollup.hourly_profile(
+            self.db, start_date, end_date, instructor_id=instructor_id
         )
 
-        if instructor_id:
-            from app.models.order import OrderItem
-
-            query = (
-                query.join(OrderItem)
-                .join(Course)
-                .filter(Course.instructor_id == instructor_id)
-            )
-
-        orders = query.all()
-
-        total_revenue = sum(order.total for order in orders)
-
-        # Breakdown by course
-        course_revenue = {}
-        for order in orders:
-            for item in order.items:
-                if item.course_id:
-                    course_name = item.item_name
-                    course_revenue[course_name] = (
-                        course_revenue.get(course_name, 0) + item.total
-                    )
-
-        # Breakdown by payment method (if available in future)
-        # For now, placeholder
-
-        # Breakdown by day of week
-        dow_revenue = {i: 0 for i in range(7)}  # 0=Monday, 6=Sunday
-        for order in orders:
-            dow = order.created_at.weekday()
-            dow_revenue[dow] += order.total
-
-        day_names = [
-            "Monday",
-            "Tuesday",
-            "Wednesday",
-            "Thursday",
-            "Friday",
-            "Saturday",
-            "Sunday",
-        ]
+        total_revenue = series.total()
+        order_count = series.order_count()
 
         return {
             "period": {
@@ -203,25 +150,74 @@ class RevenueAnalyticsService:
                 "days": (end_date - start_date).days + 1,
             },
             "total_revenue": round(total_revenue, 2),
-            "order_count": len(orders),
-            "average_order_value": round(total_revenue / len(orders), 2)
-            if orders
+            "order_count": order_count,
+            "average_order_value": round(total_revenue / order_count, 2)
+            if order_count
             else 0,
             "by_course": [
                 {
-                    "course": name,
-                    "revenue": round(rev, 2),
-                    "percentage": round(rev / total_revenue * 100, 2),
+                    "course": row["course"],
+                    "revenue": round(row["revenue"], 2),
+                    "percentage": round(row["revenue"] / total_revenue * 100, 2),
                 }
-                for name, rev in sorted(
-                    course_revenue.items(), key=lambda x: x[1], reverse=True
-                )
+                for row in courses
             ]
             if total_revenue > 0
             else [],
             "by_day_of_week": [
-                {"day": day_names[i], "revenue": round(rev, 2)}
-                for i, rev in dow_revenue.items()
+                {"day": DAY_NAMES[i], "revenue": round(rev, 2)}
+                for i, rev in enumerate(series.by_weekday())
+            ],
+            "by_hour_of_day": [
+                {"hour": hour, "revenue": round(rev, 2)} for hour, rev in enumerate(hours)
+            ],
+        }
+
+    def get_report_data(
+        self,
+        instructor_id: Optional[int] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+    ) -> Dict:
+        """
+        Revenue summary, monthly trend and top courses for PDF reports.
+        """
+        if not end_date:
+            end_date = datetime.now().date()
+        if not start_date:
+            start_date = end_date - timedelta(days=364)
+
+        series = revenue_rollup.daily_series(
+            self.db, start_date, end_date, instructor_id=instructor_id
+        )
+        courses = revenue_rollup.by_course(
+            self.db, start_date, end_date, instructor_id=instructor_id
+        )
+
+        total = series.total()
+        orders = series.order_count()
+        recent = series.tail(30).total()
+        previous = series.slice(
+            end_date - timedelta(days=59), end_date - timedelta(days=30)
+        ).total()
+
+        return {
+            "revenue_summary": {
+                "total": round(total, 2),
+                "monthly": round(recent, 2),
+                "growth_rate": round((recent - previous) / previous * 100, 1)
+                if previous
+                else 0.0,
+                "avg_order": round(total / orders, 2) if orders else 0.0,
+            },
+            "monthly_data": series.by_month(),
+            "top_courses": [
+                {
+                    "name": row["course"],
+                    "revenue": round(row["revenue"], 2),
+                    "enrollments": row["items"],
+                }
+                for row in courses[:10]
             ],
         }
 
@@ -314,26 +310,9 @@ class RevenueAnalyticsService:
         course_id: Optional[int] = None,
     ) -> float:
         """Helper to get revenue for a specific period"""
-        from app.models.order import OrderItem
-
-        query = self.db.query(func.sum(Order.total)).filter(
-            Order.status == OrderStatus.COMPLETED,
-            func.date(Order.created_at) >= start_date,
-            func.date(Order.created_at) <= end_date,
-        )
-
-        if instructor_id:
-            query = (
-                query.join(OrderItem)
-                .join(Course)
-                .filter(Course.instructor_id == instructor_id)
-            )
-
-        if course_id:
-            query = query.join(OrderItem).filter(OrderItem.course_id == course_id)
-
-        result = query.scalar()
-        return float(result) if result else 0.0
+        return revenue_rollup.daily_series(
+            self.db, start_date, end_date, instructor_id, course_id
+        ).total()
 
     def calculate_ltv(
         self, instructor_id: Optional[int] = None, lookback_days: int = 365
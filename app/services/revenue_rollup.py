@@ -0,0 +1,351 @@
+"""
+Revenue rollup.
+
+Keeps ``revenue_rollups`` (hourly buckets per course, per instructor and for
+the whole platform) in step with completed orders, and reads gap-filled daily
+series back out of it:
+- order completions, refunds/cancellations of completed orders and deletes
+  apply signed deltas in the same transaction (listener in app.models.order)
+- ``rebuild`` recomputes a date range from orders, for backfills and the
+  nightly reconciliation task
+
+Dashboards, CSV exports and PDF reports read the rollup instead of scanning
+orders.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.models.analytics import RevenueRollup
+from app.models.course import Course
+from app.models.order import Order, OrderItem, OrderStatus
+from app.services.revenue_timeseries import RevenueSeries
+
+logger = logging.getLogger(__name__)
+
+PLATFORM = 0  # course_id / instructor_id of platform rows
+
+# Deltas map (day, hour, course_id, instructor_id) to [revenue, orders, items]
+Bucket = Tuple[date, int, int, int]
+
+
+def bucket_time(created_at: Optional[datetime]) -> Tuple[date, int]:
+    """UTC (day, hour) bucket of an order timestamp."""
+    if created_at is None:
+        created_at = datetime.now(timezone.utc)
+    elif created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc)
+    return created_at.date(), created_at.hour
+
+
+def aggregate_orders(
+    orders: Iterable[Tuple[int, Optional[datetime], float]],
+    items: Iterable[Tuple[int, Optional[int], Optional[int], float, int]],
+    sign: int = 1,
+) -> Dict[Bucket, List[float]]:
+    """
+    Fold orders and their items into rollup deltas.
+
+    Args:
+        orders: (order_id, created_at, total) rows
+        items: (order_id, course_id, instructor_id, total, quantity) rows
+        sign: +1 for completions, -1 for reversals
+
+    Returns:
+        Mapping of bucket to [revenue, orders, items]
+    """
+    deltas: Dict[Bucket, List[float]] = defaultdict(lambda: [0.0, 0, 0])
+    buckets = {}
+    for order_id, created_at, total in orders:
+        day, hour = bucket_time(created_at)
+        buckets[order_id] = (day, hour)
+        row = deltas[(day, hour, PLATFORM, PLATFORM)]
+        row[0] += sign * float(total or 0.0)
+        row[1] += sign
+
+    seen = set()
+    for order_id, course_id, instructor_id, total, quantity in items:
+        if order_id not in buckets:
+            continue
+        day, hour = buckets[order_id]
+        deltas[(day, hour, PLATFORM, PLATFORM)][2] += sign * int(quantity or 1)
+        if not course_id:
+            continue
+        # Course row, plus the instructor's total row when the course has one
+        keys = [(course_id, instructor_id or PLATFORM)]
+        if instructor_id:
+            keys.append((PLATFORM, instructor_id))
+        for key in keys:
+            row = deltas[(day, hour, *key)]
+            row[0] += sign * float(total or 0.0)
+            row[2] += sign * int(quantity or 1)
+            # Orders are counted once per row even with several matching items
+            if (order_id, key) not in seen:
+                seen.add((order_id, key))
+                row[1] += sign
+    return dict(deltas)
+
+
+class RevenueRollupService:
+    """Maintains and queries the revenue rollup."""
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def apply(self, connection, deltas: Dict[Bucket, List[float]]) -> None:
+        """Add deltas to their buckets with one upsert per bucket."""
+        if not deltas:
+            return
+        rows = [
+            {
+                "day": day,
+                "hour": hour,
+                "course_id": course_id,
+                "instructor_id": instructor_id,
+                "revenue": revenue,
+                "orders": orders,
+                "items": items,
+            }
+            for (day, hour, course_id, instructor_id), (revenue, orders, items) in deltas.items()
+        ]
+
+        table = RevenueRollup.__table__
+        dialect = connection.dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            insert = pg_insert if dialect == "postgresql" else sqlite_insert
+            for row in rows:
+                stmt = insert(table).values(**row)
+                connection.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=["day", "hour", "course_id", "instructor_id"],
+                        set_={
+                            "revenue": table.c.revenue + stmt.excluded.revenue,
+                            "orders": table.c.orders + stmt.excluded.orders,
+                            "items": table.c["items"] + stmt.excluded["items"],
+                        },
+                    )
+                )
+            return
+
+        for row in rows:
+            result = connection.execute(
+                update(table)
+                .where(
+                    table.c.day == row["day"],
+                    table.c.hour == row["hour"],
+                    table.c.course_id == row["course_id"],
+                    table.c.instructor_id == row["instructor_id"],
+                )
+                .values(
+                    revenue=table.c.revenue + row["revenue"],
+                    orders=table.c.orders + row["orders"],
+                    items=table.c["items"] + row["items"],
+                )
+            )
+            if not result.rowcount:
+                connection.execute(table.insert().values(**row))
+
+    def order_deltas(
+        self,
+        connection,
+        order_ids: Sequence[int],
+        sign: int,
+    ) -> Dict[Bucket, List[float]]:
+        """Deltas for orders already written to the database."""
+        if not order_ids:
+            return {}
+        orders = connection.execute(
+            select(Order.id, Order.created_at, Order.total).where(Order.id.in_(order_ids))
+        ).all()
+        items = connection.execute(
+            select(
+                OrderItem.order_id,
+                OrderItem.course_id,
+                Course.instructor_id,
+                OrderItem.total,
+                OrderItem.quantity,
+            )
+            .outerjoin(Course, Course.id == OrderItem.course_id)
+            .where(OrderItem.order_id.in_(order_ids))
+        ).all()
+        return aggregate_orders(orders, items, sign)
+
+    def deleted_order_deltas(self, connection, orders: Sequence[Order]) -> Dict[Bucket, List[float]]:
+        """Negative deltas for completed orders deleted in the current flush."""
+        course_ids = {i.course_id for o in orders for i in o.items if i.course_id}
+        instructors = dict(
+            connection.execute(
+                select(Course.id, Course.instructor_id).where(Course.id.in_(course_ids))
+            ).all()
+        ) if course_ids else {}
+        return aggregate_orders(
+            [(o.id, o.created_at, o.total) for o in orders],
+            [
+                (o.id, i.course_id, instructors.get(i.course_id), i.total, i.quantity)
+                for o in orders
+                for i in o.items
+            ],
+            sign=-1,
+        )
+
+    def rebuild(
+        self,
+        db: Session,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+    ) -> int:
+        """
+        Recompute rollup rows for [start, end] (all time when omitted) from orders.
+
+        Returns:
+            Number of buckets written
+        """
+        table = RevenueRollup.__table__
+        delete = table.delete()
+        order_filter = [Order.status == OrderStatus.COMPLETED]
+        if start:
+            delete = delete.where(table.c.day >= start)
+            order_filter.append(
+                Order.created_at >= datetime.combine(start, time.min)
+            )
+        if end:
+            delete = delete.where(table.c.day <= end)
+            order_filter.append(
+                Order.created_at
+                < datetime.combine(end + timedelta(days=1), time.min)
+            )
+
+        orders = db.execute(
+            select(Order.id, Order.created_at, Order.total).where(*order_filter)
+        ).all()
+        items = db.execute(
+            select(
+                OrderItem.order_id,
+                OrderItem.course_id,
+                Course.instructor_id,
+                OrderItem.total,
+                OrderItem.quantity,
+            )
+            .join(Order, Order.id == OrderItem.order_id)
+            .outerjoin(Course, Course.id == OrderItem.course_id)
+            .where(*order_filter)
+        ).all()
+
+        deltas = aggregate_orders(orders, items)
+        connection = db.connection()
+        connection.execute(delete)
+        self.apply(connection, deltas)
+        db.commit()
+        return len(deltas)
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _scope(query, instructor_id: Optional[int], course_id: Optional[int]):
+        """Restrict to the course rows, an instructor's total rows or platform rows."""
+        query = query.where(RevenueRollup.course_id == (course_id or PLATFORM))
+        if instructor_id:
+            return query.where(RevenueRollup.instructor_id == instructor_id)
+        if not course_id:
+            query = query.where(RevenueRollup.instructor_id == PLATFORM)
+        return query
+
+    def daily_series(
+        self,
+        db: Session,
+        start: date,
+        end: date,
+        instructor_id: Optional[int] = None,
+        course_id: Optional[int] = None,
+    ) -> RevenueSeries:
+        """
+        Gap-filled daily revenue over [start, end].
+
+        Without filters this is platform revenue (order totals); with an
+        instructor or course it is item revenue of the matching courses.
+        """
+        query = self._scope(
+            select(
+                RevenueRollup.day,
+                func.sum(RevenueRollup.revenue),
+                func.sum(RevenueRollup.orders),
+            ).where(RevenueRollup.day >= start, RevenueRollup.day <= end),
+            instructor_id,
+            course_id,
+        ).group_by(RevenueRollup.day)
+        return RevenueSeries.from_points(start, end, db.execute(query).all())
+
+    def hourly_profile(
+        self,
+        db: Session,
+        start: date,
+        end: date,
+        instructor_id: Optional[int] = None,
+        course_id: Optional[int] = None,
+    ) -> List[float]:
+        """Revenue per UTC hour of day over [start, end]."""
+        query = self._scope(
+            select(RevenueRollup.hour, func.sum(RevenueRollup.revenue)).where(
+                RevenueRollup.day >= start, RevenueRollup.day <= end
+            ),
+            instructor_id,
+            course_id,
+        ).group_by(RevenueRollup.hour)
+        hours = [0.0] * 24
+        for hour, revenue in db.execute(query).all():
+            hours[hour] += float(revenue or 0.0)
+        return hours
+
+    def by_course(
+        self,
+        db: Session,
+        start: date,
+        end: date,
+        instructor_id: Optional[int] = None,
+        course_id: Optional[int] = None,
+    ) -> List[Dict]:
+        """Revenue, orders and items per course over [start, end], highest first."""
+        query = (
+            select(
+                RevenueRollup.course_id,
+                Course.title,
+                func.sum(RevenueRollup.revenue).label("revenue"),
+                func.sum(RevenueRollup.orders),
+                func.sum(RevenueRollup.items),
+            )
+            .outerjoin(Course, Course.id == RevenueRollup.course_id)
+            .where(
+                RevenueRollup.day >= start,
+                RevenueRollup.day <= end,
+                RevenueRollup.course_id != PLATFORM,
+            )
+            .group_by(RevenueRollup.course_id, Course.title)
+            .order_by(func.sum(RevenueRollup.revenue).desc())
+        )
+        if instructor_id:
+            query = query.where(RevenueRollup.instructor_id == instructor_id)
+        if course_id:
+            query = query.where(RevenueRollup.course_id == course_id)
+        return [
+            {
+                "course_id": cid,
+                "course": title or f"Course {cid}",
+                "revenue": float(revenue or 0.0),
+                "orders": int(orders or 0),
+                "items": int(items or 0),
+            }
+            for cid, title, revenue, orders, items in db.execute(query).all()
+        ]
+
+
+revenue_rollup = RevenueRollupService()
@@ -0,0 +1,228 @@
+"""
+Revenue time series.
+
+Gap-filled daily revenue series built from the revenue rollup, with O(1)
+range slicing, calendar breakdowns and forecasting:
+- additive weekly seasonal decomposition (centred moving average)
+- Holt's linear exponential smoothing on the deseasonalised series, with the
+  smoothing constants picked by a small grid search on one-step-ahead error
+- prediction intervals from the one-step residual variance, widened with the
+  horizon
+"""
+
+import math
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+SEASON_LENGTH = 7
+Z_95 = 1.96
+SMOOTHING_GRID = (0.1, 0.2, 0.3, 0.5, 0.7, 0.9)
+TREND_GRID = (0.01, 0.05, 0.1, 0.2, 0.3)
+
+DAY_NAMES = (
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+)
+
+
+@dataclass
+class RevenueSeries:
+    """Daily revenue and order counts from ``start``, one value per day."""
+
+    start: date
+    revenue: List[float] = field(default_factory=list)
+    orders: List[int] = field(default_factory=list)
+
+    @classmethod
+    def from_points(
+        cls,
+        start: date,
+        end: date,
+        points: Sequence[Tuple[date, float, int]],
+    ) -> "RevenueSeries":
+        """Gap-fill sparse (day, revenue, orders) points over [start, end]."""
+        days = max(0, (end - start).days + 1)
+        revenue, orders = [0.0] * days, [0] * days
+        for day, amount, count in points:
+            i = (day - start).days
+            if 0 <= i < days:
+                revenue[i] += float(amount or 0.0)
+                orders[i] += int(count or 0)
+        return cls(start=start, revenue=revenue, orders=orders)
+
+    def __len__(self) -> int:
+        return len(self.revenue)
+
+    @property
+    def end(self) -> date:
+        return self.start + timedelta(days=len(self.revenue) - 1)
+
+    def slice(self, start: Optional[date] = None, end: Optional[date] = None) -> "RevenueSeries":
+        """Sub-series over [start, end], clipped to this series."""
+        lo = max(0, (start - self.start).days) if start else 0
+        hi = min(len(self), (end - self.start).days + 1) if end else len(self)
+        hi = max(lo, hi)
+        return RevenueSeries(
+            start=self.start + timedelta(days=lo),
+            revenue=self.revenue[lo:hi],
+            orders=self.orders[lo:hi],
+        )
+
+    def tail(self, days: int) -> "RevenueSeries":
+        """The last ``days`` days."""
+        return self.slice(self.end - timedelta(days=max(0, days - 1)))
+
+    def trim_leading_zeros(self) -> "RevenueSeries":
+        for i, value in enumerate(self.revenue):
+            if value:
+                return self.slice(self.start + timedelta(days=i))
+        return RevenueSeries(start=self.start)
+
+    def total(self) -> float:
+        return sum(self.revenue)
+
+    def order_count(self) -> int:
+        return sum(self.orders)
+
+    def active_days(self) -> int:
+        return sum(1 for value in self.revenue if value)
+
+    def mean(self) -> float:
+        return self.total() / len(self) if len(self) else 0.0
+
+    def by_weekday(self) -> List[float]:
+        totals = [0.0] * 7
+        weekday = self.start.weekday()
+        for i, value in enumerate(self.revenue):
+            totals[(weekday + i) % 7] += value
+        return totals
+
+    def by_month(self) -> List[Dict]:
+        months: Dict[str, float] = {}
+        for i, value in enumerate(self.revenue):
+            key = (self.start + timedelta(days=i)).strftime("%Y-%m")
+            months[key] = months.get(key, 0.0) + value
+        return [{"month": k, "revenue": round(v, 2)} for k, v in months.items()]
+
+
+# ----------------------------------------------------------------------
+# Forecasting
+# ----------------------------------------------------------------------
+
+
+def seasonal_indices(values: Sequence[float], period: int = SEASON_LENGTH) -> List[float]:
+    """
+    Additive seasonal component per phase, aligned so index 0 is values[0].
+
+    Returns all zeros when there are fewer than two full seasons.
+    """
+    n = len(values)
+    if n < 2 * period:
+        return [0.0] * period
+
+    half = period // 2
+    deviations: List[List[float]] = [[] for _ in range(period)]
+    window = sum(values[:period])
+    for centre in range(half, n - half):
+        if centre > half:
+            window += values[centre + half] - values[centre - half - 1]
+        deviations[centre % period].append(values[centre] - window / period)
+
+    indices = [sum(d) / len(d) if d else 0.0 for d in deviations]
+    mean = sum(indices) / period
+    return [i - mean for i in indices]
+
+
+def _holt(values: Sequence[float], alpha: float, beta: float) -> Tuple[float, float, float]:
+    """Run Holt's method; returns (level, trend, sum of squared one-step errors)."""
+    level, trend = values[0], (values[1] - values[0]) if len(values) > 1 else 0.0
+    sse = 0.0
+    for value in values[1:]:
+        predicted = level + trend
+        error = value - predicted
+        sse += error * error
+        new_level = alpha * value + (1 - alpha) * predicted
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        level = new_level
+    return level, trend, sse
+
+
+@dataclass
+class Forecast:
+    """Daily forecast with 95% intervals."""
+
+    start: date
+    predicted: List[float]
+    lower: List[float]
+    upper: List[float]
+    total: float
+    total_interval: Tuple[float, float]
+    level: float
+    trend: float
+    alpha: float
+    beta: float
+    seasonality: List[float]
+
+
+def forecast(series: RevenueSeries, horizon: int, period: int = SEASON_LENGTH) -> Forecast:
+    """
+    Forecast the next ``horizon`` days of a series.
+
+    Args:
+        series: Gap-filled history (at least two days)
+        horizon: Days to forecast
+        period: Season length in days
+
+    Returns:
+        Forecast starting the day after the series ends
+    """
+    values = series.revenue
+    n = len(values)
+    seasonal = seasonal_indices(values, period)
+    adjusted = [v - seasonal[i % period] for i, v in enumerate(values)]
+
+    best = None
+    for alpha in SMOOTHING_GRID:
+        for beta in TREND_GRID:
+            level, trend, sse = _holt(adjusted, alpha, beta)
+            if best is None or sse < best[0]:
+                best = (sse, alpha, beta, level, trend)
+    sse, alpha, beta, level, trend = best
+    sigma = math.sqrt(sse / max(1, n - 1))
+
+    predicted, lower, upper = [], [], []
+    total_variance = 0.0
+    for h in range(1, horizon + 1):
+        point = max(0.0, level + h * trend + seasonal[(n - 1 + h) % period])
+        # Holt's h-step variance: sigma^2 * (1 + sum_{j<h} (alpha * (1 + j * beta))^2)
+        variance = sigma * sigma * (
+            1 + sum((alpha * (1 + j * beta)) ** 2 for j in range(1, h))
+        )
+        spread = Z_95 * math.sqrt(variance)
+        predicted.append(point)
+        lower.append(max(0.0, point - spread))
+        upper.append(point + spread)
+        total_variance += variance
+
+    # Treats daily errors as independent, so the period interval is approximate
+    total = sum(predicted)
+    spread = Z_95 * math.sqrt(total_variance)
+    return Forecast(
+        start=series.end + timedelta(days=1),
+        predicted=predicted,
+        lower=lower,
+        upper=upper,
+        total=total,
+        total_interval=(max(0.0, total - spread), total + spread),
+        level=level,
+        trend=trend,
+        alpha=alpha,
+        beta=beta,
+        seasonality=seasonal,
+    )
@@ -3,13 +3,18 @@ SAML Service for Enterprise SSO
 
 Implements SAML 2.0 authentication flow for enterprise single sign-on.
 Handles SAML login, assertion processing, logout, and metadata generation.
+
+Settings are compiled (certificates parsed, structure validated) once per
+SSOConfig version and shared by every request for that configuration.
 """
 
 from onelogin.saml2.auth import OneLogin_Saml2_Auth
 from onelogin.saml2.settings import OneLogin_Saml2_Settings
+from dataclasses import dataclass
 from typing import Dict, Optional, Tuple
 from datetime import datetime
 import logging
+import threading
 
 from app.models.sso import SSOConfig
 from app.core.config import settings
@@ -35,7 +40,8 @@ class SAMLService:
         """
         self.config = sso_config
         self.request_data = request_data or {}
-        self.saml_settings = self._build_saml_settings()
+        self._compiled = saml_settings_cache.get(sso_config)
+        self.saml_settings = self._compiled.settings
 
     def _build_saml_settings(self) -> Dict:
         """
@@ -44,56 +50,7 @@ class SAMLService:
         Returns:
             Dictionary compatible with OneLogin_Saml2_Settings
         """
-        # Base URL for this service provider
-        base_url = settings.BASE_URL or "http://localhost:8000"
-        acs_url = f"{base_url}/api/v1/sso/saml/acs"
-        sls_url = f"{base_url}/api/v1/sso/saml/sls"
-
-        saml_settings = {
-            "strict": True,
-            "debug": settings.DEBUG,
-            "sp": {
-                "entityId": self.config.entity_id or f"{base_url}/saml/metadata",
-                "assertionConsumerService": {
-                    "url": acs_url,
-                    "binding": "urn:oasis:names:tc:SAML:2.0:bindings:HTTP-POST",
-                },
-                "singleLogoutService": {
-                    "url": sls_url,
-                    "binding": "urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect",
-                },
-                "NameIDFormat": "urn:oasis:names:tc:SAML:1.1:nameid-format:emailAddress",
-                "x509cert": "",  # SP certificate (optional for encryption)
-                "privateKey": "",  # SP private key (optional for encryption)
-            },
-            "idp": {
-                "entityId": self.config.idp_entity_id,
-                "singleSignOnService": {
-                    "url": self.config.sso_url,
-                    "binding": "urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect",
-                },
-                "singleLogoutService": {
-                    "url": self.config.slo_url or "",
-                    "binding": "urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect",
-                },
-                "x509cert": self.config.x509_cert,
-            },
-            "security": {
-                "nameIdEncrypted": False,
-                "authnRequestsSigned": False,
-                "logoutRequestSigned": False,
-                "logoutResponseSigned": False,
-                "signMetadata": False,
-                "wantMessagesSigned": False,
-                "wantAssertionsSigned": True,
-                "wantNameIdEncrypted": False,
-                "requestedAuthnContext": True,
-                "signatureAlgorithm": "http://www.w3.org/2001/04/xmldsig-more#rsa-sha256",
-                "digestAlgorithm": "http://www.w3.org/2001/04/xmlenc#sha256",
-            },
-        }
-
-        return saml_settings
+        return build_saml_settings(self.config)
 
     def get_login_url(self, return_to: Optional[str] = None) -> str:
         """
@@ -284,15 +241,18 @@ class SAMLService:
         Returns:
             SAML metadata XML string
         """
-        settings_obj = OneLogin_Saml2_Settings(self.saml_settings)
-        metadata = settings_obj.get_sp_metadata()
+        compiled = self._compiled
+        if compiled.sp_metadata is None:
+            metadata = self.saml_settings.get_sp_metadata()
+
+            errors = self.saml_settings.validate_metadata(metadata)
+            if errors:
+                logger.error(f"Invalid SP metadata: {errors}")
+                raise ValueError(f"Invalid metadata: {errors}")
 
-        errors = settings_obj.validate_metadata(metadata)
-        if errors:
-            logger.error(f"Invalid SP metadata: {errors}")
-            raise ValueError(f"Invalid metadata: {errors}")
+            compiled.sp_metadata = metadata
 
-        return metadata
+        return compiled.sp_metadata
 
     def validate_certificate(self) -> Tuple[bool, Optional[datetime]]:
         """
@@ -301,30 +261,150 @@ class SAMLService:
         Returns:
             Tuple of (is_valid, expiry_date)
         """
-        try:
-            from cryptography import x509
-            from cryptography.hazmat.backends import default_backend
-            import base64
+        expiry = self._compiled.certificate_expiry
+        if expiry is None:
+            return False, None
 
-            # Parse certificate
-            cert_text = self.config.x509_cert
-            cert_bytes = base64.b64decode(cert_text)
-            cert = x509.load_der_x509_certificate(cert_bytes, default_backend())
+        # Check expiration
+        is_valid = datetime.utcnow() < expiry
 
-            # Check expiration
-            expiry = cert.not_valid_after
-            now = datetime.utcnow()
+        if not is_valid:
+            logger.warning(f"IdP certificate expired on {expiry}")
 
-            is_valid = now < expiry
+        return is_valid, expiry
 
-            if not is_valid:
-                logger.warning(f"IdP certificate expired on {expiry}")
 
-            return is_valid, expiry
+def build_saml_settings(config: SSOConfig) -> Dict:
+    """
+    Build SAML settings dict from SSOConfig.
 
-        except Exception as e:
-            logger.error(f"Error validating certificate: {e}")
-            return False, None
+    Returns:
+        Dictionary compatible with OneLogin_Saml2_Settings
+    """
+    # Base URL for this service provider
+    base_url = settings.BASE_URL or "http://localhost:8000"
+    acs_url = f"{base_url}/api/v1/sso/saml/acs"
+    sls_url = f"{base_url}/api/v1/sso/saml/sls"
+
+    saml_settings = {
+        "strict": True,
+        "debug": settings.DEBUG,
+        "sp": {
+            "entityId": config.entity_id or f"{base_url}/saml/metadata",
+            "assertionConsumerService": {
+                "url": acs_url,
+                "binding": "urn:oasis:names:tc:SAML:2.0:bindings:HTTP-POST",
+            },
+            "singleLogoutService": {
+                "url": sls_url,
+                "binding": "urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect",
+            },
+            "NameIDFormat": "urn:oasis:names:tc:SAML:1.1:nameid-format:emailAddress",
+            "x509cert": "",  # SP certificate (optional for encryption)
+            "privateKey": "",  # SP private key (optional for encryption)
+        },
+        "idp": {
+            "entityId": config.idp_entity_id,
+            "singleSignOnService": {
+                "url": config.sso_url,
+                "binding": "urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect",
+            },
+            "singleLogoutService": {
+                "url": config.slo_url or "",
+                "binding": "urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect",
+            },
+            "x509cert": config.x509_cert,
+        },
+        "security": {
+            "nameIdEncrypted": False,
+            "authnRequestsSigned": False,
+            "logoutRequestSigned": False,
+            "logoutResponseSigned": False,
+            "signMetadata": False,
+            "wantMessagesSigned": False,
+            "wantAssertionsSigned": True,
+            "wantNameIdEncrypted": False,
+            "requestedAuthnContext": True,
+            "signatureAlgorithm": "http://www.w3.org/2001/04/xmldsig-more#rsa-sha256",
+            "digestAlgorithm": "http://www.w3.org/2001/04/xmlenc#sha256",
+        },
+    }
+
+    return saml_settings
+
+
+def _certificate_expiry(cert_text: Optional[str]) -> Optional[datetime]:
+    """Expiry of a base64 DER certificate, or None if it cannot be parsed."""
+    try:
+        from cryptography import x509
+        from cryptography.hazmat.backends import default_backend
+        import base64
+
+        cert_bytes = base64.b64decode(cert_text)
+        cert = x509.load_der_x509_certificate(cert_bytes, default_backend())
+        return cert.not_valid_after
+
+    except Exception as e:
+        logger.error(f"Error validating certificate: {e}")
+        return None
+
+
+@dataclass
+class CompiledSAMLSettings:
+    version: tuple
+    settings: OneLogin_Saml2_Settings
+    certificate_expiry: Optional[datetime]
+    sp_metadata: Optional[str] = None
+
+
+class SAMLSettingsCache:
+    """python3-saml settings compiled once per SSOConfig version."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # config id -> compiled settings
+        self._compiled: Dict[int, CompiledSAMLSettings] = {}
+
+    @staticmethod
+    def _version(config: SSOConfig) -> tuple:
+        # updated_at alone misses edits not yet flushed, so compare the inputs too
+        return (
+            config.updated_at,
+            config.entity_id,
+            config.idp_entity_id,
+            config.sso_url,
+            config.slo_url,
+            config.x509_cert,
+        )
+
+    def get(self, config: SSOConfig) -> CompiledSAMLSettings:
+        version = self._version(config)
+        if config.id is not None:
+            with self._lock:
+                cached = self._compiled.get(config.id)
+            if cached is not None and cached.version == version:
+                return cached
+
+        compiled = CompiledSAMLSettings(
+            version=version,
+            settings=OneLogin_Saml2_Settings(build_saml_settings(config)),
+            certificate_expiry=_certificate_expiry(config.x509_cert),
+        )
+        if config.id is not None:
+            with self._lock:
+                self._compiled[config.id] = compiled
+        return compiled
+
+    def invalidate(self, config_id: Optional[int] = None):
+        with self._lock:
+            if config_id is None:
+                self._compiled.clear()
+            else:
+                self._compiled.pop(config_id, None)
+
+
+# Singleton instance
+saml_settings_cache = SAMLSettingsCache()
 
 
 # Utility functions for SAML
@@ -472,9 +472,10 @@ class OAuthService:
         """
         Get user information from OAuth userinfo endpoint.
         """
-        import requests
+        from app.services.idp_metadata import sso_http
 
-        response = requests.get(
+        # Pooled connection instead of a new TLS handshake per login
+        response = sso_http.sync_client().get(
             config.userinfo_endpoint,
             headers={"Authorization": f"Bearer {access_token}"},
         )
@@ -7,6 +7,7 @@ recurring billing, and access control.
 
 from sqlalchemy.orm import Session
 from app.models.subscription import SubscriptionPlan, UserSubscription
+from app.services.entitlements import entitlements
 from decimal import Decimal
 from typing import Optional, List
 from datetime import datetime, timedelta
@@ -262,30 +263,8 @@ class SubscriptionService:
         Returns:
             True if access granted
         """
-        sub = (
-            db.query(UserSubscription)
-            .filter(
-                UserSubscription.user_id == user_id,
-                UserSubscription.status.in_(["active", "trial"]),
-            )
-            .first()
-        )
-
-        if not sub:
-            return False
-
-        # Check expiration
-        if sub.current_period_end and sub.current_period_end < datetime.utcnow():
-            # Should have been marked expired by background job, but handle here just in case
-            return False
-
-        # Level hierarchy
-        levels = {"limited": 1, "standard": 2, "premium": 3, "unlimited": 4}
-
-        user_level = levels.get(sub.plan.access_level, 0)
-        req_level = levels.get(required_level, 0)
-
-        return user_level >= req_level
+        # Cached and invalidated on subscription changes
+        return entitlements.has_subscription(db, user_id, required_level)
 
     @staticmethod
     def get_active_plans(db: Session) -> List[SubscriptionPlan]:
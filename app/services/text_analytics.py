@@ -0,0 +1,339 @@
+"""
+Text analytics.
+
+Readability metrics for lesson content, computed in batches:
+- each document is tokenized once (one regex pass yields words and sentence ends)
+- syllables come from a lookup of common irregular words, with a memoized
+  heuristic for everything else, so each distinct word is counted once per process
+- Flesch reading ease, Flesch-Kincaid grade, Gunning fog, SMOG and vocabulary
+  complexity are all derived from per-document counts
+
+Metrics are cached by content hash, per worker and in Redis
+(``text_metrics:{digest}``), so re-analysing a course only computes the
+lessons whose text changed.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from redis.exceptions import RedisError
+
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = "text_metrics:{digest}"
+METRICS_TTL_SECONDS = 7 * 24 * 3600
+LOCAL_CACHE_SIZE = 4096
+
+WORDS_PER_MINUTE = 200
+COMPLEX_WORD_LENGTH = 6
+DIFFICULT_TERM_LENGTH = 12
+MAX_DIFFICULT_TERMS = 10
+
+_TAG_RE = re.compile(r"<[^>]+>")
+# Words and runs of sentence terminators in a single pass
+_TOKEN_RE = re.compile(r"[A-Za-z0-9]+(?:['\-][A-Za-z0-9]+)*|[.!?]+")
+_VOWEL_GROUP_RE = re.compile(r"[aeiouy]+")
+
+# Words the vowel-group heuristic gets wrong
+SYLLABLE_LOOKUP: Dict[str, int] = {
+    "area": 3,
+    "being": 2,
+    "business": 2,
+    "create": 2,
+    "created": 3,
+    "every": 2,
+    "everything": 3,
+    "idea": 3,
+    "ideas": 3,
+    "poem": 2,
+    "quiet": 2,
+    "science": 2,
+    "scientific": 4,
+    "society": 4,
+    "recreate": 3,
+    "theory": 3,
+    "variety": 4,
+    "video": 3,
+    "videos": 3,
+    "via": 2,
+    "react": 2,
+    "reaction": 3,
+    "cooperate": 4,
+    "maybe": 2,
+    "naive": 2,
+    "lion": 2,
+    "diet": 2,
+    "client": 2,
+    "period": 3,
+    "material": 4,
+    "serious": 3,
+    "various": 3,
+    "previous": 3,
+    "radio": 3,
+    "ratio": 3,
+    "audio": 3,
+}
+
+
+@lru_cache(maxsize=65536)
+def _estimate_syllables(word: str) -> int:
+    syllables = len(_VOWEL_GROUP_RE.findall(word))
+    # Silent trailing 'e' ("make"), but not "-le" after a consonant ("table")
+    if word.endswith("e") and not (
+        word.endswith("le") and len(word) > 2 and word[-3] not in "aeiouy"
+    ):
+        syllables -= 1
+    return max(1, syllables)
+
+
+def count_syllables(word: str) -> int:
+    """Syllables in a lowercase word."""
+    return SYLLABLE_LOOKUP.get(word) or _estimate_syllables(word)
+
+
+def clean_text(text: Optional[str]) -> str:
+    """Strip HTML tags."""
+    return _TAG_RE.sub(" ", text or "")
+
+
+def tokenize(text: Optional[str]) -> Tuple[Counter, int]:
+    """
+    Tokenize a document once.
+
+    Returns:
+        (word counts, sentence count); trailing text without a terminator
+        counts as a sentence
+    """
+    counts: Counter = Counter()
+    sentences = 0
+    open_sentence = False
+    for match in _TOKEN_RE.finditer(clean_text(text)):
+        token = match.group()
+        if token[0] in ".!?":
+            if open_sentence:
+                sentences += 1
+                open_sentence = False
+        else:
+            counts[token.lower()] += 1
+            open_sentence = True
+    if open_sentence:
+        sentences += 1
+    return counts, sentences
+
+
+def content_digest(text: Optional[str]) -> str:
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class TextMetrics:
+    """Counts for one document; every readability score derives from them."""
+
+    words: int = 0
+    sentences: int = 0
+    syllables: int = 0
+    characters: int = 0
+    complex_words: int = 0  # longer than COMPLEX_WORD_LENGTH characters
+    polysyllables: int = 0  # three or more syllables
+    difficult_terms: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_counts(cls, counts: Counter, sentences: int) -> "TextMetrics":
+        words = syllables = characters = complex_words = polysyllables = 0
+        difficult = []
+        for word, n in counts.items():
+            word_syllables = count_syllables(word)
+            words += n
+            syllables += n * word_syllables
+            characters += n * len(word)
+            if len(word) > COMPLEX_WORD_LENGTH:
+                complex_words += n
+            if word_syllables >= 3:
+                polysyllables += n
+            if len(word) > DIFFICULT_TERM_LENGTH:
+                difficult.append(word)
+        return cls(
+            words=words,
+            sentences=sentences,
+            syllables=syllables,
+            characters=characters,
+            complex_words=complex_words,
+            polysyllables=polysyllables,
+            difficult_terms=tuple(sorted(difficult)[:MAX_DIFFICULT_TERMS]),
+        )
+
+    @classmethod
+    def combine(cls, parts: Iterable["TextMetrics"]) -> "TextMetrics":
+        """Metrics of the concatenation of several documents (e.g. a whole course)."""
+        parts = list(parts)
+        terms = sorted({t for p in parts for t in p.difficult_terms})
+        return cls(
+            words=sum(p.words for p in parts),
+            sentences=sum(p.sentences for p in parts),
+            syllables=sum(p.syllables for p in parts),
+            characters=sum(p.characters for p in parts),
+            complex_words=sum(p.complex_words for p in parts),
+            polysyllables=sum(p.polysyllables for p in parts),
+            difficult_terms=tuple(terms[:MAX_DIFFICULT_TERMS]),
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, raw: str) -> "TextMetrics":
+        data = json.loads(raw)
+        data["difficult_terms"] = tuple(data.get("difficult_terms") or ())
+        return cls(**data)
+
+    def readability(self) -> Dict:
+        """
+        Readability scores in the shape DifficultyAnalyzerService stores.
+
+        Returns:
+            Dict of Flesch, Kincaid, fog, SMOG and complexity metrics
+        """
+        if not self.sentences or not self.words:
+            return {
+                "flesch_reading_ease": 100,
+                "flesch_kincaid_grade": 0,
+                "gunning_fog": 0,
+                "smog": 0,
+                "avg_sentence_length": 0,
+                "avg_word_length": 0,
+                "vocabulary_complexity": 0,
+                "reading_time": 0,
+            }
+
+        words_per_sentence = self.words / self.sentences
+        syllables_per_word = self.syllables / self.words
+
+        flesch = 206.835 - 1.015 * words_per_sentence - 84.6 * syllables_per_word
+        fk_grade = 0.39 * words_per_sentence + 11.8 * syllables_per_word - 15.59
+        fog = 0.4 * (words_per_sentence + 100 * self.polysyllables / self.words)
+        smog = 1.043 * math.sqrt(self.polysyllables * 30 / self.sentences) + 3.1291
+
+        return {
+            "flesch_reading_ease": round(max(0, min(100, flesch)), 2),
+            "flesch_kincaid_grade": round(max(0, fk_grade), 2),
+            "gunning_fog": round(fog, 2),
+            "smog": round(smog, 2),
+            "avg_sentence_length": round(words_per_sentence, 2),
+            "avg_word_length": round(self.characters / self.words, 2),
+            "vocabulary_complexity": round(self.complex_words / self.words * 100, 2),
+            "reading_time": max(1, round(self.words / WORDS_PER_MINUTE)),
+        }
+
+
+def compute_metrics(text: Optional[str]) -> TextMetrics:
+    """Metrics for one document, without caching."""
+    counts, sentences = tokenize(text)
+    return TextMetrics.from_counts(counts, sentences)
+
+
+class TextAnalytics:
+    """Batched readability analysis with a content-hash cache."""
+
+    def __init__(self, max_local: int = LOCAL_CACHE_SIZE):
+        self._lock = threading.Lock()
+        self._local: "OrderedDict[str, TextMetrics]" = OrderedDict()
+        self.max_local = max_local
+        self.computed = 0
+
+    def analyze(self, text: Optional[str]) -> TextMetrics:
+        return self.analyze_many([text])[0]
+
+    def analyze_many(self, texts: Sequence[Optional[str]]) -> List[TextMetrics]:
+        """
+        Analyse many documents in one call.
+
+        Identical texts are computed once, and texts seen before (in this worker
+        or, via Redis, in any worker) are not recomputed.
+
+        Args:
+            texts: Documents to analyse
+
+        Returns:
+            TextMetrics per document, in input order
+        """
+        digests = [content_digest(t) for t in texts]
+        found: Dict[str, TextMetrics] = {}
+
+        with self._lock:
+            for digest in digests:
+                metrics = self._local.get(digest)
+                if metrics is not None:
+                    self._local.move_to_end(digest)
+                    found[digest] = metrics
+
+        missing = [d for d in dict.fromkeys(digests) if d not in found]
+        if missing:
+            found.update(self._load_shared(missing))
+
+        to_compute = {d: t for d, t in zip(digests, texts) if d not in found}
+        if to_compute:
+            computed = {d: compute_metrics(t) for d, t in to_compute.items()}
+            self.computed += len(computed)
+            found.update(computed)
+            self._store_shared(computed)
+
+        with self._lock:
+            for digest in missing:
+                self._local[digest] = found[digest]
+                self._local.move_to_end(digest)
+            while len(self._local) > self.max_local:
+                self._local.popitem(last=False)
+
+        return [found[d] for d in digests]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._local.clear()
+
+    # ------------------------------------------------------------------
+    # Redis
+    # ------------------------------------------------------------------
+
+    def _load_shared(self, digests: List[str]) -> Dict[str, TextMetrics]:
+        redis = get_redis()
+        if redis is None:
+            return {}
+        try:
+            raw = redis.mget([METRICS_KEY.format(digest=d) for d in digests])
+        except RedisError as e:
+            logger.warning(f"Failed to load text metrics from Redis: {e}")
+            return {}
+
+        loaded = {}
+        for digest, value in zip(digests, raw):
+            if value:
+                try:
+                    loaded[digest] = TextMetrics.from_json(value)
+                except (TypeError, ValueError):
+                    continue
+        return loaded
+
+    def _store_shared(self, metrics: Dict[str, TextMetrics]) -> None:
+        redis = get_redis()
+        if redis is None:
+            return
+        try:
+            pipe = redis.pipeline(transaction=False)
+            for digest, value in metrics.items():
+                pipe.setex(METRICS_KEY.format(digest=digest), METRICS_TTL_SECONDS, value.to_json())
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Failed to store text metrics in Redis: {e}")
+
+
+text_analytics = TextAnalytics()
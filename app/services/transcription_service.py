@@ -156,7 +156,8 @@ Create the structured JSON document now:"""
             system_message=system_message,
             max_tokens=2000,
             temperature=0.3,
-            is_complex=True  # Analysis tasks are complex
+            is_complex=True,  # Analysis tasks are complex
+            feature="transcription_analysis"
         )
         
         content = result.get("content", "{}")
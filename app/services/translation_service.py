@@ -15,6 +15,7 @@ from app.schemas.translation import (
     TranslationUpdate,
     ContentTranslationCreate,
 )
+from app.services.i18n_catalogue import catalogues, user_languages
 from typing import Optional, List, Dict, Any
 import logging
 
@@ -29,7 +30,7 @@ class TranslationService:
         db: Session, key: str, language_code: str, namespace: str = "common"
     ) -> Optional[str]:
         """
-        Get translation for a key.
+        Get translation for a key from the in-memory catalogue.
 
         Args:
             db: Database session
@@ -40,24 +41,14 @@ class TranslationService:
         Returns:
             Translated value or None
         """
-        translation = (
-            db.query(Translation)
-            .filter(
-                Translation.key == key,
-                Translation.language_code == language_code,
-                Translation.namespace == namespace,
-            )
-            .first()
-        )
-
-        return translation.value if translation else None
+        return catalogues.get(db, language_code, namespace).get(key)
 
     @staticmethod
     def get_translations_by_namespace(
         db: Session, language_code: str, namespace: str = "common"
     ) -> Dict[str, str]:
         """
-        Get all translations for a namespace.
+        Get all translations for a namespace from the in-memory catalogue.
 
         Args:
             db: Database session
@@ -67,16 +58,7 @@ class TranslationService:
         Returns:
             Dictionary of key -> value
         """
-        translations = (
-            db.query(Translation)
-            .filter(
-                Translation.language_code == language_code,
-                Translation.namespace == namespace,
-            )
-            .all()
-        )
-
-        return {t.key: t.value for t in translations}
+        return dict(catalogues.get(db, language_code, namespace).entries)
 
     @staticmethod
     def create_translation(db: Session, translation: TranslationCreate) -> Translation:
@@ -94,6 +76,7 @@ class TranslationService:
         db.add(db_translation)
         db.commit()
         db.refresh(db_translation)
+        catalogues.changed(db_translation.language_code, db_translation.namespace)
         return db_translation
 
     @staticmethod
@@ -122,6 +105,7 @@ class TranslationService:
 
         db.commit()
         db.refresh(translation)
+        catalogues.changed(translation.language_code, translation.namespace)
         return translation
 
     @staticmethod
@@ -129,7 +113,7 @@ class TranslationService:
         db: Session, language_code: str, namespace: str, translations: Dict[str, str]
     ) -> int:
         """
-        Bulk create translations.
+        Bulk create translations, updating keys that already exist.
 
         Args:
             db: Database session
@@ -140,34 +124,34 @@ class TranslationService:
         Returns:
             Number of translations created
         """
-        count = 0
-        for key, value in translations.items():
-            # Check if translation already exists
-            existing = (
-                db.query(Translation)
-                .filter(
-                    Translation.key == key,
-                    Translation.language_code == language_code,
-                    Translation.namespace == namespace,
-                )
-                .first()
+        existing = {
+            t.key: t
+            for t in db.query(Translation).filter(
+                Translation.language_code == language_code,
+                Translation.namespace == namespace,
+                Translation.key.in_(list(translations)),
             )
+        }
 
-            if existing:
+        count = 0
+        for key, value in translations.items():
+            if key in existing:
                 # Update existing
-                existing.value = value
+                existing[key].value = value
             else:
                 # Create new
-                db_translation = Translation(
-                    key=key,
-                    language_code=language_code,
-                    value=value,
-                    namespace=namespace,
+                db.add(
+                    Translation(
+                        key=key,
+                        language_code=language_code,
+                        value=value,
+                        namespace=namespace,
+                    )
                 )
-                db.add(db_translation)
                 count += 1
 
         db.commit()
+        catalogues.changed(language_code, namespace)
         return count
 
 
@@ -395,4 +379,5 @@ class UserLanguageService:
 
         db.commit()
         db.refresh(preference)
+        user_languages.set(user_id, preference.preferred_language)
         return preference
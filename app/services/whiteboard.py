@@ -0,0 +1,513 @@
+"""
+Collaborative whiteboard sessions.
+
+Each whiteboard session keeps an append-only operation log instead of
+rebroadcasting and rewriting the whole board:
+- ``whiteboard:{session_id}``      hash with ``state`` (JSON snapshot) and ``seq`` (last folded op)
+- ``whiteboard:{session_id}:ops``  list of JSON ops appended since the snapshot
+- ``whiteboard:{session_id}:lock`` short-lived compaction lock
+
+Op sequence numbers are derived from the snapshot's ``seq`` and the op's
+position in the tail, read in the same transaction as the ``RPUSH``, so
+every worker agrees on the order. Once the tail reaches
+``COMPACT_EVERY`` ops it is folded into the snapshot, and late joiners get
+the folded board (snapshot + tail) in one ``init_state`` message.
+
+Ops are broadcast in batches, one message per animation frame, encoded
+once per wire format (JSON, or msgpack binary frames when the client asks
+for ``?encoding=msgpack`` and the package is installed). The board is
+written to ``LiveClass.whiteboard_data`` after ``WHITEBOARD_PERSIST_DELAY_SECONDS``
+without changes (at most ``PERSIST_MAX_DELAY_SECONDS`` after the first one)
+and when the last participant leaves. Without Redis the log lives in
+process memory.
+"""
+
+import asyncio
+import copy
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import WebSocket
+from redis.exceptions import RedisError
+from sqlalchemy import update
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.db.session import SessionLocal
+from app.models.live_class import LiveClass
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = "whiteboard:{session_id}"
+OPS_KEY = "whiteboard:{session_id}:ops"
+LOCK_KEY = "whiteboard:{session_id}:lock"
+
+# Boards outlast any class session
+SESSION_TTL_SECONDS = 24 * 3600
+COMPACT_LOCK_SECONDS = 5
+
+# Tail length that triggers folding into the snapshot
+COMPACT_EVERY = 200
+
+# One broadcast per animation frame
+FRAME_SECONDS = 1 / 60
+
+PERSIST_MAX_DELAY_SECONDS = 30.0
+
+# Undone ops kept per user for redo
+MAX_REDO = 50
+
+# Marks ``LiveClass.whiteboard_data`` written by this module; anything else is a legacy blob
+STATE_FORMAT = "oplog"
+
+OP_TYPES = ("draw", "erase", "clear", "undo", "redo", "save_state")
+
+# Ops that change the board for everyone else (``save_state`` only persists it)
+BROADCAST_TYPES = ("draw", "erase", "clear", "undo", "redo")
+
+ENCODINGS = ("json", "msgpack")
+
+
+# ------------------------------------------------------------------
+# Board state
+# ------------------------------------------------------------------
+
+
+def empty_state(base: Any = None) -> Dict[str, Any]:
+    """A board with ``base`` (a client-saved canvas) and no ops on top."""
+    return {"base": base if base is not None else {}, "ops": [], "redo": {}, "seq": 0}
+
+
+def load_state(blob: Any) -> Dict[str, Any]:
+    """Board state from ``LiveClass.whiteboard_data``, accepting legacy blobs."""
+    if isinstance(blob, dict) and blob.get("format") == STATE_FORMAT:
+        state = empty_state(blob.get("base"))
+        state["ops"] = list(blob.get("ops") or [])
+        state["redo"] = dict(blob.get("redo") or {})
+        state["seq"] = int(blob.get("seq") or 0)
+        return state
+    return empty_state(blob or {})
+
+
+def dump_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Board state as stored in ``LiveClass.whiteboard_data``."""
+    return {"format": STATE_FORMAT, **state}
+
+
+def apply_op(state: Dict[str, Any], op: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fold one op into the board state (in place).
+
+    ``draw``/``erase`` are appended; ``undo`` moves the user's last op onto
+    their redo stack and ``redo`` puts it back; ``clear`` and ``save_state``
+    replace the base and drop the visible ops. Ops at or below the state's
+    ``seq`` were already folded and are ignored.
+    """
+    if op["seq"] <= state["seq"]:
+        return state
+    state["seq"] = op["seq"]
+    kind = op["type"]
+    user = str(op.get("user_id"))
+
+    if kind in ("draw", "erase"):
+        state["ops"].append(op)
+        state["redo"].pop(user, None)
+    elif kind == "undo":
+        for index in range(len(state["ops"]) - 1, -1, -1):
+            if str(state["ops"][index].get("user_id")) == user:
+                stack = state["redo"].setdefault(user, [])
+                stack.append(state["ops"].pop(index))
+                del stack[:-MAX_REDO]
+                break
+    elif kind == "redo":
+        stack = state["redo"].get(user)
+        if stack:
+            state["ops"].append(stack.pop())
+            if not stack:
+                del state["redo"][user]
+    elif kind == "clear":
+        state.update(base={}, ops=[], redo={})
+    elif kind == "save_state":
+        state.update(base=op.get("data") or {}, ops=[], redo={})
+    return state
+
+
+def encode(message: Dict[str, Any], encoding: str):
+    """Wire payload for ``message``: text for JSON, bytes for msgpack."""
+    if encoding == "msgpack" and msgpack is not None:
+        return msgpack.packb(message, use_bin_type=True)
+    return json.dumps(message)
+
+
+def decode(frame: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Message from a raw ``websocket.receive()`` frame (text JSON or binary msgpack)."""
+    try:
+        if frame.get("bytes") is not None:
+            if msgpack is None:
+                return None
+            message = msgpack.unpackb(frame["bytes"], raw=False)
+        elif frame.get("text") is not None:
+            message = json.loads(frame["text"])
+        else:
+            return None
+    except Exception:
+        return None
+    return message if isinstance(message, dict) else None
+
+
+# ------------------------------------------------------------------
+# Per-process session bookkeeping
+# ------------------------------------------------------------------
+
+
+@dataclass
+class _LocalBoard:
+    """Snapshot and tail for a session when Redis is unavailable."""
+
+    state: Dict[str, Any]
+    tail: List[Dict[str, Any]] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+@dataclass
+class _Room:
+    """Participants connected to a session on this worker."""
+
+    clients: Dict[WebSocket, Tuple[int, str]] = field(default_factory=dict)
+    pending: List[Dict[str, Any]] = field(default_factory=list)
+    flush_task: Optional[asyncio.Task] = None
+    persist_task: Optional[asyncio.Task] = None
+    first_change: Optional[float] = None
+    last_change: float = 0.0
+
+
+class WhiteboardEngine:
+    """Op log, frame batching and debounced persistence for whiteboard sessions."""
+
+    def __init__(
+        self,
+        frame_seconds: float = FRAME_SECONDS,
+        persist_delay: float = settings.WHITEBOARD_PERSIST_DELAY_SECONDS,
+        persist_max_delay: float = PERSIST_MAX_DELAY_SECONDS,
+        compact_every: int = COMPACT_EVERY,
+    ):
+        self.frame_seconds = frame_seconds
+        self.persist_delay = persist_delay
+        self.persist_max_delay = max(persist_max_delay, persist_delay)
+        self.compact_every = compact_every
+        self.rooms: Dict[int, _Room] = {}
+        self.local: Dict[int, _LocalBoard] = {}
+        self._local_lock = threading.Lock()
+        self._next_client_id = 0
+
+    decode = staticmethod(decode)
+
+    # ------------------------------------------------------------------
+    # Op log
+    # ------------------------------------------------------------------
+
+    def _load_from_db(self, session_id: int) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            blob = (
+                db.query(LiveClass.whiteboard_data)
+                .filter(LiveClass.id == session_id)
+                .scalar()
+            )
+        finally:
+            db.close()
+        return load_state(blob)
+
+    def ensure_loaded(self, session_id: int):
+        """Seed the session's snapshot from SQL the first time it's used."""
+        redis = get_redis()
+        if redis is not None:
+            try:
+                key = SESSION_KEY.format(session_id=session_id)
+                if redis.exists(key):
+                    return
+                state = self._load_from_db(session_id)
+                pipe = redis.pipeline(transaction=True)
+                pipe.hsetnx(key, "seq", state["seq"])
+                pipe.hsetnx(key, "state", json.dumps(state))
+                pipe.expire(key, SESSION_TTL_SECONDS)
+                pipe.execute()
+                return
+            except RedisError as e:
+                logger.warning(f"Whiteboard load failed: {e}")
+        with self._local_lock:
+            if session_id in self.local:
+                return
+        state = self._load_from_db(session_id)
+        with self._local_lock:
+            self.local.setdefault(session_id, _LocalBoard(state=state))
+
+    def _local_board(self, session_id: int) -> _LocalBoard:
+        with self._local_lock:
+            board = self.local.get(session_id)
+        if board is None:
+            self.ensure_loaded(session_id)
+            with self._local_lock:
+                board = self.local[session_id]
+        return board
+
+    def append(
+        self, session_id: int, kind: str, data: Any, user_id: int, client_id: int
+    ) -> Dict[str, Any]:
+        """Append an op to the session's log and return it with its ``seq``."""
+        op = {"type": kind, "data": data, "user_id": user_id, "client_id": client_id}
+        redis = get_redis()
+        if redis is not None:
+            try:
+                ops_key = OPS_KEY.format(session_id=session_id)
+                session_key = SESSION_KEY.format(session_id=session_id)
+                pipe = redis.pipeline(transaction=True)
+                pipe.rpush(ops_key, json.dumps(op))
+                pipe.hget(session_key, "seq")
+                pipe.expire(ops_key, SESSION_TTL_SECONDS)
+                pipe.expire(session_key, SESSION_TTL_SECONDS)
+                length, head_seq, _, _ = pipe.execute()
+                op["seq"] = int(head_seq or 0) + length
+                if length >= self.compact_every:
+                    self.compact(session_id)
+                return op
+            except RedisError as e:
+                logger.warning(f"Whiteboard append failed: {e}")
+        board = self._local_board(session_id)
+        with board.lock:
+            op["seq"] = board.state["seq"] + len(board.tail) + 1
+            board.tail.append(op)
+            if len(board.tail) >= self.compact_every:
+                for pending in board.tail:
+                    apply_op(board.state, pending)
+                board.tail = []
+        return op
+
+    def _read(self, redis, session_id: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        pipe = redis.pipeline(transaction=True)
+        pipe.hgetall(SESSION_KEY.format(session_id=session_id))
+        pipe.lrange(OPS_KEY.format(session_id=session_id), 0, -1)
+        snapshot, raw_tail = pipe.execute()
+        state = json.loads(snapshot["state"]) if snapshot.get("state") else empty_state()
+        head_seq = int(snapshot.get("seq") or 0)
+        tail = []
+        for position, raw in enumerate(raw_tail, start=1):
+            op = json.loads(raw)
+            op["seq"] = head_seq + position
+            tail.append(op)
+        return state, tail
+
+    def compact(self, session_id: int) -> int:
+        """Fold the session's tail into its snapshot; returns the ops folded."""
+        redis = get_redis()
+        if redis is not None:
+            lock_key = LOCK_KEY.format(session_id=session_id)
+            try:
+                if not redis.set(lock_key, "1", nx=True, ex=COMPACT_LOCK_SECONDS):
+                    return 0
+                try:
+                    state, tail = self._read(redis, session_id)
+                    if not tail:
+                        return 0
+                    for op in tail:
+                        apply_op(state, op)
+                    pipe = redis.pipeline(transaction=True)
+                    pipe.hset(
+                        SESSION_KEY.format(session_id=session_id),
+                        mapping={"state": json.dumps(state), "seq": state["seq"]},
+                    )
+                    pipe.ltrim(OPS_KEY.format(session_id=session_id), len(tail), -1)
+                    pipe.execute()
+                    return len(tail)
+                finally:
+                    redis.delete(lock_key)
+            except RedisError as e:
+                logger.warning(f"Whiteboard compaction failed: {e}")
+                return 0
+        board = self._local_board(session_id)
+        with board.lock:
+            folded = len(board.tail)
+            for op in board.tail:
+                apply_op(board.state, op)
+            board.tail = []
+        return folded
+
+    def snapshot(self, session_id: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """The session's snapshot and the ops appended since."""
+        redis = get_redis()
+        if redis is not None:
+            try:
+                return self._read(redis, session_id)
+            except RedisError as e:
+                logger.warning(f"Whiteboard read failed: {e}")
+        board = self._local_board(session_id)
+        with board.lock:
+            return copy.deepcopy(board.state), list(board.tail)
+
+    def state(self, session_id: int) -> Dict[str, Any]:
+        """The current board: snapshot with the tail folded in."""
+        state, tail = self.snapshot(session_id)
+        for op in tail:
+            apply_op(state, op)
+        return state
+
+    def persist(self, session_id: int) -> Dict[str, Any]:
+        """Write the current board to ``LiveClass.whiteboard_data`` in one UPDATE."""
+        state = self.state(session_id)
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(LiveClass)
+                .where(LiveClass.id == session_id)
+                .values(whiteboard_data=dump_state(state))
+            )
+            db.commit()
+        finally:
+            db.close()
+        return state
+
+    def clear(self):
+        """Forget local boards (tests)."""
+        with self._local_lock:
+            self.local.clear()
+
+    # ------------------------------------------------------------------
+    # Participants
+    # ------------------------------------------------------------------
+
+    async def join(self, session_id: int, websocket: WebSocket, encoding: str = "json") -> int:
+        """Register an accepted socket and send it the board; returns its client id."""
+        if encoding not in ENCODINGS or (encoding == "msgpack" and msgpack is None):
+            encoding = "json"
+        self._next_client_id += 1
+        client_id = self._next_client_id
+
+        await run_in_threadpool(self.ensure_loaded, session_id)
+        state = self.state(session_id)
+        room = self.rooms.setdefault(session_id, _Room())
+        room.clients[websocket] = (client_id, encoding)
+        await self._send(
+            websocket,
+            encode(
+                {
+                    "type": "init_state",
+                    "data": state["base"],
+                    "ops": state["ops"],
+                    "seq": state["seq"],
+                    "client_id": client_id,
+                    "encoding": encoding,
+                },
+                encoding,
+            ),
+        )
+        return client_id
+
+    async def leave(self, session_id: int, websocket: WebSocket):
+        """Unregister a socket; the last one out flushes and persists the board."""
+        room = self.rooms.get(session_id)
+        if room is None:
+            return
+        room.clients.pop(websocket, None)
+        if room.clients:
+            return
+        del self.rooms[session_id]
+        for task in (room.flush_task, room.persist_task):
+            if task is not None and not task.done():
+                task.cancel()
+        if room.first_change is not None:
+            await self._persist(session_id)
+
+    async def submit(self, session_id: int, websocket: WebSocket, user_id: int, message: dict):
+        """Log a client's op and queue it for the next frame broadcast."""
+        kind = message.get("type")
+        if kind not in OP_TYPES:
+            return None
+        room = self.rooms.get(session_id)
+        if room is None or websocket not in room.clients:
+            return None
+        client_id, _ = room.clients[websocket]
+
+        op = self.append(session_id, kind, message.get("data"), user_id, client_id)
+        if kind in BROADCAST_TYPES:
+            room.pending.append(op)
+            if room.flush_task is None or room.flush_task.done():
+                room.flush_task = asyncio.get_running_loop().create_task(
+                    self._flush_later(session_id)
+                )
+        self._schedule_persist(session_id, room)
+        return op
+
+    async def _flush_later(self, session_id: int):
+        await asyncio.sleep(self.frame_seconds)
+        await self.flush(session_id)
+
+    async def flush(self, session_id: int):
+        """Broadcast the ops queued for a session as one ``ops`` message."""
+        room = self.rooms.get(session_id)
+        if room is None or not room.pending:
+            return
+        ops, room.pending = room.pending, []
+        message = {"type": "ops", "ops": ops}
+        payloads: Dict[str, Any] = {}
+        for websocket, (_, encoding) in list(room.clients.items()):
+            if encoding not in payloads:
+                payloads[encoding] = encode(message, encoding)
+            try:
+                await self._send(websocket, payloads[encoding])
+            except Exception:
+                room.clients.pop(websocket, None)
+
+    @staticmethod
+    async def _send(websocket: WebSocket, payload):
+        if isinstance(payload, bytes):
+            await websocket.send_bytes(payload)
+        else:
+            await websocket.send_text(payload)
+
+    # ------------------------------------------------------------------
+    # Debounced persistence
+    # ------------------------------------------------------------------
+
+    def _schedule_persist(self, session_id: int, room: _Room):
+        now = time.monotonic()
+        room.last_change = now
+        if room.first_change is None:
+            room.first_change = now
+        if room.persist_task is None or room.persist_task.done():
+            room.persist_task = asyncio.get_running_loop().create_task(
+                self._persist_later(session_id, room)
+            )
+
+    async def _persist_later(self, session_id: int, room: _Room):
+        # Changes made while a write is in flight are picked up by the next round
+        while room.first_change is not None:
+            due = min(
+                room.last_change + self.persist_delay,
+                room.first_change + self.persist_max_delay,
+            )
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            await self._persist(session_id, room)
+
+    async def _persist(self, session_id: int, room: Optional[_Room] = None):
+        if room is not None:
+            room.first_change = None
+        try:
+            await run_in_threadpool(self.persist, session_id)
+        except Exception as e:
+            logger.warning(f"Whiteboard persist failed for session {session_id}: {e}")
+
+
+whiteboard = WhiteboardEngine()
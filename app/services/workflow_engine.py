@@ -0,0 +1,933 @@
+"""
+Marketing Workflow Engine
+
+Advances WorkflowExecution rows through their WorkflowSteps:
+- Set-based enrollment of leads into workflows (bulk INSERT / INSERT ... SELECT)
+- Batched claiming of due executions (SELECT ... FOR UPDATE SKIP LOCKED)
+- Delay/timer semantics driven by the ``next_action_at`` due-time index
+- Batched outbound sends per channel
+- Retrying or failing outbox messages left PENDING
+- Throughput metrics for monitoring campaigns
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import and_, bindparam, exists, insert, literal, select, true, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.lead import Lead
+from app.models.marketing_automation import (
+    CommunicationTemplate,
+    MarketingWorkflow,
+    MessageLog,
+    WorkflowExecution,
+    WorkflowStep,
+)
+from app.services.mailer import OutgoingEmail, bulk_mailer
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_EXECUTION_STATUSES = ("PENDING", "RUNNING")
+
+# Leads per INSERT/IN-list chunk during enrollment
+ENROLL_CHUNK_SIZE = 1000
+
+# Upper bound on steps a single execution may run within one tick (guards
+# against CONDITION loops)
+MAX_STEPS_PER_TICK = 50
+
+# Audience filter keys that don't map 1:1 onto Lead columns
+AUDIENCE_FIELD_ALIASES = {"stage": "status", "source": "source_primary"}
+
+# Lead fields an UPDATE_FIELD step is allowed to write
+UPDATABLE_LEAD_FIELDS = {
+    "status",
+    "notes",
+    "intent_score",
+    "assigned_to_id",
+    "is_verified",
+    "source_secondary",
+    "source_tertiary",
+}
+
+CONVERTED_LEAD_STATUSES = {"ENROLLED"}
+
+# Outbox rows still PENDING after this long are dispatched again by the sweeper
+MESSAGE_RETRY_AFTER = timedelta(minutes=10)
+
+# ...and marked FAILED once they are this old
+MESSAGE_EXPIRE_AFTER = timedelta(hours=24)
+
+TOKEN_PATTERN = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+# Sender signature: receives the MessageLog rows for one channel and returns
+# the set of MessageLog ids that were sent successfully.
+ChannelSender = Callable[[List[MessageLog]], Iterable[int]]
+
+
+def _lead_tokens(lead: Lead) -> Dict[str, str]:
+    return {
+        "name": lead.name or "",
+        "email": lead.email or "",
+        "phone": lead.phone or "",
+        "stage": lead.status or "",
+        "source": lead.source_primary or "",
+    }
+
+
+def render_tokens(text: Optional[str], tokens: Dict[str, str]) -> Optional[str]:
+    """Replace {{token}} placeholders in a single regex pass."""
+    if not text:
+        return text
+    return TOKEN_PATTERN.sub(lambda m: tokens.get(m.group(1), m.group(0)), text)
+
+
+def evaluate_condition(lead: Lead, config: Optional[Dict[str, Any]]) -> bool:
+    """
+    Evaluate a CONDITION step against a lead.
+
+    Config format: {"field": "stage", "operator": "equals", "value": "INTERESTED"}
+    """
+    if not config:
+        return True
+
+    field = AUDIENCE_FIELD_ALIASES.get(config.get("field"), config.get("field"))
+    actual = getattr(lead, field, None) if field else None
+    expected = config.get("value")
+    operator = config.get("operator", "equals")
+
+    try:
+        if operator == "equals":
+            return actual == expected
+        if operator == "not_equals":
+            return actual != expected
+        if operator == "in":
+            return actual in (expected or [])
+        if operator == "not_in":
+            return actual not in (expected or [])
+        if operator == "contains":
+            return expected is not None and str(expected) in str(actual or "")
+        if operator == "is_set":
+            return actual not in (None, "")
+        if operator == "gt":
+            return actual is not None and actual > expected
+        if operator == "lt":
+            return actual is not None and actual < expected
+    except TypeError:
+        return False
+
+    logger.warning(f"Unknown workflow condition operator: {operator}")
+    return False
+
+
+def _smtp_email_sender(messages: List[MessageLog]) -> List[int]:
+    """Send a batch of emails over a pooled SMTP connection."""
+    if settings.MAIL_SUPPRESS_SEND:
+        return [m.id for m in messages]
+
+    errors = bulk_mailer.pool.send(
+        [
+            OutgoingEmail(recipient=m.recipient, subject=m.subject or "", body_text=m.body or "")
+            for m in messages
+        ]
+    )
+    sent = []
+    for message, error in zip(messages, errors):
+        if error is None:
+            sent.append(message.id)
+        else:
+            message.error_message = error
+    return sent
+
+
+class WorkflowEngineMetrics:
+    """Process-local throughput counters for the workflow engine."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.ticks = 0
+            self.claimed = 0
+            self.steps_executed = 0
+            self.completed = 0
+            self.failed = 0
+            self.enrolled = 0
+            self.messages_queued: Dict[str, int] = defaultdict(int)
+            self.messages_sent: Dict[str, int] = defaultdict(int)
+            self.busy_seconds = 0.0
+            self.last_tick: Optional[Dict[str, Any]] = None
+
+    def record_enrollment(self, count: int):
+        with self._lock:
+            self.enrolled += count
+
+    def record_tick(self, result: Dict[str, Any]):
+        with self._lock:
+            self.ticks += 1
+            self.claimed += result["claimed"]
+            self.steps_executed += result["steps_executed"]
+            self.completed += result["completed"]
+            self.failed += result["failed"]
+            self.busy_seconds += result["duration_ms"] / 1000
+            for channel, count in result["messages_queued"].items():
+                self.messages_queued[channel] += count
+            for channel, count in result["messages_sent"].items():
+                self.messages_sent[channel] += count
+            self.last_tick = result
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            uptime = max(time.time() - self.started_at, 1e-9)
+            busy = max(self.busy_seconds, 1e-9)
+            return {
+                "uptime_seconds": round(uptime, 2),
+                "ticks": self.ticks,
+                "claimed": self.claimed,
+                "steps_executed": self.steps_executed,
+                "completed": self.completed,
+                "failed": self.failed,
+                "enrolled": self.enrolled,
+                "messages_queued": dict(self.messages_queued),
+                "messages_sent": dict(self.messages_sent),
+                "executions_per_second": round(self.claimed / busy, 2)
+                if self.claimed
+                else 0.0,
+                "messages_per_second": round(
+                    sum(self.messages_sent.values()) / busy, 2
+                )
+                if self.messages_sent
+                else 0.0,
+                "last_tick": self.last_tick,
+            }
+
+
+class WorkflowEngine:
+    """Scheduler that enrolls leads into workflows and advances executions."""
+
+    def __init__(self, batch_size: int = 500):
+        self.batch_size = batch_size
+        self.metrics = WorkflowEngineMetrics()
+        self.senders: Dict[str, ChannelSender] = {"EMAIL": _smtp_email_sender}
+
+    def register_sender(self, channel: str, sender: ChannelSender):
+        """Register a batch sender for a channel (SMS, WHATSAPP, PUSH, ...)."""
+        self.senders[channel] = sender
+
+    # ------------------------------------------------------------------
+    # Enrollment
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _first_steps(db: Session, workflow_ids: Sequence[int]) -> Dict[int, int]:
+        """Map workflow_id -> id of its first active step."""
+        rows = db.execute(
+            select(WorkflowStep.workflow_id, WorkflowStep.id)
+            .where(
+                WorkflowStep.workflow_id.in_(workflow_ids),
+                WorkflowStep.is_active == True,
+            )
+            .order_by(WorkflowStep.workflow_id, WorkflowStep.order_index)
+        ).all()
+        first_steps: Dict[int, int] = {}
+        for workflow_id, step_id in rows:
+            first_steps.setdefault(workflow_id, step_id)
+        return first_steps
+
+    @staticmethod
+    def _new_execution_log(first_step_id: int, now: datetime) -> List[Dict[str, Any]]:
+        return [
+            {
+                "timestamp": now.isoformat(),
+                "action": "WORKFLOW_STARTED",
+                "step_id": first_step_id,
+            }
+        ]
+
+    def enroll_leads(
+        self,
+        db: Session,
+        workflows: Sequence[MarketingWorkflow],
+        lead_ids: Sequence[int],
+    ) -> int:
+        """
+        Enroll leads into workflows with set-based queries.
+
+        Issues one existence query and one bulk INSERT per chunk of leads
+        instead of per-(lead, workflow) lookups.
+
+        Returns:
+            Number of executions created
+        """
+        if not workflows or not lead_ids:
+            return 0
+
+        first_steps = self._first_steps(db, [w.id for w in workflows])
+        workflows = [w for w in workflows if w.id in first_steps]
+        if not workflows:
+            return 0
+
+        now = datetime.utcnow()
+        created_per_workflow: Dict[int, int] = defaultdict(int)
+        unique_lead_ids = list(dict.fromkeys(lead_ids))
+
+        for start in range(0, len(unique_lead_ids), ENROLL_CHUNK_SIZE):
+            chunk = unique_lead_ids[start : start + ENROLL_CHUNK_SIZE]
+            existing_leads = set(
+                db.execute(select(Lead.id).where(Lead.id.in_(chunk))).scalars()
+            )
+
+            no_reentry_ids = [w.id for w in workflows if not w.allow_re_entry]
+            active_pairs = set()
+            if no_reentry_ids:
+                active_pairs = set(
+                    db.execute(
+                        select(WorkflowExecution.workflow_id, WorkflowExecution.lead_id)
+                        .where(
+                            WorkflowExecution.workflow_id.in_(no_reentry_ids),
+                            WorkflowExecution.lead_id.in_(chunk),
+                            WorkflowExecution.status.in_(ACTIVE_EXECUTION_STATUSES),
+                        )
+                    ).all()
+                )
+
+            rows = []
+            for workflow in workflows:
+                first_step_id = first_steps[workflow.id]
+                for lead_id in chunk:
+                    if lead_id not in existing_leads:
+                        continue
+                    if (workflow.id, lead_id) in active_pairs:
+                        continue
+                    rows.append(
+                        {
+                            "workflow_id": workflow.id,
+                            "lead_id": lead_id,
+                            "status": "RUNNING",
+                            "current_step_id": first_step_id,
+                            "started_at": now,
+                            "next_action_at": now,
+                            "retry_count": 0,
+                            "execution_log": self._new_execution_log(first_step_id, now),
+                        }
+                    )
+                    created_per_workflow[workflow.id] += 1
+
+            if rows:
+                db.execute(insert(WorkflowExecution), rows)
+
+        self._bump_enrolled(db, created_per_workflow)
+        db.commit()
+
+        total = sum(created_per_workflow.values())
+        self.metrics.record_enrollment(total)
+        return total
+
+    def enroll_audience(self, db: Session, workflow: MarketingWorkflow) -> int:
+        """
+        Enroll every lead matching the workflow's audience filters with a single
+        INSERT ... SELECT, so campaigns over tens of thousands of leads never
+        round-trip lead ids through Python.
+
+        Returns:
+            Number of executions created
+        """
+        first_step_id = self._first_steps(db, [workflow.id]).get(workflow.id)
+        if first_step_id is None:
+            return 0
+
+        conditions = []
+        for key, value in (workflow.audience_filters or {}).items():
+            column = getattr(Lead, AUDIENCE_FIELD_ALIASES.get(key, key), None)
+            if column is None:
+                logger.warning(f"Ignoring unknown audience filter '{key}'")
+                continue
+            if isinstance(value, (list, tuple)):
+                conditions.append(column.in_(value))
+            else:
+                conditions.append(column == value)
+
+        if not workflow.allow_re_entry:
+            conditions.append(
+                ~exists().where(
+                    WorkflowExecution.workflow_id == workflow.id,
+                    WorkflowExecution.lead_id == Lead.id,
+                    WorkflowExecution.status.in_(ACTIVE_EXECUTION_STATUSES),
+                )
+            )
+
+        now = datetime.utcnow()
+        source = select(
+            literal(workflow.id),
+            Lead.id,
+            literal("RUNNING"),
+            literal(first_step_id),
+            literal(now),
+            literal(now),
+            literal(0),
+            literal(
+                self._new_execution_log(first_step_id, now),
+                WorkflowExecution.execution_log.type,
+            ),
+        ).where(and_(true(), *conditions))
+
+        result = db.execute(
+            insert(WorkflowExecution).from_select(
+                [
+                    "workflow_id",
+                    "lead_id",
+                    "status",
+                    "current_step_id",
+                    "started_at",
+                    "next_action_at",
+                    "retry_count",
+                    "execution_log",
+                ],
+                source,
+            )
+        )
+        created = max(result.rowcount or 0, 0)
+        self._bump_enrolled(db, {workflow.id: created})
+        db.commit()
+
+        self.metrics.record_enrollment(created)
+        return created
+
+    @staticmethod
+    def _bump_enrolled(db: Session, created_per_workflow: Dict[int, int]):
+        for workflow_id, count in created_per_workflow.items():
+            if count:
+                db.execute(
+                    update(MarketingWorkflow)
+                    .where(MarketingWorkflow.id == workflow_id)
+                    .values(total_enrolled=MarketingWorkflow.total_enrolled + count)
+                )
+
+    def resume_on_event(self, db: Session, lead_id: int, event: str) -> int:
+        """
+        Wake executions parked on ``wait_for_event`` for a lead (e.g. EMAIL_OPENED).
+
+        Returns:
+            Number of executions made due
+        """
+        waiting_step_ids = select(WorkflowStep.id).where(
+            WorkflowStep.step_type == "WAIT", WorkflowStep.wait_for_event == event
+        )
+        result = db.execute(
+            update(WorkflowExecution)
+            .where(
+                WorkflowExecution.lead_id == lead_id,
+                WorkflowExecution.status == "RUNNING",
+                WorkflowExecution.next_action_at.is_(None),
+                WorkflowExecution.current_step_id.in_(waiting_step_ids),
+            )
+            .values(next_action_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount or 0
+
+    # ------------------------------------------------------------------
+    # Scheduling
+    # ------------------------------------------------------------------
+
+    def claim_due_executions(
+        self, db: Session, limit: Optional[int] = None, now: Optional[datetime] = None
+    ) -> List[WorkflowExecution]:
+        """
+        Claim a batch of due executions.
+
+        Uses FOR UPDATE SKIP LOCKED so concurrent workers never claim the same
+        rows; backends without row locks (SQLite) simply ignore the clause.
+        """
+        now = now or datetime.utcnow()
+        return (
+            db.query(WorkflowExecution)
+            .join(MarketingWorkflow, MarketingWorkflow.id == WorkflowExecution.workflow_id)
+            .filter(
+                WorkflowExecution.status.in_(ACTIVE_EXECUTION_STATUSES),
+                WorkflowExecution.next_action_at.isnot(None),
+                WorkflowExecution.next_action_at <= now,
+                MarketingWorkflow.status == "ACTIVE",
+            )
+            .order_by(WorkflowExecution.next_action_at)
+            .limit(limit or self.batch_size)
+            .with_for_update(skip_locked=True, of=WorkflowExecution)
+            .all()
+        )
+
+    def tick(self, db: Session, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Claim one batch of due executions, advance them and flush outbound
+        messages. Step changes and the queued messages are committed together;
+        messages are sent after that commit and marked SENT/FAILED separately.
+        """
+        started = time.perf_counter()
+        now = now or datetime.utcnow()
+        executions = self.claim_due_executions(db, now=now)
+
+        result: Dict[str, Any] = {
+            "claimed": len(executions),
+            "steps_executed": 0,
+            "completed": 0,
+            "failed": 0,
+            "converted": 0,
+            "messages_queued": {},
+            "messages_sent": {},
+        }
+
+        if executions:
+            self._advance_batch(db, executions, now, result)
+
+        result["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        self.metrics.record_tick(result)
+        return result
+
+    def run_until_idle(
+        self, db: Session, max_batches: int = 100
+    ) -> Dict[str, Any]:
+        """Run ticks until no executions are due or the batch budget is spent."""
+        totals = {"batches": 0, "claimed": 0, "completed": 0, "failed": 0}
+        for _ in range(max_batches):
+            result = self.tick(db)
+            if not result["claimed"]:
+                break
+            totals["batches"] += 1
+            totals["claimed"] += result["claimed"]
+            totals["completed"] += result["completed"]
+            totals["failed"] += result["failed"]
+        return totals
+
+    # ------------------------------------------------------------------
+    # Step execution
+    # ------------------------------------------------------------------
+
+    def _advance_batch(
+        self,
+        db: Session,
+        executions: List[WorkflowExecution],
+        now: datetime,
+        result: Dict[str, Any],
+    ):
+        workflow_ids = {e.workflow_id for e in executions}
+        lead_ids = {e.lead_id for e in executions}
+
+        # Load everything the batch needs up front: one query per table
+        workflows = {
+            w.id: w
+            for w in db.query(MarketingWorkflow)
+            .filter(MarketingWorkflow.id.in_(workflow_ids))
+            .all()
+        }
+        steps_by_workflow: Dict[int, List[WorkflowStep]] = defaultdict(list)
+        for step in (
+            db.query(WorkflowStep)
+            .filter(
+                WorkflowStep.workflow_id.in_(workflow_ids),
+                WorkflowStep.is_active == True,
+            )
+            .order_by(WorkflowStep.workflow_id, WorkflowStep.order_index)
+            .all()
+        ):
+            steps_by_workflow[step.workflow_id].append(step)
+
+        template_ids = {
+            s.template_id
+            for steps in steps_by_workflow.values()
+            for s in steps
+            if s.template_id
+        }
+        templates = (
+            {
+                t.id: t
+                for t in db.query(CommunicationTemplate)
+                .filter(CommunicationTemplate.id.in_(template_ids))
+                .all()
+            }
+            if template_ids
+            else {}
+        )
+        leads = {
+            lead.id: lead
+            for lead in db.query(Lead).filter(Lead.id.in_(lead_ids)).all()
+        }
+
+        outbox: List[MessageLog] = []
+        completed_per_workflow: Dict[int, int] = defaultdict(int)
+        converted_per_workflow: Dict[int, int] = defaultdict(int)
+
+        for execution in executions:
+            workflow = workflows[execution.workflow_id]
+            steps = steps_by_workflow.get(execution.workflow_id, [])
+            lead = leads.get(execution.lead_id)
+            log = list(execution.execution_log or [])
+
+            try:
+                if lead is None:
+                    raise ValueError(f"Lead {execution.lead_id} no longer exists")
+                outcome = self._run_steps(
+                    execution, workflow, steps, lead, templates, now, log, outbox, result
+                )
+            except Exception as e:
+                logger.error(f"Workflow execution {execution.id} failed: {e}")
+                execution.status = "FAILED"
+                execution.error_message = str(e)
+                execution.next_action_at = None
+                log.append(
+                    {"timestamp": now.isoformat(), "action": "FAILED", "error": str(e)}
+                )
+                result["failed"] += 1
+                outcome = None
+
+            if outcome in ("COMPLETED", "CONVERTED"):
+                execution.status = "COMPLETED"
+                execution.completed_at = now
+                execution.next_action_at = None
+                completed_per_workflow[workflow.id] += 1
+                result["completed"] += 1
+                if outcome == "CONVERTED":
+                    converted_per_workflow[workflow.id] += 1
+                    result["converted"] += 1
+
+            execution.execution_log = log
+
+        for workflow_id, count in completed_per_workflow.items():
+            db.execute(
+                update(MarketingWorkflow)
+                .where(MarketingWorkflow.id == workflow_id)
+                .values(
+                    total_completed=MarketingWorkflow.total_completed + count,
+                    total_converted=MarketingWorkflow.total_converted
+                    + converted_per_workflow.get(workflow_id, 0),
+                )
+            )
+
+        message_ids: List[int] = []
+        if outbox:
+            db.add_all(outbox)
+            db.flush()  # batched INSERT, assigns ids for the senders
+            message_ids = [m.id for m in outbox]
+
+        # Messages are recorded as PENDING along with the step changes, and
+        # the claimed rows are released, before anything leaves the process
+        db.commit()
+
+        if message_ids:
+            self._dispatch(db, message_ids, now, result)
+
+    def _run_steps(
+        self,
+        execution: WorkflowExecution,
+        workflow: MarketingWorkflow,
+        steps: List[WorkflowStep],
+        lead: Lead,
+        templates: Dict[int, CommunicationTemplate],
+        now: datetime,
+        log: List[Dict[str, Any]],
+        outbox: List[MessageLog],
+        result: Dict[str, Any],
+    ) -> Optional[str]:
+        """
+        Run steps for one execution until it waits or finishes.
+
+        Returns:
+            "COMPLETED"/"CONVERTED" when the execution finished, None when it is
+            parked on a timer or event.
+        """
+        position = {step.id: i for i, step in enumerate(steps)}
+        by_order = {step.order_index: i for i, step in enumerate(steps)}
+        index = position.get(execution.current_step_id)
+        if index is None:
+            # Step was deleted/deactivated - continue from the start
+            index = 0
+
+        execution.status = "RUNNING"
+
+        for _ in range(MAX_STEPS_PER_TICK):
+            if workflow.exit_on_conversion and lead.status in CONVERTED_LEAD_STATUSES:
+                log.append({"timestamp": now.isoformat(), "action": "EXITED_ON_CONVERSION"})
+                return "CONVERTED"
+
+            if index >= len(steps):
+                execution.current_step_id = None
+                log.append({"timestamp": now.isoformat(), "action": "WORKFLOW_COMPLETED"})
+                return "COMPLETED"
+
+            step = steps[index]
+            execution.current_step_id = step.id
+            result["steps_executed"] += 1
+            next_index = index + 1
+
+            if step.step_type == "SEND_MESSAGE":
+                message = self._build_message(execution, step, lead, templates)
+                if message is not None:
+                    outbox.append(message)
+                    queued = result["messages_queued"]
+                    queued[message.channel] = queued.get(message.channel, 0) + 1
+                log.append(
+                    {
+                        "timestamp": now.isoformat(),
+                        "action": "MESSAGE_QUEUED" if message else "MESSAGE_SKIPPED",
+                        "step_id": step.id,
+                    }
+                )
+
+            elif step.step_type == "WAIT":
+                if self._wait_satisfied(log, step):
+                    log.append(
+                        {"timestamp": now.isoformat(), "action": "WAIT_ELAPSED", "step_id": step.id}
+                    )
+                elif step.wait_for_event:
+                    # Parked until resume_on_event() makes the execution due again
+                    execution.next_action_at = None
+                    log.append(
+                        {
+                            "timestamp": now.isoformat(),
+                            "action": "WAITING_FOR_EVENT",
+                            "step_id": step.id,
+                            "event": step.wait_for_event,
+                        }
+                    )
+                    return None
+                else:
+                    due_at = None
+                    if step.wait_duration_minutes:
+                        due_at = now + timedelta(minutes=step.wait_duration_minutes)
+                    elif step.wait_until_date and step.wait_until_date > now:
+                        due_at = step.wait_until_date
+
+                    if due_at is not None:
+                        execution.next_action_at = due_at
+                        log.append(
+                            {
+                                "timestamp": now.isoformat(),
+                                "action": "WAIT_SCHEDULED",
+                                "step_id": step.id,
+                                "resume_at": due_at.isoformat(),
+                            }
+                        )
+                        return None
+
+            elif step.step_type == "CONDITION":
+                matched = evaluate_condition(lead, step.condition_config)
+                target = step.true_next_step if matched else step.false_next_step
+                log.append(
+                    {
+                        "timestamp": now.isoformat(),
+                        "action": "CONDITION_EVALUATED",
+                        "step_id": step.id,
+                        "result": matched,
+                    }
+                )
+                if target is not None:
+                    if target not in by_order:
+                        raise ValueError(
+                            f"Condition step {step.id} points at unknown step {target}"
+                        )
+                    next_index = by_order[target]
+
+            elif step.step_type == "UPDATE_FIELD":
+                for field, value in (step.field_updates or {}).items():
+                    field = AUDIENCE_FIELD_ALIASES.get(field, field)
+                    if field in UPDATABLE_LEAD_FIELDS:
+                        setattr(lead, field, value)
+                log.append(
+                    {"timestamp": now.isoformat(), "action": "FIELDS_UPDATED", "step_id": step.id}
+                )
+
+            elif step.step_type == "ASSIGN":
+                if step.assign_to_user_id:
+                    lead.assigned_to_id = step.assign_to_user_id
+                log.append(
+                    {"timestamp": now.isoformat(), "action": "LEAD_ASSIGNED", "step_id": step.id}
+                )
+
+            else:
+                raise ValueError(f"Unknown step type: {step.step_type}")
+
+            index = next_index
+
+        # Step budget exhausted: yield and pick up on the next tick
+        execution.next_action_at = now
+        return None
+
+    @staticmethod
+    def _wait_satisfied(log: List[Dict[str, Any]], step: WorkflowStep) -> bool:
+        """A WAIT step is satisfied when the execution was parked on it and is now due."""
+        return (
+            bool(log)
+            and log[-1].get("action") in ("WAIT_SCHEDULED", "WAITING_FOR_EVENT")
+            and log[-1].get("step_id") == step.id
+        )
+
+    @staticmethod
+    def _build_message(
+        execution: WorkflowExecution,
+        step: WorkflowStep,
+        lead: Lead,
+        templates: Dict[int, CommunicationTemplate],
+    ) -> Optional[MessageLog]:
+        template = templates.get(step.template_id)
+        if template is None:
+            raise ValueError(f"Step {step.id} references missing template {step.template_id}")
+
+        channel = step.channel or template.channel
+        if channel == "EMAIL":
+            recipient = lead.email
+        elif channel in ("SMS", "WHATSAPP"):
+            recipient = lead.phone
+        else:
+            recipient = f"user_{lead.id}"
+        if not recipient:
+            return None
+
+        tokens = _lead_tokens(lead)
+        return MessageLog(
+            lead_id=lead.id,
+            workflow_execution_id=execution.id,
+            template_id=template.id,
+            channel=channel,
+            recipient=recipient,
+            subject=render_tokens(template.subject, tokens),
+            body=render_tokens(template.body, tokens),
+            status="PENDING",
+        )
+
+    def _dispatch(
+        self, db: Session, message_ids: List[int], now: datetime, result: Dict[str, Any]
+    ):
+        """
+        Hand committed PENDING messages to the registered sender for each
+        channel in one batch, then record the outcome by message id.
+
+        Sends run outside any transaction. Only rows still PENDING are sent
+        or updated, so dispatching the same ids again doesn't resend them.
+        """
+        messages = (
+            db.query(MessageLog)
+            .filter(MessageLog.id.in_(message_ids), MessageLog.status == "PENDING")
+            .order_by(MessageLog.id)
+            .all()
+        )
+        for message in messages:
+            db.expunge(message)
+        db.commit()
+
+        by_channel: Dict[str, List[MessageLog]] = defaultdict(list)
+        for message in messages:
+            by_channel[message.channel].append(message)
+
+        sent: List[int] = []
+        failed: List[Dict[str, Any]] = []
+        for channel, channel_messages in by_channel.items():
+            sender = self.senders.get(channel)
+            if sender is None:
+                error = f"No sender registered for channel {channel}"
+                logger.warning(f"{error}; failing {len(channel_messages)} messages")
+                failed.extend({"message_id": m.id, "error": error} for m in channel_messages)
+                continue
+            try:
+                sent_ids = set(sender(channel_messages))
+            except Exception as e:
+                logger.error(f"Batch send failed for {channel}: {e}")
+                failed.extend(
+                    {"message_id": m.id, "error": str(e)} for m in channel_messages
+                )
+                continue
+
+            for message in channel_messages:
+                if message.id in sent_ids:
+                    sent.append(message.id)
+                elif message.error_message:
+                    failed.append({"message_id": message.id, "error": message.error_message})
+            result["messages_sent"][channel] = len(sent_ids)
+
+        if not sent and not failed:
+            return
+        table = MessageLog.__table__
+        try:
+            if sent:
+                db.execute(
+                    update(table)
+                    .where(table.c.id.in_(sent), table.c.status == "PENDING")
+                    .values(status="SENT", sent_at=now)
+                )
+            if failed:
+                db.execute(
+                    update(table)
+                    .where(table.c.id == bindparam("message_id"), table.c.status == "PENDING")
+                    .values(status="FAILED", error_message=bindparam("error")),
+                    failed,
+                )
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Recording send results for messages {message_ids} failed: {e}")
+
+    def sweep_stale_messages(
+        self, db: Session, now: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """
+        Resolve outbox rows left PENDING, e.g. by a worker that died between
+        the outbox commit and recording the send. Rows older than
+        MESSAGE_EXPIRE_AFTER are marked FAILED; rows older than
+        MESSAGE_RETRY_AFTER are dispatched again in batches.
+
+        Delivery is at-least-once: a message the provider accepted just
+        before a crash is sent a second time.
+        """
+        now = now or datetime.utcnow()
+        table = MessageLog.__table__
+        expired = db.execute(
+            update(table)
+            .where(
+                table.c.status == "PENDING",
+                table.c.created_at < now - MESSAGE_EXPIRE_AFTER,
+            )
+            .values(
+                status="FAILED",
+                error_message=f"Not sent within {MESSAGE_EXPIRE_AFTER}",
+            )
+        ).rowcount
+        db.commit()
+
+        result: Dict[str, Any] = {"expired": expired, "retried": 0, "messages_sent": {}}
+        last_id = 0
+        while True:
+            # Walk by id so rows a sender leaves PENDING aren't picked up again
+            message_ids = db.scalars(
+                select(MessageLog.id)
+                .where(
+                    MessageLog.status == "PENDING",
+                    MessageLog.created_at < now - MESSAGE_RETRY_AFTER,
+                    MessageLog.id > last_id,
+                )
+                .order_by(MessageLog.id)
+                .limit(self.batch_size)
+            ).all()
+            db.commit()
+            if not message_ids:
+                break
+            last_id = message_ids[-1]
+            result["retried"] += len(message_ids)
+            self._dispatch(db, message_ids, now, result)
+
+        if expired or result["retried"]:
+            logger.info(
+                f"Swept stale messages: {result['retried']} retried, {expired} expired"
+            )
+        return result
+
+
+workflow_engine = WorkflowEngine()
@@ -10,7 +10,6 @@ import logging
 import os
 import sys
 
-from fastapi import Request
 from fastapi.responses import JSONResponse
 
 logger = logging.getLogger(__name__)
@@ -75,10 +74,28 @@ async def lifespan(app: FastAPI):
     
     # Auto-seed meditation processes if table is empty
     seed_meditation_processes()
+
+    # Deliver notification batches published by any worker to sockets held here
+    from app.services.notification_dispatch import notification_dispatcher
+    notification_dispatcher.start()
+
+    # Reload i18n catalogues and language preferences changed on any worker
+    from app.services.i18n_catalogue import reload_listener
+    reload_listener.start()
     
     yield  # Application runs here
 
     logger.info("Shutting down Eduecosystem Backend...")
+    notification_dispatcher.stop()
+    reload_listener.stop()
+
+    # Close pooled connections to identity providers
+    from app.services.idp_metadata import sso_http
+    await sso_http.aclose()
+
+    # Write any queued AI debug logs before exiting
+    from app.services.ai_debug_service import ai_debug_service
+    ai_debug_service.shutdown()
 
 
 
@@ -144,38 +161,31 @@ app.add_middleware(
 app.add_middleware(GZipMiddleware, minimum_size=1000)
 
 
-# SECURITY: Add security headers middleware
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
+# SECURITY: Add security headers middleware (pure ASGI, headers encoded once)
+from app.middleware.security_headers import SecurityHeadersMiddleware
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    """Add security headers to all responses to prevent common attacks."""
-    
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        
-        # Prevent clickjacking attacks
-        response.headers["X-Frame-Options"] = "DENY"
-        
-        # Prevent MIME type sniffing
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        
-        # Enable browser XSS filtering
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        
-        # Referrer policy
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        
-        # Content Security Policy (allow only same origin for scripts)
-        response.headers["Content-Security-Policy"] = "frame-ancestors 'none'"
-        
-        # HSTS - Enforce HTTPS (only in production)
-        if os.getenv("ENVIRONMENT") == "production":
-            response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-        
-        return response
+app.add_middleware(
+    SecurityHeadersMiddleware,
+    # API responses only need to forbid framing
+    content_security_policy="frame-ancestors 'none'",
+    permissions_policy=None,
+    # HSTS - Enforce HTTPS (only in production)
+    strict_transport_security=(
+        "max-age=31536000; includeSubDomains"
+        if os.getenv("ENVIRONMENT") == "production"
+        else None
+    ),
+)
+
+# Per-route latency and status, per-request SQL counts, N+1 detection and slow-query sampling
+from app.middleware.query_instrumentation import QueryInstrumentationMiddleware
+
+app.add_middleware(QueryInstrumentationMiddleware)
+
+# Sampled request logs (latency and status are recorded by the instrumentation above)
+from app.middleware.request_logging import RequestMetricsMiddleware
 
-app.add_middleware(SecurityHeadersMiddleware)
+app.add_middleware(RequestMetricsMiddleware)
 
 
 # Import and include API router
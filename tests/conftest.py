@@ -0,0 +1,54 @@
+"""
+Shared fixtures for the service tests.
+
+``engine``/``db`` give each test a fresh in-memory SQLite database with all
+tables created. ``fake_redis`` is a fakeredis client; ``redis_or_local``
+runs a test once against it and once with Redis unavailable (None), so a
+module only has to patch ``get_redis`` where its service looks it up:
+
+    @pytest.fixture
+    def backend(redis_or_local):
+        with patch("app.services.<module>.get_redis", return_value=redis_or_local):
+            yield redis_or_local
+"""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.models  # noqa: F401 - register all mappers
+from app.db.session import Base
+
+
+@pytest.fixture
+def engine():
+    # One shared connection, so threads and TestClient see the same database
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def fake_redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+@pytest.fixture(params=["redis", "local"])
+def redis_or_local(request):
+    if request.param == "redis":
+        return request.getfixturevalue("fake_redis")
+    return None
@@ -0,0 +1,277 @@
+"""
+Middleware Stack Benchmark
+Compares the previous BaseHTTPMiddleware stack (security headers, i18n,
+rate limiting, request logging) with the pure ASGI implementations
+
+The apps are driven in-process through the ASGI interface, so the numbers
+measure middleware overhead rather than the network or a server.
+
+Usage:
+    python -m tests.load.benchmark_middleware [--requests 20000] [--concurrency 50]
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from typing import Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core.rate_limiting import RateLimiter, RateLimitMiddleware
+from app.middleware.i18n_middleware import I18nMiddleware, _parse_accept_language
+from app.middleware.request_logging import RequestLoggingMiddleware
+from app.middleware.security_headers import SecurityHeadersMiddleware
+from app.db.instrumentation import LatencySketch
+
+STREAM_CHUNKS = 20
+UNLIMITED = 10**9
+
+
+# ----------------------------------------------------------------------
+# Previous implementations (BaseHTTPMiddleware), kept for comparison
+# ----------------------------------------------------------------------
+
+
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        response = await call_next(request)
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        response.headers["X-Frame-Options"] = "DENY"
+        response.headers["X-XSS-Protection"] = "1; mode=block"
+        csp_directives = [
+            "default-src 'self'",
+            "script-src 'self' 'unsafe-inline' 'unsafe-eval'",
+            "style-src 'self' 'unsafe-inline'",
+            "img-src 'self' data: https:",
+            "font-src 'self' data:",
+            "connect-src 'self' ws: wss:",
+            "frame-ancestors 'none'",
+        ]
+        response.headers["Content-Security-Policy"] = "; ".join(csp_directives)
+        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+        response.headers["Permissions-Policy"] = "geolocation=(), microphone=(), camera=()"
+        return response
+
+
+class LegacyI18nMiddleware(BaseHTTPMiddleware):
+    SUPPORTED_LANGUAGES = ["en", "es", "fr", "de", "ar", "hi", "zh"]
+
+    async def dispatch(self, request: Request, call_next):
+        language = request.query_params.get("lang")
+        if language not in self.SUPPORTED_LANGUAGES:
+            accept_language = request.headers.get("Accept-Language")
+            # The old parser ran on every request
+            _parse_accept_language.cache_clear()
+            language = (
+                _parse_accept_language(accept_language, frozenset(self.SUPPORTED_LANGUAGES))
+                if accept_language
+                else None
+            ) or "en"
+        request.state.language = language
+        request.state.is_rtl = language in ["ar", "he", "fa", "ur"]
+        response = await call_next(request)
+        response.headers["Content-Language"] = language
+        if request.state.is_rtl:
+            response.headers["X-RTL-Enabled"] = "true"
+        return response
+
+
+class LegacyRateLimitMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, limiter: RateLimiter):
+        super().__init__(app)
+        self.limiter = limiter
+
+    async def dispatch(self, request: Request, call_next):
+        key = f"ip:{request.client.host}"
+        await self.limiter.is_allowed(key, UNLIMITED, 60)
+        response = await call_next(request)
+        response.headers["X-RateLimit-Limit"] = str(UNLIMITED)
+        response.headers["X-RateLimit-Window"] = "60"
+        return response
+
+
+class LegacyRequestLoggingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        request_id = request.headers.get("X-Request-ID", f"req-{time.time()}")
+        start_time = time.time()
+        log_data = {
+            "request_id": request_id,
+            "method": request.method,
+            "path": request.url.path,
+            "query_params": dict(request.query_params),
+            "client_ip": request.client.host if request.client else None,
+            "user_agent": request.headers.get("user-agent"),
+        }
+        logging.getLogger(__name__).info("Incoming request", extra=log_data)
+        response = await call_next(request)
+        duration_ms = (time.time() - start_time) * 1000
+        response.headers["X-Request-ID"] = request_id
+        response.headers["X-Response-Time"] = f"{duration_ms:.2f}ms"
+        logging.getLogger(__name__).info("Successful response", extra=log_data)
+        return response
+
+
+# ----------------------------------------------------------------------
+# Apps
+# ----------------------------------------------------------------------
+
+
+def _routes(app: FastAPI) -> FastAPI:
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        return {"id": item_id, "name": f"Item {item_id}"}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(STREAM_CHUNKS):
+                yield f"chunk {i}\n".encode()
+                await asyncio.sleep(0)
+
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    return app
+
+
+def legacy_app() -> FastAPI:
+    app = _routes(FastAPI())
+    app.add_middleware(LegacyRequestLoggingMiddleware)
+    app.add_middleware(LegacyRateLimitMiddleware, limiter=RateLimiter())
+    app.add_middleware(LegacyI18nMiddleware)
+    app.add_middleware(LegacySecurityHeadersMiddleware)
+    return app
+
+
+def asgi_app() -> FastAPI:
+    app = _routes(FastAPI())
+    app.add_middleware(RequestLoggingMiddleware)
+    app.add_middleware(
+        RateLimitMiddleware,
+        general_limit=UNLIMITED,
+        auth_limit=UNLIMITED,
+        user_limit=UNLIMITED,
+        limiter=RateLimiter(),
+    )
+    app.add_middleware(I18nMiddleware)
+    app.add_middleware(SecurityHeadersMiddleware)
+    return app
+
+
+# ----------------------------------------------------------------------
+# Driver
+# ----------------------------------------------------------------------
+
+
+async def _request(app, path: str) -> Dict:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"bench"),
+            (b"accept-language", b"es-ES,es;q=0.9,en;q=0.8"),
+            (b"user-agent", b"benchmark"),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    result = {"status": None, "chunks": 0, "first_byte": None}
+    start = time.perf_counter()
+    request_sent, response_done = False, asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Like a server: nothing more until the client goes away
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            if result["first_byte"] is None:
+                result["first_byte"] = time.perf_counter() - start
+            result["chunks"] += 1
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            response_done.set()
+
+    await app(scope, receive, send)
+    result["latency"] = time.perf_counter() - start
+    return result
+
+
+async def _run(app, path: str, requests: int, concurrency: int) -> Dict:
+    latency, first_byte = LatencySketch(), LatencySketch()
+    chunks: List[int] = []
+
+    async def worker(count: int):
+        for _ in range(count):
+            result = await _request(app, path)
+            latency.add(result["latency"] * 1000)
+            first_byte.add((result["first_byte"] or result["latency"]) * 1000)
+            chunks.append(result["chunks"])
+
+    await _request(app, path)  # build the middleware stack
+    share, extra = divmod(requests, concurrency)
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(share + (i < extra)) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests_per_second": requests / elapsed,
+        "p50_ms": latency.quantile(0.5),
+        "p99_ms": latency.quantile(0.99),
+        "first_byte_p50_ms": first_byte.quantile(0.5),
+        "body_chunks": max(chunks),
+    }
+
+
+def run(requests: int = 20000, concurrency: int = 50) -> Dict[str, Dict[str, Dict]]:
+    """Benchmark both stacks on a JSON and a streaming endpoint."""
+    logging.getLogger("app.middleware.request_logging").setLevel(logging.WARNING)
+    logging.getLogger(__name__).setLevel(logging.WARNING)
+    results: Dict[str, Dict[str, Dict]] = {}
+    for name, factory in (("BaseHTTPMiddleware", legacy_app), ("pure ASGI", asgi_app)):
+        app = factory()
+        results[name] = {
+            "json": asyncio.run(_run(app, "/items/1", requests, concurrency)),
+            "stream": asyncio.run(_run(app, "/stream", max(1, requests // 10), concurrency)),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    results = run(args.requests, args.concurrency)
+    print(f"\n{'stack':<20}{'endpoint':<10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'TTFB ms':>10}")
+    print("-" * 70)
+    for stack, endpoints in results.items():
+        for endpoint, r in endpoints.items():
+            print(
+                f"{stack:<20}{endpoint:<10}{r['requests_per_second']:>10.0f}"
+                f"{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['first_byte_p50_ms']:>10.3f}"
+            )
+    legacy, asgi = results["BaseHTTPMiddleware"]["json"], results["pure ASGI"]["json"]
+    print(
+        f"\nThroughput: {asgi['requests_per_second'] / legacy['requests_per_second']:.2f}x, "
+        f"p99 latency: {legacy['p99_ms'] / asgi['p99_ms']:.2f}x lower\n"
+    )
+
+
+if __name__ == "__main__":
+    main()
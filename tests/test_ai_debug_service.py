@@ -0,0 +1,123 @@
+"""
+AI Debug Service Tests
+
+Tests for write-behind debug logging, payload compression, sampling and
+bounded session tracking.
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.models.ai_debug_logs import AIDebugLog, AIDebugSession
+from app.services.ai_debug_service import (
+    AIDebugLogWriter,
+    AIDebugService,
+    SessionTracker,
+    compress_payload,
+    decompress_payload,
+)
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(bind=engine)
+
+
+def _service(session_factory, sample_rate=1.0, max_queue=100):
+    writer = AIDebugLogWriter(
+        max_queue=max_queue, batch_size=50, flush_interval=60, session_factory=session_factory
+    )
+    # Keep the background thread out of the way; tests flush explicitly
+    writer._ensure_started = lambda: None
+    return AIDebugService(sample_rate=sample_rate, writer=writer)
+
+
+def _log(service, session_id, success=True, output=None):
+    asyncio.run(
+        service.log_step(
+            None, session_id, "evaluate", "Evaluate answer",
+            input_data={"prompt": "Explain federalism"}, output_data=output or {"score": 7},
+            model_used="gemini-3.0-flash", tokens_used=2000, duration_ms=120, success=success,
+        )
+    )
+
+
+def test_payload_compression_round_trip():
+    small = '{"score": 7}'
+    assert compress_payload(small) == small
+
+    large = '{"text": "%s"}' % ("federalism " * 500)
+    packed = compress_payload(large)
+    assert packed.startswith("~")
+    assert len(packed) < len(large) / 5
+    assert decompress_payload(packed) == large
+    assert decompress_payload("legacy plain text") == "legacy plain text"
+
+
+def test_steps_are_written_in_batches(session_factory):
+    service = _service(session_factory)
+    session_id = service.start_session(None, "drill_evaluation", related_entity_id="q1")
+    _log(service, session_id, output={"feedback": "x" * 5000})
+    _log(service, session_id)
+    service.end_session(None, session_id, {"score": 7})
+
+    db = session_factory()
+    assert db.query(AIDebugLog).count() == 0  # nothing written on the request path
+
+    service.flush()
+    session = db.query(AIDebugSession).one()
+    assert session.operation_status == "completed"
+    assert session.total_steps == 2
+    assert session.total_tokens == 4000
+
+    logs = service.get_session_logs(db, session_id)
+    assert [log["step_number"] for log in logs] == [1, 2]
+    details = service.get_step_details(db, session_id, 1)
+    assert details["output_full"] == '{\n  "feedback": "%s"\n}' % ("x" * 5000)
+    assert db.query(AIDebugLog).first().output_full.startswith("~")
+    db.close()
+
+
+def test_unsampled_sessions_keep_failures(session_factory):
+    service = _service(session_factory, sample_rate=0.0)
+
+    quiet = service.start_session(None, "topic_check")
+    _log(service, quiet)
+    service.end_session(None, quiet, "ok")
+
+    failing = service.start_session(None, "topic_check")
+    _log(service, failing)
+    _log(service, failing, success=False)
+    service.end_session(None, failing, "error", had_errors=True)
+    service.flush()
+
+    db = session_factory()
+    assert [s.session_id for s in db.query(AIDebugSession)] == [failing]
+    assert [(l.step_number, l.success) for l in db.query(AIDebugLog)] == [(2, False)]
+    assert db.query(AIDebugSession).one().operation_status == "failed"
+    db.close()
+
+
+def test_full_queue_drops_instead_of_blocking(session_factory):
+    service = _service(session_factory, max_queue=2)
+    session_id = service.start_session(None, "drill_evaluation")
+    _log(service, session_id)
+    _log(service, session_id)
+
+    stats = service.get_writer_stats()
+    assert stats["pending"] == 2
+    assert stats["dropped"] == 1
+
+
+def test_session_tracker_is_bounded():
+    tracker = SessionTracker(max_sessions=2, ttl_seconds=3600)
+    for session_id in ("a", "b", "c"):
+        tracker.add(session_id, {})
+    assert tracker.get("a") is None
+    assert len(tracker) == 2
+
+    expiring = SessionTracker(max_sessions=10, ttl_seconds=0)
+    expiring.add("a", {})
+    assert expiring.get("a") is None
@@ -0,0 +1,127 @@
+"""
+AI Metering Tests
+
+Tests for per-thread usage counters, Redis aggregation across workers and
+metering of the provider fallback cascade.
+"""
+
+import asyncio
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from app.services.ai_metering import AIMeter, estimate_cost
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def redis():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    with patch("app.services.ai_metering.get_redis", return_value=client):
+        yield client
+
+
+def test_counters_sum_across_threads():
+    meter = AIMeter(flush_interval=0)
+
+    def work():
+        for _ in range(500):
+            meter.record("google", "gemini-1.5-flash", "prelims_recall", 180.0,
+                         prompt_tokens=10, completion_tokens=5)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    meter.record("google", "gemini-1.5-flash", "prelims_recall", 40000.0, success=False)
+
+    with patch("app.services.ai_metering.get_redis", return_value=None):
+        summary = meter.summary()
+    assert summary["scope"] == "process"
+    row = summary["by_model"][0]
+    assert row["requests"] == 2001
+    assert row["errors"] == 1
+    assert row["prompt_tokens"] == 20000
+    assert row["p50_latency_ms"] == 250.0
+    assert row["p95_latency_ms"] == 250.0
+    assert summary["by_feature"]["prelims_recall"]["tokens"] == 30000
+
+
+def test_workers_aggregate_in_redis(redis):
+    first, second = AIMeter(flush_interval=0), AIMeter(flush_interval=0)
+    first.record("google", "gemini-1.5-flash", "chat", 300.0, prompt_tokens=100)
+    second.record("google", "gemini-1.5-flash", "chat", 700.0, prompt_tokens=50)
+    second.record("openrouter", "x:free", "chat", 900.0, fallback=True)
+
+    assert first.flush_to_redis() == 1
+    assert first.flush_to_redis() == 0  # nothing new, nothing double counted
+
+    summary = second.summary()
+    assert summary["scope"] == "cluster"
+    rows = {(r["provider"], r["feature"]): r for r in summary["by_model"]}
+    assert rows[("google", "chat")]["requests"] == 2
+    assert rows[("google", "chat")]["prompt_tokens"] == 150
+    assert rows[("google", "chat")]["avg_latency_ms"] == 500.0
+    assert rows[("openrouter", "chat")]["fallbacks"] == 1
+    assert rows[("openrouter", "chat")]["estimated_cost"] == 0.0
+
+    metrics = first.prometheus()
+    assert 'ai_requests_total{provider="google",model="gemini-1.5-flash",feature="chat"} 2' in metrics
+    assert 'ai_request_latency_ms_bucket{provider="google",model="gemini-1.5-flash",feature="chat",le="+Inf"} 2' in metrics
+    assert 'kind="prompt"} 150' in metrics
+
+
+def test_router_reports_provider_and_meters_fallbacks():
+    from app.services.ai_router import ai_router
+    from app.services.gemini_service import gemini_service
+
+    meter = AIMeter(flush_interval=0)
+    plan = [("google", "key", "gemini-1.5-flash"), ("openrouter", "key", "x:free")]
+    with patch("app.services.gemini_service.ai_meter", meter), patch(
+        "app.services.ai_router.ai_meter", meter
+    ), patch("app.services.ai_metering.get_redis", return_value=None), patch.object(
+        gemini_service, "_get_execution_plan", return_value=plan
+    ), patch.object(
+        gemini_service, "_call_google", side_effect=RuntimeError("quota")
+    ), patch.object(
+        gemini_service, "_call_openrouter_sync", return_value=("hello", (12, 3))
+    ):
+        result = asyncio.run(ai_router.route("Say hello", feature="test"))
+        summary = ai_router.get_usage_summary()
+
+    assert result["content"] == "hello"
+    assert (result["provider"], result["model"]) == ("openrouter", "x:free")
+    assert result["usage"] == {"prompt_tokens": 12, "completion_tokens": 3, "fallback_hops": 1}
+
+    rows = {r["provider"]: r for r in summary["by_model"]}
+    assert rows["google"]["errors"] == 1
+    assert rows["openrouter"]["fallbacks"] == 1
+    assert summary["totals"] == {"requests": 2, "errors": 1, "tokens": 15, "estimated_cost": 0.0}
+
+
+def test_estimate_cost():
+    assert estimate_cost("gemini-3.0-pro-latest", 2000) == pytest.approx(0.0025)
+    assert estimate_cost("meta-llama/llama-3.3-70b-instruct:free", 5000) == 0.0
+    assert estimate_cost("unknown", 1000) == pytest.approx(0.0005)
+
+
+def test_metrics_endpoint_requires_configured_token():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app.api.api_v1.endpoints import ai_debug
+
+    app = FastAPI()
+    app.include_router(ai_debug.router, prefix="/ai-debug")
+    client = TestClient(app)
+
+    # Per-model usage is admin data: never served without a token
+    with patch("app.api.deps.settings.METRICS_TOKEN", ""):
+        assert client.get("/ai-debug/metrics").status_code == 404
+    with patch("app.api.deps.settings.METRICS_TOKEN", "scrape"):
+        assert client.get("/ai-debug/metrics").status_code == 401
+        ok = client.get("/ai-debug/metrics", headers={"Authorization": "Bearer scrape"})
+        assert ok.status_code == 200
@@ -0,0 +1,124 @@
+"""
+ASGI Middleware Tests
+
+Tests for the pure ASGI security-header, i18n, rate-limit and request-logging
+middlewares, including streaming responses through the whole stack.
+"""
+
+import asyncio
+import logging
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core.rate_limiting import RateLimiter, RateLimitMiddleware
+from app.middleware.i18n_middleware import I18nMiddleware
+from app.middleware.request_logging import RequestLoggingMiddleware
+from app.middleware.security_headers import SecurityHeadersMiddleware
+
+
+def _app(**rate_limits) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/language")
+    def language(request: Request):
+        return {"language": request.state.language, "is_rtl": request.state.is_rtl}
+
+    @app.get("/framed")
+    def framed():
+        return JSONResponse({}, headers={"X-Frame-Options": "SAMEORIGIN"})
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        return {"body": (await request.body()).decode()}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(5):
+                yield f"chunk {i}\n".encode()
+                await asyncio.sleep(0)
+
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    app.add_middleware(RequestLoggingMiddleware, log_body=True)
+    app.add_middleware(RateLimitMiddleware, limiter=RateLimiter(), **rate_limits)
+    app.add_middleware(I18nMiddleware)
+    app.add_middleware(SecurityHeadersMiddleware, strict_transport_security="max-age=60")
+    return app
+
+
+@pytest.fixture
+def client():
+    return TestClient(_app())
+
+
+def test_security_headers_replace_endpoint_values(client):
+    response = client.get("/framed")
+
+    assert response.headers["x-frame-options"] == "DENY"
+    assert response.headers["x-content-type-options"] == "nosniff"
+    assert response.headers["strict-transport-security"] == "max-age=60"
+    assert "frame-ancestors 'none'" in response.headers["content-security-policy"]
+    assert response.headers.get_list("x-frame-options") == ["DENY"]
+
+
+def test_language_detection(client):
+    assert client.get("/language").json() == {"language": "en", "is_rtl": False}
+
+    response = client.get("/language", headers={"Accept-Language": "fr-CA,ar;q=0.9"})
+    assert response.json()["language"] == "fr"
+    assert response.headers["content-language"] == "fr"
+
+    response = client.get("/language?lang=ar", headers={"Accept-Language": "fr"})
+    assert response.json() == {"language": "ar", "is_rtl": True}
+    assert response.headers["x-rtl-enabled"] == "true"
+
+
+def test_rate_limit_rejects_with_retry_after():
+    client = TestClient(_app(general_limit=3, auth_limit=1, window=60))
+
+    responses = [client.get("/language") for _ in range(4)]
+    assert [r.status_code for r in responses] == [200, 200, 200, 429]
+    assert responses[0].headers["x-ratelimit-limit"] == "3"
+    assert 1 <= int(responses[-1].headers["retry-after"]) <= 60
+    assert responses[-1].json()["detail"].startswith("Rate limit exceeded")
+    # Rejections still carry the outer middlewares' headers
+    assert responses[-1].headers["x-frame-options"] == "DENY"
+
+    # Authenticated users get their own, higher budget
+    assert client.get("/language", headers={"Authorization": "Bearer abc"}).status_code == 200
+
+
+def test_sliding_window_limiter():
+    limiter = RateLimiter()
+
+    async def check():
+        return [await limiter.is_allowed("k", 2, 60) for _ in range(3)]
+
+    assert [allowed for allowed, _ in asyncio.run(check())] == [True, True, False]
+    limiter.requests["k"][0] -= 61  # oldest request leaves the window
+    assert asyncio.run(limiter.is_allowed("k", 2, 60)) == (True, 0)
+
+
+def test_request_logging_replays_body(client, caplog):
+    with caplog.at_level(logging.INFO, logger="app.middleware.request_logging"):
+        response = client.post("/echo", content=b"hello", headers={"X-Request-ID": "abc"})
+
+    assert response.json() == {"body": "hello"}
+    assert response.headers["x-request-id"] == "abc"
+    assert response.headers["x-response-time"].endswith("ms")
+    incoming, completed = [r for r in caplog.records if r.name == "app.middleware.request_logging"]
+    assert incoming.request_body == "hello"
+    assert completed.status_code == 200
+
+
+def test_streaming_passes_through_stack(client):
+    with client.stream("GET", "/stream") as response:
+        chunks = list(response.iter_bytes())
+
+    assert b"".join(chunks) == b"".join(f"chunk {i}\n".encode() for i in range(5))
+    assert response.headers["content-language"] == "en"
+    assert response.headers["x-ratelimit-limit"] == "100"
@@ -0,0 +1,113 @@
+"""
+Cohort Service Tests
+
+Tests for the grouped-query retention matrix and closed-month caching.
+"""
+
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import event
+
+from app.models.activity_log import ActivityLog
+from app.models.course import Course
+from app.models.enrollment import Enrollment, EnrollmentStatus
+from app.models.order import Order, OrderStatus
+from app.models.user import User
+from app.services.cohort_engine import CohortEngine, parse_period
+from app.services.cohort_service import CohortService
+
+NOW = datetime(2026, 4, 10)
+
+
+@pytest.fixture
+def cohort_engine():
+    engine = CohortEngine()
+    with patch("app.services.cohort_engine.get_redis", return_value=None), patch(
+        "app.services.cohort_service.cohort_engine", engine
+    ):
+        yield engine
+
+
+@pytest.fixture
+def users(db):
+    users = [User(email=f"user{i}@example.com", full_name=f"User {i}") for i in range(4)]
+    db.add_all(users)
+    db.flush()
+    course = Course(title="Polity", slug="polity", instructor_id=users[0].id)
+    db.add(course)
+    db.flush()
+
+    def enroll(user, when, status=EnrollmentStatus.ACTIVE):
+        db.add(Enrollment(user_id=user.id, course_id=course.id, enrolled_at=when, status=status))
+
+    # January cohort: users 0, 1, 2. February cohort: user 3
+    enroll(users[0], datetime(2026, 1, 5), EnrollmentStatus.COMPLETED)
+    enroll(users[1], datetime(2026, 1, 20))
+    enroll(users[2], datetime(2026, 1, 25))
+    enroll(users[3], datetime(2026, 2, 2))
+    enroll(users[0], datetime(2026, 2, 14))  # Re-enrollment counts as activity
+
+    db.add_all(
+        [
+            ActivityLog(user_id=users[1].id, action="login", timestamp=datetime(2026, 2, 3)),
+            ActivityLog(user_id=users[1].id, action="login", timestamp=datetime(2026, 3, 3)),
+            ActivityLog(user_id=users[3].id, action="login", timestamp=datetime(2026, 4, 1)),
+            Order(order_number="A1", user_id=users[0].id, status=OrderStatus.COMPLETED, total=90.0),
+            Order(order_number="A2", user_id=users[1].id, status=OrderStatus.FAILED, total=50.0),
+        ]
+    )
+    db.commit()
+    return users
+
+
+def test_matrix_from_single_grouped_query(engine, db, users, cohort_engine):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+
+    matrix = cohort_engine.matrix(db, now=NOW)
+
+    # One query for closed months, one for the current month
+    assert len(statements) == 2
+    assert matrix.row(parse_period("2026-01")) == [3, 2, 1, 0]
+    assert matrix.row(parse_period("2026-02")) == [1, 0, 1]
+    assert matrix.periods() == [("2026-01", 3), ("2026-02", 1)]
+
+
+def test_closed_months_are_cached(engine, db, users, cohort_engine):
+    cohort_engine.matrix(db, now=NOW)
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+
+    # Same month: only the current month is recomputed
+    cohort_engine.matrix(db, now=NOW)
+    assert len(statements) == 1
+
+    # A month later only the newly closed month is folded in
+    statements.clear()
+    matrix = cohort_engine.matrix(db, now=datetime(2026, 5, 3))
+    assert len(statements) == 2
+    assert matrix.row(parse_period("2026-01")) == [3, 2, 1, 0, 0]
+
+
+def test_retention_and_comparison_slice_matrix(db, users, cohort_engine):
+    with patch("app.services.cohort_engine.datetime") as mock_datetime:
+        mock_datetime.utcnow.return_value = NOW
+        retention = CohortService.analyze_cohort_retention(db, "2026-01")
+        comparison = CohortService.compare_cohorts(db, ["2026-01", "2026-02"])
+
+    assert retention["initial_size"] == 3
+    assert [r["retention_rate"] for r in retention["retention_data"]] == [
+        100.0, 66.67, 33.33, 0.0,
+    ]
+
+    january, february = comparison["cohorts"]
+    assert january["retention_summary"]["month_1_retention"] == 66.67
+    assert january["performance"]["total_enrollments"] == 4
+    assert january["performance"]["metrics"]["completion_rate"] == 25.0
+    assert january["performance"]["metrics"]["total_revenue"] == 90.0
+    assert january["performance"]["metrics"]["ltv"] == 30.0
+    assert february["retention_summary"]["initial_size"] == 1
+    assert february["performance"]["metrics"]["total_revenue"] == 0.0
@@ -0,0 +1,258 @@
+"""
+Entitlement Tests
+
+Tests for batched course access maps (drip rules, subscriptions, learning
+paths), caching and event-driven invalidation.
+"""
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+
+from app.db.instrumentation import assert_max_queries, count_queries
+from app.models.course import Course
+from app.models.enrollment import Enrollment, EnrollmentStatus
+from app.models.learning_path import LearningPath, PathCourse, PathEnrollment
+from app.models.lesson import Lesson
+from app.models.lesson_drip import LessonDripSetting
+from app.models.lesson_progress import LessonProgress, ProgressStatus
+from app.models.module import Module
+from app.models.subscription import SubscriptionPlan, UserSubscription
+from app.models.user import User
+from app.services.entitlements import EntitlementResolver, entitlements
+from app.services.lesson_access import check_lesson_access
+from app.services.path_graph import path_graph
+from app.services.subscription_service import SubscriptionService
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    entitlements.clear()
+    path_graph.clear()
+    yield
+    entitlements.clear()
+    path_graph.clear()
+
+
+@pytest.fixture
+def course(db):
+    """A course with two modules; lessons 2-4 are dripped."""
+    teacher = User(email="teacher@example.com", full_name="Teacher")
+    student = User(email="student@example.com", full_name="Student")
+    db.add_all([teacher, student])
+    db.flush()
+    course = Course(title="Polity", slug="polity", instructor_id=teacher.id)
+    db.add(course)
+    db.flush()
+    first = Module(course_id=course.id, title="Basics", order_index=0)
+    second = Module(course_id=course.id, title="Advanced", order_index=1)
+    db.add_all([first, second])
+    db.flush()
+    lessons = [
+        Lesson(module_id=first.id, title="Intro", order_index=0, is_preview=True),
+        Lesson(module_id=first.id, title="Preamble", order_index=1),
+        Lesson(module_id=second.id, title="Rights", order_index=0),
+        Lesson(module_id=second.id, title="Duties", order_index=1),
+        Lesson(module_id=second.id, title="Amendments", order_index=2),
+    ]
+    db.add_all(lessons)
+    db.flush()
+    db.add_all(
+        [
+            LessonDripSetting(lesson_id=lessons[1].id, unlock_type="sequence",
+                              prerequisite_lesson_id=lessons[0].id),
+            LessonDripSetting(lesson_id=lessons[2].id, unlock_type="after_days",
+                              unlock_after_days=7),
+            LessonDripSetting(lesson_id=lessons[3].id, unlock_type="date",
+                              unlock_date=datetime.utcnow() + timedelta(days=2)),
+            LessonDripSetting(lesson_id=lessons[4].id, unlock_type="date",
+                              unlock_date=datetime.utcnow() - timedelta(days=1)),
+        ]
+    )
+    db.commit()
+    # Read ids now so later commits don't refresh them inside query counts
+    return course.id, student.id, [lesson.id for lesson in lessons]
+
+
+def _enroll(db, course_id, user_id, **kwargs):
+    enrollment = Enrollment(user_id=user_id, course_id=course_id, **kwargs)
+    db.add(enrollment)
+    db.commit()
+    return enrollment
+
+
+def test_outline_in_one_batch(db, engine, course):
+    course, student, lessons = course
+
+    with assert_max_queries(engine, 5):
+        access_map = entitlements.course_access(db, student, course)
+    assert not access_map.has_course_access
+    assert [lesson["reason"] for lesson in access_map.outline()] == [
+        "preview", "not_enrolled", "not_enrolled", "not_enrolled", "not_enrolled",
+    ]
+
+    _enroll(db, course, student)
+    with assert_max_queries(engine, 5):
+        outline = entitlements.course_access(db, student, course).outline()
+    assert [lesson["lesson_id"] for lesson in outline] == lessons
+    assert [lesson["reason"] for lesson in outline] == [
+        "no_drip", "prerequisite_not_completed", "days_locked", "date_locked", "date_unlocked",
+    ]
+    assert [lesson["is_locked"] for lesson in outline] == [False, True, True, True, False]
+    assert outline[1]["prerequisite_lesson_id"] == lessons[0]
+    assert outline[2]["days_remaining"] == 7
+
+    # Every per-lesson check is answered from the cached map
+    with count_queries(engine) as statements:
+        infos = [check_lesson_access(db, student, lesson, course) for lesson in lessons]
+    assert statements == []
+    assert [info.has_access for info in infos] == [True, False, False, False, True]
+    assert check_lesson_access(db, student, 10_000, course).reason == "not_in_course"
+
+
+def test_progress_and_drip_changes_invalidate(db, engine, course):
+    course, student, lessons = course
+    _enroll(db, course, student)
+    assert not entitlements.can_access(db, student, course, lessons[1])
+
+    # Heartbeats that don't complete a lesson keep the cached map
+    progress = LessonProgress(user_id=student, lesson_id=lessons[0],
+                              status=ProgressStatus.IN_PROGRESS)
+    db.add(progress)
+    db.commit()
+    entitlements.course_access(db, student, course)
+    progress.time_spent_seconds = 120
+    db.commit()
+    with count_queries(engine) as statements:
+        entitlements.course_access(db, student, course)
+    assert statements == []
+
+    progress.status = ProgressStatus.COMPLETED
+    db.commit()
+    access_map = entitlements.course_access(db, student, course)
+    assert access_map.can_access(lessons[1])
+    assert access_map.lessons[lessons[0]].is_completed
+
+    drip = db.query(LessonDripSetting).filter_by(lesson_id=lessons[3]).one()
+    drip.is_active = False
+    db.commit()
+    assert entitlements.can_access(db, student, course, lessons[3])
+
+
+def test_timed_unlocks_expire_the_map(db, engine, course):
+    course, student, lessons = course
+    enrollment = _enroll(db, course, student, enrolled_at=datetime.utcnow() - timedelta(days=6))
+
+    access_map = entitlements.course_access(db, student, course)
+    assert access_map.valid_until == enrollment.enrolled_at + timedelta(days=7)
+
+    with patch("app.services.entitlements.datetime") as clock:
+        clock.utcnow.return_value = access_map.valid_until + timedelta(seconds=1)
+        refreshed = entitlements.course_access(db, student, course)
+    assert refreshed is not access_map
+    assert refreshed.can_access(lessons[2])
+
+    enrollment.status = EnrollmentStatus.EXPIRED
+    db.commit()
+    access_map = entitlements.course_access(db, student, course)
+    assert access_map.reason == "enrollment_expired"
+    assert access_map.can_access(lessons[0])  # preview
+    assert not access_map.can_access(lessons[4])
+
+
+def test_subscription_grants_access(db, course):
+    course, student, lessons = course
+    plan = SubscriptionPlan(name="Standard", slug="standard", monthly_price=Decimal("9.99"),
+                            access_level="limited")
+    db.add(plan)
+    db.flush()
+    db.add(UserSubscription(user_id=student, plan_id=plan.id, billing_cycle="monthly",
+                            price_paid=Decimal("9.99"),
+                            current_period_end=datetime.utcnow() + timedelta(days=30)))
+    db.commit()
+
+    assert SubscriptionService.check_access(db, student, "limited")
+    assert not SubscriptionService.check_access(db, student, "standard")
+    assert not entitlements.can_access(db, student, course)
+
+    # Plan changes reach every subscriber
+    plan.access_level = "premium"
+    db.commit()
+    assert SubscriptionService.check_access(db, student, "premium")
+    access_map = entitlements.course_access(db, student, course)
+    assert access_map.granted_by == "subscription"
+    assert access_map.subscription_level == "premium"
+    assert access_map.can_access(lessons[4])
+
+
+def test_path_prerequisites(db, course):
+    course, student, _ = course
+    teacher_id = db.get(Course, course).instructor_id
+    basics = Course(title="Basics", slug="basics", instructor_id=teacher_id)
+    db.add(basics)
+    db.flush()
+    basics_id = basics.id
+    path = LearningPath(title="UPSC", slug="upsc", creator_id=teacher_id)
+    db.add(path)
+    db.flush()
+    db.add_all(
+        [
+            PathCourse(path_id=path.id, course_id=basics_id, order_index=0),
+            PathCourse(path_id=path.id, course_id=course, order_index=1,
+                       prerequisite_course_id=basics_id),
+        ]
+    )
+    db.commit()
+    path_id = path.id
+
+    assert not entitlements.course_access(db, student, course).can_access_path_course(path_id)
+
+    db.add(PathEnrollment(path_id=path_id, student_id=student))
+    db.commit()
+    assert entitlements.course_access(db, student, basics_id).can_access_path_course(path_id)
+    assert not entitlements.course_access(db, student, course).can_access_path_course(path_id)
+
+    _enroll(db, basics_id, student, status=EnrollmentStatus.COMPLETED)
+    assert entitlements.course_access(db, student, course).can_access_path_course(path_id)
+
+
+def test_versions_are_shared_through_redis(db, engine, course):
+    fakeredis = pytest.importorskip("fakeredis")
+    course, student, lessons = course
+    _enroll(db, course, student)
+    other_worker = EntitlementResolver()
+
+    with patch("app.services.entitlements.get_redis",
+               return_value=fakeredis.FakeRedis(decode_responses=True)):
+        assert not other_worker.can_access(db, student, course, lessons[1])
+        with count_queries(engine) as statements:
+            other_worker.can_access(db, student, course, lessons[1])
+        assert statements == []
+
+        # Committed on this worker, seen by the other one
+        db.add(LessonProgress(user_id=student, lesson_id=lessons[0],
+                              status=ProgressStatus.COMPLETED))
+        db.commit()
+        assert other_worker.can_access(db, student, course, lessons[1])
+
+
+def test_uncommitted_grants_are_not_cached(db, course):
+    fakeredis = pytest.importorskip("fakeredis")
+    course, student, lessons = course
+
+    with patch("app.services.entitlements.get_redis",
+               return_value=fakeredis.FakeRedis(decode_responses=True)):
+        db.add(Enrollment(user_id=student, course_id=course))
+        db.flush()
+        # The transaction sees its own write, but the map isn't kept
+        assert entitlements.course_access(db, student, course).has_course_access
+        db.rollback()
+        assert not entitlements.course_access(db, student, course).has_course_access
+
+        _enroll(db, course, student)
+        assert entitlements.course_access(db, student, course).has_course_access
+        assert entitlements.course_access(db, student, course) is entitlements.course_access(
+            db, student, course
+        )
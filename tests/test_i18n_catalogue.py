@@ -0,0 +1,188 @@
+"""
+i18n Catalogue Tests
+
+Tests for the in-process translation catalogues: one query per
+(language, namespace), reloads on writes (locally and across workers over
+Redis pub/sub), ETag revalidation of /translations/{namespace} and
+language detection from cached user preferences.
+"""
+
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+import app.models  # noqa: F401 - register all mappers
+from app.db.instrumentation import count_queries
+from app.db.session import get_db
+from app.middleware.i18n_middleware import I18nMiddleware
+from app.schemas.translation import TranslationCreate, TranslationUpdate
+from app.services.i18n_catalogue import (
+    CatalogueStore,
+    ReloadListener,
+    UserLanguageCache,
+    catalogues,
+    user_languages,
+)
+from app.services.translation_service import TranslationService, UserLanguageService
+
+KEYS = 100
+
+
+@pytest.fixture
+def backend(redis_or_local):
+    with patch("app.services.i18n_catalogue.get_redis", return_value=redis_or_local):
+        yield redis_or_local
+    catalogues.clear()
+    user_languages.clear()
+
+
+@pytest.fixture
+def seeded(db, backend):
+    TranslationService.bulk_create_translations(
+        db, "es", "course", {f"course.key{i}": f"valor {i}" for i in range(KEYS)}
+    )
+    TranslationService.bulk_create_translations(db, "en", "course", {"course.key0": "value 0"})
+
+
+def test_page_of_strings_costs_one_query(db, engine, seeded):
+    with count_queries(engine) as statements:
+        values = [
+            TranslationService.get_translation(db, f"course.key{i}", "es", "course")
+            for i in range(KEYS)
+        ]
+        assert TranslationService.get_translation(db, "course.missing", "es", "course") is None
+    assert values[7] == "valor 7"
+    assert len(statements) == 1
+
+    catalogue = catalogues.get(db, "es", "course")
+    with pytest.raises(TypeError):
+        catalogue.entries["course.key0"] = "changed"
+    assert catalogues.get(db, "en", "course").etag != catalogue.etag
+    assert catalogue.matches(f'"x", W/{catalogue.etag}') and catalogue.matches("*")
+    assert not catalogue.matches(None) and not catalogue.matches('"x"')
+
+
+def test_writes_reload_the_catalogue(db, engine, seeded):
+    before = catalogues.get(db, "es", "course")
+    catalogues.get(db, "en", "course")
+
+    # Bulk upsert: one lookup for all keys instead of one per key
+    with count_queries(engine) as statements:
+        created = TranslationService.bulk_create_translations(
+            db, "es", "course", {"course.key0": "nuevo", "course.extra": "extra"}
+        )
+    assert created == 1
+    assert sum("FROM translations" in s for s in statements) == 1
+
+    after = catalogues.get(db, "es", "course")
+    assert after.version > before.version and after.etag != before.etag
+    assert after.get("course.key0") == "nuevo" and before.get("course.key0") == "valor 0"
+
+    row = TranslationService.create_translation(
+        db, TranslationCreate(key="course.title", language_code="es", value="Título", namespace="course")
+    )
+    assert TranslationService.get_translation(db, "course.title", "es", "course") == "Título"
+    TranslationService.update_translation(db, row.id, TranslationUpdate(value="Curso"))
+    assert TranslationService.get_translation(db, "course.title", "es", "course") == "Curso"
+    # Other catalogues stay loaded
+    with count_queries(engine) as statements:
+        catalogues.get(db, "en", "course")
+    assert statements == []
+
+
+def test_reload_reaches_other_workers(db):
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis(decode_responses=True)
+    writer, reader = CatalogueStore(), CatalogueStore()
+    listener = ReloadListener(reader, UserLanguageCache())
+
+    with patch("app.services.i18n_catalogue.get_redis", return_value=client):
+        TranslationService.bulk_create_translations(db, "fr", "common", {"hello": "bonjour"})
+        assert reader.get(db, "fr", "common").get("hello") == "bonjour"
+        listener.start()
+        try:
+            time.sleep(0.2)
+            db.query(app.models.Translation).filter_by(key="hello").update({"value": "salut"})
+            db.commit()
+            writer.changed("fr", "common")
+            deadline = time.monotonic() + 5
+            while reader.get(db, "fr", "common").get("hello") != "salut" and time.monotonic() < deadline:
+                time.sleep(0.02)
+        finally:
+            listener.stop()
+        assert reader.get(db, "fr", "common").get("hello") == "salut"
+
+        # A load that read the stamp before a newer write was announced is not kept
+        reader.drop("fr", "common", 99)
+        assert reader.get(db, "fr", "common") is not reader.get(db, "fr", "common")
+    catalogues.clear()
+
+
+def test_translations_endpoint_revalidates_with_etag(db, seeded):
+    try:
+        from app.api.api_v1.endpoints import translation as endpoints
+    except ImportError as e:
+        pytest.skip(f"translation endpoints unavailable: {e}")
+
+    app = FastAPI()
+    app.include_router(endpoints.router)
+    app.dependency_overrides[get_db] = lambda: db
+    client = TestClient(app)
+
+    first = client.get("/translations/course", params={"language": "es"})
+    assert first.status_code == 200 and first.json()["total_count"] == KEYS
+    etag = first.headers["etag"]
+
+    cached = client.get("/translations/course", params={"language": "es"},
+                        headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b""
+    assert cached.headers["etag"] == etag
+
+    TranslationService.bulk_create_translations(db, "es", "course", {"course.key1": "otro"})
+    fresh = client.get("/translations/course", params={"language": "es"},
+                       headers={"If-None-Match": etag})
+    assert fresh.status_code == 200 and fresh.headers["etag"] != etag
+    assert fresh.json()["translations"]["course.key1"] == "otro"
+
+
+def test_middleware_uses_cached_preference(db, engine, backend):
+    class User:
+        id = 5
+
+    app = FastAPI()
+
+    @app.get("/language")
+    def language(request: Request):
+        return {"language": request.state.language}
+
+    def with_user(inner):
+        async def asgi(scope, receive, send):
+            scope.setdefault("state", {})["user"] = User()
+            await inner(scope, receive, send)
+        return asgi
+
+    client = TestClient(with_user(I18nMiddleware(app)))
+    session_factory = sessionmaker(bind=engine)
+
+    with patch("app.db.session.SessionLocal", session_factory):
+        # No preference yet: looked up once, then the header decides
+        assert client.get("/language", headers={"Accept-Language": "fr"}).json() == {"language": "fr"}
+        with count_queries(engine) as statements:
+            assert client.get("/language", headers={"Accept-Language": "fr"}).json() == {"language": "fr"}
+        assert statements == []
+
+        UserLanguageService.set_user_preference(db, User.id, "de")
+        with count_queries(engine) as statements:
+            assert client.get("/language").json() == {"language": "de"}
+        assert statements == []
+
+        # Another worker (empty local cache) reads the shared copy or the database once
+        user_languages.clear()
+        assert client.get("/language").json() == {"language": "de"}
+        with count_queries(engine) as statements:
+            assert client.get("/language").json() == {"language": "de"}
+        assert statements == []
@@ -0,0 +1,251 @@
+"""
+IdP Metadata Tests
+
+Tests for the SSO performance layer against a local stand-in identity
+provider: pooled connections across a login wave, cached OIDC discovery and
+key sets (shared across workers, refreshed on key rotation), local id_token
+verification and compiled SAML settings.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+from app.models.sso import SSOConfig, SSOProviderType
+from app.services import sso_service
+from app.services.idp_metadata import IdPMetadataCache, idp_metadata, sso_http
+from app.services.oauth_service import OAuthService
+
+CLIENT_ID = "lms-client"
+
+
+def _rsa_key(kid):
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public = jwk.construct(pem, "RS256").public_key().to_dict()
+    return pem, dict(public, kid=kid, use="sig", alg="RS256")
+
+
+class _IdPHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, document, status=200):
+        body = json.dumps(document).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+        if server.down:
+            self.reply({"error": "unavailable"}, status=503)
+        elif self.path == "/.well-known/openid-configuration":
+            self.reply({
+                "issuer": server.url,
+                "token_endpoint": f"{server.url}/token",
+                "userinfo_endpoint": f"{server.url}/userinfo",
+                "jwks_uri": f"{server.url}/jwks",
+            })
+        elif self.path == "/jwks":
+            self.reply({"keys": [public for _, public in server.keys]})
+        elif self.path == "/userinfo":
+            self.reply({"sub": "u-1", "email": "userinfo@example.com"})
+        else:
+            self.reply({}, status=404)
+
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers["Content-Length"]))
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+        claims = dict(server.claims, iss=server.url, aud=CLIENT_ID,
+                      iat=int(time.time()), exp=int(time.time()) + 300)
+        pem, public = server.keys[-1]
+        self.reply({
+            "access_token": "access",
+            "token_type": "Bearer",
+            "id_token": jwt.encode(claims, pem, algorithm="RS256", headers={"kid": public["kid"]}),
+        })
+
+
+class StandInIdP(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _IdPHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.hits = {}
+        self.down = False
+        self.keys = [_rsa_key("k1")]
+        self.claims = {"sub": "u-1", "email": "student@example.com", "given_name": "Ada"}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+@pytest.fixture
+def idp():
+    server = StandInIdP()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def backend(redis_or_local):
+    with patch("app.services.idp_metadata.get_redis", return_value=redis_or_local):
+        yield redis_or_local
+    idp_metadata.clear()
+    sso_http.close()
+
+
+def _config(idp, **settings):
+    return SSOConfig(
+        organization_id=1,
+        provider_type=SSOProviderType.OIDC,
+        provider_name="Stand-in",
+        client_id=CLIENT_ID,
+        client_secret="secret",
+        settings={"issuer": idp.url, **settings},
+    )
+
+
+async def _login(service):
+    success, tokens, error = await service.exchange_code("code")
+    assert success, error
+    return await service.user_info_from_tokens(tokens)
+
+
+def test_login_wave_uses_pool_and_cached_metadata(idp, backend):
+    service = OAuthService(_config(idp))
+
+    async def waves():
+        first = await asyncio.gather(*(_login(service) for _ in range(10)))
+        opened = idp.connections
+        second = [await _login(service) for _ in range(10)]
+        await sso_http.aclose()
+        return first + second, opened
+
+    results, opened = asyncio.run(waves())
+    assert all(success for success, _, _ in results)
+    assert results[-1][1]["email"] == "student@example.com"
+    assert results[-1][1]["first_name"] == "Ada"
+    # Discovery and keys fetched once; no userinfo calls since the id_token has the email
+    assert idp.hits["/.well-known/openid-configuration"] == 1
+    assert idp.hits["/jwks"] == 1 and "/userinfo" not in idp.hits
+    assert idp.hits["/token"] == 20
+    # The sequential wave reused the pooled connections
+    assert idp.connections == opened <= 10
+
+
+def test_key_rotation_and_claim_checks(idp, backend):
+    service = OAuthService(_config(idp))
+
+    async def scenario():
+        assert (await _login(service))[0]
+        idp.keys.append(_rsa_key("k2"))  # provider rotates its signing key
+        # Within the refresh window an unknown key id does not refetch
+        rotated = await _login(service)
+        assert idp.hits["/jwks"] == 1
+        with patch.object(idp_metadata, "min_refresh", 0):
+            refreshed = await _login(service)
+        assert idp.hits["/jwks"] == 2
+
+        idp.claims["email"] = None  # no email claim: falls back to userinfo
+        fallback = await _login(service)
+
+        other = OAuthService(_config(idp))
+        other.client_id = "another-client"
+        rejected = await other.verify_id_token(
+            (await service.exchange_code("code"))[1]["id_token"]
+        )
+        return rotated, refreshed, fallback, rejected
+
+    rotated, refreshed, fallback, rejected = asyncio.run(scenario())
+    # A rejected id_token falls back to userinfo, which this stand-in answers
+    assert rotated[1]["email"] == "userinfo@example.com"
+    assert refreshed[1]["email"] == "student@example.com"
+    assert fallback[1]["email"] == "userinfo@example.com"
+    assert rejected == (False, None)
+
+
+def test_metadata_shared_and_kept_when_idp_down(idp):
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis(decode_responses=True)
+
+    async def scenario():
+        with patch("app.services.idp_metadata.get_redis", return_value=client):
+            first, second = IdPMetadataCache(ttl=0.2), IdPMetadataCache(ttl=0.2)
+            await first.discovery(idp.url)
+            document = await second.discovery(idp.url)  # another worker
+            assert idp.hits["/.well-known/openid-configuration"] == 1
+
+            await asyncio.sleep(0.3)
+            idp.down = True
+            assert await second.discovery(idp.url) == document
+            await sso_http.aclose()
+            return document
+
+    assert asyncio.run(scenario())["jwks_uri"] == f"{idp.url}/jwks"
+
+
+def test_sync_userinfo_uses_pooled_client(idp):
+    config = _config(idp)
+    config.userinfo_endpoint = f"{idp.url}/userinfo"
+    try:
+        for _ in range(3):
+            user = sso_service.OAuthService.get_user_info("access", config)
+        assert user["email"] == "userinfo@example.com"
+        assert idp.connections == 1
+    finally:
+        sso_http.close()
+
+
+def test_saml_settings_compiled_once_per_version():
+    pytest.importorskip("onelogin")
+    from app.services import saml_service
+
+    config = SSOConfig(
+        id=7,
+        organization_id=1,
+        provider_type=SSOProviderType.SAML,
+        provider_name="IdP",
+        idp_entity_id="https://idp.example.com",
+        sso_url="https://idp.example.com/sso",
+        x509_cert="",
+    )
+    try:
+        first = saml_service.SAMLService(config)
+        assert saml_service.SAMLService(config).saml_settings is first.saml_settings
+        config.sso_url = "https://idp.example.com/sso2"
+        assert saml_service.SAMLService(config).saml_settings is not first.saml_settings
+    finally:
+        saml_service.saml_settings_cache.invalidate()
@@ -0,0 +1,183 @@
+"""
+KPI Engine Tests
+
+Tests for conditional-aggregation KPIs and staleness-bounded snapshots.
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import event
+
+from app.models.analytics import KPISnapshot
+from app.models.course import Course
+from app.models.course_review import CourseReview
+from app.models.enrollment import Enrollment, EnrollmentStatus
+from app.models.order import Order, OrderStatus
+from app.models.user import User
+from app.services.executive_service import ExecutiveService
+from app.services.kpi_engine import REFRESH_LOCK_KEY, KPIEngine, KPISnapshotUnavailable
+
+NOW = datetime(2026, 3, 15, 12, 0)
+
+
+@pytest.fixture
+def backend(redis_or_local):
+    with patch("app.services.kpi_engine.get_redis", return_value=redis_or_local):
+        yield redis_or_local
+
+
+@pytest.fixture
+def platform(db):
+    users = [User(email=f"user{i}@example.com", full_name=f"User {i}") for i in range(4)]
+    users[3].is_active = False
+    db.add_all(users)
+    db.flush()
+
+    courses = [
+        Course(title="Polity", slug="polity", instructor_id=users[0].id, is_published=True),
+        Course(title="Draft", slug="draft", instructor_id=users[0].id, is_published=False),
+    ]
+    db.add_all(courses)
+    db.flush()
+
+    db.add_all(
+        [
+            # Today, this week, this month, and in January
+            Enrollment(user_id=users[0].id, course_id=courses[0].id, enrolled_at=NOW,
+                       status=EnrollmentStatus.COMPLETED),
+            Enrollment(user_id=users[1].id, course_id=courses[0].id,
+                       enrolled_at=NOW - timedelta(days=3)),
+            Enrollment(user_id=users[2].id, course_id=courses[0].id,
+                       enrolled_at=NOW - timedelta(days=20)),
+            Enrollment(user_id=users[0].id, course_id=courses[1].id,
+                       enrolled_at=datetime(2026, 1, 10)),
+            Order(order_number="A1", status=OrderStatus.COMPLETED, total=300.0,
+                  created_at=NOW - timedelta(days=5)),
+            Order(order_number="A2", status=OrderStatus.COMPLETED, total=200.0,
+                  created_at=NOW - timedelta(days=40)),
+            Order(order_number="A3", status=OrderStatus.PENDING, total=999.0,
+                  created_at=NOW - timedelta(days=1)),
+            CourseReview(course_id=courses[0].id, user_id=users[1].id, rating=4.0),
+            CourseReview(course_id=courses[0].id, user_id=users[2].id, rating=5.0),
+        ]
+    )
+    db.commit()
+    return users
+
+
+def test_compute_matches_expected_kpis(db, platform):
+    data = KPIEngine(max_age_seconds=60).compute(db, now=NOW)
+    kpis = data["kpis"]
+
+    assert kpis["active_users"] == {"daily": 1, "weekly": 2, "monthly": 3, "total": 4}
+    assert kpis["revenue"]["total"] == 500.0
+    assert kpis["revenue"]["monthly"] == 300.0
+    assert kpis["revenue"]["growth_rate"] == 50.0
+    assert kpis["courses"] == {
+        "total_published": 1,
+        "total_enrollments": 4,
+        "completion_rate": 25.0,
+    }
+    assert kpis["satisfaction"]["average_rating"] == 4.5
+    assert kpis["business_metrics"]["churn_rate"] == 25.0
+    assert kpis["business_metrics"]["total_orders"] == 2
+
+    trends = data["growth"]["monthly_trends"]
+    assert [t["month"] for t in trends] == [
+        "2025-09", "2025-10", "2025-11", "2025-12", "2026-01", "2026-02",
+    ]
+    assert trends[4] == {"month": "2026-01", "enrollments": 1, "revenue": 0.0, "new_users": 1}
+    assert trends[5]["enrollments"] == 1
+    assert trends[5]["revenue"] == 200.0
+
+
+def test_compute_uses_few_queries(engine, db, platform):
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        KPIEngine(max_age_seconds=60).compute(db, now=NOW)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    assert len(statements) <= 4
+
+
+def test_snapshot_served_until_stale(db, platform, backend):
+    kpi_engine = KPIEngine(max_age_seconds=300)
+    first = kpi_engine.get_snapshot(db, now=NOW)
+
+    # Within the bound the stored snapshot is served as-is
+    assert kpi_engine.get_snapshot(db, now=NOW + timedelta(minutes=4)).id == first.id
+
+    refreshed = kpi_engine.get_snapshot(db, now=NOW + timedelta(minutes=6))
+    assert refreshed.id != first.id
+    assert db.query(KPISnapshot).count() == 2
+
+    assert kpi_engine.prune(db, now=NOW + timedelta(days=60)) == 1
+    assert kpi_engine.latest(db).id == refreshed.id
+
+
+def test_health_and_risks_reuse_loaded_kpis(db, platform, backend):
+    kpis = ExecutiveService.get_kpis(db)
+    assert "as_of" in kpis
+
+    health = ExecutiveService.calculate_health_score(db, kpis=kpis)
+    assert health["as_of"] == kpis["as_of"]
+    assert 0 <= health["score"] <= 100
+
+    risk_types = {r["type"] for r in ExecutiveService.identify_risks(db, kpis=kpis)}
+    assert "high_churn" in risk_types
+    assert "low_completion" in risk_types
+    assert db.query(KPISnapshot).count() == 1
+
+
+def test_one_request_refreshes_a_stale_snapshot(db, platform, backend):
+    kpi_engine = KPIEngine(max_age_seconds=300)
+    assert kpi_engine.get_snapshot(db, now=NOW - timedelta(minutes=10)) is not None
+    stale = kpi_engine.latest(db)
+
+    # While another request holds the refresh lock, the stale snapshot is served
+    if backend is not None:
+        backend.set(REFRESH_LOCK_KEY, "other-worker")
+        assert kpi_engine.get_snapshot(db, now=NOW).id == stale.id
+        backend.delete(REFRESH_LOCK_KEY)
+    with kpi_engine._refresh_lock() as acquired:
+        assert acquired
+        assert kpi_engine.get_snapshot(db, now=NOW).id == stale.id
+    assert db.query(KPISnapshot).count() == 1
+
+    refreshed = kpi_engine.get_snapshot(db, now=NOW)
+    assert refreshed.id != stale.id
+    if backend is not None:
+        assert backend.get(REFRESH_LOCK_KEY) is None
+
+
+def test_first_snapshot_is_awaited_not_computed_while_locked(db, platform, backend):
+    kpi_engine = KPIEngine()
+    other = KPIEngine()
+
+    def first_snapshot_lands(seconds):
+        # The request holding the lock finishes while this one waits
+        if kpi_engine.latest(db) is None:
+            other.refresh(db, now=NOW)
+
+    with kpi_engine._refresh_lock(), patch.object(
+        kpi_engine, "compute", side_effect=AssertionError("computed twice")
+    ), patch("app.services.kpi_engine.time.sleep", side_effect=first_snapshot_lands):
+        snapshot = kpi_engine.get_snapshot(db, now=NOW)
+    assert snapshot.id is not None
+    assert db.query(KPISnapshot).count() == 1
+
+
+def test_first_snapshot_wait_gives_up(db, platform, backend):
+    kpi_engine = KPIEngine()
+    with kpi_engine._refresh_lock(), patch(
+        "app.services.kpi_engine.FIRST_SNAPSHOT_WAIT_SECONDS", 0
+    ), pytest.raises(KPISnapshotUnavailable):
+        kpi_engine.get_snapshot(db, now=NOW)
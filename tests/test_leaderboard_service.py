@@ -0,0 +1,130 @@
+"""
+Leaderboard Service Tests
+
+Tests for sorted-set leaderboards, rank/window queries and SQL rebuilds.
+"""
+
+from unittest.mock import patch
+
+import pytest
+
+from app.models.user import User
+from app.services.coin_service import award_coins, spend_coins
+from app.services.leaderboard_service import (
+    USERS_ALLTIME,
+    USERS_WEEKLY,
+    LeaderboardService,
+    course_board,
+)
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def redis(fake_redis):
+    with patch("app.services.leaderboard_service.get_redis", return_value=fake_redis):
+        yield fake_redis
+
+
+@pytest.fixture
+def users(db):
+    users = [
+        User(email=f"user{i}@example.com", full_name=f"User {i}", coins=0, streak_days=0)
+        for i in range(6)
+    ]
+    db.add_all(users)
+    db.commit()
+    return users
+
+
+def test_rebuild_from_sql_and_rank(db, redis, users):
+    for i, user in enumerate(users):
+        user.coins = (i + 1) * 100
+    db.commit()
+
+    service = LeaderboardService()
+    top = service.top(db, USERS_ALLTIME, limit=3)
+    assert [entry[0] for entry in top] == [users[5].id, users[4].id, users[3].id]
+    assert [entry[2] for entry in top] == [1, 2, 3]
+
+    assert service.rank(db, USERS_ALLTIME, users[0].id) == (users[0].id, 100, 6)
+
+    window = service.around(db, USERS_ALLTIME, users[2].id, radius=1)
+    assert [entry[0] for entry in window] == [users[3].id, users[2].id, users[1].id]
+
+
+def test_coin_changes_update_boards(db, redis, users):
+    service = LeaderboardService()
+    award_coins(db, users[0], 50, "quiz_complete")
+    award_coins(db, users[1], 80, "course_complete", reference_type="course", reference_id=7)
+    spend_coins(db, users[1], 60, "shop_purchase")
+
+    assert service.rank(db, USERS_ALLTIME, users[0].id)[2] == 1
+    assert service.rank(db, USERS_ALLTIME, users[1].id)[1] == 20
+
+    # Spending doesn't reduce weekly earnings
+    assert service.rank(db, USERS_WEEKLY, users[1].id) == (users[1].id, 80, 1)
+    assert service.top(db, course_board(7)) == [(users[1].id, 80, 1)]
+
+
+def test_sql_fallback_matches_redis(db, users):
+    for i, user in enumerate(users):
+        user.coins = i * 10
+    db.commit()
+
+    service = LeaderboardService()
+    with patch("app.services.leaderboard_service.get_redis", return_value=None):
+        assert service.rank(db, USERS_ALLTIME, users[4].id) == (users[4].id, 40, 2)
+        assert service.top(db, USERS_ALLTIME, limit=1)[0][0] == users[5].id
+
+
+def test_rebuild_is_locked_and_keeps_concurrent_changes(db, redis, users):
+    users[0].coins, users[1].coins = 100, 200
+    db.commit()
+    service = LeaderboardService()
+    alltime, weekly = service._key(USERS_ALLTIME), service._key(USERS_WEEKLY)
+
+    # While another worker holds the rebuild lock, reads come from SQL
+    redis.set(f"{alltime}:rebuilding", "other")
+    assert service.rebuild(db, USERS_ALLTIME) is None
+    assert service.top(db, USERS_ALLTIME, limit=1) == [(users[1].id, 200, 1)]
+    assert not redis.exists(alltime)
+    redis.delete(f"{alltime}:rebuilding")
+
+    # Coins committed after the rebuild read SQL are kept by its swap
+    sql_scores = service._sql_scores
+
+    def scores_then_concurrent_award(db, board, member_ids=None):
+        scores = sql_scores(db, board, member_ids)
+        if member_ids is None:
+            award_coins(db, users[0], 40, "quiz_complete")
+        return scores
+
+    with patch.object(service, "_sql_scores", side_effect=scores_then_concurrent_award):
+        assert service.rebuild(db, USERS_ALLTIME) == 2
+        service.rebuild(db, USERS_WEEKLY)
+    assert service.rank(db, USERS_ALLTIME, users[0].id) == (users[0].id, 180, 2)
+    assert service.rank(db, USERS_WEEKLY, users[0].id) == (users[0].id, 80, 1)
+    assert [k for k in redis.keys("*") if k.endswith((":pending", ":rebuilding")) or ":rebuild:" in k] == []
+    assert redis.ttl(weekly) > 0
+
+
+def test_rebuild_does_not_double_count_changes_it_read(db, redis, users):
+    service = LeaderboardService()
+    weekly = service._key(USERS_WEEKLY)
+    record_user_coins = service.record_user_coins
+    sql_scores = service._sql_scores
+
+    def scores_then_late_redis_write(db, board, member_ids=None):
+        # The award committed before this read but reaches Redis only afterwards
+        scores = sql_scores(db, board, member_ids)
+        if member_ids is None:
+            record_user_coins(users[0].id, balance=users[0].coins, earned=50)
+        return scores
+
+    with patch("app.services.leaderboard_service.leaderboard_service.record_user_coins"):
+        award_coins(db, users[0], 50, "quiz_complete", reference_type="course", reference_id=7)
+    with patch.object(service, "_sql_scores", side_effect=scores_then_late_redis_write):
+        service.rebuild(db, USERS_WEEKLY)
+    assert service.rank(db, USERS_WEEKLY, users[0].id) == (users[0].id, 50, 1)
+    assert redis.zscore(weekly, users[0].id) == 50
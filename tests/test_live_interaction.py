@@ -0,0 +1,208 @@
+"""
+Live Interaction Tests
+
+Tests for live poll tallies and question upvotes: deduplicated concurrent
+counting (Redis and in-process), batched persistence on poll close,
+upvote write-behind and coalesced tally broadcasts.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app.api import deps
+from app.api.api_v1.endpoints import live_class_interactive as endpoints
+from app.crud.live_class_interactive import live_class_interactive as crud
+from app.db.instrumentation import assert_max_queries, count_queries
+from app.models.course import Course
+from app.models.live_class import LiveClass
+from app.models.live_class_interactive import (
+    LiveClassPoll,
+    LiveClassPollResponse,
+    LiveClassQuestion,
+    PollStatus,
+)
+from app.models.user import User
+from app.services.live_interaction import LiveInteractionEngine
+
+STUDENTS = 500
+
+
+@pytest.fixture
+def backend(redis_or_local):
+    with patch("app.services.live_interaction.get_redis", return_value=redis_or_local):
+        yield redis_or_local
+
+
+@pytest.fixture
+def live(backend):
+    return LiveInteractionEngine(broadcasts_per_second=10)
+
+
+@pytest.fixture
+def live_class(db):
+    teacher = User(email="teacher@example.com", full_name="Teacher")
+    db.add(teacher)
+    db.flush()
+    course = Course(title="Polity", slug="polity", instructor_id=teacher.id)
+    db.add(course)
+    db.flush()
+    live_class = LiveClass(course_id=course.id, instructor_id=teacher.id, title="Live",
+                           scheduled_at=datetime.utcnow())
+    db.add(live_class)
+    db.commit()
+    return live_class
+
+
+@pytest.fixture
+def poll(db, live, live_class):
+    poll = LiveClassPoll(live_class_id=live_class.id, question="Capital?",
+                         options=["Delhi", "Mumbai", "Kolkata", "Chennai"],
+                         status=PollStatus.ACTIVE)
+    db.add(poll)
+    db.commit()
+    live.register_poll(poll)
+    return poll
+
+
+def test_concurrent_votes_are_counted_once(db, engine, live, poll):
+    poll_id = poll.id
+
+    def vote(student_id):
+        return live.record_vote(db, poll_id, student_id, student_id % 4)
+
+    with count_queries(engine) as statements, ThreadPoolExecutor(max_workers=32) as pool:
+        results = list(pool.map(vote, range(1, STUDENTS + 1)))
+        repeats = list(pool.map(vote, range(1, 101)))
+    assert statements == []
+    assert all(r.counted for r in results)
+    assert not any(r.counted for r in repeats)
+    assert live.tallies([poll_id]) == {poll_id: [125, 125, 125, 125]}
+
+    with pytest.raises(ValueError):
+        live.record_vote(db, poll_id, 9999, 4)
+
+    # One bulk INSERT for every response when the poll closes
+    with assert_max_queries(engine, 4):
+        assert live.close_poll(db, poll) == STUDENTS
+    assert db.query(LiveClassPollResponse).filter_by(poll_id=poll_id).count() == STUDENTS
+    assert db.get(LiveClassPoll, poll_id).status == PollStatus.ENDED
+
+    with pytest.raises(ValueError):
+        live.record_vote(db, poll_id, STUDENTS + 1, 0)
+    assert live.poll_results(db, poll_id)["tally"] == [125, 125, 125, 125]
+
+
+def test_vote_racing_close_is_rejected(db, live, poll):
+    live.record_vote(db, poll.id, 1, 0)
+    poll_meta = live.poll_meta
+
+    def close_meanwhile(db, poll_id):
+        # The vote saw an open poll; the teacher closes it before the vote is stored
+        meta = poll_meta(db, poll_id)
+        live.close_poll(db, poll)
+        return meta
+
+    with patch.object(live, "poll_meta", side_effect=close_meanwhile):
+        with pytest.raises(ValueError, match="ended"):
+            live.record_vote(db, poll.id, 2, 1)
+    assert db.query(LiveClassPollResponse).filter_by(poll_id=poll.id).count() == 1
+
+
+def test_tally_broadcasts_are_coalesced(db, live, poll):
+    send = AsyncMock()
+
+    async def classroom():
+        for student_id in range(1, STUDENTS + 1):
+            vote = live.record_vote(db, poll.id, student_id, 0)
+            live.broadcaster.mark(vote.class_id, poll_id=poll.id)
+            if student_id % 50 == 0:
+                await asyncio.sleep(0.02)
+        await asyncio.sleep(0.15)
+
+    started = time.monotonic()
+    with patch("app.services.live_interaction.realtime_service.send_live_class_update", send):
+        asyncio.run(classroom())
+    elapsed = time.monotonic() - started
+
+    # At most 10 broadcasts per second instead of one per vote
+    assert 1 <= send.await_count <= elapsed * 10 + 1
+    assert send.await_count < 20
+    final = send.await_args.kwargs
+    assert final["update_type"] == "tallies_updated"
+    assert final["data"]["polls"] == [
+        {"poll_id": poll.id, "tally": [STUDENTS, 0, 0, 0], "responses_count": STUDENTS}
+    ]
+
+
+def test_upvotes_are_deduplicated_and_written_behind(db, engine, live, live_class):
+    question = LiveClassQuestion(live_class_id=live_class.id, student_id=1,
+                                 question_text="Why?", upvotes=3)
+    db.add(question)
+    db.commit()
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda uid: live.upvote(question, uid % 40), range(200)))
+    assert sum(counted for _, counted in results) == 40
+    assert live.upvote_counts(live_class.id) == {question.id: 43}
+    assert db.get(LiveClassQuestion, question.id).upvotes == 3
+
+    with assert_max_queries(engine, 2):
+        assert live.flush_to_db(db) == 1
+    db.expire_all()
+    assert db.get(LiveClassQuestion, question.id).upvotes == 43
+    assert live.flush_to_db(db) == 0
+
+    # Direct CRUD upvotes increment in SQL
+    assert crud.upvote_question(db, question_id=question.id).upvotes == 44
+
+
+def test_failed_upvote_read_keeps_questions_dirty(db, live, live_class, backend):
+    if backend is None:
+        pytest.skip("Redis write-behind only")
+    question = LiveClassQuestion(live_class_id=live_class.id, student_id=1, question_text="Why?")
+    db.add(question)
+    db.commit()
+    live.upvote(question, 7)
+
+    broken = MagicMock()
+    broken.execute.side_effect = RedisConnectionError("redis down")
+    with patch.object(backend, "pipeline", return_value=broken):
+        with pytest.raises(RedisConnectionError):
+            live.flush_to_db(db)
+    assert backend.smembers("live:upvotes:dirty") == {f"{live_class.id}:{question.id}"}
+    assert live.flush_to_db(db) == 1
+
+
+def test_endpoints(db, live, poll):
+    app = FastAPI()
+    app.include_router(endpoints.router)
+    user = SimpleNamespace(id=7, full_name="Student")
+    app.dependency_overrides[deps.get_db] = lambda: db
+    app.dependency_overrides[deps.get_current_active_user] = lambda: user
+    client = TestClient(app)
+
+    with patch.object(endpoints, "live_interaction", live), patch(
+        "app.services.live_interaction.realtime_service.send_live_class_update", AsyncMock()
+    ):
+        body = {"poll_id": poll.id, "selected_option_index": 2}
+        first = client.post(f"/polls/{poll.id}/respond", json=body)
+        again = client.post(f"/polls/{poll.id}/respond", json={**body, "selected_option_index": 1})
+        invalid = client.post(f"/polls/{poll.id}/respond", json={**body, "selected_option_index": 9})
+        missing = client.post("/polls/999/respond", json=body)
+        results = client.get(f"/polls/{poll.id}/results")
+
+    assert first.json() == {"status": "success", "counted": True, "selected_option_index": 2}
+    assert again.json() == {"status": "success", "counted": False, "selected_option_index": 2}
+    assert invalid.status_code == 400
+    assert missing.status_code == 404
+    assert results.json()["tally"] == [0, 0, 1, 0]
+    assert db.query(LiveClassPollResponse).count() == 0
@@ -0,0 +1,360 @@
+"""
+Live Quiz Tests
+
+Tests for server-side live quiz scoring: speed bonuses, first-answer-wins
+under concurrency, order-statistics ranking, throttled rank deltas, batched
+persistence at the end and sharing a session between workers.
+"""
+
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.api import deps
+from app.api.api_v1.endpoints import websocket as endpoints
+from app.core import security
+from app.core.websocket import manager
+from app.db.instrumentation import assert_max_queries, count_queries
+from app.models.course import Course
+from app.models.quiz import Question, QuestionOption, Quiz, QuizAttempt, StudentAnswer
+from app.models.user import User
+from app.services.live_quiz import LiveQuizEngine, Ranking, live_quiz, speed_score
+from app.services.quiz_compiler import quiz_compiler
+
+STUDENTS = 200
+
+
+@pytest.fixture
+def session_factory(engine):
+    factory = sessionmaker(bind=engine)
+    with patch("app.services.live_quiz.SessionLocal", factory):
+        yield factory
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def backend(redis_or_local):
+    with patch("app.services.live_quiz.get_redis", return_value=redis_or_local), patch(
+        "app.services.quiz_compiler.get_redis", return_value=redis_or_local
+    ):
+        yield redis_or_local
+    quiz_compiler._local.clear()
+
+
+@pytest.fixture
+def quiz(db):
+    """Three one-point questions; option 0 is correct in each. Returns (quiz, teacher, questions)."""
+    teacher = User(email="teacher@example.com", full_name="Teacher", is_active=True)
+    db.add(teacher)
+    db.flush()
+    course = Course(title="Polity", slug="polity", instructor_id=teacher.id)
+    db.add(course)
+    db.flush()
+    quiz = Quiz(title="Live", course_id=course.id, passing_score=50.0, is_published=True)
+    db.add(quiz)
+    db.flush()
+    questions = []
+    for i in range(3):
+        question = Question(quiz_id=quiz.id, text=f"Q{i}", type="multiple_choice",
+                            points=1, order_index=i)
+        db.add(question)
+        db.flush()
+        db.add_all(
+            [
+                QuestionOption(question_id=question.id, text="Yes", is_correct=True, order_index=0),
+                QuestionOption(question_id=question.id, text="No", order_index=1),
+            ]
+        )
+        questions.append(question)
+    db.commit()
+    options = {
+        q.id: [o.id for o in sorted(q.options, key=lambda o: o.order_index)] for q in questions
+    }
+    return quiz.id, teacher.id, options
+
+
+def test_ranking_order_statistics():
+    ranking = Ranking()
+    rng = random.Random(7)
+    scores = {}
+    for _ in range(2000):
+        member, delta = rng.randrange(300), rng.randrange(1000)
+        scores[member] = ranking.add(member, delta)
+    expected = sorted(scores, key=lambda m: (-scores[m], m))
+    assert [member for member, _ in ranking.top(20)] == expected[:20]
+    assert all(ranking.rank(m) == i for i, m in enumerate(expected))
+    assert ranking.rank(10_000) is None
+
+
+def test_speed_bonus():
+    assert speed_score(1, 0, 30) == 1000
+    assert speed_score(1, 15, 30) == 750
+    assert speed_score(2, 45, 30) == 1000
+
+
+def test_concurrent_answers_scored_once(db, engine, backend, quiz):
+    quiz_id, teacher_id, options = quiz
+    live = LiveQuizEngine()
+    question_id = next(iter(options))
+    live.start(db, 1, quiz_id, teacher_id)
+    with pytest.raises(ValueError):
+        live.start(db, 1, quiz_id, teacher_id)
+    live.open_question(1, question_id)
+
+    def answer(student):
+        choice = options[question_id][student % 2]
+        return live.submit_answer(1, student, f"S{student}", question_id, selected_option_id=choice)
+
+    with count_queries(engine) as statements, ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(answer, range(1, STUDENTS + 1)))
+        repeats = list(pool.map(answer, range(1, 21)))
+    assert statements == []
+    assert all(r.counted for r in results) and not any(r.counted for r in repeats)
+    assert {r.is_correct for r in results if r.awarded} == {True}
+    assert all(500 <= r.awarded <= 1000 for r in results if r.is_correct)
+    assert sum(r.is_correct for r in results) == STUDENTS // 2
+
+    top = live.top(1, 5)
+    assert [entry["rank"] for entry in top] == [1, 2, 3, 4, 5]
+    assert [entry["score"] for entry in top] == sorted((e["score"] for e in top), reverse=True)
+    ranks = live.ranks(1, {top[0]["user_id"], 1})
+    assert ranks[top[0]["user_id"]] == (1, top[0]["score"])
+    assert ranks[1][1] == 0
+    assert live.participant_count(1) == STUDENTS
+
+    with pytest.raises(ValueError):
+        live.submit_answer(1, 1, "S1", 10_000, selected_option_id=1)
+
+    # Every attempt and answer written in one batch each
+    with assert_max_queries(engine, 3):
+        ended = live.finish(db, 1)
+    assert ended["participants"] == STUDENTS
+    assert live.finish(db, 1) is None
+    assert db.query(QuizAttempt).count() == STUDENTS
+    assert db.query(StudentAnswer).count() == STUDENTS
+    scores = sorted(score for score, in db.query(QuizAttempt.score))
+    assert scores[0] == 0 and scores[-1] == pytest.approx(33.33)
+    with pytest.raises(ValueError):
+        live.submit_answer(1, 999, "Late", question_id, selected_option_id=1)
+
+
+def test_only_opened_questions_accept_answers(db, backend, quiz):
+    quiz_id, teacher_id, options = quiz
+    first, second = list(options)[:2]
+    live = LiveQuizEngine()
+    live.start(db, 3, quiz_id, teacher_id)
+
+    # The client picks question ids; answering ahead of the host is rejected
+    with pytest.raises(ValueError, match="not been opened"):
+        live.submit_answer(3, 1, "S1", first, selected_option_id=options[first][0])
+    live.open_question(3, first)
+    assert live.submit_answer(3, 1, "S1", first, selected_option_id=options[first][0]).counted
+    with pytest.raises(ValueError, match="not been opened"):
+        live.submit_answer(3, 1, "S1", second, selected_option_id=options[second][0])
+
+    with patch("app.services.live_quiz.time.time", return_value=time.time() + 60):
+        with pytest.raises(ValueError, match="Time is up"):
+            live.submit_answer(3, 2, "S2", first, selected_option_id=options[first][0])
+
+
+def test_failed_persist_can_be_retried(db, backend, quiz):
+    quiz_id, teacher_id, options = quiz
+    question_id = next(iter(options))
+    live = LiveQuizEngine()
+    live.start(db, 4, quiz_id, teacher_id)
+    live.open_question(4, question_id)
+    live.submit_answer(4, 1, "S1", question_id, selected_option_id=options[question_id][0])
+
+    with patch.object(db, "execute", side_effect=OperationalError("INSERT", {}, Exception("down"))):
+        with pytest.raises(OperationalError):
+            live.finish(db, 4)
+    assert live.meta(4)["status"] == "running"
+    assert db.query(QuizAttempt).count() == 0
+
+    assert live.finish(db, 4)["participants"] == 1
+    assert live.finish(db, 4) is None
+    assert db.query(QuizAttempt).count() == 1 and db.query(StudentAnswer).count() == 1
+
+
+def test_answer_racing_finish_is_rejected(db, backend, quiz):
+    quiz_id, teacher_id, options = quiz
+    question_id = next(iter(options))
+    live = LiveQuizEngine()
+    live.start(db, 5, quiz_id, teacher_id)
+    live.open_question(5, question_id)
+    live.submit_answer(5, 1, "S1", question_id, selected_option_id=options[question_id][0])
+    opened_at = live._opened_at
+
+    def finish_meanwhile(session_id, question_id):
+        # The answer passed the status check; the host ends the quiz before it is written
+        live.finish(db, session_id)
+        return opened_at(session_id, question_id)
+
+    with patch.object(live, "_opened_at", side_effect=finish_meanwhile):
+        with pytest.raises(ValueError, match="not running"):
+            live.submit_answer(5, 2, "S2", question_id, selected_option_id=options[question_id][0])
+    assert live.participant_count(5) == db.query(QuizAttempt).count() == 1
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+    def of_type(self, message_type):
+        return [m for m in self.sent if m["type"] == message_type]
+
+
+def test_rank_deltas_are_throttled_and_minimal(db, backend, quiz):
+    quiz_id, teacher_id, options = quiz
+    live = LiveQuizEngine(updates_per_second=0.01)
+    questions = list(options)
+    room = "quiz:5"
+    sockets = {user_id: FakeSocket() for user_id in range(1, 6)}
+    manager.active_connections[room] = set(sockets.values())
+    for user_id, socket in sockets.items():
+        manager.connection_users[socket] = {"user_id": user_id, "user_name": f"S{user_id}", "room": room}
+
+    async def session():
+        live.start(db, 5, quiz_id, teacher_id)
+        await live.join(5, 1)
+        live.open_question(5, questions[0])
+        for user_id in sockets:
+            live.submit_answer(5, user_id, f"S{user_id}", questions[0], options[questions[0]][0])
+            live.broadcaster.mark(5, user_id)
+        await live.broadcaster.flush(5)
+        await live.broadcaster.flush(5)  # nothing new
+
+        # Only user 5 scores on the next question: one entry moves
+        live.open_question(5, questions[1])
+        live.submit_answer(5, 5, "S5", questions[1], options[questions[1]][0])
+        live.broadcaster.mark(5, 5)
+        await live.broadcaster.flush(5)
+
+        live.finish(db, 5)
+        await live.broadcaster.flush(5)
+
+    try:
+        asyncio.run(session())
+    finally:
+        manager.active_connections.pop(room, None)
+        for socket in sockets.values():
+            manager.connection_users.pop(socket, None)
+
+    watcher = sockets[1]
+    assert [m["type"] for m in watcher.sent] == [
+        "question_started", "leaderboard_delta", "rank_update",
+        "question_started", "leaderboard_delta", "quiz_ended", "final_rank",
+    ]
+    deltas = watcher.of_type("leaderboard_delta")
+    assert len(deltas[-2]["changes"]) == 5
+    moved = deltas[-1]["changes"]
+    assert moved[0]["user_id"] == 5 and moved[0]["rank"] == 1
+    assert all(entry["rank"] > 1 for entry in moved[1:])
+    assert "is_correct" not in watcher.of_type("question_started")[0]["question"]["options"][0]
+    leader = sockets[5].of_type("rank_update")[-1]
+    assert leader["rank"] == 1
+    assert sockets[5].of_type("final_rank") == [dict(leader, type="final_rank")]
+
+
+def test_session_shared_between_workers(db, quiz):
+    fakeredis = pytest.importorskip("fakeredis")
+    quiz_id, teacher_id, options = quiz
+    question_id = next(iter(options))
+    client = fakeredis.FakeRedis(decode_responses=True)
+    with patch("app.services.live_quiz.get_redis", return_value=client), patch(
+        "app.services.quiz_compiler.get_redis", return_value=client
+    ):
+        host_worker, other_worker = LiveQuizEngine(), LiveQuizEngine()
+        host_worker.start(db, 9, quiz_id, teacher_id)
+        host_worker.open_question(9, question_id)
+
+        events, _ = other_worker.poll(9, 0)
+        assert [e["type"] for e in events] == ["quiz_started", "question_started"]
+        # The other worker loads the pinned snapshot once, then scores in memory
+        result = other_worker.submit_answer(9, 42, "S42", question_id, options[question_id][0])
+        assert result.counted and result.is_correct
+        assert host_worker.top(9)[0]["user_id"] == 42
+        assert not host_worker.submit_answer(9, 42, "S42", question_id, options[question_id][1]).counted
+        assert other_worker.finish(db, 9) is not None
+        assert host_worker.finish(db, 9) is None
+    quiz_compiler._local.clear()
+
+
+def test_endpoint_host_controls(engine, session_factory, quiz):
+    quiz_id, teacher_id, options = quiz
+    question_id = next(iter(options))
+    db = session_factory()
+    student = User(email="student@example.com", full_name="Student", is_active=True)
+    db.add(student)
+    db.commit()
+    student_id = student.id
+    db.close()
+
+    app = FastAPI()
+    app.include_router(endpoints.router)
+    client = TestClient(app)
+    host_token = security.create_access_token(teacher_id)
+    student_token = security.create_access_token(student_id)
+
+    with patch.object(deps, "SessionLocal", session_factory), patch.object(
+        endpoints, "SessionLocal", session_factory
+    ), patch("app.core.websocket.SessionLocal", session_factory), patch(
+        "app.services.presence.get_redis", return_value=None
+    ), patch("app.services.live_quiz.get_redis", return_value=None), patch(
+        "app.services.quiz_compiler.get_redis", return_value=None
+    ):
+        try:
+            with client.websocket_connect(f"/ws/live-quiz/77?token={student_token}") as student_ws:
+                assert student_ws.receive_json()["type"] == "online_users"
+                assert student_ws.receive_json() == {"type": "quiz_state", "status": None}
+                student_ws.send_json({"type": "quiz_started", "quiz_id": quiz_id})
+                assert student_ws.receive_json()["type"] == "error"
+
+                with client.websocket_connect(f"/ws/live-quiz/77?token={host_token}") as host_ws:
+                    host_ws.receive_json()
+                    host_ws.receive_json()
+                    host_ws.send_json({"type": "quiz_started", "quiz_id": quiz_id})
+                    host_ws.send_json({"type": "question_started", "question_id": question_id})
+
+                    received = [student_ws.receive_json() for _ in range(3)]
+                    assert [m["type"] for m in received] == [
+                        "user_joined", "quiz_started", "question_started"
+                    ]
+                    student_ws.send_json({"type": "answer_submitted", "question_id": question_id,
+                                          "selected_option_id": options[question_id][0]})
+                    result = student_ws.receive_json()
+                    assert result["type"] == "answer_result" and result["is_correct"]
+
+                    student_ws.send_json({"type": "quiz_ended"})
+                    assert student_ws.receive_json()["type"] == "error"
+                    host_ws.send_json({"type": "quiz_ended"})
+                    types = set()
+                    while "final_rank" not in types:
+                        types.add(student_ws.receive_json()["type"])
+                    assert "quiz_ended" in types
+        finally:
+            live_quiz.clear()
+            quiz_compiler._local.clear()
+
+    check = session_factory()
+    assert check.query(QuizAttempt).filter_by(user_id=student_id).one().score == pytest.approx(33.33)
+    check.close()
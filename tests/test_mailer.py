@@ -0,0 +1,291 @@
+"""
+Bulk Mailer Tests
+
+Tests for the bulk mail pipeline against a local stand-in SMTP server:
+pooled connections reused across batches, per-recipient rendering from
+compiled templates, preferences resolved per batch, failure handling and
+Celery batching.
+"""
+
+import socketserver
+import threading
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from app.db.instrumentation import assert_max_queries, count_queries
+from app.models.email_notification import (
+    EmailLog,
+    EmailStatus,
+    EmailTemplate,
+    NotificationType,
+    UserEmailPreference,
+)
+from app.models.user import User
+from app.services import background_tasks
+from app.services.mailer import (
+    BulkMailer,
+    CompiledTemplate,
+    Recipient,
+    SMTPPool,
+    TemplateCache,
+    queue_bulk_email,
+)
+
+AUDIENCE = 250
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: one session per connection."""
+
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 stand-in ESMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().rstrip("\r\n")
+            if not line:
+                return
+            command = line.split(" ", 1)[0].upper()
+            if command == "EHLO":
+                self.reply("250-stand-in")
+                self.reply("250 8BITMIME")
+            elif command in ("HELO", "NOOP"):
+                self.reply("250 OK")
+            elif command == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif command == "RCPT":
+                address = line.split(":", 1)[1].strip("<> ")
+                if address.startswith("refused"):
+                    self.reply("550 No such user")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif command == "RSET":
+                recipients = []
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                body = []
+                while True:
+                    data = self.rfile.readline().decode()
+                    if data in (".\r\n", ""):
+                        break
+                    body.append(data)
+                with server.lock:
+                    for address in recipients:
+                        server.messages.append((address, "".join(body)))
+                    dropped = server.drop_after and len(server.messages) % server.drop_after == 0
+                self.reply("250 Queued")
+                if dropped:
+                    return  # hang up without QUIT
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Not implemented")
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = []
+        self.drop_after = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def bodies_for(self, address):
+        return [body for to, body in self.messages if to == address]
+
+
+@pytest.fixture
+def smtp_server():
+    server = StandInSMTPServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def pool(smtp_server):
+    pool = SMTPPool(host="127.0.0.1", port=smtp_server.port, starttls=False, username=None,
+                    size=2, max_messages=1000, timeout=5)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def mailer(pool):
+    return BulkMailer(pool=pool, templates=TemplateCache(), suppress=False)
+
+
+@pytest.fixture
+def recipients(db):
+    """Students; every tenth one turned announcement emails off."""
+    db.execute(
+        insert(User),
+        [{"email": f"student{i}@example.com", "full_name": f"Student {i}"} for i in range(AUDIENCE)],
+    )
+    users = db.query(User.id, User.email).order_by(User.id).all()
+    db.add_all(
+        UserEmailPreference(user_id=user_id, announcement_enabled=i % 10 != 0)
+        for i, (user_id, _) in enumerate(users)
+        if i % 5 == 0
+    )
+    db.add(
+        EmailTemplate(
+            name="course_announcement",
+            display_name="Announcement",
+            subject="{{announcement_title}}",
+            body_html="<p>Hi {{student_name}}, {{announcement_content}} {{unknown}}</p>",
+            body_text="Hi {{student_name}}",
+            notification_type=NotificationType.ANNOUNCEMENT,
+        )
+    )
+    db.commit()
+    return [
+        Recipient(user_id, email, {"student_name": f"S{user_id}", "announcement_title": "Exam",
+                                   "announcement_content": "Room 4"})
+        for user_id, email in users
+    ]
+
+
+def _send(mailer, db, recipients, **kwargs):
+    return mailer.send_batch(db, "course_announcement", NotificationType.ANNOUNCEMENT,
+                             recipients, **kwargs)
+
+
+def test_compiled_template_matches_replace():
+    source = "{{a}} and {{b}}{{a}} {{missing}} {{ spaced }}"
+    variables = {"a": 1, "b": "<b>", " spaced ": "x"}
+    expected = source
+    for key, value in variables.items():
+        expected = expected.replace(f"{{{{{key}}}}}", str(value))
+    assert CompiledTemplate(source).render(variables) == expected
+
+
+def test_batch_over_one_connection(db, engine, smtp_server, mailer, recipients):
+    with assert_max_queries(engine, 6):
+        result = _send(mailer, db, recipients + recipients[:3])
+
+    opted_out = AUDIENCE // 10
+    assert (result.sent, result.failed, result.skipped) == (AUDIENCE - opted_out, 0, opted_out + 3)
+    assert smtp_server.connections == 1
+    assert len(smtp_server.messages) == AUDIENCE - opted_out
+    first, opted = recipients[1], recipients[0]
+    body = smtp_server.bodies_for(first.email)[0]
+    assert f"Hi S{first.user_id}, Room 4 {{{{unknown}}}}" in body
+    assert smtp_server.bodies_for(opted.email) == []
+    assert db.query(EmailLog).filter(EmailLog.status == EmailStatus.SENT).count() == result.sent
+
+    # The next batch reuses the pooled connection and the compiled template
+    with count_queries(engine) as statements:
+        _send(mailer, db, recipients[1:2], force=True)
+    assert smtp_server.connections == 1
+    assert not any("email_templates" in s for s in statements)
+    assert not any("user_email_preferences" in s for s in statements)
+
+
+def test_connections_recycled_and_recovered(db, smtp_server, pool, mailer, recipients):
+    pool.max_messages = 10
+    batch = [r for i, r in enumerate(recipients[:40]) if i % 10]  # 36 who want mail
+    assert _send(mailer, db, batch).sent == 36
+    assert smtp_server.connections == 4
+
+    # Server hangs up mid-batch: the message is retried on a fresh connection
+    smtp_server.drop_after = 7
+    pool.max_messages = 1000
+    result = _send(mailer, db, batch, force=True)
+    assert (result.sent, result.failed) == (36, 0)
+    assert len(smtp_server.messages) == 72
+
+
+def test_refused_and_unreachable(db, smtp_server, pool, mailer, recipients):
+    refused = Recipient(recipients[1].user_id, "refused@example.com", recipients[1].variables)
+    result = _send(mailer, db, [refused] + recipients[2:5])
+    assert (result.sent, result.failed) == (3, 1)
+    log = db.get(EmailLog, result.log_ids[refused.user_id])
+    assert log.status == EmailStatus.FAILED and "No such user" in log.error_message
+
+    pool.close()
+    smtp_server.shutdown()
+    smtp_server.server_close()
+    started = datetime.utcnow()
+    result = _send(mailer, db, recipients[6:9])
+    assert (result.sent, result.failed) == (0, 3)
+    assert datetime.utcnow() - started < timedelta(seconds=5)
+
+
+@pytest.mark.parametrize(
+    "ssl_tls, starttls, transport, upgraded",
+    [
+        (True, False, "SMTP_SSL", False),
+        (True, True, "SMTP_SSL", False),
+        (False, True, "SMTP", True),
+        (False, False, "SMTP", False),
+    ],
+)
+def test_connection_security_follows_settings(ssl_tls, starttls, transport, upgraded):
+    pool = SMTPPool(host="mail.example.com", port=465, starttls=starttls, ssl_tls=ssl_tls,
+                    username="mailer", password="secret", size=1)
+    with patch("smtplib.SMTP") as smtp, patch("smtplib.SMTP_SSL") as smtp_ssl:
+        connection = pool._open()
+
+    opened = {"SMTP": smtp, "SMTP_SSL": smtp_ssl}
+    opened.pop(transport).assert_called_once_with("mail.example.com", 465, timeout=30)
+    opened.popitem()[1].assert_not_called()
+    assert connection.smtp.starttls.called is upgraded
+    connection.smtp.login.assert_called_once_with("mailer", "secret")
+
+
+def test_template_recompiled_on_new_version(db, engine, recipients):
+    cache = TemplateCache(check_seconds=0)
+    first = cache.get(db, "course_announcement")
+    with count_queries(engine) as statements:
+        assert cache.get(db, "course_announcement") is first
+    assert len(statements) == 1  # version check only
+
+    template = db.query(EmailTemplate).filter_by(name="course_announcement").one()
+    template.subject = "New {{announcement_title}}"
+    template.updated_at = datetime.utcnow() + timedelta(seconds=1)
+    db.commit()
+    assert cache.get(db, "course_announcement").subject.render({"announcement_title": "X"}) == "New X"
+    with pytest.raises(ValueError):
+        cache.get(db, "missing")
+
+
+def test_bulk_batches_queued_to_celery(db, mailer, recipients):
+    with patch.object(background_tasks.send_bulk_email_task, "delay") as delay:
+        assert queue_bulk_email(db, "course_announcement", NotificationType.ANNOUNCEMENT,
+                                recipients, batch_size=100) == 3
+    assert [len(call.args[2]) for call in delay.call_args_list] == [100, 100, 50]
+    assert delay.call_args.args[2][0]["variables"]["announcement_title"] == "Exam"
+    assert db.query(EmailLog).count() == 0
+
+    # The task sends its batch with its own session
+    session_factory = sessionmaker(bind=db.get_bind())
+    with patch.object(background_tasks, "SessionLocal", session_factory), patch(
+        "app.services.mailer.bulk_mailer", mailer
+    ):
+        outcome = background_tasks.send_bulk_email_task(*delay.call_args.args)
+        raw = background_tasks.send_email_task("ops@example.com", "Report", "<b>ok</b>", html=True)
+    assert outcome["status"] == "success" and outcome["sent"] == 45
+    assert raw == {"status": "success", "to": "ops@example.com"}
@@ -0,0 +1,166 @@
+"""
+Notification Dispatch Tests
+
+Tests for bulk notification fan-out: batched inserts, grouped socket
+delivery (in-process and across workers over Redis pub/sub), cached unread
+counts and handing large audiences to Celery.
+"""
+
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import insert
+
+from app.core.websocket import manager
+from app.db.instrumentation import assert_max_queries, count_queries
+from app.models.notification import Notification, NotificationType
+from app.models.user import User
+from app.services.notification_dispatch import (
+    NotificationDispatcher,
+    notification_room,
+    unread_counter,
+)
+from app.services.notification_service import notification_service
+
+AUDIENCE = 2500
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+
+@pytest.fixture
+def backend(redis_or_local):
+    with patch("app.services.notification_dispatch.get_redis", return_value=redis_or_local):
+        yield redis_or_local
+    unread_counter.clear()
+
+
+@pytest.fixture
+def user_ids(db):
+    db.execute(
+        insert(User),
+        [{"email": f"student{i}@example.com", "full_name": f"Student {i}"} for i in range(AUDIENCE)],
+    )
+    db.commit()
+    return [user_id for (user_id,) in db.query(User.id).order_by(User.id)]
+
+
+@pytest.fixture
+def sockets():
+    """Notification sockets for the first three users, as /ws/notifications opens them."""
+    opened = {}
+
+    def open_for(user_ids):
+        for user_id in user_ids:
+            socket = FakeSocket()
+            manager.active_connections.setdefault(notification_room(user_id), set()).add(socket)
+            opened[user_id] = socket
+        return opened
+
+    yield open_for
+    for user_id in opened:
+        manager.active_connections.pop(notification_room(user_id), None)
+
+
+def _dispatch(dispatcher, db, user_ids, **kwargs):
+    return dispatcher.dispatch(
+        db, user_ids, NotificationType.LIVE_CLASS_STARTING, "Starting", "In 5 minutes",
+        data={"live_class_id": 7}, **kwargs
+    )
+
+
+def test_bulk_insert_and_grouped_delivery(db, engine, backend, user_ids, sockets):
+    dispatcher = NotificationDispatcher(batch_size=1000, celery_min_recipients=10 ** 6)
+    opened = sockets(user_ids[:3])
+
+    async def session():
+        dispatcher.start()
+        try:
+            with assert_max_queries(engine, 3):
+                count = _dispatch(dispatcher, db, user_ids + user_ids[:5], exclude=[user_ids[-1]])
+            deadline = time.monotonic() + 5
+            while not all(s.sent for s in opened.values()) and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+        finally:
+            dispatcher.stop()
+        return count
+
+    assert asyncio.run(session()) == AUDIENCE - 1
+    assert db.query(Notification).count() == AUDIENCE - 1
+    assert db.query(Notification).filter_by(user_id=user_ids[-1]).count() == 0
+    for user_id, socket in opened.items():
+        assert len(socket.sent) == 1
+        sent = socket.sent[0]["notification"]
+        stored = db.query(Notification).filter_by(user_id=user_id).one()
+        assert (sent["id"], sent["user_id"], sent["type"]) == (stored.id, user_id, "live_class_starting")
+        assert sent["data"] == {"live_class_id": 7}
+
+
+def test_sync_caller_delivers_through_server_loop(db, user_ids, sockets):
+    dispatcher = NotificationDispatcher()
+    opened = sockets(user_ids[:1])
+
+    async def session():
+        dispatcher.start()
+        # Sync endpoints run in the threadpool, where there is no running loop
+        await asyncio.get_running_loop().run_in_executor(
+            None, lambda: _dispatch(dispatcher, db, user_ids[:2])
+        )
+        await asyncio.sleep(0.05)
+
+    with patch("app.services.notification_dispatch.get_redis", return_value=None):
+        asyncio.run(session())
+        # Without a server loop (e.g. a script) the rows are still written
+        _dispatch(NotificationDispatcher(), db, user_ids[:2])
+    unread_counter.clear()
+    assert len(opened[user_ids[0]].sent) == 1
+    assert db.query(Notification).count() == 4
+
+
+def test_unread_count_is_cached(db, engine, backend, user_ids):
+    dispatcher = NotificationDispatcher()
+    user_id = user_ids[0]
+    assert notification_service.get_unread_count(db, user_id) == 0
+
+    for _ in range(3):
+        _dispatch(dispatcher, db, [user_id, user_ids[1]])
+    with count_queries(engine) as statements:
+        assert notification_service.get_unread_count(db, user_id) == 3
+    assert statements == []
+
+    first = db.query(Notification).filter_by(user_id=user_id).first()
+    notification_service.mark_as_read(db, first.id, user_id)
+    notification_service.mark_as_read(db, first.id, user_id)  # already read
+    assert notification_service.get_unread_count(db, user_id) == 2
+    notification_service.create_notification(
+        db, user_id, NotificationType.MENTION, "Mention", "You were mentioned"
+    )
+    assert notification_service.get_unread_count(db, user_id) == 3
+    notification_service.mark_all_as_read(db, user_id)
+    assert notification_service.get_unread_count(db, user_id) == 0
+
+    # Never cached: the first read counts in SQL
+    assert notification_service.get_unread_count(db, user_ids[1]) == 3
+
+
+def test_large_audience_goes_to_celery(db, backend, user_ids):
+    dispatcher = NotificationDispatcher(celery_min_recipients=100)
+    with patch("app.services.background_tasks.dispatch_notifications_task.delay") as delay:
+        assert _dispatch(dispatcher, db, user_ids[:500]) == 500
+    assert delay.call_args.args[:2] == (user_ids[:500], "live_class_starting")
+    assert db.query(Notification).count() == 0
+
+    # Broker unreachable: sent inline instead
+    with patch(
+        "app.services.background_tasks.dispatch_notifications_task.delay",
+        side_effect=ConnectionError("broker down"),
+    ):
+        assert _dispatch(dispatcher, db, user_ids[:500]) == 500
+    assert db.query(Notification).count() == 500
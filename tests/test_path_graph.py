@@ -0,0 +1,253 @@
+"""
+Path Graph Tests
+
+Tests for compiled learning-path graphs: topological order and transitive
+prerequisites, batched progress across enrollments, incremental progression,
+invalidation on commit (locally and through Redis) and /my-enrollments.
+"""
+
+import logging
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import deps
+from app.crud import learning_path as crud
+from app.db.instrumentation import assert_max_queries, count_queries
+from app.models.course import Course
+from app.models.enrollment import Enrollment, EnrollmentStatus
+from app.models.learning_path import LearningPath, PathCourse, PathEnrollment
+from app.models.user import User
+from app.services.entitlements import entitlements
+from app.services.path_graph import PathGraphCompiler, path_graph
+
+STUDENTS = 20
+
+
+@pytest.fixture
+def backend(redis_or_local):
+    path_graph.clear()
+    entitlements.clear()
+    with patch("app.services.path_graph.get_redis", return_value=redis_or_local):
+        yield redis_or_local
+    path_graph.clear()
+    entitlements.clear()
+
+
+@pytest.fixture
+def path(db, backend):
+    """
+    Path: basics -> intro -> advanced -> capstone, plus an optional elective.
+
+    ``advanced`` is listed first but needs ``intro``; ``capstone`` also needs
+    ``primer``, a course outside the path.
+    """
+    teacher = User(email="teacher@example.com", full_name="Teacher")
+    db.add(teacher)
+    db.flush()
+    names = ["basics", "intro", "advanced", "capstone", "elective", "primer"]
+    courses = {name: Course(title=name, slug=name, instructor_id=teacher.id) for name in names}
+    db.add_all(courses.values())
+    db.flush()
+    ids = {name: course.id for name, course in courses.items()}
+
+    path = LearningPath(title="UPSC", slug="upsc", creator_id=teacher.id)
+    db.add(path)
+    db.flush()
+    db.add_all(
+        [
+            PathCourse(path_id=path.id, course_id=ids["advanced"], order_index=0,
+                       prerequisite_course_id=ids["intro"]),
+            PathCourse(path_id=path.id, course_id=ids["basics"], order_index=1),
+            PathCourse(path_id=path.id, course_id=ids["intro"], order_index=2,
+                       prerequisite_course_id=ids["basics"]),
+            PathCourse(path_id=path.id, course_id=ids["elective"], order_index=3,
+                       is_required=False),
+            PathCourse(path_id=path.id, course_id=ids["capstone"], order_index=4,
+                       prerequisite_course_id=ids["advanced"]),
+            PathCourse(path_id=path.id, course_id=ids["capstone"], order_index=4,
+                       prerequisite_course_id=ids["primer"]),
+        ]
+    )
+    db.commit()
+    return path.id, ids
+
+
+def _student(db, path_id, email="student@example.com"):
+    student = User(email=email, full_name="Student")
+    db.add(student)
+    db.flush()
+    db.add(PathEnrollment(path_id=path_id, student_id=student.id, total_courses=5))
+    db.commit()
+    return student.id
+
+
+def _complete(db, student_id, *course_ids):
+    db.add_all(
+        Enrollment(user_id=student_id, course_id=course_id, status=EnrollmentStatus.COMPLETED)
+        for course_id in course_ids
+    )
+    db.commit()
+
+
+def test_graph_orders_and_closes_prerequisites(db, path):
+    path_id, ids = path
+    graph = path_graph.get(db, path_id)
+
+    assert graph.course_ids == tuple(
+        ids[name] for name in ["basics", "intro", "advanced", "elective", "capstone"]
+    )
+    capstone = graph.closure[ids["capstone"]]
+    assert {c for c, bit in graph.bits.items() if capstone >> bit & 1} == {
+        ids["basics"], ids["intro"], ids["advanced"], ids["primer"],
+    }
+
+    done = graph.completed_mask([ids["basics"], ids["intro"], ids["advanced"]])
+    assert graph.unlockable(done) == [ids["elective"]]
+    assert not graph.is_unlocked(ids["capstone"], done)
+    assert graph.is_unlocked(ids["capstone"], done | graph.completed_mask([ids["primer"]]))
+
+    # Optional courses don't hold back completion
+    everything = graph.completed_mask(ids[n] for n in ["basics", "intro", "advanced", "capstone"])
+    progress = graph.progress(everything | graph.completed_mask([ids["primer"]]))
+    assert progress.is_completed and progress.completed_courses == 4
+    assert progress.next_course_id == ids["elective"] and progress.progress_percentage == 80
+
+
+def test_access_follows_indirect_prerequisites(db, path):
+    path_id, ids = path
+    student = _student(db, path_id)
+
+    # Only the direct prerequisite is done; its own prerequisite is not
+    _complete(db, student, ids["intro"])
+    assert not entitlements.course_access(db, student, ids["advanced"]).can_access_path_course(path_id)
+
+    _complete(db, student, ids["basics"])
+    assert crud.check_course_access(db, path_id, student, ids["advanced"])
+    assert not crud.check_course_access(db, path_id, student, ids["capstone"])
+
+
+def test_progress_for_many_enrollments_in_two_queries(db, engine, path):
+    path_id, ids = path
+    students = [_student(db, path_id, f"s{i}@example.com") for i in range(STUDENTS)]
+    for i, student in enumerate(students):
+        _complete(db, student, *[ids[n] for n in ["basics", "intro", "advanced"][: i % 4]])
+    enrollments = db.query(PathEnrollment).all()
+
+    path_graph.clear()
+    with assert_max_queries(engine, 2):
+        progress = path_graph.progress_many(db, enrollments)
+    with count_queries(engine) as statements:
+        path_graph.progress_many(db, enrollments)
+    assert len(statements) == 1  # the graph is cached
+
+    by_student = {e.student_id: progress[e.id] for e in enrollments}
+    assert by_student[students[0]].next_course_id == ids["basics"]
+    assert by_student[students[2]].unlockable_course_ids == (ids["advanced"], ids["elective"])
+    assert by_student[students[3]].completed_courses == 3
+    assert by_student[students[3]].next_course_id == ids["elective"]
+
+
+def test_incremental_progression(db, path):
+    path_id, ids = path
+    student = _student(db, path_id)
+    enrollment_id = db.query(PathEnrollment.id).filter_by(student_id=student).scalar()
+
+    enrollment = crud.update_path_enrollment_progress(db, enrollment_id, ids["basics"])
+    assert enrollment.completed_courses == 1 and enrollment.total_courses == 5
+    assert enrollment.current_course_id == ids["intro"]
+
+    _complete(db, student, ids["basics"], ids["intro"], ids["primer"])
+    enrollment = crud.update_path_enrollment_progress(db, enrollment_id, ids["advanced"])
+    assert enrollment.current_course_id == ids["capstone"] and not enrollment.is_completed
+
+    _complete(db, student, ids["advanced"])
+    enrollment = crud.update_path_enrollment_progress(db, enrollment_id, ids["capstone"])
+    assert enrollment.is_completed and enrollment.completed_at is not None
+    assert enrollment.progress_percentage == 80
+
+
+def test_changes_recompile_on_commit(db, engine, path, backend):
+    path_id, ids = path
+    student = _student(db, path_id)
+    _complete(db, student, ids["basics"])
+    other_worker = PathGraphCompiler()
+    assert not other_worker.get(db, path_id).is_unlocked(ids["advanced"], 0)
+    assert not crud.check_course_access(db, path_id, student, ids["advanced"])
+
+    # Dropping intro's prerequisite opens the whole chain up to capstone
+    db.query(PathCourse).filter_by(course_id=ids["intro"]).one().prerequisite_course_id = None
+    db.commit()
+    graph = path_graph.get(db, path_id)
+    assert graph.closure[ids["advanced"]] == 1 << graph.bits[ids["intro"]]
+    assert crud.check_course_access(db, path_id, student, ids["intro"])
+
+    if backend is not None:
+        # Another worker sees the bump through Redis
+        assert other_worker.get(db, path_id).version == graph.version
+        with count_queries(engine) as statements:
+            other_worker.get(db, path_id)
+        assert statements == []
+
+    # Rolled-back changes don't bump the version
+    db.query(PathCourse).filter_by(course_id=ids["elective"]).one().is_required = True
+    db.flush()
+    db.rollback()
+    unchanged = path_graph.get(db, path_id)
+    assert unchanged is graph
+
+
+def test_cycles_are_broken(db, path, caplog):
+    path_id, ids = path
+    db.query(PathCourse).filter_by(course_id=ids["basics"]).one().prerequisite_course_id = (
+        ids["advanced"]
+    )
+    db.commit()
+
+    with caplog.at_level(logging.WARNING, logger="app.services.path_graph"):
+        graph = path_graph.get(db, path_id)
+    assert "prerequisite cycle" in caplog.text
+    assert len(graph.course_ids) == 5
+    # Something in the cycle can still be started
+    assert set(graph.unlockable(0)) & {ids["basics"], ids["intro"], ids["advanced"]}
+
+
+def test_my_enrollments_reports_progress(db, engine, path):
+    path_id, ids = path
+    student_id = _student(db, path_id)
+    _complete(db, student_id, ids["basics"])
+    student = db.get(User, student_id)
+
+    try:
+        from app.api.api_v1.endpoints import learning_paths
+    except ImportError as e:
+        pytest.skip(f"learning path endpoints unavailable: {e}")
+    api = FastAPI()
+    api.include_router(learning_paths.router)
+    api.dependency_overrides[deps.get_db] = lambda: db
+    api.dependency_overrides[deps.get_current_user] = lambda: student
+    client = TestClient(api)
+
+    client.get("/my-enrollments")
+    with count_queries(engine) as statements:
+        response = client.get("/my-enrollments")
+    assert response.status_code == 200
+    # Enrollments with their paths, then the student's completed courses
+    assert len(statements) == 2
+    [enrollment] = response.json()
+    assert enrollment["completed_courses"] == 1 and enrollment["progress_percentage"] == 20
+    assert enrollment["next_course_id"] == ids["intro"]
+    assert enrollment["unlockable_course_ids"] == [ids["intro"], ids["elective"]]
+
+
+def test_uncommitted_path_courses_are_not_cached(db, path):
+    path_id, ids = path
+    db.add(PathCourse(path_id=path_id, course_id=ids["primer"], order_index=5))
+    db.flush()
+    assert ids["primer"] in path_graph.get(db, path_id).course_ids
+
+    db.rollback()
+    assert ids["primer"] not in path_graph.get(db, path_id).course_ids
+    assert path_graph.get(db, path_id) is path_graph.get(db, path_id)
@@ -0,0 +1,118 @@
+"""
+Presence Service Tests
+
+Tests for Redis-backed presence with write-behind flushing to SQL.
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app.models.chat import RealtimeUserPresence
+from app.services.presence import DIRTY_KEY, ONLINE_KEY, PresenceService, _to_score
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def redis(fake_redis):
+    with patch("app.services.presence.get_redis", return_value=fake_redis):
+        yield fake_redis
+
+
+def test_heartbeat_does_not_touch_sql(db, redis):
+    PresenceService.update_presence(db, 1, "online", current_location="course:5")
+    PresenceService.heartbeat(db, 1)
+
+    assert db.query(RealtimeUserPresence).count() == 0
+    assert redis.zscore(ONLINE_KEY, 1) is not None
+
+
+def test_online_users_by_location(db, redis):
+    PresenceService.update_presence(db, 1, "online", current_location="course:5")
+    PresenceService.update_presence(db, 2, "online", current_location="course:6")
+    PresenceService.update_presence(db, 3, "away", current_location="course:5")
+
+    assert {p.user_id for p in PresenceService.get_online_users(db)} == {1, 2}
+    assert [p.user_id for p in PresenceService.get_online_users(db, "course:5")] == [1]
+
+    # Moving location removes the user from the old location set
+    PresenceService.update_presence(db, 1, "online", current_location="course:6")
+    assert PresenceService.get_online_users(db, "course:5") == []
+
+    PresenceService.set_offline(db, 2)
+    assert {p.user_id for p in PresenceService.get_online_users(db)} == {1}
+
+
+def test_flush_writes_changed_users_in_bulk(db, redis):
+    for user_id in range(1, 6):
+        PresenceService.update_presence(db, user_id, "online")
+
+    assert PresenceService.flush_to_db(db) == 5
+    assert db.query(RealtimeUserPresence).count() == 5
+
+    # Nothing changed since, so nothing to flush
+    assert PresenceService.flush_to_db(db) == 0
+
+    PresenceService.set_offline(db, 3)
+    assert PresenceService.flush_to_db(db) == 1
+    row = db.query(RealtimeUserPresence).filter_by(user_id=3).one()
+    assert row.status == "offline"
+    assert PresenceService.get_presence(db, 3).id == row.id
+
+
+def test_cleanup_expires_by_score_range(db, redis):
+    PresenceService.update_presence(db, 1, "online")
+    PresenceService.update_presence(db, 2, "online")
+    redis.zadd(ONLINE_KEY, {1: _to_score(datetime.utcnow() - timedelta(minutes=30))})
+
+    assert PresenceService.cleanup_stale_presence(db, threshold_minutes=15) == 1
+    assert PresenceService.get_presence(db, 1).status == "offline"
+    assert db.query(RealtimeUserPresence).filter_by(user_id=1).one().status == "offline"
+
+
+def test_sql_fallback_without_redis(db):
+    with patch("app.services.presence.get_redis", return_value=None):
+        PresenceService.update_presence(db, 7, "online")
+        PresenceService.heartbeat(db, 7)
+        assert [p.user_id for p in PresenceService.get_online_users(db)] == [7]
+
+        row = db.query(RealtimeUserPresence).filter_by(user_id=7).one()
+        row.last_activity = datetime.utcnow() - timedelta(hours=1)
+        db.commit()
+
+        assert PresenceService.cleanup_stale_presence(db) == 1
+
+
+def test_sql_fallback_when_redis_fails(db):
+    server = fakeredis.FakeServer()
+    server.connected = False
+    client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    with patch("app.services.presence.get_redis", return_value=client):
+        PresenceService.update_presence(db, 7, "online", current_location="course:5")
+        PresenceService.heartbeat(db, 7)
+        assert PresenceService.get_presence(db, 7).current_location == "course:5"
+        assert [p.user_id for p in PresenceService.get_online_users(db, "course:5")] == [7]
+        assert PresenceService.flush_to_db(db) == 0
+
+        PresenceService.set_offline(db, 7)
+        assert db.query(RealtimeUserPresence).filter_by(user_id=7).one().status == "offline"
+
+        PresenceService.update_presence(db, 8, "online")
+        row = db.query(RealtimeUserPresence).filter_by(user_id=8).one()
+        row.last_activity = datetime.utcnow() - timedelta(hours=1)
+        db.commit()
+        assert PresenceService.cleanup_stale_presence(db) == 1
+
+
+def test_failed_flush_read_keeps_users_dirty(db, redis):
+    PresenceService.update_presence(db, 1, "online")
+
+    broken = MagicMock()
+    broken.execute.side_effect = RedisConnectionError("redis down")
+    with patch.object(redis, "pipeline", return_value=broken):
+        assert PresenceService.flush_to_db(db) == 0
+    assert redis.smembers(DIRTY_KEY) == {"1"}
+    assert PresenceService.flush_to_db(db) == 1
@@ -0,0 +1,141 @@
+"""
+Progress Ingestion Tests
+
+Tests for buffered video heartbeats, bulk flushes and denormalized lesson counts.
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+
+from app.models.course import Course
+from app.models.enrollment import Enrollment, EnrollmentStatus
+from app.models.lesson import Lesson
+from app.models.lesson_progress import LessonProgress, ProgressStatus
+from app.models.module import Module
+from app.models.user import User
+from app.services.progress_ingestion import DIRTY_KEY, ProgressIngestionService
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def redis(fake_redis):
+    with patch("app.services.progress_ingestion.get_redis", return_value=fake_redis):
+        yield fake_redis
+
+
+@pytest.fixture
+def course(db):
+    user = User(email="student@example.com", full_name="Student")
+    db.add(user)
+    db.flush()
+    course = Course(title="Polity", slug="polity", instructor_id=user.id)
+    module = Module(title="Basics", course=course)
+    module.lessons = [Lesson(title="Intro"), Lesson(title="Preamble")]
+    db.add(course)
+    db.flush()
+    db.add(Enrollment(user_id=user.id, course_id=course.id))
+    db.commit()
+    return course
+
+
+def _context(db, course):
+    user = db.query(User).first()
+    lessons = db.query(Lesson).order_by(Lesson.id).all()
+    enrollment = db.query(Enrollment).first()
+    return user, lessons, enrollment
+
+
+def test_lesson_count_is_denormalized(db, course):
+    db.refresh(course)
+    assert course.total_lessons == 2
+
+    module = course.modules[0]
+    db.add(Lesson(title="Rights", module_id=module.id))
+    db.commit()
+    db.refresh(course)
+    assert course.total_lessons == 3
+
+    db.delete(db.query(Lesson).filter_by(title="Intro").one())
+    db.commit()
+    db.refresh(course)
+    assert course.total_lessons == 2
+
+
+def test_lesson_context_single_query(db, course):
+    user, lessons, enrollment = _context(db, course)
+    context = ProgressIngestionService.lesson_context(db, user.id, lessons[0].id)
+    assert context == (course.id, enrollment.id, "Intro")
+    assert ProgressIngestionService.lesson_context(db, user.id, 9999) is None
+    assert ProgressIngestionService.lesson_context(db, 9999, lessons[0].id).enrollment_id is None
+
+
+def test_heartbeats_coalesce_until_flush(db, redis, course):
+    user, lessons, enrollment = _context(db, course)
+    start = datetime(2026, 5, 1, 10, 0)
+
+    for i in range(1, 6):
+        response = ProgressIngestionService.record_heartbeat(
+            db, user.id, lessons[0].id, course.id, enrollment.id,
+            {"video_progress_seconds": i * 10, "video_completed_percentage": i * 10.0},
+            now=start + timedelta(seconds=i * 10),
+        )
+    assert response["video_progress_seconds"] == 50
+    assert response["status"] == ProgressStatus.IN_PROGRESS
+
+    # Only the first heartbeat created the row; later ones stayed in Redis
+    row = db.query(LessonProgress).one()
+    assert row.id == response["id"]
+    assert row.video_progress_seconds == 0
+
+    assert ProgressIngestionService.flush_to_db(db) == 1
+    db.refresh(row)
+    assert row.video_progress_seconds == 50
+    assert row.video_completed_percentage == 50.0
+    assert redis.scard(DIRTY_KEY) == 0
+
+
+def test_completion_is_sticky_and_checked_on_flush(db, redis, course):
+    user, lessons, enrollment = _context(db, course)
+
+    for lesson in lessons:
+        ProgressIngestionService.record_heartbeat(
+            db, user.id, lesson.id, course.id, enrollment.id,
+            {"video_completed_percentage": 97.0},
+        )
+    # Seeking back after finishing doesn't undo completion
+    response = ProgressIngestionService.record_heartbeat(
+        db, user.id, lessons[1].id, course.id, enrollment.id,
+        {"video_completed_percentage": 10.0},
+    )
+    assert response["status"] == ProgressStatus.COMPLETED
+
+    with patch.object(ProgressIngestionService, "_on_course_completed") as completed:
+        assert ProgressIngestionService.flush_to_db(db) == 2
+        completed.assert_called_once()
+
+    statuses = {row.status for row in db.query(LessonProgress).all()}
+    assert statuses == {ProgressStatus.COMPLETED}
+    db.refresh(enrollment)
+    assert enrollment.status == EnrollmentStatus.COMPLETED
+    assert enrollment.progress_percentage == 100.0
+    assert enrollment.last_accessed_lesson_id == lessons[1].id
+
+
+def test_writes_through_without_redis(db, course):
+    user, lessons, enrollment = _context(db, course)
+    with patch("app.services.progress_ingestion.get_redis", return_value=None):
+        response = ProgressIngestionService.record_heartbeat(
+            db, user.id, lessons[0].id, course.id, enrollment.id,
+            {"time_spent_seconds": 30, "video_completed_percentage": 40.0},
+        )
+
+    row = db.query(LessonProgress).one()
+    assert response["id"] == row.id
+    assert row.time_spent_seconds == 30
+    assert row.status == ProgressStatus.IN_PROGRESS
+    db.refresh(enrollment)
+    assert enrollment.progress_percentage == 0.0
+    assert enrollment.last_accessed_lesson_id == lessons[0].id
@@ -0,0 +1,161 @@
+"""
+Query Instrumentation Tests
+
+Tests for per-request query counting, N+1 detection, slow-query sampling,
+fixed-memory histograms and query budgets on key endpoints.
+"""
+
+from unittest.mock import patch
+
+import pytest
+from fastapi import APIRouter, Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.api import deps
+from app.api.api_v1.endpoints import ai_tools
+from app.db.instrumentation import (
+    Histogram,
+    QueryInstrumentation,
+    assert_max_queries,
+)
+from app.middleware.query_instrumentation import QueryInstrumentationMiddleware
+from app.models.course import Course
+from app.models.lesson import Lesson
+from app.models.module import Module
+from app.models.user import User
+
+
+@pytest.fixture
+def instrumentation(engine):
+    instrumentation = QueryInstrumentation(
+        slow_query_ms=10_000, n_plus_one_threshold=5, max_samples=3
+    )
+    instrumentation.install(engine)
+    yield instrumentation
+    instrumentation.uninstall(engine)
+
+
+@pytest.fixture
+def course(db):
+    teacher = User(email="teacher@example.com", full_name="Teacher")
+    db.add(teacher)
+    db.flush()
+    course = Course(title="Polity", slug="polity", instructor_id=teacher.id)
+    db.add(course)
+    db.flush()
+    modules = [Module(course_id=course.id, title=f"Module {i}") for i in range(6)]
+    db.add_all(modules)
+    db.flush()
+    db.add_all(
+        Lesson(module_id=m.id, title=f"Lesson {i}", order_index=i,
+               content={"markdown": "The cat sat on the mat."})
+        for i, m in enumerate(modules)
+    )
+    db.commit()
+    return course
+
+
+@pytest.fixture
+def client(db, course, instrumentation):
+    n_plus_one = APIRouter()
+
+    @n_plus_one.get("/lessons/{course_id}")
+    def lesson_titles(course_id: int, session: Session = Depends(deps.get_db)):
+        lessons = session.query(Lesson).join(Module).filter(Module.course_id == course_id).all()
+        # One module query per lesson
+        return [f"{lesson.module.title}: {lesson.title}" for lesson in lessons]
+
+    teacher = course.instructor
+    teacher.id  # load before counting starts
+
+    app = FastAPI()
+    app.add_middleware(QueryInstrumentationMiddleware)
+    app.include_router(ai_tools.router, prefix="/ai-tools")
+    app.include_router(n_plus_one, prefix="/demo")
+    app.dependency_overrides[deps.get_db] = lambda: db
+    app.dependency_overrides[deps.get_current_active_user] = lambda: teacher
+
+    with patch("app.middleware.query_instrumentation.query_instrumentation", instrumentation):
+        yield TestClient(app)
+
+
+def test_histogram_percentiles_are_bounded():
+    histogram = Histogram()
+    for value in range(1, 1001):
+        histogram.record(value / 10)  # 0.1 .. 100ms
+
+    assert histogram.count == 1000
+    assert histogram.max == 100
+    assert histogram.percentile(0.50) == pytest.approx(50, rel=0.3)
+    assert histogram.percentile(0.99) == pytest.approx(99, rel=0.3)
+    assert histogram.percentile(1.0) == 100
+    assert len(histogram.counts) == len(histogram.bounds) + 1
+    assert Histogram().percentile(0.5) is None
+
+
+def test_queries_are_counted_per_request(engine, instrumentation):
+    with instrumentation.track() as outer:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            with instrumentation.track() as inner:
+                conn.execute(text("SELECT 2"))
+                conn.execute(text("SELECT 2"))
+            conn.execute(text("SELECT 3"))
+
+    assert inner.count == 2
+    assert inner.statements["SELECT 2"] == 2
+    assert outer.count == 2
+    assert instrumentation.snapshot()["query_time_ms"]["count"] == 4
+
+
+def test_endpoint_stats_and_n_plus_one(client, course, instrumentation):
+    for _ in range(3):
+        assert client.get(f"/ai-tools/course-difficulty/{course.id}").status_code == 200
+    assert len(client.get(f"/demo/lessons/{course.id}").json()) == 6
+
+    routes = instrumentation.route_stats()
+    difficulty = routes["GET /ai-tools/course-difficulty/{course_id}"]
+    assert difficulty["requests"] == 3
+    assert difficulty["queries"]["p95"] == 2
+    assert difficulty["n_plus_one_requests"] == 0
+
+    lessons = routes["GET /demo/lessons/{course_id}"]
+    assert lessons["n_plus_one_requests"] == 1
+    [flagged] = instrumentation.snapshot()["n_plus_one"]
+    assert flagged["route"] == "GET /demo/lessons/{course_id}"
+    assert flagged["count"] == 6
+    assert "FROM modules" in flagged["statement"]
+
+
+def test_key_endpoint_query_budget(engine, client, course):
+    with assert_max_queries(engine, 2):
+        client.get(f"/ai-tools/course-difficulty/{course.id}")
+
+    with pytest.raises(AssertionError, match="Expected at most 2 queries, 7"):
+        with assert_max_queries(engine, 2):
+            client.get(f"/demo/lessons/{course.id}")
+
+
+def test_slow_queries_sampled_with_plan(engine, db, course, instrumentation):
+    instrumentation.slow_query_ms = 0
+    with instrumentation.track():
+        for i in range(5):
+            db.query(Course).filter(Course.slug == f"slug-{i}").all()
+    db.execute(text("UPDATE courses SET title = 'Polity'"))
+    db.query(Module).filter(Module.title == "Module 1").all()
+    instrumentation._executor.shutdown(wait=True)
+
+    slow = instrumentation.snapshot()["slow_queries"]
+    assert len(slow) == 3  # ring buffer keeps the most recent samples
+    by_table = {
+        f"{s['statement'].split()[0]} {'modules' if 'FROM modules' in s['statement'] else 'courses'}": s
+        for s in slow
+    }
+    assert set(by_table) == {"SELECT courses", "UPDATE courses", "SELECT modules"}
+    # Repeats of an explained statement are not explained again; writes never are
+    assert by_table["SELECT courses"]["plan"] is None
+    assert by_table["UPDATE courses"]["plan"] is None
+    assert "modules" in by_table["SELECT modules"]["plan"]
+    assert by_table["SELECT modules"]["route"] is None
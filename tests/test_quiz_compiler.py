@@ -0,0 +1,141 @@
+"""
+Quiz Compiler Tests
+
+Tests for compiled quiz snapshots, in-memory grading and version-based invalidation.
+"""
+
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import event
+
+from app.models.course import Course
+from app.models.quiz import Question, QuestionOption, QuestionType, Quiz, QuizFeedback
+from app.models.user import User
+from app.services.quiz_compiler import VERSION_KEY, QuizCompiler
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def redis(fake_redis):
+    with patch("app.services.quiz_compiler.get_redis", return_value=fake_redis):
+        yield fake_redis
+
+
+@pytest.fixture
+def quiz(db):
+    user = User(email="teacher@example.com", full_name="Teacher")
+    db.add(user)
+    db.flush()
+    course = Course(title="Polity", slug="polity", instructor_id=user.id)
+    db.add(course)
+    db.flush()
+
+    quiz = Quiz(title="Basics", course_id=course.id, is_published=True, show_hints=True)
+    mcq = Question(text="Capital?", type=QuestionType.MULTIPLE_CHOICE.value, points=2)
+    mcq.options = [
+        QuestionOption(text="Delhi", is_correct=True, order_index=0),
+        QuestionOption(text="Mumbai", order_index=1),
+    ]
+    short = Question(text="Preamble starts with?", type=QuestionType.SHORT_ANSWER.value,
+                     order_index=1)
+    short.options = [QuestionOption(text="We the People", is_correct=True)]
+    blank = Question(text="Article __ abolishes untouchability", order_index=2,
+                     type=QuestionType.FILL_IN_BLANK.value)
+    blank.options = [QuestionOption(text="17", is_correct=True)]
+    quiz.questions = [mcq, short, blank]
+    db.add(quiz)
+    db.flush()
+    db.add(QuizFeedback(question_id=mcq.id, feedback_for_correct="Right!",
+                        feedback_for_incorrect="Not quite", hint_text="North"))
+    db.commit()
+    return quiz
+
+
+def _count_queries(engine):
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    return statements, lambda: event.remove(engine, "before_cursor_execute", count)
+
+
+def test_compile_and_grade_in_memory(engine, db, quiz):
+    quiz_id = quiz.id
+    statements, stop = _count_queries(engine)
+    try:
+        compiled = QuizCompiler().compile(db, quiz_id)
+    finally:
+        stop()
+    assert len(statements) <= 5
+
+    mcq, short, blank = (q.id for q in quiz.questions)
+    delhi, mumbai = (o.id for o in quiz.questions[0].options)
+    assert compiled.question_count == 3
+    assert compiled.total_points == 4.0
+    assert compiled.question_payloads[0]["feedback"]["hint_text"] == "North"
+    assert compiled.quiz_payload["questions"][0]["id"] == mcq
+
+    right = compiled.grade(mcq, selected_option_id=delhi)
+    assert (right.is_correct, right.points_awarded, right.correct_option_id) == (True, 2.0, delhi)
+    wrong = compiled.grade(mcq, selected_option_id=mumbai)
+    assert not wrong.is_correct and wrong.points_awarded == 0.0
+
+    assert compiled.grade(short, text_response="  we the people ").is_correct
+    assert not compiled.grade(short, text_response="we").is_correct
+    assert compiled.grade(blank, text_response="It is Article 17").is_correct
+
+    response = compiled.answer_response(mcq, wrong)
+    assert response["feedback"]["feedback_text"] == "Not quite"
+    assert response["feedback"]["hint_text"] == "North"
+    assert response["correct_option_id"] == delhi
+
+
+def test_snapshot_shared_through_redis(engine, db, redis, quiz):
+    quiz_id = quiz.id
+    compiled = QuizCompiler().get(db, quiz_id)
+
+    # Another worker loads the snapshot from Redis without compiling
+    statements, stop = _count_queries(engine)
+    try:
+        other = QuizCompiler().get(db, quiz_id)
+    finally:
+        stop()
+    assert statements == []
+    assert other.to_json() == compiled.to_json()
+
+
+def test_content_changes_bump_version(db, redis, quiz):
+    compiler = QuizCompiler()
+    mcq = quiz.questions[0]
+    delhi, mumbai = mcq.options
+    before = compiler.get(db, quiz.id)
+    assert before.grade(mcq.id, selected_option_id=delhi.id).is_correct
+
+    with patch("app.services.quiz_compiler.quiz_compiler", compiler):
+        delhi.is_correct, mumbai.is_correct = False, True
+        db.commit()
+
+    assert int(redis.get(VERSION_KEY.format(quiz_id=quiz.id))) == before.version + 1
+    compiled = compiler.get(db, quiz.id)
+    assert compiled.version == before.version + 1
+    assert compiled.grade(mcq.id, selected_option_id=mumbai.id).is_correct
+
+
+def test_local_versions_without_redis(db, quiz):
+    compiler = QuizCompiler()
+    with patch("app.services.quiz_compiler.get_redis", return_value=None), patch(
+        "app.services.quiz_compiler.quiz_compiler", compiler
+    ):
+        first = compiler.get(db, quiz.id)
+        assert compiler.get(db, quiz.id) is first
+
+        quiz.questions[1].points = 5
+        db.commit()
+
+        compiled = compiler.get(db, quiz.id)
+        assert compiled.version == 1
+        assert compiled.total_points == 8.0
@@ -0,0 +1,110 @@
+"""
+Recall Scorer Tests
+
+Tests for the local TF-IDF pre-scorer that settles clear recall submissions
+without an LLM call.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+from app.services.recall_scorer import (
+    ACCEPT,
+    ESCALATE,
+    REJECT,
+    RecallScorer,
+    split_key_points,
+    split_sentences,
+)
+
+KEY_POINTS = """- The Preamble declares India a sovereign socialist secular democratic republic
+- The 42nd Amendment added the words socialist and secular in 1976
+- Justice, liberty, equality and fraternity are the objectives of the Preamble
+- The Kesavananda Bharati case held that the Preamble is part of the Constitution"""
+
+POINTS = split_key_points(KEY_POINTS)
+
+
+def test_split_key_points_and_sentences():
+    assert len(POINTS) == 4
+    assert POINTS[0].startswith("The Preamble declares")
+    assert split_key_points("federalism, judicial review; fundamental rights") == [
+        "federalism", "judicial review", "fundamental rights",
+    ]
+    assert len(split_sentences("Rivers flow east. The Ganga rises in Gangotri!\n\nIt ends.")) == 2
+
+
+def test_clear_cases_are_settled_locally():
+    scorer = RecallScorer()
+
+    empty = scorer.prescore("1_1_1_1", POINTS, "   um ok ")
+    assert (empty.decision, empty.reason, empty.recall_score) == (REJECT, "empty", 0)
+
+    off_topic = scorer.prescore(
+        "1_1_1_1", POINTS, "Photosynthesis converts sunlight water and carbon dioxide into glucose"
+    )
+    assert (off_topic.decision, off_topic.reason) == (REJECT, "off_topic")
+
+    copied = scorer.prescore("1_1_1_1", POINTS, POINTS[0] + ". " + POINTS[1])
+    assert (copied.decision, copied.reason) == (REJECT, "copied")
+
+    covered = scorer.prescore(
+        "1_1_1_1",
+        POINTS,
+        "India is declared a sovereign secular socialist democratic republic by the preamble. "
+        "Socialist and secular were inserted by the 42nd amendment in 1976. It aims for justice, "
+        "liberty, equality and fraternity, and Kesavananda Bharati said the preamble is a part "
+        "of the constitution.",
+    )
+    assert covered.decision == ACCEPT
+    assert covered.recall_score >= 85
+    assert covered.concepts_missed == []
+
+
+def test_partial_recall_escalates_with_baseline():
+    scorer = RecallScorer()
+    partial = scorer.prescore(
+        "1_1_1_1",
+        POINTS,
+        "I remember that the 42nd amendment in 1976 inserted socialist and secular into it.",
+    )
+    assert partial.decision == ESCALATE
+    assert partial.recall_score == 25
+    assert partial.concepts_covered == [POINTS[1]]
+
+    no_points = scorer.prescore("1_1_1_2", [], "Some long answer about the constitution today")
+    assert no_points.decision == ESCALATE and no_points.recall_score is None
+
+
+def test_index_cached_per_content():
+    scorer = RecallScorer(max_indexes=2)
+    first = scorer.index("1_1_1_1", POINTS)
+    assert scorer.index("1_1_1_1", POINTS) is first
+    assert scorer.index("1_1_1_1", POINTS[:2]) is not first
+
+    scorer.index("1_1_1_2", POINTS)
+    assert scorer.index("1_1_1_1", POINTS) is not first
+
+
+def test_analyze_recall_skips_llm_for_clear_cases():
+    from app.api.api_v1.endpoints import prelims_recall
+
+    request = prelims_recall.RecallAnalysisRequest(
+        cycle_id=999, day_number=1, part_number=1, segment_number=1,
+        segment_title="Preamble", key_points=KEY_POINTS, response_type="audio",
+        response_text="Photosynthesis converts sunlight water and carbon dioxide into glucose",
+    )
+    route = AsyncMock(side_effect=RuntimeError("provider down"))
+    with patch.object(prelims_recall.ai_router, "route", route):
+        rejected = asyncio.run(prelims_recall.analyze_recall(request, current_user=None, db=None))
+        assert not route.called
+        assert rejected.is_relevant is False
+        assert rejected.recall_score == 0
+        assert rejected.ai_source == "local"
+
+        # Ambiguous submissions reach the LLM; on failure the local score is the baseline
+        request.response_text = "The 42nd amendment in 1976 inserted socialist and secular."
+        fallback = asyncio.run(prelims_recall.analyze_recall(request, current_user=None, db=None))
+        assert route.called
+        assert fallback.recall_score == 25
+        assert fallback.concepts_covered == [POINTS[1]]
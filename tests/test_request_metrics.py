@@ -0,0 +1,164 @@
+"""
+Request Metrics Tests
+
+Tests for quantile sketch accuracy and memory bounds, the pure ASGI metrics
+middleware, request log sampling and Prometheus export.
+"""
+
+import logging
+import random
+from unittest.mock import patch
+
+import pytest
+from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.db.instrumentation import QueryInstrumentation
+from app.middleware.query_instrumentation import QueryInstrumentationMiddleware
+from app.middleware.request_logging import RequestMetricsMiddleware
+from app.services.request_metrics import LatencySketch, LogSampler, RequestMetrics
+
+
+def _exact(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+@pytest.fixture
+def instrumentation():
+    return QueryInstrumentation()
+
+
+@pytest.fixture
+def metrics(instrumentation):
+    metrics = RequestMetrics(instrumentation)
+    metrics.sampler = LogSampler(rate_per_second=5, slow_ms=500)
+    return metrics
+
+
+@pytest.fixture
+def client(metrics, instrumentation):
+    router = APIRouter()
+
+    @router.get("/items/{item_id}")
+    def get_item(item_id: int):
+        if item_id == 0:
+            raise HTTPException(status_code=404, detail="Not found")
+        return {"id": item_id}
+
+    @router.get("/boom")
+    def boom():
+        raise RuntimeError("boom")
+
+    app = FastAPI()
+    app.add_middleware(QueryInstrumentationMiddleware, instrumentation=instrumentation)
+    app.add_middleware(RequestMetricsMiddleware, metrics=metrics)
+    app.include_router(router, prefix="/api")
+    return TestClient(app, raise_server_exceptions=False)
+
+
+def test_sketch_quantiles_within_relative_error():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(3, 1.2) for _ in range(100_000)]
+    sketch = LatencySketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+
+    for q in (0.5, 0.9, 0.99, 0.999):
+        assert sketch.quantile(q) == pytest.approx(_exact(values, q), rel=0.02)
+    assert sketch.max == max(values)
+    assert sketch.quantile(1.0) == max(values)
+    assert len(sketch.bins) < 1500
+
+    halves = LatencySketch(), LatencySketch()
+    for i, value in enumerate(values):
+        halves[i % 2].add(value)
+    halves[0].merge(halves[1])
+    assert halves[0].quantile(0.99) == sketch.quantile(0.99)
+
+
+def test_sketch_memory_is_bounded():
+    values = [step * 10.0 ** exponent for exponent in range(-3, 7) for step in range(1, 200)]
+    values.append(0.0)
+    sketch = LatencySketch(max_buckets=64)
+    for value in values:
+        sketch.add(value)
+
+    assert len(sketch.bins) == 64
+    assert sketch.count == len(values)
+    # Only the lowest buckets are collapsed: the tail stays accurate
+    assert sketch.quantile(0.99) == pytest.approx(_exact(values, 0.99), rel=0.02)
+
+
+def test_middleware_records_by_route_template(client, metrics, instrumentation):
+    for item_id in range(1, 6):
+        assert client.get(f"/api/items/{item_id}").status_code == 200
+    assert client.get("/api/items/0").status_code == 404
+    assert client.get("/api/boom").status_code == 500
+    assert client.get("/nowhere").status_code == 404
+
+    summary = metrics.summary()
+    routes = {(r["method"], r["route"]): r for r in summary["routes"]}
+    assert set(routes) == {
+        ("GET", "/api/items/{item_id}"),
+        ("GET", "/api/boom"),
+        ("GET", "<unmatched>"),
+    }
+    items = routes[("GET", "/api/items/{item_id}")]
+    assert items["requests"] == 6
+    assert items["statuses"] == {"200": 5, "404": 1}
+    assert items["latency_ms"]["p99"] <= items["latency_ms"]["max"]
+    assert routes[("GET", "/api/boom")]["errors"] == 1
+    assert summary["overall"]["requests"] == 8
+
+    assert metrics.summary(route="/api/boom")["routes"][0]["requests"] == 1
+
+    # One store: the SQL instrumentation's route stats hold the same requests
+    assert instrumentation.route_stats()["GET /api/items/{item_id}"]["requests"] == 6
+
+    text = metrics.prometheus()
+    assert 'http_request_duration_ms_count{method="GET",route="/api/items/{item_id}"} 6' in text
+    assert 'http_requests_total{method="GET",route="/api/items/{item_id}",status="404"} 1' in text
+    assert 'quantile="0.99"' in text
+
+
+def test_request_logs_are_sampled(client, metrics, caplog):
+    with caplog.at_level(logging.INFO, logger="app.services.request_metrics"):
+        for _ in range(50):
+            client.get("/api/items/1")
+        client.get("/api/boom")
+
+    lines = [r for r in caplog.records if r.name == "app.services.request_metrics"]
+    assert len(lines) < 15
+    # Server errors always get through and report what was skipped before them
+    error = lines[-1]
+    assert error.levelno == logging.ERROR
+    assert error.route == "/api/boom"
+    assert sum(r.sampled_out for r in lines) + len(lines) == 51
+
+
+def test_sampler_refills_over_time():
+    sampler = LogSampler(rate_per_second=2, slow_ms=100)
+    with patch("app.services.request_metrics.time.monotonic", return_value=sampler._updated):
+        assert [sampler.sample(200, 1) for _ in range(4)] == [0, 0, None, None]
+        assert sampler.sample(200, 150) == 2  # slow requests are always logged
+    with patch("app.services.request_metrics.time.monotonic", return_value=sampler._updated + 1):
+        assert sampler.sample(200, 1) == 0
+
+
+def test_prometheus_scrape_requires_configured_token():
+    from app.api.api_v1.endpoints import performance
+
+    app = FastAPI()
+    app.include_router(performance.router, prefix="/performance")
+    client = TestClient(app)
+
+    # Without a configured token the endpoint isn't served at all
+    with patch("app.api.deps.settings.METRICS_TOKEN", ""):
+        assert client.get("/performance/metrics").status_code == 404
+    with patch("app.api.deps.settings.METRICS_TOKEN", "scrape"):
+        assert client.get("/performance/metrics").status_code == 401
+        wrong = client.get("/performance/metrics", headers={"Authorization": "Bearer other"})
+        assert wrong.status_code == 401
+        ok = client.get("/performance/metrics", headers={"Authorization": "Bearer scrape"})
+        assert ok.status_code == 200 and ok.headers["content-type"].startswith("text/plain")
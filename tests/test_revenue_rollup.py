@@ -0,0 +1,168 @@
+"""
+Revenue Rollup Tests
+
+Tests for incremental rollup maintenance, rebuilds, time-series slicing and
+forecasting, and rollup-backed revenue analytics.
+"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.models.analytics import RevenueRollup
+from app.models.course import Course
+from app.models.order import Order, OrderItem, OrderStatus
+from app.models.user import User
+from app.services.revenue_analytics_service import RevenueAnalyticsService
+from app.services.revenue_rollup import revenue_rollup
+from app.services.revenue_timeseries import RevenueSeries, forecast, seasonal_indices
+
+
+@pytest.fixture
+def courses(db):
+    teacher = User(email="teacher@example.com", full_name="Teacher")
+    other = User(email="other@example.com", full_name="Other")
+    db.add_all([teacher, other])
+    db.flush()
+    polity = Course(title="Polity", slug="polity", instructor_id=teacher.id)
+    history = Course(title="History", slug="history", instructor_id=teacher.id)
+    geography = Course(title="Geography", slug="geography", instructor_id=other.id)
+    db.add_all([polity, history, geography])
+    db.commit()
+    return polity, history, geography
+
+
+def _order(db, created_at, items, status=OrderStatus.COMPLETED, tax=0.0):
+    order = Order(
+        order_number=f"ORD-{created_at:%Y%m%d%H%M%S}-{len(items)}",
+        created_at=created_at,
+        status=status,
+    )
+    order.items = [
+        OrderItem(course_id=course.id, item_name=course.title, unit_price=price, total=price)
+        for course, price in items
+    ]
+    order.subtotal = sum(price for _, price in items)
+    order.tax = tax
+    order.total = order.subtotal + tax
+    db.add(order)
+    db.commit()
+    return order
+
+
+def _rollup(db):
+    return {
+        (r.day, r.hour, r.course_id, r.instructor_id): (round(r.revenue, 2), r.orders, r.items)
+        for r in db.query(RevenueRollup).all()
+        if r.orders or r.revenue
+    }
+
+
+def test_rollup_follows_order_lifecycle(db, courses):
+    polity, history, geography = courses
+    teacher = polity.instructor_id
+    at = datetime(2026, 10, 1, 9, 15)
+    day = at.date()
+
+    _order(db, at, [(polity, 100.0), (history, 50.0)], tax=15.0)
+    second = _order(db, at + timedelta(minutes=20), [(polity, 100.0), (geography, 80.0)])
+    _order(db, at, [(geography, 999.0)], status=OrderStatus.PENDING)
+
+    other = geography.instructor_id
+    assert _rollup(db) == {
+        (day, 9, 0, 0): (345.0, 2, 4),
+        (day, 9, 0, teacher): (250.0, 2, 3),
+        (day, 9, 0, other): (80.0, 1, 1),
+        (day, 9, polity.id, teacher): (200.0, 2, 2),
+        (day, 9, history.id, teacher): (50.0, 1, 1),
+        (day, 9, geography.id, other): (80.0, 1, 1),
+    }
+
+    second.status = OrderStatus.REFUNDED
+    db.commit()
+    assert _rollup(db) == {
+        (day, 9, 0, 0): (165.0, 1, 2),
+        (day, 9, 0, teacher): (150.0, 1, 2),
+        (day, 9, polity.id, teacher): (100.0, 1, 1),
+        (day, 9, history.id, teacher): (50.0, 1, 1),
+    }
+
+    pending = db.query(Order).filter(Order.status == OrderStatus.PENDING).one()
+    pending.status = OrderStatus.COMPLETED
+    db.commit()
+    incremental = _rollup(db)
+    assert incremental[(day, 9, geography.id, other)] == (999.0, 1, 1)
+
+    # A rebuild from orders reproduces the incremental state
+    revenue_rollup.rebuild(db)
+    assert _rollup(db) == incremental
+
+    db.delete(pending)
+    db.commit()
+    assert (day, 9, geography.id, other) not in _rollup(db)
+    assert _rollup(db)[(day, 9, 0, 0)] == (165.0, 1, 2)
+
+
+def test_series_slicing_and_forecast():
+    start = date(2026, 1, 5)  # a Monday
+    weekly = [100.0, 100.0, 100.0, 100.0, 100.0, 300.0, 300.0]
+    values = [weekly[i % 7] + i for i in range(84)]
+    series = RevenueSeries.from_points(
+        start, start + timedelta(days=83), [(start + timedelta(days=i), v, 1) for i, v in enumerate(values)]
+    )
+
+    assert len(series) == 84
+    week = series.slice(date(2026, 1, 12), date(2026, 1, 18))
+    assert week.revenue == values[7:14]
+    assert series.slice(date(2025, 1, 1), date(2026, 1, 6)).revenue == values[:2]
+    assert series.tail(30).revenue == values[-30:]
+    assert series.by_weekday()[5] > series.by_weekday()[0]
+
+    indices = seasonal_indices(values)
+    assert indices[5] > 100 and indices[0] < -50
+
+    prediction = forecast(series, 14)
+    assert prediction.start == start + timedelta(days=84)
+    # Saturday/Sunday stay high, weekdays low, and the trend keeps rising
+    assert prediction.predicted[5] > prediction.predicted[4] + 150
+    assert prediction.predicted[7] == pytest.approx(84 + 7 + 100, abs=15)
+    lower, upper = prediction.total_interval
+    assert lower <= prediction.total <= upper
+    assert all(lo <= p <= hi for lo, p, hi in zip(prediction.lower, prediction.predicted, prediction.upper))
+
+
+def test_analytics_read_rollup_not_orders(engine, db, courses):
+    polity, history, _ = courses
+    today = datetime.utcnow().replace(hour=10, minute=0, second=0, microsecond=0)
+    for i in range(20):
+        _order(db, today - timedelta(days=i), [(polity, 100.0), (history, 20.0 * (i % 2))])
+
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        service = RevenueAnalyticsService(db)
+        breakdown = service.get_revenue_breakdown(instructor_id=polity.instructor_id)
+        prediction = service.forecast_revenue(forecast_days=14)
+        report = service.get_report_data(instructor_id=polity.instructor_id)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    assert not any("FROM orders" in s or "JOIN orders" in s for s in statements)
+    assert breakdown["total_revenue"] == 2200.0
+    assert breakdown["order_count"] == 20  # orders with both courses count once
+    assert breakdown["by_course"][0] == {"course": "Polity", "revenue": 2000.0, "percentage": 90.91}
+    assert sum(h["revenue"] for h in breakdown["by_hour_of_day"]) == 2200.0
+
+    assert prediction["historical_days"] == 20
+    assert len(prediction["daily_forecast"]) == 14
+    assert [w["days"] for w in prediction["breakdown_by_week"]] == [7, 7]
+    assert prediction["confidence_interval"][0] <= prediction["predicted_revenue"]
+
+    assert report["revenue_summary"]["total"] == 2200.0
+    assert report["top_courses"][0]["name"] == "Polity"
+    assert sum(m["revenue"] for m in report["monthly_data"]) == 2200.0
@@ -0,0 +1,139 @@
+"""
+Text Analytics Tests
+
+Tests for batched readability metrics, the content-hash cache and
+course-wide difficulty analysis.
+"""
+
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import event
+
+from app.models.course import Course
+from app.models.lesson import Lesson
+from app.models.module import Module
+from app.models.user import User
+from app.services.difficulty_analyzer_service import DifficultyAnalyzerService
+from app.services.text_analytics import (
+    TextAnalytics,
+    TextMetrics,
+    compute_metrics,
+    count_syllables,
+    tokenize,
+)
+
+fakeredis = pytest.importorskip("fakeredis")
+
+SIMPLE = "The cat sat on the mat. It was a big cat!"
+DENSE = (
+    "<p>Constitutional interpretation necessitates comprehensive understanding "
+    "of jurisprudential methodologies and institutional accountability.</p>"
+)
+
+
+@pytest.fixture(autouse=True)
+def no_redis():
+    with patch("app.services.text_analytics.get_redis", return_value=None):
+        yield
+
+
+def test_tokenize_once_and_count_syllables():
+    counts, sentences = tokenize("One <b>two</b> three. Four!! Five")
+    assert sentences == 3
+    assert sum(counts.values()) == 5
+
+    assert count_syllables("make") == 1
+    assert count_syllables("table") == 2
+    assert count_syllables("idea") == 3  # lookup beats the heuristic
+    assert count_syllables("people") == 2
+
+
+def test_readability_scores():
+    simple = compute_metrics(SIMPLE).readability()
+    dense = compute_metrics(DENSE).readability()
+
+    assert simple["avg_sentence_length"] == 5.5
+    assert simple["flesch_reading_ease"] == 100
+    assert simple["flesch_kincaid_grade"] == 0
+    assert dense["flesch_kincaid_grade"] > 12
+    assert dense["gunning_fog"] > simple["gunning_fog"]
+    assert dense["smog"] > simple["smog"]
+    assert "necessitates" not in compute_metrics(DENSE).difficult_terms
+    assert "jurisprudential" in compute_metrics(DENSE).difficult_terms
+
+    assert compute_metrics("").readability()["flesch_reading_ease"] == 100
+
+    whole = TextMetrics.combine([compute_metrics(SIMPLE), compute_metrics(DENSE)])
+    assert whole == compute_metrics(SIMPLE + " " + DENSE)
+
+
+def test_batch_only_computes_new_content():
+    analytics = TextAnalytics()
+    first = analytics.analyze_many([SIMPLE, DENSE, SIMPLE])
+    assert analytics.computed == 2
+    assert first[0] is first[2]
+
+    second = analytics.analyze_many([SIMPLE, DENSE + " Edited."])
+    assert analytics.computed == 3
+    assert second[0] is first[0]
+
+
+def test_metrics_shared_through_redis():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    with patch("app.services.text_analytics.get_redis", return_value=client):
+        TextAnalytics().analyze_many([SIMPLE, DENSE])
+
+        other = TextAnalytics()
+        metrics = other.analyze_many([DENSE, SIMPLE])
+    assert other.computed == 0
+    assert metrics[0] == compute_metrics(DENSE)
+
+
+def test_analyze_course_recomputes_only_edited_lessons(engine, db):
+    user = User(email="teacher@example.com", full_name="Teacher")
+    db.add(user)
+    db.flush()
+    course = Course(title="Polity", slug="polity", instructor_id=user.id)
+    db.add(course)
+    db.flush()
+    module = Module(course_id=course.id, title="Basics")
+    db.add(module)
+    db.flush()
+    lessons = [
+        Lesson(module_id=module.id, title=f"Lesson {i}", order_index=i,
+               content={"markdown": f"{SIMPLE} Lesson number {i}."})
+        for i in range(20)
+    ]
+    lessons.append(Lesson(module_id=module.id, title="Hard", order_index=20,
+                          description=DENSE, content={}))
+    db.add_all(lessons)
+    db.commit()
+    course_id = course.id
+
+    analytics = TextAnalytics()
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        with patch("app.services.difficulty_analyzer_service.text_analytics", analytics):
+            report = DifficultyAnalyzerService.analyze_course(db, course_id)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    assert len(statements) == 1
+    assert report["lesson_count"] == 21
+    assert report["recomputed_lessons"] == 21
+    assert report["lessons"][0]["recommended_level"] == "beginner"
+    assert report["lessons"][-1]["recommended_level"] == "advanced"
+    assert report["course"]["recommended_level"] == "beginner"
+
+    lessons[3].content = {"markdown": DENSE + " Revised."}
+    db.commit()
+    with patch("app.services.difficulty_analyzer_service.text_analytics", analytics):
+        report = DifficultyAnalyzerService.analyze_course(db, course_id)
+    assert report["recomputed_lessons"] == 1
+    assert report["lessons"][3]["recommended_level"] == "advanced"
@@ -0,0 +1,174 @@
+"""
+WebSocket Connection Release Tests
+
+Tests that WebSocket handlers hold no pooled database connection while
+sockets are open (auth and writes use short-lived sessions), and the pool
+saturation metrics that make long-held connections visible.
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+import app.models  # noqa: F401 - register all mappers
+from app.api import deps
+from app.api.api_v1.endpoints import websocket as endpoints
+from app.core import security
+from app.core import websocket as websocket_module
+from app.core.websocket import manager
+from app.db.instrumentation import PoolMonitor, QueryInstrumentation
+from app.db.session import Base
+from app.models.user import User
+from app.services.whiteboard import whiteboard
+
+POOL_SIZE = 2
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'ws.db'}",
+        connect_args={"check_same_thread": False},
+        poolclass=QueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=0,
+        pool_timeout=2,
+    )
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def monitor(engine):
+    monitor = PoolMonitor(long_hold_seconds=60)
+    monitor.install(engine)
+    yield monitor
+    monitor.uninstall(engine)
+
+
+@pytest.fixture
+def session_factory(engine):
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with patch.object(deps, "SessionLocal", factory), patch(
+        "app.core.websocket.SessionLocal", factory
+    ), patch("app.services.whiteboard.SessionLocal", factory), patch(
+        "app.services.presence.get_redis", return_value=None
+    ), patch("app.services.whiteboard.get_redis", return_value=None):
+        yield factory
+    whiteboard.clear()
+
+
+@pytest.fixture
+def user(session_factory):
+    db = session_factory()
+    user = User(email="student@example.com", full_name="Student", is_active=True)
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+    return user_id
+
+
+@pytest.fixture
+def client(session_factory):
+    app = FastAPI()
+    app.include_router(endpoints.router)
+
+    @app.get("/ping-db")
+    def ping_db(db: Session = Depends(deps.get_db)):
+        return {"ok": db.execute(text("SELECT 1")).scalar()}
+
+    return TestClient(app)
+
+
+def test_open_sockets_hold_no_connections(client, monitor, user):
+    token = security.create_access_token(user)
+    urls = [
+        f"/ws/discussions/1?token={token}",
+        f"/ws/discussions/2?token={token}",
+        f"/ws/live-quiz/1?token={token}",
+        f"/ws/live-quiz/2?token={token}",
+        f"/ws/whiteboard/1?token={token}",
+        f"/ws/notifications/{user}?token={token}",
+    ]
+    sockets = [client.websocket_connect(url) for url in urls]
+    opened = []
+    try:
+        for socket in sockets:
+            opened.append(socket.__enter__())
+            assert opened[-1].receive_json()["type"] in ("online_users", "init_state")
+
+        # Three times more sockets than pooled connections, and HTTP still gets one
+        assert monitor.pool_status()["checked_out"] == 0
+        assert client.get("/ping-db").json() == {"ok": 1}
+        opened[4].send_json({"type": "draw", "data": [1, 2]})
+    finally:
+        for socket in reversed(sockets[: len(opened)]):
+            socket.__exit__(None, None, None)
+
+    # Offline presence and the whiteboard save finish in the threadpool
+    deadline = time.monotonic() + 5
+    while monitor.pool_status()["checked_out"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    snapshot = monitor.snapshot()
+    assert snapshot["capacity"] == POOL_SIZE
+    assert snapshot["checked_out"] == 0
+    assert snapshot["checkouts"] >= len(urls)
+    assert snapshot["hold_ms"]["max"] < 2000
+
+
+def test_unauthorized_socket_is_closed(client, monitor, user):
+    other = security.create_access_token(user + 1)
+    with pytest.raises(Exception):
+        with client.websocket_connect(f"/ws/notifications/{user}?token={other}") as socket:
+            socket.receive_json()
+    assert monitor.pool_status()["checked_out"] == 0
+
+
+def test_disconnect_keeps_its_tasks_until_done(monitor, session_factory, user):
+    socket = MagicMock()
+
+    async def session():
+        manager.active_connections["discussion_1"] = {socket}
+        manager.connection_users[socket] = {
+            "user_id": user, "user_name": "Student", "room": "discussion_1",
+        }
+        manager.disconnect(socket)
+        # The leave broadcast and the offline write aren't left to the GC
+        pending = set(websocket_module._background_tasks)
+        assert len(pending) == 2
+        await asyncio.gather(*pending)
+        await asyncio.sleep(0)
+        return set(websocket_module._background_tasks)
+
+    assert asyncio.run(session()) == set()
+    assert monitor.pool_status()["checked_out"] == 0
+
+
+def test_pool_monitor_attributes_long_holds(engine, monitor):
+    monitor.long_hold_seconds = 0
+    instrumentation = QueryInstrumentation()
+    scope = {"method": "GET", "route": SimpleNamespace(path="/slow")}
+
+    with instrumentation.track(scope, record=False):
+        connection = engine.connect()
+    snapshot = monitor.snapshot()
+    assert snapshot["holders"] == {"GET /slow": 1}
+    assert snapshot["saturation"] == 0.5
+    connection.close()
+
+    assert monitor.snapshot()["long_holds"] == 1
+    assert instrumentation.route_stats() == {}
+    metrics = monitor.prometheus()
+    assert "db_pool_checked_out 0" in metrics
+    assert f"db_pool_capacity {POOL_SIZE}" in metrics
+    assert "db_pool_long_holds_total 1" in metrics
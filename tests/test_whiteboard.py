@@ -0,0 +1,199 @@
+"""
+Whiteboard Tests
+
+Tests for the whiteboard op log: undo/redo folding, snapshot compaction for
+late joiners (Redis and in-process), per-frame broadcast batching, optional
+msgpack framing and debounced persistence.
+"""
+
+import asyncio
+import json
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.db.instrumentation import count_queries
+from app.models.course import Course
+from app.models.live_class import LiveClass
+from app.models.user import User
+from app.services import whiteboard as whiteboard_module
+from app.services.whiteboard import WhiteboardEngine, apply_op, empty_state, load_state
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, payload):
+        self.sent.append(payload)
+
+    async def send_bytes(self, payload):
+        self.sent.append(payload)
+
+    def messages(self):
+        return [json.loads(payload) for payload in self.sent]
+
+
+@pytest.fixture
+def db(engine):
+    factory = sessionmaker(bind=engine)
+    session = factory()
+    with patch.object(whiteboard_module, "SessionLocal", factory):
+        yield session
+    session.close()
+
+
+@pytest.fixture
+def backend(redis_or_local):
+    with patch("app.services.whiteboard.get_redis", return_value=redis_or_local):
+        yield redis_or_local
+
+
+@pytest.fixture
+def board(backend):
+    return WhiteboardEngine(frame_seconds=0.01, persist_delay=0.1,
+                            persist_max_delay=1.0, compact_every=10)
+
+
+@pytest.fixture
+def session_id(db):
+    teacher = User(email="teacher@example.com", full_name="Teacher")
+    db.add(teacher)
+    db.flush()
+    course = Course(title="Polity", slug="polity", instructor_id=teacher.id)
+    db.add(course)
+    db.flush()
+    live_class = LiveClass(course_id=course.id, instructor_id=teacher.id, title="Live",
+                           scheduled_at=datetime.utcnow(),
+                           whiteboard_data={"objects": ["legacy"]})
+    db.add(live_class)
+    db.commit()
+    return live_class.id
+
+
+def _op(seq, kind, user_id=1, data=None):
+    return {"seq": seq, "type": kind, "user_id": user_id, "data": data}
+
+
+def test_undo_redo_and_clear_fold():
+    state = empty_state()
+    for op in [
+        _op(1, "draw", 1, "a"), _op(2, "draw", 2, "b"), _op(3, "draw", 1, "c"),
+        _op(4, "undo", 1), _op(5, "undo", 1),
+    ]:
+        apply_op(state, op)
+    assert [op["data"] for op in state["ops"]] == ["b"]
+
+    apply_op(state, _op(6, "redo", 1))
+    assert [op["data"] for op in state["ops"]] == ["b", "a"]
+    apply_op(state, _op(6, "redo", 1))  # already folded
+    assert [op["data"] for op in state["ops"]] == ["b", "a"]
+
+    # A new stroke drops the user's redo stack
+    apply_op(state, _op(7, "draw", 1, "d"))
+    apply_op(state, _op(8, "redo", 1))
+    assert [op["data"] for op in state["ops"]] == ["b", "a", "d"]
+
+    apply_op(state, _op(9, "clear", 2))
+    assert state == {"base": {}, "ops": [], "redo": {}, "seq": 9}
+    assert load_state({"objects": []})["base"] == {"objects": []}
+
+
+def test_late_joiner_gets_snapshot_and_tail(db, backend, board, session_id):
+    first = FakeSocket()
+    late = FakeSocket()
+
+    async def session():
+        await board.join(session_id, first)
+        for stroke in range(25):
+            await board.submit(session_id, first, 1, {"type": "draw", "data": stroke})
+        await board.submit(session_id, first, 1, {"type": "undo"})
+        await board.join(session_id, late)
+
+    asyncio.run(session())
+
+    init = late.messages()[0]
+    assert init["type"] == "init_state"
+    assert init["data"] == {"objects": ["legacy"]}
+    assert [op["data"] for op in init["ops"]] == list(range(24))
+    assert init["seq"] == 26
+    # Compacted twice; only the newest ops remain in the tail
+    snapshot, tail = board.snapshot(session_id)
+    assert snapshot["seq"] == 20
+    assert [op["seq"] for op in tail] == list(range(21, 27))
+    if backend is not None:
+        assert backend.llen(f"whiteboard:{session_id}:ops") == 6
+
+
+def test_ops_are_batched_per_frame(db, board, session_id):
+    drawer, watchers = FakeSocket(), [FakeSocket() for _ in range(30)]
+
+    async def session():
+        client_id = await board.join(session_id, drawer)
+        for watcher in watchers:
+            await board.join(session_id, watcher)
+        for stroke in range(50):
+            await board.submit(session_id, drawer, 1, {"type": "draw", "data": stroke})
+        await board.submit(session_id, drawer, 1, {"type": "save_state", "data": {}})
+        await board.submit(session_id, drawer, 1, {"type": "ping"})
+        await asyncio.sleep(0.05)
+        return client_id
+
+    client_id = asyncio.run(session())
+
+    batches = [m for m in watchers[0].messages() if m["type"] == "ops"]
+    assert len(batches) == 1
+    assert [op["data"] for op in batches[0]["ops"]] == list(range(50))
+    assert {op["client_id"] for op in batches[0]["ops"]} == {client_id}
+    # Encoded once and shared by every socket
+    payloads = [watcher.sent[-1] for watcher in watchers]
+    assert all(payload is payloads[0] for payload in payloads)
+
+
+def test_msgpack_frames(db, board, session_id):
+    msgpack = pytest.importorskip("msgpack")
+    binary, text = FakeSocket(), FakeSocket()
+
+    async def session():
+        await board.join(session_id, binary, "msgpack")
+        await board.join(session_id, text)
+        message = board.decode({"bytes": msgpack.packb({"type": "draw", "data": [1, 2]})})
+        await board.submit(session_id, binary, 1, message)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(session())
+
+    assert isinstance(binary.sent[-1], bytes)
+    assert msgpack.unpackb(binary.sent[-1])["ops"][0]["data"] == [1, 2]
+    assert json.loads(text.sent[-1])["ops"][0]["data"] == [1, 2]
+
+
+def test_persistence_is_debounced(db, engine, board, session_id):
+    drawer = FakeSocket()
+
+    def updates(statements):
+        return [s for s in statements if s.lstrip().upper().startswith("UPDATE")]
+
+    async def session():
+        await board.join(session_id, drawer)
+        with count_queries(engine) as statements:
+            for stroke in range(40):
+                await board.submit(session_id, drawer, 1, {"type": "draw", "data": stroke})
+                await asyncio.sleep(0.005)
+            assert updates(statements) == []
+            await asyncio.sleep(0.3)
+        assert len(updates(statements)) == 1
+
+        await board.submit(session_id, drawer, 1, {"type": "clear"})
+        with count_queries(engine) as statements:
+            await board.leave(session_id, drawer)
+        assert len(updates(statements)) == 1
+
+    asyncio.run(session())
+
+    db.expire_all()
+    stored = db.get(LiveClass, session_id).whiteboard_data
+    assert stored["format"] == "oplog"
+    assert load_state(stored) == {"base": {}, "ops": [], "redo": {}, "seq": 41}
@@ -0,0 +1,290 @@
+"""
+Workflow Engine Tests
+
+Tests for set-based enrollment, due-time scheduling and batched sends.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.lead import Lead
+from app.models.marketing_automation import (
+    CommunicationTemplate,
+    MarketingWorkflow,
+    MessageLog,
+    WorkflowExecution,
+    WorkflowStep,
+)
+from app.services.workflow_engine import WorkflowEngine, render_tokens
+
+
+@pytest.fixture
+def workflow(db):
+    template = CommunicationTemplate(
+        name="Welcome", channel="EMAIL", subject="Hi {{name}}", body="Hello {{ name }}"
+    )
+    db.add(template)
+    db.flush()
+
+    workflow = MarketingWorkflow(
+        name="Onboarding",
+        status="ACTIVE",
+        trigger_type="MANUAL",
+        audience_filters={"stage": "NEW"},
+        total_enrolled=0,
+        total_completed=0,
+        total_converted=0,
+    )
+    db.add(workflow)
+    db.flush()
+
+    db.add_all(
+        [
+            WorkflowStep(
+                workflow_id=workflow.id, order_index=0, name="Welcome email",
+                step_type="SEND_MESSAGE", channel="EMAIL", template_id=template.id,
+            ),
+            WorkflowStep(
+                workflow_id=workflow.id, order_index=1, name="Wait a day",
+                step_type="WAIT", wait_duration_minutes=60 * 24,
+            ),
+            WorkflowStep(
+                workflow_id=workflow.id, order_index=2, name="Mark contacted",
+                step_type="UPDATE_FIELD", field_updates={"stage": "CONTACTED"},
+            ),
+        ]
+    )
+    db.commit()
+    return workflow
+
+
+def _add_leads(db, count, status="NEW"):
+    leads = [
+        Lead(name=f"Lead {i}", email=f"lead{i}@example.com", status=status)
+        for i in range(count)
+    ]
+    db.add_all(leads)
+    db.commit()
+    return leads
+
+
+def test_render_tokens():
+    assert render_tokens("Hi {{name}}, {{ unknown }}", {"name": "Asha"}) == (
+        "Hi Asha, {{ unknown }}"
+    )
+
+
+def test_enroll_leads_skips_active_and_missing(db, workflow):
+    leads = _add_leads(db, 3)
+    engine = WorkflowEngine()
+
+    created = engine.enroll_leads(db, [workflow], [l.id for l in leads] + [9999])
+    assert created == 3
+
+    # Re-entry is disabled, so a second trigger creates nothing
+    assert engine.enroll_leads(db, [workflow], [l.id for l in leads]) == 0
+
+    db.refresh(workflow)
+    assert workflow.total_enrolled == 3
+
+
+def test_enroll_audience_uses_filters(db, workflow):
+    _add_leads(db, 4, status="NEW")
+    _add_leads(db, 2, status="JUNK")
+    engine = WorkflowEngine()
+
+    assert engine.enroll_audience(db, workflow) == 4
+    assert engine.enroll_audience(db, workflow) == 0
+    assert db.query(WorkflowExecution).count() == 4
+
+
+def test_tick_sends_batch_and_schedules_wait(db, workflow):
+    leads = _add_leads(db, 5)
+    engine = WorkflowEngine(batch_size=10)
+    sent_batches = []
+
+    def fake_sender(messages):
+        sent_batches.append(len(messages))
+        return [m.id for m in messages]
+
+    engine.register_sender("EMAIL", fake_sender)
+    engine.enroll_leads(db, [workflow], [l.id for l in leads])
+
+    now = datetime.utcnow()
+    result = engine.tick(db, now=now)
+
+    assert result["claimed"] == 5
+    assert sent_batches == [5]
+    assert db.query(MessageLog).filter(MessageLog.status == "SENT").count() == 5
+    assert db.query(MessageLog).first().body.startswith("Hello Lead")
+
+    # All executions are parked on the timer
+    assert engine.tick(db, now=now)["claimed"] == 0
+
+    later = now + timedelta(days=1, minutes=1)
+    result = engine.tick(db, now=later)
+    assert result["claimed"] == 5
+    assert result["completed"] == 5
+
+    db.refresh(workflow)
+    assert workflow.total_completed == 5
+    assert {l.status for l in db.query(Lead).all()} == {"CONTACTED"}
+    assert engine.metrics.snapshot()["completed"] == 5
+
+
+def test_condition_branch_and_conversion_exit(db, workflow):
+    db.query(WorkflowStep).filter(WorkflowStep.workflow_id == workflow.id).delete()
+    db.add_all(
+        [
+            WorkflowStep(
+                workflow_id=workflow.id, order_index=0, name="Interested?",
+                step_type="CONDITION",
+                condition_config={"field": "stage", "operator": "equals", "value": "INTERESTED"},
+                true_next_step=2, false_next_step=1,
+            ),
+            WorkflowStep(
+                workflow_id=workflow.id, order_index=1, name="Enroll",
+                step_type="UPDATE_FIELD", field_updates={"stage": "ENROLLED"},
+            ),
+            WorkflowStep(
+                workflow_id=workflow.id, order_index=2, name="Assign",
+                step_type="UPDATE_FIELD", field_updates={"notes": "hot"},
+            ),
+        ]
+    )
+    db.commit()
+
+    interested = _add_leads(db, 1, status="INTERESTED")
+    other = _add_leads(db, 1, status="NEW")
+    engine = WorkflowEngine()
+    engine.enroll_leads(db, [workflow], [interested[0].id, other[0].id])
+
+    result = engine.tick(db)
+    assert result["completed"] == 2
+    assert result["converted"] == 1
+
+    db.refresh(interested[0])
+    db.refresh(other[0])
+    assert interested[0].notes == "hot"
+    assert other[0].status == "ENROLLED"
+
+
+def test_messages_are_committed_before_sending_and_resends_are_skipped(db, workflow):
+    leads = _add_leads(db, 3)
+    engine = WorkflowEngine()
+    calls = []
+
+    def fake_sender(messages):
+        # The step changes and the PENDING outbox are already committed
+        assert not db.in_transaction()
+        assert {m.status for m in messages} == {"PENDING"}
+        calls.append([m.id for m in messages])
+        messages[0].error_message = "mailbox full"
+        return [m.id for m in messages[1:]]
+
+    engine.register_sender("EMAIL", fake_sender)
+    engine.enroll_leads(db, [workflow], [l.id for l in leads])
+
+    now = datetime.utcnow()
+    result = engine.tick(db, now=now)
+    assert result["messages_sent"] == {"EMAIL": 2}
+    statuses = dict(db.query(MessageLog.id, MessageLog.status).all())
+    first = calls[0][0]
+    assert statuses.pop(first) == "FAILED"
+    assert set(statuses.values()) == {"SENT"}
+    assert db.get(MessageLog, first).error_message == "mailbox full"
+
+    # A retry of the same messages sends nothing again
+    engine._dispatch(db, calls[0], now, {"messages_sent": {}})
+    assert len(calls) == 1
+
+
+def test_failed_send_keeps_step_progress(db, workflow):
+    leads = _add_leads(db, 2)
+    engine = WorkflowEngine()
+
+    def broken_sender(messages):
+        raise ConnectionError("SMTP down")
+
+    engine.register_sender("EMAIL", broken_sender)
+    engine.enroll_leads(db, [workflow], [l.id for l in leads])
+
+    engine.tick(db)
+    assert {m.status for m in db.query(MessageLog).all()} == {"FAILED"}
+    assert {m.error_message for m in db.query(MessageLog).all()} == {"SMTP down"}
+    # Executions moved on to the wait step rather than re-sending next tick
+    assert engine.tick(db)["claimed"] == 0
+
+
+def test_messages_without_sender_are_failed(db, workflow):
+    leads = _add_leads(db, 2)
+    engine = WorkflowEngine()
+    engine.senders.pop("EMAIL")
+    engine.enroll_leads(db, [workflow], [l.id for l in leads])
+
+    engine.tick(db)
+    messages = db.query(MessageLog).all()
+    assert {m.status for m in messages} == {"FAILED"}
+    assert {m.error_message for m in messages} == {"No sender registered for channel EMAIL"}
+
+
+def test_sweep_retries_and_expires_stale_pending_messages(db, workflow):
+    leads = _add_leads(db, 4)
+    now = datetime.utcnow()
+    ages = [timedelta(minutes=1), timedelta(minutes=30), timedelta(hours=2), timedelta(days=2)]
+    # Outbox rows a crashed worker committed but never sent
+    messages = [
+        MessageLog(
+            lead_id=lead.id, channel="EMAIL", recipient=lead.email,
+            status="PENDING", created_at=now - age,
+        )
+        for lead, age in zip(leads, ages)
+    ]
+    db.add_all(messages)
+    db.commit()
+    fresh, recent, old, expired = [m.id for m in messages]
+
+    engine = WorkflowEngine(batch_size=1)
+    calls = []
+
+    def fake_sender(batch):
+        calls.append([m.id for m in batch])
+        return [m.id for m in batch]
+
+    engine.register_sender("EMAIL", fake_sender)
+    result = engine.sweep_stale_messages(db, now=now)
+
+    assert result["expired"] == 1
+    assert result["retried"] == 2
+    assert calls == [[recent], [old]]
+    statuses = dict(db.query(MessageLog.id, MessageLog.status).all())
+    assert statuses == {fresh: "PENDING", recent: "SENT", old: "SENT", expired: "FAILED"}
+
+    # Nothing left to sweep
+    assert engine.sweep_stale_messages(db, now=now)["retried"] == 0
+    assert len(calls) == 2
+
+
+def test_sweep_skips_rows_the_sender_leaves_pending(db, workflow):
+    lead = _add_leads(db, 1)[0]
+    now = datetime.utcnow()
+    db.add(
+        MessageLog(
+            lead_id=lead.id, channel="EMAIL", recipient=lead.email,
+            status="PENDING", created_at=now - timedelta(hours=1),
+        )
+    )
+    db.commit()
+
+    engine = WorkflowEngine()
+    calls = []
+
+    def deferring_sender(batch):
+        calls.append(len(batch))
+        return []
+
+    engine.register_sender("EMAIL", deferring_sender)
+    assert engine.sweep_stale_messages(db, now=now)["retried"] == 1
+    assert calls == [1]
+    assert db.query(MessageLog).one().status == "PENDING"
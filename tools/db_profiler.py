@@ -1,98 +1,94 @@
 """
 Database Query Profiler
-Analyzes database queries to identify slow operations and missing indexes
+Reports on the SQL instrumentation installed on the application engine
+(app.db.instrumentation): slow queries with plans, N+1 candidates and
+per-route query percentiles
 """
 
-import time
 import logging
-from sqlalchemy import create_engine, event
-from sqlalchemy.orm import sessionmaker
-from app.core.config import settings
+
+from app.db.instrumentation import query_instrumentation
+from app.db.session import engine  # noqa: F401 - installs the instrumentation
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Track query statistics
-query_stats = []
-
-
-@event.listens_for(engine := create_engine(settings.DATABASE_URL), "before_cursor_execute")
-def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-    """Record query start time"""
-    conn.info.setdefault("query_start_time", []).append(time.time())
-    logger.debug(f"START QUERY: {statement[:100]}...")
-
-
-@event.listens_for(engine, "after_cursor_execute")
-def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-    """Record query execution time and log slow queries"""
-    total_time = time.time() - conn.info["query_start_time"].pop()
-    
-    query_info = {
-        "query": statement[:200],  # First 200 chars
-        "duration_ms": round(total_time * 1000, 2),
-        "timestamp": time.time()
-    }
-    
-    query_stats.append(query_info)
-    
-    # Log slow queries (>100ms)
-    if total_time * 1000 > 100:
-        logger.warning(
-            f"SLOW QUERY ({query_info['duration_ms']}ms): {statement[:200]}..."
-        )
-
 
 def get_slow_queries(threshold_ms=100):
-    """Get all queries slower than threshold"""
-    return [q for q in query_stats if q["duration_ms"] > threshold_ms]
+    """Get sampled queries slower than threshold, slowest first"""
+    return [
+        q
+        for q in query_instrumentation.snapshot()["slow_queries"]
+        if q["duration_ms"] > threshold_ms
+    ]
 
 
 def print_query_report():
     """Print comprehensive query performance report"""
-    if not query_stats:
+    snapshot = query_instrumentation.snapshot()
+    query_time = snapshot["query_time_ms"]
+    if not query_time["count"]:
         print("No queries recorded yet")
         return
-    
+
     print("\n" + "=" * 80)
     print("DATABASE QUERY PERFORMANCE REPORT")
     print("=" * 80)
-    
-    total_queries = len(query_stats)
-    slow_queries = get_slow_queries(100)
-    
-    print(f"\nTotal Queries: {total_queries}")
-    print(f"Slow Queries (>100ms): {len(slow_queries)}")
-    
+
+    slow_queries = snapshot["slow_queries"]
+    print(f"\nTotal Queries: {query_time['count']}")
+    print(
+        f"Slow Queries (>{snapshot['thresholds']['slow_query_ms']:.0f}ms, "
+        f"last {len(slow_queries)} kept): {len(slow_queries)}"
+    )
+
     if slow_queries:
         print("\n" + "-" * 80)
         print("SLOW QUERIES:")
         print("-" * 80)
-        
-        for i, q in enumerate(sorted(slow_queries, key=lambda x: x["duration_ms"], reverse=True)[:10], 1):
-            print(f"\n{i}. Duration: {q['duration_ms']}ms")
-            print(f"   Query: {q['query']}")
-    
-    # Calculate statistics
-    durations = [q["duration_ms"] for q in query_stats]
-    avg_duration = sum(durations) / len(durations)
-    max_duration = max(durations)
-    
+
+        for i, q in enumerate(slow_queries[:10], 1):
+            print(f"\n{i}. Duration: {q['duration_ms']}ms  Route: {q['route'] or '-'}")
+            print(f"   Query: {q['statement'][:200]}")
+            if q["plan"]:
+                print("   Plan:")
+                for line in q["plan"].splitlines():
+                    print(f"     {line}")
+
+    if snapshot["n_plus_one"]:
+        print("\n" + "-" * 80)
+        print("POSSIBLE N+1 QUERIES:")
+        print("-" * 80)
+        for q in snapshot["n_plus_one"][-10:]:
+            print(f"\n{q['route']}: {q['count']}x {q['statement'][:200]}")
+
     print("\n" + "-" * 80)
     print("STATISTICS:")
     print("-" * 80)
-    print(f"Average Query Time: {avg_duration:.2f}ms")
-    print(f"Slowest Query: {max_duration:.2f}ms")
-    print(f"Percentage Slow: {(len(slow_queries) / total_queries * 100):.1f}%")
+    print(f"Average Query Time: {query_time['avg']:.2f}ms")
+    print(f"p95 Query Time: {query_time['p95']:.2f}ms")
+    print(f"Slowest Query: {query_time['max']:.2f}ms")
+
+    routes = snapshot["routes"]
+    if routes:
+        print("\n" + "-" * 80)
+        print("ROUTES (queries p50/p95, db ms p95, latency ms p95):")
+        print("-" * 80)
+        busiest = sorted(routes.items(), key=lambda r: r[1]["queries"]["p95"] or 0, reverse=True)
+        for route, stats in busiest[:20]:
+            print(
+                f"{route}: {stats['queries']['p50']}/{stats['queries']['p95']} queries, "
+                f"{stats['db_ms']['p95']}ms db, {stats['latency_ms']['p95']}ms total "
+                f"({stats['requests']} requests)"
+            )
     print("=" * 80 + "\n")
 
 
 if __name__ == "__main__":
     print("Database Query Profiler")
-    print("This will monitor queries when you run your application")
+    print("The application engine is instrumented on import of app.db.session")
     print("\nTo use:")
-    print("1. Import this module in your app")
-    print("2. Run your application normally")
-    print("3. Call print_query_report() to see results")
-    print("\nFor live monitoring, check the logs for 'SLOW QUERY' warnings")
+    print("1. Run your application normally")
+    print("2. Call print_query_report() in-process, or GET /api/v1/performance/queries")
+    print("\nFor live monitoring, check the logs for 'Slow query' and 'Possible N+1' warnings")
@@ -1,155 +1,205 @@
-import threading
-import time
-import json
-import requests
-import websocket
-import sys
-import random
+"""
+WebSocket Load Test
+
+Opens thousands of concurrent WebSockets across the discussion, live-quiz,
+whiteboard and notification endpoints, then keeps issuing HTTP requests that
+need a database connection while the sockets stay open. Passes when every
+socket stays connected and HTTP requests keep succeeding within the latency
+budget, i.e. open sockets don't starve the connection pool.
+
+Usage:
+    python tools/websocket_stress_test.py --sockets 2000 --duration 30
+    python tools/websocket_stress_test.py --admin-token <token>   # also report pool saturation
 
-# Configuration
-API_URL = "http://localhost:8006/api/v1"
-WS_URL = "ws://localhost:8006/api/v1"
-NUM_CONNECTIONS = 50
-DURATION = 30  # seconds
+Requires ``websockets`` (installed with ``uvicorn[standard]``) and ``httpx``.
+"""
 
-# Test User Credentials
+import argparse
+import asyncio
+import statistics
+import sys
+import time
 import uuid
-EMAIL = f"stress_test_{uuid.uuid4()}@example.com"
-PASSWORD = "password123"
-
-def get_auth_token():
-    """Register and get access token"""
-    print(f"Attempting to register user: {EMAIL}")
-    try:
-        response = requests.post(
-            f"{API_URL}/login/register",
-            json={
-                "email": EMAIL,
-                "password": PASSWORD,
-                "full_name": "WS Stress Test User",
-                "role": "student"
-            }
-        )
-        if response.status_code != 200:
-            print(f"Registration failed: {response.status_code} - {response.text}")
-            return None, None
-            
-        # Login
-        response = requests.post(
-            f"{API_URL}/login/access-token",
-            data={"username": EMAIL, "password": PASSWORD}
-        )
-        if response.status_code == 200:
-            token = response.json()["access_token"]
-            user_id = get_user_id(token)
-            return token, user_id
-        else:
-            print(f"Login failed: {response.status_code} - {response.text}")
-            return None, None
-
-    except Exception as e:
-        print(f"Auth Exception: {e}")
-        return None, None
-
-def get_user_id(token):
-    # Helper to get user ID from /users/me
+from typing import List, Optional
+
+import httpx
+import websockets
+
+ENDPOINTS = (
+    "ws/discussions/{room}",
+    "ws/live-quiz/{room}",
+    "ws/whiteboard/{room}",
+    "ws/notifications/{user_id}",
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--api-url", default="http://localhost:8006/api/v1")
+    parser.add_argument("--sockets", type=int, default=2000)
+    parser.add_argument("--rooms", type=int, default=20, help="Rooms per endpoint")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to hold the sockets")
+    parser.add_argument("--connect-concurrency", type=int, default=200)
+    parser.add_argument("--http-concurrency", type=int, default=20)
+    parser.add_argument("--http-p95-ms", type=float, default=1000, help="Latency budget for HTTP")
+    parser.add_argument("--admin-token", help="Admin bearer token to sample /performance/pool")
+    return parser.parse_args()
+
+
+async def get_auth(client: httpx.AsyncClient):
+    """Register a throwaway student and return (token, user_id)."""
+    email = f"ws_load_{uuid.uuid4().hex[:12]}@example.com"
+    password = "password123"
+    response = await client.post(
+        "/login/register",
+        json={"email": email, "password": password, "full_name": "WS Load Test", "role": "student"},
+    )
+    response.raise_for_status()
+    response = await client.post(
+        "/login/access-token", data={"username": email, "password": password}
+    )
+    response.raise_for_status()
+    token = response.json()["access_token"]
+    me = await client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+    me.raise_for_status()
+    return token, me.json()["id"]
+
+
+class SocketPool:
+    """Holds the open sockets and what happened to them."""
+
+    def __init__(self):
+        self.open = 0
+        self.failed_connects = 0
+        self.dropped = 0
+        self.connect_ms: List[float] = []
+        self.ready = asyncio.Event()
+
+    async def hold(self, url: str, gate: asyncio.Semaphore, stop: asyncio.Event):
+        started = time.perf_counter()
+        try:
+            async with gate:
+                socket = await websockets.connect(url, open_timeout=30, max_size=None)
+        except Exception as e:
+            self.failed_connects += 1
+            print(f"connect failed: {e}", file=sys.stderr)
+            return
+        self.connect_ms.append((time.perf_counter() - started) * 1000)
+        self.open += 1
+        try:
+            while not stop.is_set():
+                try:
+                    # Drain broadcasts so server-side sends never back up
+                    await asyncio.wait_for(socket.recv(), timeout=1)
+                except asyncio.TimeoutError:
+                    continue
+        except websockets.ConnectionClosed:
+            self.dropped += 1
+        finally:
+            self.open -= 1
+            await socket.close()
+
+
+async def hammer_http(client: httpx.AsyncClient, token: str, stop: asyncio.Event,
+                      latencies: List[float], failures: List[str]):
+    """Authenticated requests that each need a pooled DB connection."""
     headers = {"Authorization": f"Bearer {token}"}
-    resp = requests.get(f"{API_URL}/users/me", headers=headers)
-    if resp.status_code == 200:
-        return resp.json()["id"]
-    return None
-
-class WSClient(threading.Thread):
-    def __init__(self, url, token, client_id):
-        threading.Thread.__init__(self)
-        self.url = f"{url}?token={token}"
-        self.client_id = client_id
-        self.ws = None
-        self.connected = False
-        self.error = None
-
-    def run(self):
-        # websocket.enableTrace(True)
-        self.ws = websocket.WebSocketApp(
-            self.url,
-            on_open=self.on_open,
-            on_message=self.on_message,
-            on_error=self.on_error,
-            on_close=self.on_close
-        )
-        self.ws.run_forever()
-
-    def on_open(self, ws):
-        self.connected = True
-        # print(f"Client {self.client_id}: Connected")
-
-    def on_message(self, ws, message):
-        pass
-        # print(f"Client {self.client_id}: Received {message}")
-
-    def on_error(self, ws, error):
-        self.error = error
-        print(f"Client {self.client_id}: Error: {error}")
-
-    def on_close(self, ws, close_status_code, close_msg):
-        self.connected = False
-        # print(f"Client {self.client_id}: Closed")
-
-    def close(self):
-        if self.ws:
-            self.ws.close()
-
-def run_stress_test():
-    print(f"Starting WebSocket Stress Test with {NUM_CONNECTIONS} connections...")
-    
-    token, user_id = get_auth_token()
-    if not token:
-        print("Failed to authenticate. Exiting.")
-        sys.exit(1)
-        
-    print(f"Authenticated as user {user_id}")
-    
-    clients = []
-    target_url = f"{WS_URL}/ws/notifications/{user_id}"
-    
-    # Spawn clients
-    for i in range(NUM_CONNECTIONS):
-        client = WSClient(target_url, token, i)
-        client.start()
-        clients.append(client)
-        time.sleep(0.05) # Stagger connections slightly
-        
-    print("All clients started. Waiting for connections to establish...")
-    time.sleep(5)
-    
-    # Check status
-    connected_count = sum(1 for c in clients if c.connected)
-    print(f"Connected: {connected_count}/{NUM_CONNECTIONS}")
-    
-    if connected_count < NUM_CONNECTIONS:
-        print("WARNING: Not all clients connected!")
-        
-    print(f"Holding connections for {DURATION} seconds...")
-    time.sleep(DURATION)
-    
-    # Final check
-    final_connected_count = sum(1 for c in clients if c.connected)
-    print(f"Final Connected: {final_connected_count}/{NUM_CONNECTIONS}")
-    
-    # Cleanup
-    print("Closing connections...")
-    for client in clients:
-        client.close()
-        client.join()
-        
-    print("Test Complete.")
-    
-    if final_connected_count == NUM_CONNECTIONS:
-        print("SUCCESS: All connections maintained.")
-        sys.exit(0)
-    else:
-        print(f"FAILURE: Lost {NUM_CONNECTIONS - final_connected_count} connections.")
-        sys.exit(1)
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            response = await client.get("/users/me", headers=headers)
+            if response.status_code != 200:
+                failures.append(f"HTTP {response.status_code}")
+        except httpx.HTTPError as e:
+            failures.append(type(e).__name__)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def sample_pool(client: httpx.AsyncClient, admin_token: Optional[str],
+                      stop: asyncio.Event, samples: List[dict]):
+    if not admin_token:
+        return
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    while not stop.is_set():
+        try:
+            response = await client.get("/performance/pool", headers=headers)
+            if response.status_code == 200:
+                samples.append(response.json())
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(1)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(args) -> bool:
+    ws_base = args.api_url.replace("http", "ws", 1).rstrip("/")
+    limits = httpx.Limits(max_connections=args.http_concurrency + 5)
+    async with httpx.AsyncClient(base_url=args.api_url, timeout=30, limits=limits) as client:
+        token, user_id = await get_auth(client)
+        print(f"Authenticated as user {user_id}")
+
+        urls = []
+        for i in range(args.sockets):
+            path = ENDPOINTS[i % len(ENDPOINTS)].format(room=i % args.rooms + 1, user_id=user_id)
+            urls.append(f"{ws_base}/{path}?token={token}")
+
+        sockets = SocketPool()
+        stop = asyncio.Event()
+        gate = asyncio.Semaphore(args.connect_concurrency)
+        latencies: List[float] = []
+        failures: List[str] = []
+        pool_samples: List[dict] = []
+
+        print(f"Opening {args.sockets} sockets...")
+        holders = [asyncio.create_task(sockets.hold(url, gate, stop)) for url in urls]
+        workers = [
+            asyncio.create_task(hammer_http(client, token, stop, latencies, failures))
+            for _ in range(args.http_concurrency)
+        ]
+        workers.append(asyncio.create_task(sample_pool(client, args.admin_token, stop, pool_samples)))
+
+        deadline = time.monotonic() + args.duration
+        while time.monotonic() < deadline:
+            await asyncio.sleep(5)
+            print(
+                f"  open={sockets.open} failed={sockets.failed_connects} "
+                f"dropped={sockets.dropped} http={len(latencies)} "
+                f"http_p95={percentile(latencies, 0.95):.0f}ms http_errors={len(failures)}"
+            )
+        peak_open = sockets.open
+
+        stop.set()
+        await asyncio.gather(*workers, *holders, return_exceptions=True)
+
+    print("\nResults")
+    print(f"  sockets open at end of hold: {peak_open}/{args.sockets}")
+    print(f"  failed connects: {sockets.failed_connects}, dropped: {sockets.dropped}")
+    if sockets.connect_ms:
+        print(f"  connect p50/p95: {statistics.median(sockets.connect_ms):.0f}/"
+              f"{percentile(sockets.connect_ms, 0.95):.0f}ms")
+    http_p95 = percentile(latencies, 0.95)
+    print(f"  HTTP requests: {len(latencies)}, errors: {len(failures)}, "
+          f"p50/p95: {percentile(latencies, 0.5):.0f}/{http_p95:.0f}ms")
+    if pool_samples:
+        peak = max(pool_samples, key=lambda s: s.get("checked_out") or 0)
+        print(f"  pool peak checked out: {peak['checked_out']}/{peak.get('capacity')} "
+              f"(saturation {peak.get('saturation')}), holders: {peak.get('holders')}")
+
+    passed = (
+        peak_open == args.sockets
+        and not failures
+        and latencies
+        and http_p95 <= args.http_p95_ms
+    )
+    print("SUCCESS" if passed else "FAILURE")
+    return bool(passed)
+
 
 if __name__ == "__main__":
-    run_stress_test()
+    sys.exit(0 if asyncio.run(run(parse_args())) else 1)